@@ -0,0 +1,64 @@
+"""add labs_acc_jobs (durable ACC upload / copy job registry)
+
+Revision ID: 20261019_acc_jobs
+Revises: 20261019_device_tokens
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_acc_jobs'
+down_revision = '20261019_device_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'labs_acc_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'labs_acc_jobs',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('status', sa.String(), nullable=True),
+            sa.Column('params', sa.JSON(), nullable=True),
+            sa.Column('progress', sa.JSON(), nullable=True),
+            sa.Column('result', sa.JSON(), nullable=True), # CompressedJSON (JSON envelope)
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=True),
+            sa.Column('claimed_by', sa.String(), nullable=True),
+            sa.Column('cancel_requested', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+
+    indexes = {i["name"] for i in inspector.get_indexes("labs_acc_jobs")} if 'labs_acc_jobs' in inspector.get_table_names() else set()
+
+    # Claim queue: WHERE status = 'pending' ORDER BY created_at; stale heartbeat recovery
+    if 'ix_labs_acc_jobs_status_created' not in indexes:
+        op.create_index('ix_labs_acc_jobs_status_created', 'labs_acc_jobs', ['status', 'created_at'], unique=False)
+
+    # Cleanup: finished_at < cutoff
+    if 'ix_labs_acc_jobs_finished' not in indexes:
+        op.create_index('ix_labs_acc_jobs_finished', 'labs_acc_jobs', ['finished_at'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'labs_acc_jobs' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("labs_acc_jobs")}
+    if 'ix_labs_acc_jobs_finished' in indexes:
+        op.drop_index('ix_labs_acc_jobs_finished', table_name='labs_acc_jobs')
+    if 'ix_labs_acc_jobs_status_created' in indexes:
+        op.drop_index('ix_labs_acc_jobs_status_created', table_name='labs_acc_jobs')
+    op.drop_table('labs_acc_jobs')
@@ -0,0 +1,37 @@
+"""add plugin_activities session index (per-session log counts on the admin listing)
+
+Revision ID: 20261019_activity_session_idx
+Revises: 20261019_cloud_external
+Create Date: 2026-10-19 19:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_activity_session_idx'
+down_revision = '20261019_cloud_external'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_activities' not in inspector.get_table_names():
+        print("WARNING: plugin_activities does not exist. Skipping session index.")
+        return
+
+    existing = {i["name"] for i in inspector.get_indexes('plugin_activities')}
+    if 'ix_plugin_activities_session' not in existing:
+        op.create_index('ix_plugin_activities_session', 'plugin_activities', ['session_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_activities' in inspector.get_table_names():
+        existing = {i["name"] for i in inspector.get_indexes('plugin_activities')}
+        if 'ix_plugin_activities_session' in existing:
+            op.drop_index('ix_plugin_activities_session', table_name='plugin_activities')
@@ -0,0 +1,58 @@
+"""add plugin_cloud_elements and revision for delta sync
+
+Revision ID: 20261019_cloud_elements
+Revises: 20261019_plugin_listing_idx
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_cloud_elements'
+down_revision = '20261019_plugin_listing_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    # 1. Revision counter on sessions (optimistic concurrency for deltas)
+    if 'plugin_cloud_sessions' in tables:
+        cols = {c["name"] for c in inspector.get_columns("plugin_cloud_sessions")}
+        if 'revision' not in cols:
+            op.add_column('plugin_cloud_sessions', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+    else:
+        print("WARNING: plugin_cloud_sessions does not exist. Skipping revision column.")
+
+    # 2. Keyed element rows
+    if 'plugin_cloud_elements' not in tables:
+        op.create_table(
+            'plugin_cloud_elements',
+            sa.Column('session_id', sa.String(), sa.ForeignKey('plugin_cloud_sessions.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('element_id', sa.String(), primary_key=True),
+            sa.Column('category', sa.String(), nullable=True),
+            sa.Column('data_json', sa.JSON(), nullable=True),
+            sa.Column('row_hash', sa.String(), nullable=True),
+            sa.Column('revision', sa.Integer(), nullable=True),
+        )
+        op.create_index('ix_plugin_cloud_elements_category', 'plugin_cloud_elements', ['session_id', 'category'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'plugin_cloud_elements' in tables:
+        op.drop_index('ix_plugin_cloud_elements_category', table_name='plugin_cloud_elements')
+        op.drop_table('plugin_cloud_elements')
+
+    if 'plugin_cloud_sessions' in tables:
+        cols = {c["name"] for c in inspector.get_columns("plugin_cloud_sessions")}
+        if 'revision' in cols:
+            op.drop_column('plugin_cloud_sessions', 'revision')
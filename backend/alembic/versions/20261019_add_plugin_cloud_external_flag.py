@@ -0,0 +1,38 @@
+"""add plugin_cloud_sessions.elements_external (column copy of the data_json flag)
+
+Revision ID: 20261019_cloud_external
+Revises: 20261019_sheet_pending
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_cloud_external'
+down_revision = '20261019_sheet_pending'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_cloud_sessions' not in inspector.get_table_names():
+        print("WARNING: plugin_cloud_sessions does not exist. Skipping elements_external column.")
+        return
+
+    cols = {c["name"] for c in inspector.get_columns("plugin_cloud_sessions")}
+    if 'elements_external' not in cols:
+        # Left NULL: existing sessions are checked once on their next revision read and the column backfilled
+        op.add_column('plugin_cloud_sessions', sa.Column('elements_external', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_cloud_sessions' in inspector.get_table_names():
+        cols = {c["name"] for c in inspector.get_columns("plugin_cloud_sessions")}
+        if 'elements_external' in cols:
+            op.drop_column('plugin_cloud_sessions', 'elements_external')
@@ -0,0 +1,49 @@
+"""add listing indexes to plugin_cloud_sessions
+
+Revision ID: 20261019_cloud_listing_idx
+Revises: 20261019_cloud_elements
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_cloud_listing_idx'
+down_revision = '20261019_cloud_elements'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_cloud_sessions' not in inspector.get_table_names():
+        print("WARNING: plugin_cloud_sessions does not exist. Skipping listing indexes.")
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_cloud_sessions")}
+
+    # 1. Folder tree: sessions per folder, newest first
+    if 'ix_plugin_cloud_sessions_folder_ts' not in indexes:
+        op.create_index('ix_plugin_cloud_sessions_folder_ts', 'plugin_cloud_sessions', ['folder_id', 'timestamp'], unique=False)
+
+    # 2. Project list filtered by owner
+    if 'ix_plugin_cloud_sessions_user_ts' not in indexes:
+        op.create_index('ix_plugin_cloud_sessions_user_ts', 'plugin_cloud_sessions', ['user_email', 'timestamp'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_cloud_sessions' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_cloud_sessions")}
+
+    if 'ix_plugin_cloud_sessions_user_ts' in indexes:
+        op.drop_index('ix_plugin_cloud_sessions_user_ts', table_name='plugin_cloud_sessions')
+
+    if 'ix_plugin_cloud_sessions_folder_ts' in indexes:
+        op.drop_index('ix_plugin_cloud_sessions_folder_ts', table_name='plugin_cloud_sessions')
@@ -0,0 +1,62 @@
+"""add plugin_command_stats (hourly command latency digests)
+
+Revision ID: 20261019_command_stats
+Revises: 20261019_retention_idx
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_command_stats'
+down_revision = '20261019_retention_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'plugin_command_stats' not in inspector.get_table_names():
+        op.create_table(
+            'plugin_command_stats',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('command_name', sa.String(), nullable=False),
+            sa.Column('revit_version', sa.String(), nullable=False, server_default=''),
+            sa.Column('plugin_version', sa.String(), nullable=False, server_default=''),
+            sa.Column('machine_id', sa.String(), nullable=False, server_default=''),
+            sa.Column('count', sa.Integer(), nullable=True),
+            sa.Column('total_ms', sa.Float(), nullable=True),
+            sa.Column('min_ms', sa.Float(), nullable=True),
+            sa.Column('max_ms', sa.Float(), nullable=True),
+            sa.Column('digest_json', sa.JSON(), nullable=True),
+        )
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_command_stats")} if 'plugin_command_stats' in inspector.get_table_names() else set()
+
+    # One rollup row per (hour, command, revit version, plugin version, machine)
+    if 'ix_plugin_command_stats_key' not in indexes:
+        op.create_index('ix_plugin_command_stats_key', 'plugin_command_stats',
+                        ['bucket_start', 'command_name', 'revit_version', 'plugin_version', 'machine_id'], unique=True)
+
+    # Single-command drill-down over a window
+    if 'ix_plugin_command_stats_command' not in indexes:
+        op.create_index('ix_plugin_command_stats_command', 'plugin_command_stats', ['command_name', 'bucket_start'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_command_stats' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_command_stats")}
+    if 'ix_plugin_command_stats_command' in indexes:
+        op.drop_index('ix_plugin_command_stats_command', table_name='plugin_command_stats')
+    if 'ix_plugin_command_stats_key' in indexes:
+        op.drop_index('ix_plugin_command_stats_key', table_name='plugin_command_stats')
+    op.drop_table('plugin_command_stats')
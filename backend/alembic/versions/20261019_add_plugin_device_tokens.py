@@ -0,0 +1,59 @@
+"""add plugin_device_tokens for token-based plugin resume
+
+Revision ID: 20261019_device_tokens
+Revises: 20261019_command_stats
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_device_tokens'
+down_revision = '20261019_command_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if 'plugin_device_tokens' not in inspector.get_table_names():
+        op.create_table(
+            'plugin_device_tokens',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('token_hash', sa.String(length=64), nullable=False),
+            sa.Column('user_email', sa.String(), nullable=False),
+            sa.Column('machine_id', sa.String(), nullable=True),
+            sa.Column('session_id', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_used_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('revoked', sa.Boolean(), nullable=True),
+        )
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_device_tokens")} if 'plugin_device_tokens' in inspector.get_table_names() else set()
+
+    # Resume: WHERE token_hash = :h
+    if 'ix_plugin_device_tokens_token_hash' not in indexes:
+        op.create_index('ix_plugin_device_tokens_token_hash', 'plugin_device_tokens', ['token_hash'], unique=True)
+
+    # Revocation per user / machine
+    if 'ix_plugin_device_tokens_user' not in indexes:
+        op.create_index('ix_plugin_device_tokens_user', 'plugin_device_tokens', ['user_email', 'machine_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_device_tokens' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_device_tokens")}
+    if 'ix_plugin_device_tokens_user' in indexes:
+        op.drop_index('ix_plugin_device_tokens_user', table_name='plugin_device_tokens')
+    if 'ix_plugin_device_tokens_token_hash' in indexes:
+        op.drop_index('ix_plugin_device_tokens_token_hash', table_name='plugin_device_tokens')
+    op.drop_table('plugin_device_tokens')
@@ -0,0 +1,58 @@
+"""add retention indexes to plugin_sheet_sessions and plugin_cloud_commands
+
+Revision ID: 20261019_retention_idx
+Revises: 20261019_sheet_rows
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_retention_idx'
+down_revision = '20261019_sheet_rows'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'plugin_sheet_sessions': [
+        # Expired sessions: WHERE expires_at < now
+        ('ix_plugin_sheet_sessions_expires', ['expires_at']),
+        # Legacy sessions without expires_at: WHERE created_at < cutoff
+        ('ix_plugin_sheet_sessions_created', ['created_at']),
+    ],
+    'plugin_cloud_commands': [
+        ('ix_plugin_cloud_commands_consumed_updated', ['is_consumed', 'updated_at']),
+        ('ix_plugin_cloud_commands_consumed_created', ['is_consumed', 'created_at']),
+    ],
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            print(f"WARNING: {table} does not exist. Skipping retention indexes.")
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table)}
+        for name, columns in indexes:
+            if name not in existing:
+                op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    for table, indexes in INDEXES.items():
+        if table not in tables:
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table)}
+        for name, _ in reversed(indexes):
+            if name in existing:
+                op.drop_index(name, table_name=table)
@@ -0,0 +1,38 @@
+"""add plugin_sessions lower(user_email) index (case-insensitive user filter)
+
+Revision ID: 20261019_session_email_lower
+Revises: 20261019_activity_session_idx
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_session_email_lower'
+down_revision = '20261019_activity_session_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' not in inspector.get_table_names():
+        print("WARNING: plugin_sessions does not exist. Skipping email index.")
+        return
+
+    existing = {i["name"] for i in inspector.get_indexes('plugin_sessions')}
+    if 'ix_plugin_sessions_user_email_lower' not in existing:
+        # Functional index: matches func.lower(PluginSession.user_email) == :email
+        op.create_index('ix_plugin_sessions_user_email_lower', 'plugin_sessions', [sa.text('lower(user_email)')], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' in inspector.get_table_names():
+        existing = {i["name"] for i in inspector.get_indexes('plugin_sessions')}
+        if 'ix_plugin_sessions_user_email_lower' in existing:
+            op.drop_index('ix_plugin_sessions_user_email_lower', table_name='plugin_sessions')
@@ -0,0 +1,42 @@
+"""add keyset listing index to plugin_sessions
+
+Revision ID: 20261019_plugin_listing_idx
+Revises: 20261019_plugin_presence_idx
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_plugin_listing_idx'
+down_revision = '20261019_plugin_presence_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' not in inspector.get_table_names():
+        print("WARNING: plugin_sessions does not exist. Skipping listing index.")
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_sessions")}
+
+    # Admin listing: ORDER BY start_time DESC, id DESC (keyset pagination)
+    if 'ix_plugin_sessions_start_time' not in indexes:
+        op.create_index('ix_plugin_sessions_start_time', 'plugin_sessions', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_sessions")}
+
+    if 'ix_plugin_sessions_start_time' in indexes:
+        op.drop_index('ix_plugin_sessions_start_time', table_name='plugin_sessions')
@@ -0,0 +1,49 @@
+"""add presence indexes to plugin_sessions
+
+Revision ID: 20261019_plugin_presence_idx
+Revises: 20260213_add_slug_to_orgs
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_plugin_presence_idx'
+down_revision = '20260213_add_slug_to_orgs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' not in inspector.get_table_names():
+        print("WARNING: plugin_sessions does not exist. Skipping presence indexes.")
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_sessions")}
+
+    # 1. Session healing / online status: (user_email, machine_id, last_heartbeat)
+    if 'ix_plugin_sessions_presence' not in indexes:
+        op.create_index('ix_plugin_sessions_presence', 'plugin_sessions', ['user_email', 'machine_id', 'last_heartbeat'], unique=False)
+
+    # 2. Stale session reaper: WHERE is_active AND last_heartbeat < cutoff
+    if 'ix_plugin_sessions_active_heartbeat' not in indexes:
+        op.create_index('ix_plugin_sessions_active_heartbeat', 'plugin_sessions', ['is_active', 'last_heartbeat'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sessions' not in inspector.get_table_names():
+        return
+
+    indexes = {i["name"] for i in inspector.get_indexes("plugin_sessions")}
+
+    if 'ix_plugin_sessions_active_heartbeat' in indexes:
+        op.drop_index('ix_plugin_sessions_active_heartbeat', table_name='plugin_sessions')
+
+    if 'ix_plugin_sessions_presence' in indexes:
+        op.drop_index('ix_plugin_sessions_presence', table_name='plugin_sessions')
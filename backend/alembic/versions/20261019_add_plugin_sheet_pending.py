@@ -0,0 +1,44 @@
+"""add plugin_sheet_pending_updates (sheet edits awaiting Revit confirmation)
+
+Revision ID: 20261019_sheet_pending
+Revises: 20261019_acc_jobs
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_sheet_pending'
+down_revision = '20261019_acc_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'plugin_sheet_sessions' not in tables:
+        print("WARNING: plugin_sheet_sessions does not exist. Skipping plugin_sheet_pending_updates.")
+        return
+
+    if 'plugin_sheet_pending_updates' not in tables:
+        op.create_table(
+            'plugin_sheet_pending_updates',
+            sa.Column('command_id', sa.Integer(), primary_key=True),
+            sa.Column('session_id', sa.String(), sa.ForeignKey('plugin_sheet_sessions.id', ondelete='CASCADE'), nullable=True),
+            sa.Column('updates_json', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_plugin_sheet_pending_updates_session_id', 'plugin_sheet_pending_updates', ['session_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sheet_pending_updates' in inspector.get_table_names():
+        op.drop_index('ix_plugin_sheet_pending_updates_session_id', table_name='plugin_sheet_pending_updates')
+        op.drop_table('plugin_sheet_pending_updates')
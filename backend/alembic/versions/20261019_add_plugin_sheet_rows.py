@@ -0,0 +1,50 @@
+"""add plugin_sheet_rows for sheet manager paging and diffed apply
+
+Revision ID: 20261019_sheet_rows
+Revises: 20261019_cloud_listing_idx
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '20261019_sheet_rows'
+down_revision = '20261019_cloud_listing_idx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = inspector.get_table_names()
+
+    if 'plugin_sheet_sessions' not in tables:
+        print("WARNING: plugin_sheet_sessions does not exist. Skipping plugin_sheet_rows.")
+        return
+
+    if 'plugin_sheet_rows' not in tables:
+        op.create_table(
+            'plugin_sheet_rows',
+            sa.Column('session_id', sa.String(), sa.ForeignKey('plugin_sheet_sessions.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('sheet_id', sa.String(), primary_key=True),
+            sa.Column('position', sa.Integer(), nullable=True),
+            sa.Column('number', sa.String(), nullable=True),
+            sa.Column('name', sa.String(), nullable=True),
+            sa.Column('data_json', sa.JSON(), nullable=True),
+        )
+        op.create_index('ix_plugin_sheet_rows_number', 'plugin_sheet_rows', ['session_id', 'number'], unique=False)
+        op.create_index('ix_plugin_sheet_rows_name', 'plugin_sheet_rows', ['session_id', 'name'], unique=False)
+        op.create_index('ix_plugin_sheet_rows_position', 'plugin_sheet_rows', ['session_id', 'position'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if 'plugin_sheet_rows' in inspector.get_table_names():
+        op.drop_index('ix_plugin_sheet_rows_position', table_name='plugin_sheet_rows')
+        op.drop_index('ix_plugin_sheet_rows_name', table_name='plugin_sheet_rows')
+        op.drop_index('ix_plugin_sheet_rows_number', table_name='plugin_sheet_rows')
+        op.drop_table('plugin_sheet_rows')
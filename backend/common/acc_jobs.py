@@ -0,0 +1,256 @@
+import os
+import time
+import socket
+import datetime
+import threading
+from typing import Callable, Dict, Optional
+
+# Jobs run concurrently per process (each job has its own inner pool: copy workers / upload parts)
+ACC_JOB_WORKERS = int(os.getenv("ACC_JOB_WORKERS", "2"))
+ACC_JOB_POLL_SECONDS = float(os.getenv("ACC_JOB_POLL_SECONDS", "2"))
+# A running job without a heartbeat for this long belongs to a dead worker
+ACC_JOB_STALE_SECONDS = int(os.getenv("ACC_JOB_STALE_SECONDS", "600"))
+# Running jobs heartbeat on a timer, independent of progress callbacks (a long part may report nothing)
+ACC_JOB_HEARTBEAT_SECONDS = float(os.getenv("ACC_JOB_HEARTBEAT_SECONDS", str(max(1, ACC_JOB_STALE_SECONDS // 4))))
+# Finished jobs (and their spool files) are kept this long for status polling / resume
+ACC_JOB_RETENTION_HOURS = float(os.getenv("ACC_JOB_RETENTION_HOURS", "24"))
+ACC_JOB_CLEANUP_SECONDS = int(os.getenv("ACC_JOB_CLEANUP_SECONDS", "900"))
+# Kinds that can safely be re-run after a crash (uploads resume from their part state)
+RESUMABLE_KINDS = ["upload"]
+
+
+class AccJobContext:
+    """Handed to a job handler: progress reporting (persisted, throttled) and cancellation."""
+
+    def __init__(self, job_id: str, min_interval: float = 1.0):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last = 0.0
+        self._cancel_callbacks = []
+        self.cancelled = False
+        self.last_progress: Dict = {}
+
+    def on_cancel(self, callback: Callable):
+        self._cancel_callbacks.append(callback)
+
+    def progress(self, progress: Dict):
+        from .database import update_acc_job_progress
+
+        self.last_progress = progress
+        now = time.monotonic()
+        if now - self._last < self.min_interval:
+            return
+        self._last = now
+        if update_acc_job_progress(self.job_id, progress):
+            self._cancel()
+
+    def heartbeat(self):
+        """Keeps the job alive for recover_stale_acc_jobs; also picks up cancel requests."""
+        from .database import touch_acc_job
+
+        if touch_acc_job(self.job_id):
+            self._cancel()
+
+    def _cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        for callback in self._cancel_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[ACC JOBS] Cancel callback error: {e}")
+
+
+class AccJobWorker:
+    """
+    Claims jobs from labs_acc_jobs (any process can create them) and runs the handler registered
+    for their kind: handler(job, ctx) -> (status, result). Also requeues jobs of crashed workers and
+    purges finished jobs together with their spool files.
+    """
+
+    def __init__(self, workers: int = ACC_JOB_WORKERS, poll_seconds: float = ACC_JOB_POLL_SECONDS,
+                 spool_dir: str = "tmp"):
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.spool_dir = spool_dir
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers: Dict[str, Callable] = {}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+        self._cleaner = None
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_cleanup: Optional[Dict] = None
+
+    def register(self, kind: str, handler: Callable):
+        self.handlers[kind] = handler
+
+    def wake(self):
+        """New job queued in this process: claim it now instead of at the next poll."""
+        self._wake.set()
+
+    # --- Execution ---
+
+    def run_job(self, job: Dict):
+        from .database import finish_acc_job
+
+        handler = self.handlers.get(job["kind"])
+        if not handler:
+            finish_acc_job(job["id"], "error", error=f"No handler for job kind '{job['kind']}'")
+            return
+        ctx = AccJobContext(job["id"])
+        with self._lock:
+            self.running += 1
+        started = time.perf_counter()
+        beating = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(ctx, beating), daemon=True)
+        heartbeat.start()
+        try:
+            status, result = handler(job, ctx)
+            if ctx.cancelled and status in ("done", "partial"):
+                status = "cancelled"
+            finish_acc_job(job["id"], status, result=result, progress=ctx.last_progress or None)
+            with self._lock:
+                self.completed += 1
+            print(f"[ACC JOBS] {job['kind']} {job['id'][:8]} -> {status} in {round(time.perf_counter() - started, 1)}s")
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            finish_acc_job(job["id"], "error", error=str(e), progress=ctx.last_progress or None)
+            print(f"[ACC JOBS] {job['kind']} {job['id'][:8]} failed: {e}")
+        finally:
+            beating.set()
+            heartbeat.join()
+            with self._lock:
+                self.running -= 1
+
+    @staticmethod
+    def _heartbeat_loop(ctx: AccJobContext, done: threading.Event):
+        while not done.wait(ACC_JOB_HEARTBEAT_SECONDS):
+            try:
+                ctx.heartbeat()
+            except Exception as e:
+                print(f"[ACC JOBS] Heartbeat error: {e}")
+
+    def run_pending(self, max_jobs: int = None) -> int:
+        """Claims and runs pending jobs in the calling thread. Returns the number run."""
+        from .database import claim_next_acc_job
+
+        count = 0
+        while not self._stop.is_set() and (max_jobs is None or count < max_jobs):
+            job = claim_next_acc_job(self.worker_id, list(self.handlers))
+            if not job:
+                break
+            self.run_job(job)
+            count += 1
+        return count
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"[ACC JOBS] Worker Error: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    # --- Maintenance ---
+
+    def cleanup(self) -> Dict:
+        from .database import recover_stale_acc_jobs, purge_finished_acc_jobs, get_active_acc_job_ids
+
+        recovered = recover_stale_acc_jobs(datetime.timedelta(seconds=ACC_JOB_STALE_SECONDS), RESUMABLE_KINDS)
+        retention = datetime.timedelta(hours=ACC_JOB_RETENTION_HOURS)
+        purged = purge_finished_acc_jobs(retention)
+        removed = 0
+        for params in purged:
+            removed += self._remove_spool(params.get("temp_path"))
+
+        # Orphan spool files (job row gone or never created)
+        if os.path.isdir(self.spool_dir):
+            active = get_active_acc_job_ids()
+            cutoff = time.time() - retention.total_seconds()
+            for name in os.listdir(self.spool_dir):
+                if not name.startswith("tmp_"):
+                    continue
+                job_id = name[4:40] # tmp_{uuid}_{filename}
+                path = os.path.join(self.spool_dir, name)
+                try:
+                    if job_id not in active and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+
+        self.last_cleanup = {
+            "ran_at": datetime.datetime.now().isoformat(),
+            "recovered": recovered,
+            "purged_jobs": len(purged),
+            "removed_files": removed
+        }
+        if recovered or purged or removed:
+            print(f"[ACC JOBS] Cleanup: {recovered} stale recovered, {len(purged)} jobs purged, {removed} spool files removed")
+        return self.last_cleanup
+
+    @staticmethod
+    def _remove_spool(temp_path: Optional[str]) -> int:
+        removed = 0
+        if not temp_path:
+            return 0
+        for path in (temp_path, f"{temp_path}.upload.json", f"{temp_path}.upload.json.storage"):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _cleanup_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"[ACC JOBS] Cleanup Error: {e}")
+            self._stop.wait(ACC_JOB_CLEANUP_SECONDS)
+
+    # --- Lifecycle ---
+
+    def start(self):
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"acc-jobs-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        self._cleaner = threading.Thread(target=self._cleanup_loop, name="acc-jobs-cleanup", daemon=True)
+        self._cleaner.start()
+        print(f"[ACC JOBS] Worker {self.worker_id} started ({self.workers} threads, kinds: {', '.join(self.handlers)})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict:
+        from .database import get_acc_job_counts
+
+        return {
+            "worker_id": self.worker_id,
+            "threads": self.workers,
+            "alive": sum(1 for t in self._threads if t.is_alive()),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "jobs": get_acc_job_counts(),
+            "last_cleanup": self.last_cleanup
+        }
+
+# Singleton Instance
+acc_job_worker = AccJobWorker()
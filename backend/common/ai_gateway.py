@@ -0,0 +1,310 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+# Response cache
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+# Upstream concurrency: calls in flight, callers allowed to wait, max wait
+AI_MAX_CONCURRENT = int(os.getenv("AI_MAX_CONCURRENT", "4"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "32"))
+AI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", "10"))
+# Per-user token bucket
+AI_USER_RATE_PER_MINUTE = float(os.getenv("AI_USER_RATE_PER_MINUTE", "20"))
+AI_USER_BURST = int(os.getenv("AI_USER_BURST", "5"))
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, strip accents/punctuation, collapse whitespace ("¡Acotá  ejes!" -> "acota ejes")."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class ResponseCache:
+    """LRU + TTL cache of model answers keyed by the normalized prompt (and context)."""
+
+    def __init__(self, ttl_seconds: int = AI_CACHE_TTL_SECONDS, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(message: str, context: str = "", user_email: str = "", routine_ids: Tuple = ()) -> str:
+        # The answer depends on everything sent to the model: the user's own routines are part of it
+        routines = ",".join(str(r) for r in routine_ids)
+        raw = f"{normalize_prompt(message)}\x00{normalize_prompt(context)}\x00{(user_email or '').strip().lower()}\x00{routines}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class IntentClassifier:
+    """
+    Answers short, unambiguous action requests ("acotar ejes", "auditar muros") locally.
+    Only fires when the message is short, reads as a command (the phrase opens the message, after an
+    optional polite lead-in), has no negation or question and matches exactly one action;
+    everything else ("no quiero auditar muros", "¿qué hace auditar muros?") goes to the model.
+    """
+
+    # Lead-ins allowed before the action phrase (normalized, longest first)
+    LEAD_INS = [
+        "por favor", "porfa", "please", "puedes", "podrias", "quiero", "necesito", "ayudame a",
+        "vamos a", "hay que", "can you", "could you", "i want to", "ok", "hola", "hey"
+    ]
+    # Any of these tokens turns the message into something the model has to read
+    NEGATIONS = {"no", "nunca", "jamas", "ni", "tampoco", "not", "never", "dont", "cancel", "cancelar", "deshacer", "undo"}
+    QUESTION_WORDS = {"que", "como", "cuando", "donde", "cual", "cuales", "porque", "para", "what", "how", "why", "when", "where", "which", "does", "is"}
+
+    # action -> (phrases, reply). Phrases are matched on the normalized prompt.
+    INTENTS = {
+        "AUDIT_WALLS": (
+            ["auditar muros", "auditar los muros", "audita muros", "audit walls", "muros duplicados", "muros superpuestos"],
+            "Entendido, voy a auditar los muros."
+        ),
+        "AUTO_DIMENSION": (
+            ["acotar ejes", "acotar los ejes", "acota ejes", "acotar grillas", "dimensionar ejes", "auto dimension"],
+            "Entendido, voy a acotar los ejes de la vista actual."
+        ),
+        "GENERATE_SHOP_DRAWINGS": (
+            ["planos de taller", "shop drawings", "generar despieces"],
+            "Entendido, voy a preparar los planos de taller de los elementos seleccionados."
+        ),
+        "GENERATE_MEP": (
+            ["generar mep", "lineas a tuberias", "lineas a ductos", "convertir lineas en tuberias", "convertir lineas en ductos"],
+            "Entendido, voy a convertir las líneas seleccionadas en tuberías/ductos."
+        ),
+        "COUNT_ELEMENTS": (
+            ["contar elementos", "cuenta elementos", "count elements", "cuantos elementos"],
+            "Entendido, voy a contar los elementos."
+        ),
+        "CREATE_SHEET_LIST": (
+            ["lista de planos", "lista de laminas", "tabla de planos", "sheet list"],
+            "Entendido, voy a crear la tabla de planificación de planos."
+        ),
+    }
+
+    def __init__(self, max_words: int = 8):
+        self.max_words = max_words
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, message: str) -> Optional[Dict]:
+        norm = normalize_prompt(message)
+        words = norm.split()
+        if (not norm or len(words) > self.max_words or "?" in message or "¿" in message
+                or self.NEGATIONS.intersection(words) or " don t " in f" {norm} "):
+            self.misses += 1
+            return None
+        lead_stripped = True
+        while lead_stripped:
+            lead_stripped = False
+            for lead in self.LEAD_INS:
+                if norm.startswith(lead + " "):
+                    norm = norm[len(lead) + 1:]
+                    lead_stripped = True
+                    break
+        if norm.split()[0] in self.QUESTION_WORDS:
+            self.misses += 1
+            return None
+        padded = f"{norm} "
+        matches = [action for action, (phrases, _) in self.INTENTS.items()
+                   if any(padded.startswith(f"{p} ") for p in phrases)]
+        if len(matches) != 1:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"text": self.INTENTS[matches[0]][1], "action": matches[0]}
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class UserRateLimiter:
+    """Token bucket per user (rate_per_minute refill, 'burst' capacity)."""
+
+    def __init__(self, rate_per_minute: float = AI_USER_RATE_PER_MINUTE, burst: int = AI_USER_BURST, max_users: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict() # user -> (tokens, updated)
+        self.rejected = 0
+
+    def check(self, user: str):
+        """Consumes one token or raises RateLimitExceeded(retry_after)."""
+        if self.rate <= 0:
+            return
+        user = (user or "anonymous").lower()
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(user, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            if tokens < 1.0:
+                self._buckets[user] = (tokens, now)
+                self.rejected += 1
+                raise RateLimitExceeded((1.0 - tokens) / self.rate)
+            self._buckets[user] = (tokens - 1.0, now)
+            self._buckets.move_to_end(user)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ConcurrencyGovernor:
+    """
+    Bounds upstream model calls in flight. Extra callers wait (up to max_queue of them, at most
+    queue_timeout seconds); beyond that QueueFull is raised so the endpoint degrades to fallback.
+    """
+
+    def __init__(self, max_concurrent: int = AI_MAX_CONCURRENT, max_queue: int = AI_MAX_QUEUE,
+                 queue_timeout: float = AI_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._sem = None # Created lazily inside the running event loop
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.calls = 0
+        self._waits = deque(maxlen=1000) # seconds spent queued (recent calls)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+        return self._sem
+
+    async def run(self, coro_fn):
+        sem = self._semaphore()
+        # waiting/in_flight are updated before any await, so this is exact within the loop
+        if self.waiting + self.in_flight >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise QueueFull()
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise QueueFull()
+        finally:
+            self.waiting -= 1
+        self._waits.append(time.perf_counter() - started)
+        self.in_flight += 1
+        self.calls += 1
+        try:
+            return await coro_fn()
+        finally:
+            self.in_flight -= 1
+            sem.release()
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "queue_wait_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)}
+        }
+
+
+class AIGatewayMetrics:
+    """Where chat answers came from (cache / classifier / model / fallback / rate_limited)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sources = {}
+
+    def record(self, source: str):
+        with self._lock:
+            self.sources[source] = self.sources.get(source, 0) + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.sources)
+
+# Singleton Instances
+ai_response_cache = ResponseCache()
+ai_intent_classifier = IntentClassifier()
+ai_rate_limiter = UserRateLimiter()
+ai_governor = ConcurrencyGovernor()
+ai_gateway_metrics = AIGatewayMetrics()
+
+
+def ai_gateway_stats() -> Dict:
+    return {
+        "sources": ai_gateway_metrics.snapshot(),
+        "cache": ai_response_cache.stats(),
+        "classifier": ai_intent_classifier.stats(),
+        "concurrency": ai_governor.stats(),
+        "rate_limit": {
+            "per_minute": ai_rate_limiter.rate * 60,
+            "burst": ai_rate_limiter.burst,
+            "rejected": ai_rate_limiter.rejected
+        }
+    }
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import heapq
+import datetime
+import tempfile
+import threading
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows dev boxes: in-process lock only
+
+# Append-only usage log (one JSON object per line)
+USAGE_LOG_FILE = os.getenv("AI_USAGE_LOG_FILE", "ai_usage_log.jsonl")
+# Counters snapshot (counters + byte offset of the log they cover), so restarts don't rescan the log
+USAGE_SNAPSHOT_FILE = os.getenv("AI_USAGE_SNAPSHOT_FILE", "ai_usage_counters.json")
+# Legacy whole-file JSON array, imported once (a marker next to the log records that it was)
+LEGACY_STATS_FILE = "ai_stats_log.json"
+# fsync after this many appends or this many seconds, whichever comes first
+FSYNC_EVERY = int(os.getenv("AI_USAGE_FSYNC_EVERY", "20"))
+FSYNC_INTERVAL_SECONDS = float(os.getenv("AI_USAGE_FSYNC_INTERVAL_SECONDS", "2"))
+SNAPSHOT_EVERY = int(os.getenv("AI_USAGE_SNAPSHOT_EVERY", "200"))
+# Days kept in the actions-per-day counter
+DAYS_KEPT = int(os.getenv("AI_USAGE_DAYS_KEPT", "90"))
+
+DEFAULT_ACTION = "Chat/Q&A"
+
+
+class AIUsageLog:
+    """
+    Append-only AI usage store with incrementally maintained counters.
+    - record(): one O_APPEND write of one line under flock (safe with several workers), fsync batched.
+    - stats(): ingests only the bytes appended since the last call (by any worker) and reads the counters.
+    """
+
+    def __init__(self, path: str = USAGE_LOG_FILE, snapshot_path: str = USAGE_SNAPSHOT_FILE):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._since_snapshot = 0
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.total = 0
+        self.users = {}
+        self.actions = {}
+        self.days = {} # { 'YYYY-MM-DD': { action: count } }
+        self.recent = deque(maxlen=10)
+
+    # --- Write path ---
+
+    def _open(self):
+        """Opens the log for appends (caller holds self._lock); the first open imports the legacy file."""
+        if self._fd is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._import_legacy(self._fd)
+        return self._fd
+
+    def record(self, user_email: str, action: str, message: str):
+        entry = {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "user": user_email or "Unknown",
+            "action": action if action else DEFAULT_ACTION,
+            "message_length": len(message or "")
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                fd = self._open()
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    os.write(fd, line)
+                finally:
+                    if fcntl:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                self._unsynced += 1
+                if self._unsynced >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL_SECONDS:
+                    os.fsync(fd)
+                    self._unsynced = 0
+                    self._last_sync = time.monotonic()
+        except Exception as e:
+            print(f"[AI USAGE] Log Error: {e}")
+
+    def flush(self):
+        with self._lock:
+            if self._fd is not None and self._unsynced:
+                os.fsync(self._fd)
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    # --- Counters ---
+
+    def _apply(self, entry: dict):
+        user = entry.get("user") or "Unknown"
+        action = entry.get("action") or DEFAULT_ACTION
+        day = (entry.get("timestamp") or "")[:10]
+        self.total += 1
+        self.users[user] = self.users.get(user, 0) + 1
+        self.actions[action] = self.actions.get(action, 0) + 1
+        if day:
+            per_day = self.days.setdefault(day, {})
+            per_day[action] = per_day.get(action, 0) + 1
+            if len(self.days) > DAYS_KEPT:
+                for old in sorted(self.days)[:-DAYS_KEPT]:
+                    del self.days[old]
+        self.recent.append(entry)
+
+    def _load(self):
+        """First use: open the log (imports the legacy JSON array), then restore the counters snapshot."""
+        self._loaded = True
+        try:
+            self._open()
+        except OSError as e:
+            print(f"[AI USAGE] Log Error: {e}")
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            if os.path.getsize(self.path) >= snap.get("offset", 0):
+                self.offset = snap["offset"]
+                self.total = snap["total"]
+                self.users = snap["users"]
+                self.actions = snap["actions"]
+                self.days = snap["days"]
+                self.recent = deque(snap.get("recent", []), maxlen=10)
+        except (OSError, ValueError, KeyError):
+            self._reset() # No / stale snapshot: rebuild from the log once
+
+    def _import_legacy(self, fd: int):
+        """
+        Appends the legacy entries once. Runs under the log's flock and is recorded with a marker file,
+        so it doesn't depend on which comes first (record or stats) nor on how many workers start together.
+        """
+        marker = self.path + ".legacy-imported"
+        if not os.path.exists(LEGACY_STATS_FILE) or os.path.exists(marker):
+            return
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(marker): # Another worker got there first
+                return
+            with open(LEGACY_STATS_FILE, "r") as f:
+                data = json.load(f)
+            lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in data)
+            os.write(fd, lines.encode("utf-8"))
+            os.fsync(fd)
+            with open(marker, "w") as f:
+                f.write(datetime.datetime.now().isoformat())
+            print(f"[AI USAGE] Imported {len(data)} entries from {LEGACY_STATS_FILE}")
+        except Exception as e:
+            print(f"[AI USAGE] Legacy import failed: {e}")
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _catch_up(self):
+        """Applies complete lines appended after self.offset (by this or any other worker)."""
+        if not self._loaded:
+            self._load()
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self.offset: # Log was rotated/truncated
+            self._reset()
+        if size == self.offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b"\n") + 1 # Ignore a partially written last line
+        for raw in chunk[:end].splitlines():
+            self._since_snapshot += 1
+            try:
+                self._apply(json.loads(raw))
+            except ValueError:
+                continue
+        self.offset += end
+        if self._since_snapshot >= SNAPSHOT_EVERY:
+            self._save_snapshot()
+
+    def _save_snapshot(self):
+        self._since_snapshot = 0
+        snap = {
+            "offset": self.offset,
+            "total": self.total,
+            "users": self.users,
+            "actions": self.actions,
+            "days": self.days,
+            "recent": list(self.recent)
+        }
+        try:
+            folder = os.path.dirname(self.snapshot_path) or "."
+            fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=".part")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.snapshot_path)
+        except Exception as e:
+            print(f"[AI USAGE] Snapshot Error: {e}")
+
+    def stats(self, top: int = 5, days: int = 14) -> dict:
+        with self._lock:
+            self._catch_up()
+            top_users = heapq.nlargest(top, self.users.items(), key=lambda x: x[1])
+            day_keys = sorted(self.days)[-days:]
+            return {
+                "total_requests": self.total,
+                "top_users": [{"email": k, "count": v} for k, v in top_users],
+                "actions": dict(self.actions),
+                "actions_by_day": [{"date": d, "actions": dict(self.days[d])} for d in day_keys],
+                "recent_activity": list(reversed(self.recent))
+            }
+
+# Singleton Instance
+ai_usage_log = AIUsageLog()
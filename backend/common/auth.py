@@ -1,7 +1,11 @@
 
 import os
 import jwt
+import time
+import hashlib
 import datetime
+import threading
+from collections import OrderedDict
 from datetime import timedelta
 from fastapi import Request, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
@@ -97,6 +101,127 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7 # Shortened for testing or as policy
 # OAuth2 Scheme for Swagger UI
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# -----------------------------------------------------------------------------
+# VERIFIED TOKEN CACHE
+# -----------------------------------------------------------------------------
+# RS256 verification is paid once per token, not once per request/dependency.
+
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("AO_VERIFIED_TOKEN_CACHE_SIZE", "10000"))
+
+
+class VerifiedTokenCache:
+    """
+    LRU of verified claims keyed by sha256(token) + audience (the raw token is never stored).
+    Entries expire at the token's 'exp'. revoke() drops a token and rejects it until its 'exp'
+    (per process). clear() after a key rotation.
+    """
+
+    def __init__(self, max_entries: int = VERIFIED_TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict() # (hash, audience) -> (exp, claims)
+        self._revoked: Dict[str, float] = {} # hash -> exp
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revoked_hits = 0
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _audience_key(audience: Any):
+        return tuple(audience) if isinstance(audience, (list, tuple, set)) else audience
+
+    def is_revoked(self, token_hash: str) -> bool:
+        with self._lock:
+            exp = self._revoked.get(token_hash)
+            if exp is None:
+                return False
+            if exp <= time.time():
+                del self._revoked[token_hash]
+                return False
+            self.revoked_hits += 1
+            return True
+
+    def get(self, token_hash: str, audience: Any) -> Optional[Dict[str, Any]]:
+        key = (token_hash, self._audience_key(audience))
+        with self._lock:
+            item = self._entries.get(key)
+            if item and item[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(item[1]) # Callers may mutate their copy
+            if item:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token_hash: str, audience: Any, claims: Dict[str, Any]):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        key = (token_hash, self._audience_key(audience))
+        with self._lock:
+            self._entries[key] = (float(exp), dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        """Forget a token and reject it until it expires (logout, session revocation)."""
+        if not token:
+            return
+        if token.startswith("Bearer "):
+            token = token.split(" ")[1]
+        token_hash = self._hash(token)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == token_hash]:
+                exp = exp or self._entries[key][0]
+                del self._entries[key]
+            if exp is None:
+                # Not cached: read 'exp' without verifying (it only bounds the denylist entry)
+                try:
+                    exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+                except Exception:
+                    exp = None
+            if not isinstance(exp, (int, float)):
+                return # Without 'exp' decode_token rejects it anyway
+            now = time.time()
+            if len(self._revoked) >= self.max_entries:
+                self._revoked = {h: e for h, e in self._revoked.items() if e > now}
+            self._revoked[token_hash] = float(exp)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "revoked": len(self._revoked),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+                "evictions": self.evictions,
+                "revoked_hits": self.revoked_hits
+            }
+
+# Singleton Instance
+verified_tokens = VerifiedTokenCache()
+
+def revoke_token(token: str):
+    """
+    Revocation hook: the token fails decode_token in this process until it expires.
+    Not shared across processes: elsewhere it stays valid until 'exp' (short-lived access tokens).
+    """
+    verified_tokens.revoke(token)
+
 # -----------------------------------------------------------------------------
 # CORE FUNCTIONS
 # -----------------------------------------------------------------------------
@@ -172,6 +297,14 @@ def decode_token(token: str, audience: Any = ["somosao", "ao-platform"]) -> Opti
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
 
+        token_hash = verified_tokens._hash(token)
+        if verified_tokens.is_revoked(token_hash):
+            print("⚠️ [AUTH] Token Revoked")
+            return None
+        cached = verified_tokens.get(token_hash, audience)
+        if cached is not None:
+            return cached
+
         # Ensure audience is a list for jwt.decode if multiple needed, 
         # or jwt library handles it if we pass "audience" parameter.
         # PyJWT supports 'audience' as string or list/iterable.
@@ -185,6 +318,7 @@ def decode_token(token: str, audience: Any = ["somosao", "ao-platform"]) -> Opti
             issuer="accounts.somosao.com",
             options={"require": ["exp", "iss", "aud", "sub"]}
         )
+        verified_tokens.put(token_hash, audience, payload)
         return payload
     except jwt.ExpiredSignatureError:
         print("⚠️ [AUTH] Token Expired")
@@ -0,0 +1,210 @@
+import os
+import io
+import gzip
+import json
+import base64
+import threading
+
+from anyio import to_thread
+from sqlalchemy.types import TypeDecorator, JSON
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Documents smaller than this are stored as plain JSON (not worth the CPU)
+COMPRESS_THRESHOLD_BYTES = int(os.getenv("JSON_COMPRESS_THRESHOLD_BYTES", str(64 * 1024)))
+# 'zstd' (if zstandard is installed) or 'gzip'
+STORAGE_CODEC = os.getenv("JSON_STORAGE_CODEC", "zstd" if zstandard else "gzip")
+# Decompression bomb guard for request bodies (a full Revit dump is a few tens of MB of JSON)
+MAX_DECODED_BODY_BYTES = int(os.getenv("PLUGIN_MAX_DECODED_BODY_BYTES", str(64 * 1024 * 1024)))
+
+ENVELOPE_KEY = "__codec__"
+
+
+class CompressionStats:
+    """Counters for stored documents and decoded request bodies (exposed via /api/plugin/compression/stats)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.storage = {"documents": 0, "compressed": 0, "raw_bytes": 0, "stored_bytes": 0}
+        self.requests = {"decoded": 0, "wire_bytes": 0, "decoded_bytes": 0, "rejected": 0}
+
+    def record_storage(self, raw_size: int, stored_size: int, compressed: bool):
+        with self._lock:
+            self.storage["documents"] += 1
+            self.storage["raw_bytes"] += raw_size
+            self.storage["stored_bytes"] += stored_size
+            if compressed:
+                self.storage["compressed"] += 1
+
+    def record_request(self, wire_size: int, decoded_size: int):
+        with self._lock:
+            self.requests["decoded"] += 1
+            self.requests["wire_bytes"] += wire_size
+            self.requests["decoded_bytes"] += decoded_size
+
+    def record_rejected(self):
+        with self._lock:
+            self.requests["rejected"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            storage = dict(self.storage)
+            requests = dict(self.requests)
+        storage["bytes_saved"] = storage["raw_bytes"] - storage["stored_bytes"]
+        requests["bytes_saved"] = requests["decoded_bytes"] - requests["wire_bytes"]
+        return {
+            "codec": STORAGE_CODEC,
+            "threshold_bytes": COMPRESS_THRESHOLD_BYTES,
+            "storage": storage,
+            "requests": requests
+        }
+
+compression_stats = CompressionStats()
+
+
+# --- Byte codecs ---
+
+def compress_bytes(raw: bytes, codec: str = None) -> bytes:
+    codec = codec or STORAGE_CODEC
+    if codec == "zstd":
+        if not zstandard:
+            raise ValueError("zstd codec requested but 'zstandard' is not installed")
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    if codec == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    raise ValueError(f"Unknown codec '{codec}'")
+
+def decompress_bytes(data: bytes, codec: str, max_size: int = None) -> bytes:
+    if codec == "zstd":
+        if not zstandard:
+            raise ValueError("zstd payload received but 'zstandard' is not installed")
+        # max_output_size only applies when the frame has no content size: stream instead
+        out = bytearray()
+        reader = zstandard.ZstdDecompressor().stream_reader(data)
+        while True:
+            chunk = reader.read(1024 * 1024)
+            if not chunk:
+                break
+            out += chunk
+            if max_size and len(out) > max_size:
+                raise ValueError("Decoded payload too large")
+        return bytes(out)
+    if codec == "gzip":
+        d = gzip.GzipFile(fileobj=io.BytesIO(data))
+        out = d.read(max_size + 1) if max_size else d.read()
+        if max_size and len(out) > max_size:
+            raise ValueError("Decoded payload too large")
+        return out
+    raise ValueError(f"Unknown codec '{codec}'")
+
+
+# --- Stored JSON documents ---
+
+def encode_document(value):
+    """Python value -> plain value, or { __codec__, size, data(b64) } envelope above the threshold."""
+    if value is None:
+        return None
+    raw = json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+    if len(raw) < COMPRESS_THRESHOLD_BYTES:
+        compression_stats.record_storage(len(raw), len(raw), False)
+        return value
+    packed = base64.b64encode(compress_bytes(raw)).decode("ascii")
+    if len(packed) >= len(raw):
+        compression_stats.record_storage(len(raw), len(raw), False)
+        return value
+    compression_stats.record_storage(len(raw), len(packed), True)
+    return {ENVELOPE_KEY: STORAGE_CODEC, "size": len(raw), "data": packed}
+
+def decode_document(value):
+    """Inverse of encode_document. Plain (legacy / small) values pass through."""
+    if isinstance(value, dict) and ENVELOPE_KEY in value and "data" in value:
+        raw = decompress_bytes(base64.b64decode(value["data"]), value[ENVELOPE_KEY])
+        return json.loads(raw.decode("utf-8"))
+    return value
+
+
+class CompressedJSON(TypeDecorator):
+    """
+    JSON column that compresses large documents transparently.
+    Still a JSON column in the DB (no type migration): big values are stored as a small
+    { "__codec__": "zstd"|"gzip", "size", "data": base64 } envelope; existing rows read as before.
+    """
+    impl = JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_document(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_document(value)
+
+
+# --- Request bodies ---
+
+class DecompressRequestMiddleware:
+    """
+    ASGI middleware: decodes 'Content-Encoding: gzip|zstd' request bodies for the given path prefixes,
+    so routers keep receiving plain JSON. Pure ASGI (no BaseHTTPMiddleware) to avoid buffering twice.
+    Decompression runs in a worker thread so a large body doesn't stall the event loop.
+    """
+
+    CODECS = {"gzip": "gzip", "x-gzip": "gzip", "zstd": "zstd"}
+
+    def __init__(self, app, prefixes=("/api/plugin",), max_size: int = MAX_DECODED_BODY_BYTES):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+
+        headers = list(scope.get("headers") or [])
+        encoding = None
+        for k, v in headers:
+            if k == b"content-encoding":
+                encoding = v.decode("latin-1").strip().lower()
+                break
+        codec = self.CODECS.get(encoding) if encoding else None
+        if not codec:
+            return await self.app(scope, receive, send)
+
+        body = bytearray()
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        try:
+            if len(body) > self.max_size:
+                raise ValueError("Compressed payload too large")
+            decoded = await to_thread.run_sync(decompress_bytes, bytes(body), codec, self.max_size)
+        except Exception as e:
+            compression_stats.record_rejected()
+            print(f"[COMPRESSION] Rejected {codec} body on {scope.get('path')}: {e}")
+            await send({"type": "http.response.start", "status": 400, "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": json.dumps({"detail": f"Invalid {codec} body"}).encode()})
+            return
+
+        compression_stats.record_request(len(body), len(decoded))
+
+        new_headers = [(k, v) for k, v in headers if k not in (b"content-encoding", b"content-length")]
+        new_headers.append((b"content-length", str(len(decoded)).encode()))
+        scope = dict(scope)
+        scope["headers"] = new_headers
+
+        sent = False
+        async def receive_decoded():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": decoded, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_decoded, send)
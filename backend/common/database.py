@@ -1,14 +1,21 @@
 from __future__ import annotations
 import os
+import time
 import datetime
 import json
 import uuid
 import types
+import base64
+import hashlib
+import secrets
+import threading
 from typing import List, Optional
 from sqlalchemy.orm import Session, sessionmaker, joinedload
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, case
 from sqlalchemy.sql import func
 from . import models
+from .plugin_presence import plugin_presence
+from .plugin_bootstrap import plugin_bootstrap
 from .models import Base, Project as DBProject, Collaborator as DBCollaborator, TimelineEvent, ContactSubmission, AppUser, ExpenseColumn, ExpenseCard, PluginSheetSession, DailyTeam, DailyProject, DailyColumn, DailyTask, DailyComment, DailyMessage
 from sqlalchemy.orm.attributes import flag_modified
 
@@ -675,7 +682,11 @@ def save_user(user: User):
     try:
         # Check if exists
         existing = db.query(models.AppUser).filter(models.AppUser.email == user.email).first()
+        revoke_devices = False
         if existing:
+            # New password or account locked: remembered Revit machines must sign in again
+            revoke_devices = (existing.hashed_password != user.hashed_password
+                              or (existing.is_active and not user.is_active))
             existing.full_name = user.name
             existing.role = user.role
             existing.is_active = user.is_active
@@ -692,6 +703,9 @@ def save_user(user: User):
             )
             db.add(new_u)
         db.commit()
+        plugin_bootstrap.invalidate_user(user.email)
+        if revoke_devices:
+            revoke_user_device_tokens(user.email)
     finally:
         db.close()
 
@@ -711,11 +725,12 @@ def delete_user(user_id: str):
         if u:
             db.delete(u)
             db.commit()
+        plugin_bootstrap.invalidate_user(user_id)
     finally:
         db.close()
         
 def update_user_permissions(user_id: str, permissions: dict):
-    db = SessionLocal()
+    db = SessionCore() # AppUser lives in the Core DB (see get_user_by_email)
     try:
         # User ID here might be email or ID. Let's try to match ID first, then Email.
         # But wait, my ID generation strategy was str(abs(hash(email))) or timestamp.
@@ -730,6 +745,7 @@ def update_user_permissions(user_id: str, permissions: dict):
             u.permissions = permissions
             flag_modified(u, "permissions")
             db.commit()
+            plugin_bootstrap.invalidate_user(user_id)
             return True
         return False
     except Exception as e:
@@ -742,7 +758,7 @@ def update_user_assigned_projects(user_email: str, project_ids: List[str]) -> bo
     """
     Updates the list of project IDs assigned to a user.
     """
-    db = SessionLocal()
+    db = SessionCore()
     try:
         # AppUser PK is email
         u = db.query(models.AppUser).filter(models.AppUser.email == user_email).first()
@@ -1211,6 +1227,134 @@ def get_plugin_sessions():
     finally:
         db.close()
 
+def _encode_session_cursor(start_time, session_id):
+    raw = f"{start_time.isoformat() if start_time else ''}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_session_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        ts, sid = raw.split("|", 1)
+        return (datetime.datetime.fromisoformat(ts) if ts else None), sid
+    except Exception:
+        return None, None
+
+# Listing counters (total / active / users / machines) per filter set, reused across pages for this long
+PLUGIN_SESSION_COUNTS_TTL_SECONDS = float(os.getenv("PLUGIN_SESSION_COUNTS_TTL_SECONDS", "60"))
+_session_counts_lock = threading.Lock()
+_session_counts = {} # filter key -> (expires, (total, active, users, machines))
+
+def _plugin_session_counts(db, key, filters):
+    """Aggregate counters for a filter set, computed once per TTL instead of on every page."""
+    now = time.monotonic()
+    with _session_counts_lock:
+        item = _session_counts.get(key)
+        if item and item[0] > now:
+            return item[1]
+    S = models.PluginSession
+    total, active, users, machines = db.query(
+        func.count(S.id),
+        func.coalesce(func.sum(case((S.is_active == True, 1), else_=0)), 0),
+        func.count(func.distinct(S.user_email)),
+        func.count(func.distinct(S.machine_id))
+    ).filter(*filters).one()
+    counts = (total or 0, int(active or 0), users or 0, machines or 0)
+    with _session_counts_lock:
+        if len(_session_counts) >= 256:
+            _session_counts.clear()
+        _session_counts[key] = (now + PLUGIN_SESSION_COUNTS_TTL_SECONDS, counts)
+    return counts
+
+def list_plugin_sessions_page(user: str = None, machine: str = None, version: str = None,
+                              date_from: datetime.date = None, date_to: datetime.date = None,
+                              active_only: bool = False, cursor: str = None, limit: int = 50):
+    """
+    Keyset-paginated admin listing of plugin sessions (newest first).
+    Filters run in SQL. Counts come from one aggregate query cached per filter set
+    (PLUGIN_SESSION_COUNTS_TTL_SECONDS), so paging doesn't recount; 'online' comes from plugin_presence.
+    Returns { sessions: [...], next_cursor, counts: { total, active, online, users, machines } }.
+    """
+    limit = max(1, min(int(limit or 50), 500))
+    db = SessionPlugin()
+    try:
+        S = models.PluginSession
+        filters = []
+        if user:
+            filters.append(func.lower(S.user_email) == user.lower().strip())
+        if machine:
+            filters.append(S.machine_id == machine)
+        if version:
+            # Matches either Revit or plugin version
+            filters.append((S.revit_version == version) | (S.plugin_version == version))
+        if date_from:
+            filters.append(S.start_time >= datetime.datetime.combine(date_from, datetime.time.min))
+        if date_to:
+            filters.append(S.start_time <= datetime.datetime.combine(date_to, datetime.time.max))
+        if active_only:
+            filters.append(S.is_active == True)
+
+        # 1. Counts (cached per filter set)
+        key = ((user or "").lower().strip(), machine, version, date_from, date_to, bool(active_only))
+        total, active, users, machines = _plugin_session_counts(db, key, filters)
+
+        # 2. Page (keyset on start_time DESC, id DESC)
+        q = db.query(
+            S.id, S.user_email, S.machine_id, S.revit_version, S.plugin_version,
+            S.ip_address, S.start_time, S.last_heartbeat, S.is_active
+        ).filter(*filters)
+
+        if cursor:
+            c_time, c_id = _decode_session_cursor(cursor)
+            if c_id is not None:
+                if c_time is not None:
+                    q = q.filter((S.start_time < c_time) | ((S.start_time == c_time) & (S.id < c_id)))
+                else:
+                    q = q.filter(S.id < c_id)
+
+        rows = q.order_by(S.start_time.desc(), S.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # Activity log count per session of this page only (ix_plugin_activities_session)
+        A = models.PluginActivity
+        logs = dict(db.query(A.session_id, func.count(A.id)).filter(
+            A.session_id.in_([r.id for r in rows])
+        ).group_by(A.session_id).all()) if rows else {}
+
+        sessions = [
+            {
+                "session_id": r.id,
+                "user_email": r.user_email,
+                "machine_id": r.machine_id,
+                "revit_version": r.revit_version,
+                "plugin_version": r.plugin_version,
+                "ip_address": r.ip_address,
+                "start_time": r.start_time.isoformat() if r.start_time else None,
+                "last_heartbeat": r.last_heartbeat.isoformat() if r.last_heartbeat else None,
+                "is_active": bool(r.is_active),
+                "is_online": plugin_presence.get(r.id) is not None,
+                "activity_count": logs.get(r.id, 0)
+            }
+            for r in rows
+        ]
+
+        return {
+            "sessions": sessions,
+            "next_cursor": _encode_session_cursor(rows[-1].start_time, rows[-1].id) if has_more and rows else None,
+            "counts": {
+                "total": total,
+                "active": active,
+                "users": users,
+                "machines": machines,
+                "online": len(plugin_presence.online())
+            }
+        }
+    except Exception as e:
+        print(f"Error listing plugin sessions: {e}")
+        return {"sessions": [], "next_cursor": None, "counts": {"total": 0, "active": 0, "users": 0, "machines": 0, "online": 0}}
+    finally:
+        db.close()
+
 def get_user_plugin_stats(email):
     db = SessionPlugin()
     try:
@@ -1260,6 +1404,7 @@ def start_revit_session(email, machine, version, ip, plugin_version="1.0.0"):
         )
         db.add(session)
         db.commit()
+        plugin_presence.touch(sid, email, machine, version, plugin_version, session.last_heartbeat)
         return sid
     except Exception as e:
         print(f"Error starting session: {e}")
@@ -1267,14 +1412,129 @@ def start_revit_session(email, machine, version, ip, plugin_version="1.0.0"):
     finally:
         db.close()
 
+# Device refresh tokens (plugin resume)
+PLUGIN_DEVICE_TOKEN_TTL_DAYS = int(os.getenv("PLUGIN_DEVICE_TOKEN_TTL_DAYS", "30"))
+# A prior session silent for longer than this is assumed to belong to a closed Revit and is reused
+PLUGIN_RESUME_REUSE_AFTER_SECONDS = int(os.getenv("PLUGIN_RESUME_REUSE_AFTER_SECONDS", "90"))
+
+def _hash_device_token(raw: str) -> str:
+    return hashlib.sha256((raw or "").encode("utf-8")).hexdigest()
+
+def issue_device_token(user_email: str, machine_id: str, session_id: str):
+    """New device token for (user, machine). Returns (raw_token, expires_at); only the hash is stored."""
+    db = SessionPlugin()
+    try:
+        raw = secrets.token_urlsafe(32)
+        now = datetime.datetime.now()
+        expires_at = now + datetime.timedelta(days=PLUGIN_DEVICE_TOKEN_TTL_DAYS)
+        db.add(models.PluginDeviceToken(
+            token_hash=_hash_device_token(raw), user_email=user_email, machine_id=machine_id,
+            session_id=session_id, created_at=now, last_used_at=now, expires_at=expires_at
+        ))
+        db.commit()
+        return raw, expires_at
+    finally:
+        db.close()
+
+def revoke_device_token(raw: str) -> bool:
+    db = SessionPlugin()
+    try:
+        n = db.query(models.PluginDeviceToken).filter(
+            models.PluginDeviceToken.token_hash == _hash_device_token(raw)
+        ).update({models.PluginDeviceToken.revoked: True}, synchronize_session=False)
+        db.commit()
+        return n > 0
+    finally:
+        db.close()
+
+def revoke_user_device_tokens(user_email: str) -> int:
+    """Revokes every device token of a user (password / email change, lock). Returns tokens revoked."""
+    if not user_email:
+        return 0
+    db = SessionPlugin()
+    try:
+        T = models.PluginDeviceToken
+        n = db.query(T).filter(
+            func.lower(T.user_email) == user_email.lower().strip(),
+            T.revoked.isnot(True)
+        ).update({T.revoked: True}, synchronize_session=False)
+        db.commit()
+        if n:
+            print(f"[PLUGIN AUTH] Revoked {n} device token(s) for {user_email}")
+        return n
+    finally:
+        db.close()
+
+def resume_plugin_session(raw: str, machine: str, version: str, ip: str, plugin_version: str = "1.0.0", user_active=None):
+    """
+    Validates a device token (single indexed lookup on token_hash) and returns
+    { user_email, session_id, resumed, expires_at } or None.
+    'user_active(email) -> bool' is checked before any session is opened: a locked user's token is
+    revoked and { user_email, locked: True } returned.
+    The token's previous PluginSession is reused when it's the same machine / Revit version and has
+    gone silent (its Revit was closed); otherwise a new session is started. Expiry slides on use.
+    """
+    db = SessionPlugin()
+    try:
+        now = datetime.datetime.now()
+        T = models.PluginDeviceToken
+        tok = db.query(T).filter(T.token_hash == _hash_device_token(raw)).first()
+        if not tok or tok.revoked or tok.expires_at < now:
+            return None
+        if tok.machine_id and machine and tok.machine_id != machine:
+            return None # Token copied to another machine
+        if user_active is not None and not user_active(tok.user_email):
+            tok.revoked = True
+            db.commit()
+            return {"user_email": tok.user_email, "locked": True}
+
+        session = None
+        if tok.session_id:
+            session = db.query(models.PluginSession).filter(models.PluginSession.id == tok.session_id).first()
+        silent_for = (now - session.last_heartbeat).total_seconds() if session and session.last_heartbeat else None
+        resumed = bool(
+            session and session.machine_id == machine and session.revit_version == version
+            and silent_for is not None and silent_for > PLUGIN_RESUME_REUSE_AFTER_SECONDS
+        )
+        if resumed:
+            session.is_active = True
+            session.last_heartbeat = now
+            session.plugin_version = plugin_version
+            session.ip_address = ip
+        else:
+            session = models.PluginSession(
+                id=str(uuid.uuid4()), user_email=tok.user_email, machine_id=machine, revit_version=version,
+                plugin_version=plugin_version, ip_address=ip, start_time=now, last_heartbeat=now, is_active=True
+            )
+            db.add(session)
+
+        tok.session_id = session.id
+        tok.last_used_at = now
+        tok.expires_at = now + datetime.timedelta(days=PLUGIN_DEVICE_TOKEN_TTL_DAYS)
+        db.commit()
+        plugin_presence.touch(session.id, tok.user_email, machine, version, plugin_version, now)
+        return {"user_email": tok.user_email, "session_id": session.id, "resumed": resumed, "expires_at": tok.expires_at}
+    except Exception as e:
+        print(f"Error resuming plugin session: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
 def heartbeat_session(session_id, ip):
     db = SessionPlugin()
     try:
-        session = db.query(models.PluginSession).filter(models.PluginSession.id == session_id).first()
+        # Ended sessions (logout, reaper) stay ended: the add-in gets "Invalid Session" and signs in again
+        session = db.query(models.PluginSession).filter(
+            models.PluginSession.id == session_id,
+            models.PluginSession.is_active == True
+        ).first()
         if session:
             session.last_heartbeat = datetime.datetime.now()
             # session.ip_address = ip # Update IP if changed?
             db.commit()
+            plugin_presence.touch(session.id, session.user_email, session.machine_id,
+                                  session.revit_version, session.plugin_version, session.last_heartbeat)
             return True
         return False
     except:
@@ -1289,6 +1549,7 @@ def end_revit_session(session_id):
         if session:
             session.is_active = False
             db.commit()
+        plugin_presence.remove(session_id)
     except:
         pass
     finally:
@@ -1326,16 +1587,6 @@ def get_user_plugin_stats(email):
     finally:
         db.close()
 
-def get_plugin_sessions():
-    db = SessionPlugin()
-    try:
-        return db.query(models.PluginSession).all()
-    except Exception as e:
-        print(f"Error getting sessions: {e}")
-        return []
-    finally:
-        db.close()
-
 def get_user_plugin_logs(email, start_date: datetime.date = None, end_date: datetime.date = None):
     db = SessionPlugin()
     try:
@@ -1858,13 +2109,23 @@ def get_latest_plugin_version():
 # ==========================================
 
 def save_cloud_session(session_id: str, data: dict, project_name: str = None, user_email: str = None, folder_id: str = None):
+    """
+    Wholesale write of the document (legacy path). Its inline rows become the source of truth:
+    stored element rows are dropped and 'elements_external' cleared, so nothing is counted twice.
+    """
     db = SessionPlugin()
     try:
         session = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        data = dict(data or {})
+        data.pop("elements_external", None)
         
         if session:
             # Update
+            db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == session_id).delete(synchronize_session=False)
             session.data_json = data
+            flag_modified(session, "data_json")
+            session.revision = (session.revision or 0) + 1
+            session.elements_external = False
             if project_name: session.project_name = project_name
             if user_email: session.user_email = user_email
             if folder_id: session.folder_id = folder_id
@@ -1876,7 +2137,8 @@ def save_cloud_session(session_id: str, data: dict, project_name: str = None, us
                 user_email=user_email or "unknown",
                 project_name=project_name or "Sin Nombre",
                 data_json=data,
-                folder_id=folder_id
+                folder_id=folder_id,
+                elements_external=False
             )
             db.add(new_s)
         
@@ -1888,42 +2150,482 @@ def save_cloud_session(session_id: str, data: dict, project_name: str = None, us
     finally:
         db.close()
 
-def get_cloud_session(session_id: str):
+def get_cloud_session(session_id: str, include_rows: bool = True):
+    """include_rows=False returns categories with live counts/headers only (rows are fetched per category)."""
     db = SessionPlugin()
     try:
         s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
         if s:
+            data = s.data_json or {}
+            if data.get("elements_external"):
+                # Element rows live in plugin_cloud_elements: rebuild the legacy document shape
+                data = dict(data)
+                if include_rows:
+                    data["data"] = _assemble_revit_data(db, s.id, data.get("data") or {})
+                else:
+                    data["data"] = _summarize_revit_data(db, s.id, data.get("data") or {})
+                data.pop("elements_external", None)
+            elif not include_rows:
+                data = dict(data)
+                meta, _ = _split_revit_data(data.get("data") or {})
+                data["data"] = meta
             return {
                 "session_id": s.id,
                 "project_name": s.project_name,
                 "user_email": s.user_email,
-                "data": s.data_json,
+                "data": data,
+                "revision": s.revision or 0,
                 "timestamp": s.timestamp.isoformat() if s.timestamp else ""
             }
         return None
     finally:
         db.close()
 
-def list_cloud_projects(email: str = None):
+# --- Element-level Delta Sync ---
+# data_json keeps the small parts (cards, groups, sheets, schedules, category headers).
+# categories[].rows are stored one row per element in plugin_cloud_elements, keyed by Revit Id,
+# and every change bumps PluginCloudSession.revision (optimistic concurrency).
+
+CLOUD_ELEMENT_CHUNK = 1000
+
+def _cloud_row_hash(row: dict) -> str:
+    raw = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _split_revit_data(revit_data: dict):
+    """
+    Splits a Revit dump into (meta, elements).
+    elements: [(element_id, category, row)]. Rows without 'Id' stay inline in meta.
+    """
+    meta = dict(revit_data or {})
+    elements = []
+    cats = meta.get("categories")
+    if isinstance(cats, list):
+        slim = []
+        for c in cats:
+            if not isinstance(c, dict):
+                slim.append(c)
+                continue
+            c2 = {k: v for k, v in c.items() if k != "rows"}
+            inline = []
+            for row in c.get("rows") or []:
+                if isinstance(row, dict) and row.get("Id") is not None:
+                    elements.append((str(row["Id"]), c.get("name"), row))
+                else:
+                    inline.append(row)
+            if inline:
+                c2["rows"] = inline
+            slim.append(c2)
+        meta["categories"] = slim
+    return meta, elements
+
+def _inline_rows(category: dict) -> list:
+    """
+    Rows kept inline in an externalized session: only the ones without 'Id'. Rows with an Id
+    (e.g. a full document written over the slim meta by an older client) duplicate stored elements.
+    """
+    return [r for r in category.get("rows") or [] if not (isinstance(r, dict) and r.get("Id") is not None)]
+
+def _assemble_revit_data(db, session_id: str, meta: dict) -> dict:
+    """Inverse of _split_revit_data: streams element rows back into categories[].rows."""
+    E = models.PluginCloudElement
+    rows_by_cat = {}
+    q = db.query(E.category, E.data_json).filter(E.session_id == session_id).order_by(E.category, E.element_id)
+    for cat, row in q.yield_per(CLOUD_ELEMENT_CHUNK):
+        rows_by_cat.setdefault(cat, []).append(row)
+
+    data = dict(meta)
+    categories = []
+    for c in meta.get("categories") or []:
+        if not isinstance(c, dict):
+            categories.append(c)
+            continue
+        c2 = dict(c)
+        c2["rows"] = _inline_rows(c) + rows_by_cat.pop(c.get("name"), [])
+        categories.append(c2)
+
+    # Categories introduced by deltas (not present in the last full dump)
+    for cat, rows in rows_by_cat.items():
+        headers = sorted({k for r in rows for k in r.keys() if k not in ("Id", "Name")})
+        categories.append({"name": cat, "count": len(rows), "rows": rows, "headers": headers})
+
+    data["categories"] = categories
+    return data
+
+def _summarize_revit_data(db, session_id: str, meta: dict) -> dict:
+    """Like _assemble_revit_data but without rows: per-category counts come from one GROUP BY."""
+    E = models.PluginCloudElement
+    counts = dict(db.query(E.category, func.count(E.element_id)).filter(E.session_id == session_id).group_by(E.category).all())
+
+    data = dict(meta)
+    categories = []
+    for c in meta.get("categories") or []:
+        if not isinstance(c, dict):
+            categories.append(c)
+            continue
+        c2 = {k: v for k, v in c.items() if k != "rows"}
+        c2["count"] = counts.pop(c.get("name"), 0) + len(_inline_rows(c))
+        categories.append(c2)
+    for cat, n in counts.items():
+        categories.append({"name": cat, "count": n, "headers": []})
+
+    data["categories"] = categories
+    return data
+
+def _upsert_cloud_elements(db, session_id: str, elements, revision: int):
+    """Chunked upsert. Rows whose hash did not change are skipped. Returns (written, skipped)."""
+    E = models.PluginCloudElement
+    written = skipped = 0
+    for i in range(0, len(elements), CLOUD_ELEMENT_CHUNK):
+        chunk = elements[i:i + CLOUD_ELEMENT_CHUNK]
+        ids = [el_id for el_id, _, _ in chunk]
+        existing = dict(db.query(E.element_id, E.row_hash).filter(
+            E.session_id == session_id, E.element_id.in_(ids)
+        ).all())
+
+        inserts, updates = [], []
+        for el_id, category, row in chunk:
+            row_hash = _cloud_row_hash(row)
+            mapping = {
+                "session_id": session_id,
+                "element_id": el_id,
+                "category": category,
+                "data_json": row,
+                "row_hash": row_hash,
+                "revision": revision
+            }
+            if el_id not in existing:
+                inserts.append(mapping)
+                existing[el_id] = row_hash # Guard against duplicate ids inside the payload
+            elif existing[el_id] != row_hash:
+                updates.append(mapping)
+            else:
+                skipped += 1
+
+        if inserts: db.bulk_insert_mappings(E, inserts)
+        if updates: db.bulk_update_mappings(E, updates)
+        written += len(inserts) + len(updates)
+    return written, skipped
+
+def _delete_cloud_elements(db, session_id: str, element_ids) -> int:
+    E = models.PluginCloudElement
+    removed = 0
+    element_ids = [str(x) for x in element_ids]
+    for i in range(0, len(element_ids), CLOUD_ELEMENT_CHUNK):
+        chunk = element_ids[i:i + CLOUD_ELEMENT_CHUNK]
+        removed += db.query(E).filter(E.session_id == session_id, E.element_id.in_(chunk)).delete(synchronize_session=False)
+    return removed
+
+def _externalize_cloud_session(db, s):
+    """Moves a legacy session (rows inside data_json) into plugin_cloud_elements. Revision unchanged."""
+    s.elements_external = True
+    data = dict(s.data_json or {})
+    if data.get("elements_external"):
+        return
+    meta, elements = _split_revit_data(data.get("data") or {})
+    _upsert_cloud_elements(db, s.id, elements, s.revision or 0)
+    data["data"] = meta
+    data["elements_external"] = True
+    s.data_json = data
+    flag_modified(s, "data_json")
+
+def sync_cloud_session_full(session_id: str, revit_data: dict, project_name: str = None, user_email: str = None, folder_id: str = None):
+    """
+    Full dump from Revit. Stores element rows keyed by Id and writes only what changed
+    (hash diff + removal of vanished elements). Cards/groups/sheets are preserved.
+    Returns { status, revision, written, skipped, removed }.
+    """
+    db = SessionPlugin()
+    try:
+        s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        if not s:
+            s = models.PluginCloudSession(
+                id=session_id,
+                user_email=user_email or "unknown",
+                project_name=project_name or "Sin Nombre",
+                data_json={"cards": [], "groups": [], "sheets": []},
+                folder_id=folder_id,
+                revision=0
+            )
+            db.add(s)
+            db.flush()
+        else:
+            if project_name: s.project_name = project_name
+            if user_email: s.user_email = user_email
+            if folder_id: s.folder_id = folder_id
+
+        meta, elements = _split_revit_data(revit_data)
+        new_rev = (s.revision or 0) + 1
+
+        written, skipped = _upsert_cloud_elements(db, session_id, elements, new_rev)
+
+        # Elements that disappeared from the model
+        E = models.PluginCloudElement
+        incoming = {el_id for el_id, _, _ in elements}
+        stored = [r[0] for r in db.query(E.element_id).filter(E.session_id == session_id).all()]
+        removed = _delete_cloud_elements(db, session_id, [x for x in stored if x not in incoming])
+
+        data = dict(s.data_json or {})
+        changed = bool(written or removed) or data.get("data") != meta or not data.get("elements_external")
+        if changed:
+            data["data"] = meta
+            data["elements_external"] = True
+            s.data_json = data
+            flag_modified(s, "data_json")
+            s.revision = new_rev
+            s.timestamp = datetime.datetime.now()
+        s.elements_external = True
+
+        db.commit()
+        return {"status": "ok", "revision": s.revision, "written": written, "skipped": skipped, "removed": removed}
+    except Exception as e:
+        print(f"Error syncing cloud session: {e}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+def apply_cloud_delta(session_id: str, base_revision: int, upserts: dict = None, removed: list = None, meta: dict = None):
+    """
+    Applies an element-level delta.
+    upserts: { category: [row, ...] } (added + changed, rows keyed by 'Id').
+    removed: [element_id, ...]. meta: optional non-element parts (sheets, schedules, materials...).
+    Conflict when base_revision != stored revision -> { status: 'conflict', revision }.
+    """
     db = SessionPlugin()
     try:
-        q = db.query(models.PluginCloudSession)
+        PCS = models.PluginCloudSession
+        s = db.query(PCS).filter(PCS.id == session_id).first()
+        if not s:
+            return {"status": "not_found"}
+
+        current = s.revision or 0
+        if base_revision != current:
+            return {"status": "conflict", "revision": current}
+
+        _externalize_cloud_session(db, s)
+
+        # Compare-and-swap on revision: concurrent deltas from two machines can't both win
+        new_rev = current + 1
+        swapped = db.query(PCS).filter(PCS.id == session_id, PCS.revision == current).update(
+            {PCS.revision: new_rev, PCS.timestamp: datetime.datetime.now()}, synchronize_session=False
+        )
+        if not swapped:
+            db.rollback()
+            latest = db.query(PCS.revision).filter(PCS.id == session_id).scalar()
+            return {"status": "conflict", "revision": latest or 0}
+
+        n_removed = _delete_cloud_elements(db, session_id, removed or [])
+
+        elements = []
+        for category, rows in (upserts or {}).items():
+            for row in rows or []:
+                if isinstance(row, dict) and row.get("Id") is not None:
+                    elements.append((str(row["Id"]), category, row))
+        written, skipped = _upsert_cloud_elements(db, session_id, elements, new_rev)
+
+        if meta:
+            meta_part, meta_elements = _split_revit_data(meta)
+            if meta_elements:
+                _upsert_cloud_elements(db, session_id, meta_elements, new_rev)
+            data = dict(s.data_json or {})
+            merged = dict(data.get("data") or {})
+            merged.update(meta_part)
+            data["data"] = merged
+            s.data_json = data
+            flag_modified(s, "data_json")
+
+        db.commit()
+        return {"status": "ok", "revision": new_rev, "written": written, "skipped": skipped, "removed": n_removed}
+    except Exception as e:
+        print(f"Error applying cloud delta: {e}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+def get_cloud_element_index(session_id: str):
+    """{ revision, elements: { element_id: row_hash } } so the plugin can diff without a local cache."""
+    db = SessionPlugin()
+    try:
+        state = _cloud_session_rows(db, session_id)
+        if state is None:
+            return None
+        revision, inline = state
+        if inline is not None:
+            return {"revision": revision, "elements": {el_id: _cloud_row_hash(row) for el_id, _, row in inline}}
+        E = models.PluginCloudElement
+        rows = db.query(E.element_id, E.row_hash).filter(E.session_id == session_id).all()
+        return {"revision": revision, "elements": {el_id: h for el_id, h in rows}}
+    finally:
+        db.close()
+
+def _cloud_session_rows(db, session_id: str):
+    """
+    (revision, inline_elements) of a session, or None if it doesn't exist. Read-only.
+    inline_elements is None when the rows live in plugin_cloud_elements; for a legacy session not yet
+    externalized (sync or externalize_legacy_cloud_sessions does that) they are split out of data_json.
+    """
+    PCS = models.PluginCloudSession
+    row = db.query(PCS.revision, PCS.elements_external).filter(PCS.id == session_id).first()
+    if not row:
+        return None
+    if row.elements_external:
+        return row.revision or 0, None
+    data = db.query(PCS.data_json).filter(PCS.id == session_id).scalar() or {}
+    if data.get("elements_external"):
+        return row.revision or 0, None
+    return row.revision or 0, _split_revit_data(data.get("data") or {})[1]
+
+def get_cloud_session_revision(session_id: str):
+    """Current revision (None if the session doesn't exist). One column, never loads data_json."""
+    db = SessionPlugin()
+    try:
+        PCS = models.PluginCloudSession
+        row = db.query(PCS.revision).filter(PCS.id == session_id).first()
+        return (row.revision or 0) if row else None
+    finally:
+        db.close()
+
+def externalize_legacy_cloud_sessions(limit: int = None) -> int:
+    """
+    Moves the rows of legacy sessions (still inside data_json) into plugin_cloud_elements, one
+    session per transaction. Run at startup so reads never have to write. Returns sessions migrated.
+    """
+    db = SessionPlugin()
+    try:
+        PCS = models.PluginCloudSession
+        q = db.query(PCS.id).filter((PCS.elements_external == False) | (PCS.elements_external.is_(None)))
+        if limit:
+            q = q.limit(limit)
+        ids = [sid for (sid,) in q.all()]
+        migrated = 0
+        for sid in ids:
+            try:
+                s = db.query(PCS).filter(PCS.id == sid).first()
+                if s:
+                    _externalize_cloud_session(db, s)
+                    db.commit()
+                    migrated += 1
+            except Exception as e:
+                db.rollback()
+                print(f"[CLOUD] Externalize failed for session {sid}: {e}")
+            finally:
+                db.expunge_all()
+        if migrated:
+            print(f"[CLOUD] Externalized {migrated} legacy cloud session(s)")
+        return migrated
+    finally:
+        db.close()
+
+def get_cloud_elements(session_id: str, category: str = None):
+    """[(element_id, category, row)] streamed in chunks (feeds the aggregation engine)."""
+    db = SessionPlugin()
+    try:
+        state = _cloud_session_rows(db, session_id)
+        if state and state[1] is not None:
+            inline = [e for e in state[1] if category is None or e[1] == category]
+            return sorted(inline, key=lambda e: (e[1] or "", e[0]))
+        E = models.PluginCloudElement
+        q = db.query(E.element_id, E.category, E.data_json).filter(E.session_id == session_id)
+        if category is not None:
+            q = q.filter(E.category == category)
+        return [(el_id, cat, row) for el_id, cat, row in q.order_by(E.category, E.element_id).yield_per(CLOUD_ELEMENT_CHUNK)]
+    finally:
+        db.close()
+
+def get_cloud_category_rows(session_id: str, category: str, fields: list = None, offset: int = 0, limit: int = None):
+    """
+    Rows of one category (uses ix_plugin_cloud_elements_category). 'fields' projects the row keys.
+    Returns { total, rows } or None if the session doesn't exist.
+    """
+    db = SessionPlugin()
+    try:
+        state = _cloud_session_rows(db, session_id)
+        if state is None:
+            return None
+        if state[1] is not None:
+            inline = sorted((e for e in state[1] if e[1] == category), key=lambda e: e[0])
+            page = inline[offset:offset + limit] if limit else inline[offset:]
+            rows = [{k: row.get(k) for k in ["Id"] + [f for f in fields if f != "Id"]} if fields else row
+                    for _, _, row in page]
+            return {"total": len(inline), "rows": rows}
+
+        E = models.PluginCloudElement
+        base = db.query(E).filter(E.session_id == session_id, E.category == category)
+        total = base.count()
+        q = db.query(E.data_json).filter(E.session_id == session_id, E.category == category).order_by(E.element_id).offset(offset)
+        if limit:
+            q = q.limit(limit)
+        rows = []
+        for (row,) in q.yield_per(CLOUD_ELEMENT_CHUNK):
+            if fields:
+                row = {k: row.get(k) for k in ["Id"] + [f for f in fields if f != "Id"]}
+            rows.append(row)
+        return {"total": total, "rows": rows}
+    finally:
+        db.close()
+
+def save_cloud_project_state(session_id: str, cards: list, groups: list, sheets: list, project_name: str = None):
+    """Saves only the user-managed parts (cards/groups/sheets). Element rows are not rewritten."""
+    db = SessionPlugin()
+    try:
+        s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        if not s:
+            return False
+        if not (s.data_json or {}).get("elements_external"):
+            _externalize_cloud_session(db, s)
+        data = dict(s.data_json or {})
+        data["cards"] = cards
+        data["groups"] = groups
+        data["sheets"] = sheets
+        s.data_json = data
+        flag_modified(s, "data_json")
+        if project_name: s.project_name = project_name
+        s.timestamp = datetime.datetime.now()
+        db.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving cloud project state: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def list_cloud_projects(email: str = None, folder_id: str = None, limit: int = None, offset: int = 0):
+    """Column-only listing (never loads data_json). Newest first."""
+    return list_cloud_projects_page(email, folder_id, limit, offset)["projects"]
+
+def list_cloud_projects_page(email: str = None, folder_id: str = None, limit: int = None, offset: int = 0):
+    """{ projects: [...], total, offset, limit }. Selects id/name/owner/folder/timestamp only."""
+    db = SessionPlugin()
+    try:
+        PCS = models.PluginCloudSession
+        q = db.query(PCS.id, PCS.project_name, PCS.user_email, PCS.folder_id, PCS.timestamp)
         if email:
-             q = q.filter(models.PluginCloudSession.user_email == email)
-        
+            q = q.filter(PCS.user_email == email)
+        if folder_id:
+            q = q.filter(PCS.folder_id == folder_id)
+
+        total = q.order_by(None).count()
+
         # Sort by latest
-        sessions = q.order_by(models.PluginCloudSession.timestamp.desc()).all()
-        
+        q = q.order_by(PCS.timestamp.desc(), PCS.id.desc())
+        if offset:
+            q = q.offset(offset)
+        if limit:
+            q = q.limit(limit)
+
         res = []
-        for s in sessions:
+        for sid, name, owner, fid, ts in q.all():
             res.append({
-                "session_id": s.id,
-                "project_name": s.project_name,
-                "user_email": s.user_email,
-                "updated": s.timestamp.strftime("%Y-%m-%d %H:%M") if s.timestamp else ""
+                "session_id": sid,
+                "project_name": name,
+                "user_email": owner,
+                "folder_id": fid,
+                "updated": ts.strftime("%Y-%m-%d %H:%M") if ts else ""
             })
-
-        return res
+        return {"projects": res, "total": total, "offset": offset, "limit": limit}
     finally:
         db.close()
 
@@ -1932,6 +2634,7 @@ def delete_cloud_session(session_id: str):
     try:
         s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
         if s:
+            db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == s.id).delete(synchronize_session=False)
             db.delete(s)
             db.commit()
             return True
@@ -1957,29 +2660,67 @@ def create_project_folder(name: str):
     finally:
         db.close()
 
-def list_project_folders():
+def list_project_folders(limit: int = None, offset: int = 0, sessions_per_folder: int = None):
+    """Folder tree without N+1: returns the folder list (see list_project_folders_page)."""
+    return list_project_folders_page(limit, offset, sessions_per_folder)["folders"]
+
+def list_project_folders_page(limit: int = None, offset: int = 0, sessions_per_folder: int = None):
+    """
+    { folders: [{ id, name, session_count, sessions: [...] }], total, offset, limit }.
+    Three column-only queries whatever the folder count: folders page, one GROUP BY for counts,
+    one query for the sessions of the page (capped per folder with ROW_NUMBER when requested).
+    """
     db = SessionPlugin()
     try:
-        # Return list of folders with their sessions
-        folders = db.query(models.PluginProjectFolder).order_by(models.PluginProjectFolder.created_at.desc()).all()
+        F = models.PluginProjectFolder
+        PCS = models.PluginCloudSession
+
+        fq = db.query(F.id, F.name).order_by(F.created_at.desc(), F.id)
+        total = db.query(func.count(F.id)).scalar() or 0
+        if offset:
+            fq = fq.offset(offset)
+        if limit:
+            fq = fq.limit(limit)
+        folders = fq.all()
+        folder_ids = [fid for fid, _ in folders]
+        if not folder_ids:
+            return {"folders": [], "total": total, "offset": offset, "limit": limit}
+
+        counts = dict(
+            db.query(PCS.folder_id, func.count(PCS.id))
+            .filter(PCS.folder_id.in_(folder_ids))
+            .group_by(PCS.folder_id)
+            .all()
+        )
+
+        cols = [PCS.id, PCS.project_name, PCS.folder_id, PCS.timestamp]
+        if sessions_per_folder:
+            rn = func.row_number().over(partition_by=PCS.folder_id, order_by=(PCS.timestamp.desc(), PCS.id)).label("rn")
+            sub = db.query(*cols, rn).filter(PCS.folder_id.in_(folder_ids)).subquery()
+            sq = db.query(sub.c.id, sub.c.project_name, sub.c.folder_id, sub.c.timestamp).filter(sub.c.rn <= sessions_per_folder).order_by(sub.c.timestamp.desc())
+        else:
+            sq = db.query(*cols).filter(PCS.folder_id.in_(folder_ids)).order_by(PCS.timestamp.desc())
+
+        sessions_by_folder = {}
+        for sid, name, fid, ts in sq.all():
+            sessions_by_folder.setdefault(fid, []).append({
+                "session_id": sid,
+                "name": name, # This is the "Subproject" name
+                "updated": ts.strftime("%Y-%m-%d") if ts else ""
+            })
+
         res = []
-        for f in folders:
-            sessions = []
-            for s in f.sessions:
-                sessions.append({
-                    "session_id": s.id,
-                    "name": s.project_name, # This is the "Subproject" name
-                    "updated": s.timestamp.strftime("%Y-%m-%d") if s.timestamp else ""
-                })
+        for fid, name in folders:
             res.append({
-                "id": f.id,
-                "name": f.name,
-                "sessions": sessions
+                "id": fid,
+                "name": name,
+                "session_count": counts.get(fid, 0),
+                "sessions": sessions_by_folder.get(fid, [])
             })
-        return res
+        return {"folders": res, "total": total, "offset": offset, "limit": limit}
     except Exception as e:
         print(f"Error listing folders: {e}")
-        return []
+        return {"folders": [], "total": 0, "offset": offset, "limit": limit}
     finally:
         db.close()
 
@@ -1989,6 +2730,7 @@ def delete_project_folder(folder_id: str):
         f = db.query(models.PluginProjectFolder).filter(models.PluginProjectFolder.id == folder_id).first()
         if f:
             for s in f.sessions:
+                db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == s.id).delete(synchronize_session=False)
                 db.delete(s)
             db.delete(f)
             db.commit()
@@ -2038,12 +2780,29 @@ def get_session_by_id(session_id: str):
         db.close()
 
 def get_latest_active_session(user_email: str, machine_id: str = None):
+    # 1. Presence map (no DB hit)
+    live = plugin_presence.find_latest(user_email, machine_id)
+    if live:
+        return types.SimpleNamespace(
+            id=live["session_id"],
+            user_email=live.get("user_email"),
+            machine_id=live.get("machine_id"),
+            revit_version=live.get("revit_version"),
+            plugin_version=live.get("plugin_version"),
+            last_heartbeat=live["last_heartbeat"],
+            is_active=True
+        )
+
+    # 2. Fallback (session owned by another worker): indexed lookup
     db = SessionPlugin()
     try:
         # Check for sessions active in last 5 minutes
-        cutoff = datetime.datetime.now() - datetime.timedelta(minutes=5)
+        cutoff = datetime.datetime.now() - plugin_presence.timeout
         
-        query = db.query(models.PluginSession).filter(models.PluginSession.last_heartbeat > cutoff)
+        query = db.query(models.PluginSession).filter(
+            models.PluginSession.is_active == True,
+            models.PluginSession.last_heartbeat > cutoff
+        )
         
         if user_email and machine_id:
              # Prioritize Email match, but fallback to Machine ID if Email is null in DB?
@@ -2066,6 +2825,339 @@ def get_latest_active_session(user_email: str, machine_id: str = None):
     finally:
         db.close()
 
+def reap_stale_plugin_sessions(timeout: datetime.timedelta):
+    """
+    Closes every active session whose last heartbeat is older than 'timeout'.
+    Single bulk UPDATE (uses ix_plugin_sessions_active_heartbeat). Returns rows closed.
+    """
+    db = SessionPlugin()
+    try:
+        cutoff = datetime.datetime.now() - timeout
+        count = db.query(models.PluginSession).filter(
+            models.PluginSession.is_active == True,
+            models.PluginSession.last_heartbeat < cutoff
+        ).update({models.PluginSession.is_active: False}, synchronize_session=False)
+        db.commit()
+        return count
+    except Exception as e:
+        print(f"Error reaping plugin sessions: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def get_live_plugin_sessions(timeout: datetime.timedelta):
+    """Snapshot of live sessions (column-only query) used to re-sync the presence map."""
+    db = SessionPlugin()
+    try:
+        cutoff = datetime.datetime.now() - timeout
+        rows = db.query(
+            models.PluginSession.id,
+            models.PluginSession.user_email,
+            models.PluginSession.machine_id,
+            models.PluginSession.revit_version,
+            models.PluginSession.plugin_version,
+            models.PluginSession.last_heartbeat
+        ).filter(
+            models.PluginSession.is_active == True,
+            models.PluginSession.last_heartbeat > cutoff
+        ).all()
+        return [
+            {
+                "session_id": r.id,
+                "user_email": r.user_email,
+                "machine_id": r.machine_id,
+                "revit_version": r.revit_version,
+                "plugin_version": r.plugin_version,
+                "last_heartbeat": r.last_heartbeat
+            }
+            for r in rows
+        ]
+    except Exception as e:
+        print(f"Error listing live plugin sessions: {e}")
+        return []
+    finally:
+        db.close()
+
+# -----------------------------------------------------------------------------
+# COMMAND LATENCY (PluginLog + hourly t-digest rollups)
+# -----------------------------------------------------------------------------
+COMMAND_STAT_DIMENSIONS = ("command", "revit_version", "plugin_version", "machine")
+_COMMAND_STAT_COLUMNS = {
+    "command": "command_name", "revit_version": "revit_version",
+    "plugin_version": "plugin_version", "machine": "machine_id"
+}
+
+def _plugin_session_dimensions(db, session_id: str) -> dict:
+    live = plugin_presence.get(session_id) if session_id else None
+    if live:
+        return {k: live.get(k) for k in ("user_email", "machine_id", "revit_version", "plugin_version")}
+    s = db.query(
+        models.PluginSession.user_email, models.PluginSession.machine_id,
+        models.PluginSession.revit_version, models.PluginSession.plugin_version
+    ).filter(models.PluginSession.id == session_id).first() if session_id else None
+    if not s:
+        return {}
+    return {"user_email": s.user_email, "machine_id": s.machine_id, "revit_version": s.revit_version, "plugin_version": s.plugin_version}
+
+def _parse_timing_ts(value, now: datetime.datetime) -> datetime.datetime:
+    if value:
+        try:
+            ts = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            if ts.tzinfo:
+                ts = ts.astimezone().replace(tzinfo=None)
+            if ts <= now + datetime.timedelta(minutes=5):
+                return ts
+        except ValueError:
+            pass
+    return now
+
+def ingest_command_timings(session_id: str, timings: list) -> dict:
+    """
+    Stores a batch of command timings from a plugin session: raw PluginLog rows plus a merge into the
+    hourly PluginCommandStat digests. Returns { accepted, rejected, buckets, rejected_buckets }:
+    rejected_buckets lists the digests that still conflicted after 3 tries (their raw rows are stored).
+    """
+    from .latency_sketch import TDigest
+    from sqlalchemy.exc import IntegrityError
+
+    db = SessionPlugin()
+    try:
+        dims = _plugin_session_dimensions(db, session_id)
+        now = datetime.datetime.now()
+        logs, groups, rejected = [], {}, 0
+        for t in timings or []:
+            try:
+                command = str(t.get("command") or t.get("command_name") or "").strip()[:200]
+                duration = float(t.get("duration_ms"))
+                if not command or duration < 0 or duration != duration:
+                    raise ValueError()
+            except (TypeError, ValueError, AttributeError):
+                rejected += 1
+                continue
+            ts = _parse_timing_ts(t.get("timestamp"), now)
+            context = dict(t.get("context") or {})
+            context.update({"session_id": session_id, "revit_version": dims.get("revit_version"), "plugin_version": dims.get("plugin_version")})
+            logs.append({
+                "user_email": dims.get("user_email"), "machine_id": dims.get("machine_id"),
+                "command_name": command, "duration_ms": int(round(duration)), "timestamp": ts, "context_data": context
+            })
+            bucket = ts.replace(minute=0, second=0, microsecond=0)
+            groups.setdefault((bucket, command), []).append(duration)
+
+        if logs:
+            db.bulk_insert_mappings(models.PluginLog, logs)
+            db.commit()
+
+        S = models.PluginCommandStat
+        revit_version = dims.get("revit_version") or ""
+        plugin_version = dims.get("plugin_version") or ""
+        machine_id = dims.get("machine_id") or ""
+        rejected_buckets = []
+        for (bucket, command), values in groups.items():
+            for attempt in range(3):
+                try:
+                    row = db.query(S).filter(
+                        S.bucket_start == bucket, S.command_name == command, S.revit_version == revit_version,
+                        S.plugin_version == plugin_version, S.machine_id == machine_id
+                    ).with_for_update().first()
+                    digest = TDigest.from_dict(row.digest_json if row else None)
+                    digest.add_many(values)
+                    if row is None:
+                        row = S(bucket_start=bucket, command_name=command, revit_version=revit_version,
+                                plugin_version=plugin_version, machine_id=machine_id, count=0, total_ms=0.0)
+                        db.add(row)
+                    row.count = (row.count or 0) + len(values)
+                    row.total_ms = (row.total_ms or 0.0) + sum(values)
+                    row.min_ms = min(values) if row.min_ms is None else min(row.min_ms, min(values))
+                    row.max_ms = max(values) if row.max_ms is None else max(row.max_ms, max(values))
+                    row.digest_json = digest.to_dict()
+                    db.commit()
+                    break
+                except IntegrityError:
+                    db.rollback() # Another worker created the bucket row first: merge into it
+            else:
+                print(f"[TELEMETRY] Digest merge failed after 3 tries: bucket={bucket.isoformat()} command={command} timings={len(values)}")
+                rejected_buckets.append({"bucket_start": bucket.isoformat(), "command": command, "count": len(values)})
+        return {"accepted": len(logs), "rejected": rejected, "buckets": len(groups) - len(rejected_buckets),
+                "rejected_buckets": rejected_buckets}
+    except Exception as e:
+        print(f"Error ingesting command timings: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_command_latency_stats(date_from: datetime.datetime, date_to: datetime.datetime, group_by: list = None,
+                              command: str = None, machine: str = None, revit_version: str = None,
+                              plugin_version: str = None, interval: str = None, limit: int = 200) -> dict:
+    """
+    p50/p95/p99 per group over [date_from, date_to), merged from hourly digests (no PluginLog scan).
+    group_by: subset of COMMAND_STAT_DIMENSIONS. interval: None (whole window), 'hour' or 'day' series.
+    """
+    from .latency_sketch import TDigest
+
+    group_by = [g for g in (group_by or ["command"]) if g in COMMAND_STAT_DIMENSIONS] or ["command"]
+    db = SessionPlugin()
+    try:
+        S = models.PluginCommandStat
+        q = db.query(
+            S.bucket_start, S.command_name, S.revit_version, S.plugin_version, S.machine_id,
+            S.count, S.total_ms, S.digest_json
+        ).filter(S.bucket_start >= date_from, S.bucket_start < date_to)
+        if command: q = q.filter(S.command_name == command)
+        if machine: q = q.filter(S.machine_id == machine)
+        if revit_version: q = q.filter(S.revit_version == revit_version)
+        if plugin_version: q = q.filter(S.plugin_version == plugin_version)
+
+        groups, buckets_read = {}, 0
+        for r in q.yield_per(500):
+            buckets_read += 1
+            key = tuple(getattr(r, _COMMAND_STAT_COLUMNS[g]) for g in group_by)
+            if interval == "day":
+                key += (r.bucket_start.date().isoformat(),)
+            elif interval == "hour":
+                key += (r.bucket_start.isoformat(),)
+            g = groups.get(key)
+            if g is None:
+                g = groups[key] = {"count": 0, "total_ms": 0.0, "digest": TDigest()}
+            g["count"] += r.count or 0
+            g["total_ms"] += r.total_ms or 0.0
+            g["digest"].merge(TDigest.from_dict(r.digest_json))
+
+        rows = []
+        for key, g in groups.items():
+            d = g["digest"]
+            item = {dim: key[i] for i, dim in enumerate(group_by)}
+            if interval:
+                item["period"] = key[-1]
+            item.update({
+                "count": g["count"],
+                "mean_ms": round(g["total_ms"] / g["count"], 1) if g["count"] else None,
+                "p50_ms": round(d.quantile(0.50), 1) if d.count else None,
+                "p95_ms": round(d.quantile(0.95), 1) if d.count else None,
+                "p99_ms": round(d.quantile(0.99), 1) if d.count else None,
+                "max_ms": round(d.max, 1) if d.max is not None else None
+            })
+            rows.append(item)
+        if interval:
+            rows.sort(key=lambda x: (x["period"], -x["count"]))
+        else:
+            rows.sort(key=lambda x: (x["p95_ms"] or 0), reverse=True)
+        return {
+            "from": date_from.isoformat(), "to": date_to.isoformat(),
+            "group_by": group_by, "interval": interval,
+            "buckets_read": buckets_read, "groups": rows[:limit]
+        }
+    finally:
+        db.close()
+
+# -----------------------------------------------------------------------------
+# RETENTION (plugin sheet sessions / command queue)
+# -----------------------------------------------------------------------------
+
+def _purge_ids_in_chunks(db, model, id_query, chunk_size: int, before_delete=None, max_chunks: int = None) -> int:
+    """
+    Deletes the rows selected by id_query in chunks of chunk_size, committing per chunk
+    so locks stay short. before_delete(ids) removes dependent rows first. Returns rows deleted.
+    """
+    deleted = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        ids = [r[0] for r in id_query.limit(chunk_size).all()]
+        if not ids:
+            break
+        if before_delete:
+            before_delete(ids)
+        deleted += db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        chunks += 1
+    return deleted
+
+def purge_expired_sheet_sessions(ttl: datetime.timedelta, chunk_size: int = 500, max_chunks: int = None) -> int:
+    """
+    Deletes sheet sessions past expires_at (or, for legacy rows without it, created more than 'ttl' ago)
+    together with their plugin_sheet_rows and pending updates.
+    """
+    db = SessionPlugin()
+    try:
+        now = datetime.datetime.now()
+        S = PluginSheetSession
+        id_query = db.query(S.id).filter(
+            (S.expires_at < now) | ((S.expires_at == None) & (S.created_at < now - ttl))
+        ).order_by(S.id)
+
+        def drop_rows(ids):
+            db.query(models.PluginSheetRow).filter(models.PluginSheetRow.session_id.in_(ids)).delete(synchronize_session=False)
+            db.query(models.PluginSheetPendingUpdate).filter(models.PluginSheetPendingUpdate.session_id.in_(ids)).delete(synchronize_session=False)
+
+        return _purge_ids_in_chunks(db, S, id_query, chunk_size, drop_rows, max_chunks)
+    except Exception as e:
+        print(f"Error purging sheet sessions: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def purge_cloud_commands(consumed_ttl: datetime.timedelta, pending_ttl: datetime.timedelta,
+                         chunk_size: int = 1000, max_chunks: int = None) -> int:
+    """
+    Deletes consumed commands last touched more than 'consumed_ttl' ago and never-delivered
+    commands older than 'pending_ttl' (their Revit session is long gone).
+    """
+    db = SessionPlugin()
+    try:
+        now = datetime.datetime.now()
+        C = models.CloudCommand
+        id_query = db.query(C.id).filter(
+            ((C.is_consumed == True) & (C.updated_at < now - consumed_ttl)) |
+            ((C.is_consumed == False) & (C.created_at < now - pending_ttl))
+        ).order_by(C.id)
+
+        def drop_pending(ids):
+            db.query(models.PluginSheetPendingUpdate).filter(models.PluginSheetPendingUpdate.command_id.in_(ids)).delete(synchronize_session=False)
+
+        return _purge_ids_in_chunks(db, C, id_query, chunk_size, drop_pending, max_chunks)
+    except Exception as e:
+        print(f"Error purging cloud commands: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def get_plugin_table_stats(tables: list) -> dict:
+    """{ table: { rows, size_bytes } }. size_bytes is the total relation size on Postgres, None elsewhere."""
+    db = SessionPlugin()
+    try:
+        is_pg = engine_plugin.dialect.name == "postgresql"
+        out = {}
+        for table in tables:
+            try:
+                rows = db.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+                size = None
+                if is_pg:
+                    size = db.execute(text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": table}).scalar()
+                out[table] = {"rows": int(rows or 0), "size_bytes": int(size) if size is not None else None}
+            except Exception as e:
+                db.rollback()
+                out[table] = {"rows": None, "size_bytes": None, "error": str(e)}
+        return out
+    finally:
+        db.close()
+
+def get_user_last_heartbeat(email: str):
+    """Last heartbeat of a user (uses ix_plugin_sessions_presence). None if never seen."""
+    db = SessionPlugin()
+    try:
+        return db.query(func.max(models.PluginSession.last_heartbeat)).filter(
+            models.PluginSession.user_email == email
+        ).scalar()
+    except Exception as e:
+        print(f"Error getting last heartbeat for {email}: {e}")
+        return None
+    finally:
+        db.close()
+
 # -----------------------------------------------------------------------------
 # CLOUD COMMANDS
 # -----------------------------------------------------------------------------
@@ -2084,23 +3176,40 @@ def queue_command(session_id: str, action: str, payload: dict):
     finally:
         db.close()
 
-def get_pending_commands(session_id: str):
+def queue_commands(session_id: str, action: str, payloads: list):
+    """Queues several commands in one transaction (e.g. chunked UPDATE_SHEETS). Returns their ids."""
+    db = SessionPlugin()
+    try:
+        cmds = [models.CloudCommand(session_id=session_id, action=action, payload=p) for p in payloads]
+        db.add_all(cmds)
+        db.commit()
+        return [c.id for c in cmds]
+    finally:
+        db.close()
+
+def get_pending_commands(session_id: str, limit: int = None):
+    """Oldest unconsumed commands (at most 'limit'), marked consumed/sent on the way out."""
     db = SessionPlugin()
     try:
         # Get unconsumed commands
-        cmds = db.query(models.CloudCommand).filter(
+        q = db.query(models.CloudCommand).filter(
             models.CloudCommand.session_id == session_id,
             models.CloudCommand.is_consumed == False
-        ).order_by(models.CloudCommand.created_at.asc()).all()
+        ).order_by(models.CloudCommand.created_at.asc(), models.CloudCommand.id.asc())
+        if limit:
+            q = q.limit(limit)
+        cmds = q.all()
         
         result = []
         for c in cmds:
             result.append({
+                "id": c.id,
                 "action": c.action,
                 "payload": c.payload
             })
             # Mark consumed
             c.is_consumed = True
+            c.status = "sent"
             
         if result:
             db.commit()
@@ -2109,6 +3218,51 @@ def get_pending_commands(session_id: str):
     finally:
         db.close()
 
+def count_pending_commands(session_id: str) -> int:
+    """Queue depth without consuming anything."""
+    db = SessionPlugin()
+    try:
+        return db.query(func.count(models.CloudCommand.id)).filter(
+            models.CloudCommand.session_id == session_id,
+            models.CloudCommand.is_consumed == False
+        ).scalar() or 0
+    finally:
+        db.close()
+
+def mark_commands_as_sent(command_ids: list):
+    db = SessionPlugin()
+    try:
+        if not command_ids:
+            return 0
+        n = db.query(models.CloudCommand).filter(models.CloudCommand.id.in_(command_ids)).update(
+            {models.CloudCommand.is_consumed: True, models.CloudCommand.status: "sent"}, synchronize_session=False
+        )
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+def update_command_status(command_id: int, status: str, result_json: dict = None, message: str = None):
+    db = SessionPlugin()
+    try:
+        cmd = db.query(models.CloudCommand).filter(models.CloudCommand.id == command_id).first()
+        if not cmd:
+            return False
+        cmd.status = status
+        cmd.result_json = result_json
+        if message:
+            cmd.error_message = message
+        if cmd.action == "UPDATE_SHEETS" and status in ("success", "error"):
+            _settle_sheet_updates(db, cmd.id, applied=status == "success")
+        db.commit()
+        return True
+    except Exception as e:
+        print(f"Error updating command status: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
 
 # -----------------------------------------------------------------------------
 # ROUTINES (KNOWLEDGE BASE)
@@ -2127,6 +3281,8 @@ def save_routine(title, description, category, actions_json, user_email, is_glob
         db.add(new_routine)
         db.commit()
         db.refresh(new_routine)
+        from .routine_index import routine_index
+        routine_index.add(new_routine)
         return new_routine
     except Exception as e:
         print(f"Error saving routine: {e}")
@@ -2146,6 +3302,27 @@ def get_all_routines(user_email=None):
     finally:
         db.close()
 
+def get_routine_watermark():
+    """(max id, row count) of plugin_routines: lets the search index detect new / deleted routines cheaply."""
+    db = SessionPlugin()
+    try:
+        max_id, count = db.query(func.max(models.PluginRoutine.id), func.count(models.PluginRoutine.id)).one()
+        return max_id or 0, count or 0
+    finally:
+        db.close()
+
+def get_routines_after(min_id: int = 0):
+    db = SessionPlugin()
+    try:
+        return db.query(models.PluginRoutine).filter(models.PluginRoutine.id > min_id).order_by(models.PluginRoutine.id).all()
+    finally:
+        db.close()
+
+def search_routines(query: str, user_email: str = None, category: str = None, offset: int = 0, limit: int = 20):
+    """Ranked routine search (in-process inverted index, see common/routine_index.py)."""
+    from .routine_index import routine_index
+    return routine_index.search(query, user_email=user_email, category=category, offset=offset, limit=limit)
+
 
 # -----------------------------------------------------------------------------
 # SHEET MANAGER TEMPLATES
@@ -2186,19 +3363,63 @@ def delete_sheet_template(tpl_id: int):
 # SHEET MANAGER SESSION FUNCTIONS
 # -----------------------------------------------------------------------------
 
-def create_sheet_session(session_id: str, project_name: str, sheets: list, param_defs: list, plugin_session_id: str):
+def _sheet_row_mappings(session_id: str, sheets: list):
+    rows = []
+    seen = set()
+    for pos, sh in enumerate(sheets or []):
+        if not isinstance(sh, dict):
+            continue
+        sheet_id = str(sh.get("id") or "")
+        if not sheet_id or sheet_id in seen:
+            continue
+        seen.add(sheet_id)
+        rows.append({
+            "session_id": session_id,
+            "sheet_id": sheet_id,
+            "position": pos,
+            "number": sh.get("number"),
+            "name": sh.get("name"),
+            "data_json": sh
+        })
+    return rows
+
+def _externalize_sheet_session(db, session):
+    """Moves the sheets list of sheets_json into plugin_sheet_rows (legacy sessions are migrated lazily)."""
+    blob = session.sheets_json
+    if isinstance(blob, dict) and blob.get("rows_external"):
+        return
+    if isinstance(blob, dict):
+        sheets = blob.get("sheets") or []
+        meta = {k: v for k, v in blob.items() if k != "sheets"}
+    else:
+        sheets = blob or []
+        meta = {"version": "v2"}
+    rows = _sheet_row_mappings(session.id, sheets)
+    for i in range(0, len(rows), CLOUD_ELEMENT_CHUNK):
+        db.bulk_insert_mappings(models.PluginSheetRow, rows[i:i + CLOUD_ELEMENT_CHUNK])
+    meta["rows_external"] = True
+    session.sheets_json = meta
+    flag_modified(session, "sheets_json")
+
+def create_sheet_session(session_id: str, project_name: str, sheets, param_defs: list, plugin_session_id: str):
+    from .retention import retention_policy
     db = SessionPlugin()
     try:
         # Check if exists (unlikely given UUID)
+        now = datetime.datetime.now()
         new_session = PluginSheetSession(
             id=session_id,
             project=project_name,
             plugin_session_id=plugin_session_id,
             sheets_json=sheets,
             param_definitions_json=param_defs,
-            created_at=datetime.datetime.now()
+            created_at=now,
+            expires_at=now + retention_policy.sheet_session_ttl
         )
         db.add(new_session)
+        db.flush()
+        # One row per sheet (paging / filtering / diff); the blob keeps metadata only
+        _externalize_sheet_session(db, new_session)
         db.commit()
         return True
     except Exception as e:
@@ -2223,14 +3444,24 @@ def update_sheet_session_plugin_id(session_id: str, new_plugin_session_id: str):
     finally:
         db.close()
 
-def get_sheet_session(session_id: str):
+def get_sheet_session(session_id: str, include_sheets: bool = True):
+    """Legacy document shape ({ sheets: { version, sheets: [...], ... } }). include_sheets=False skips the rows."""
     db = SessionPlugin()
     try:
         session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if session and session.expires_at and session.expires_at < datetime.datetime.now():
+            return None # Expired (row is removed by the retention job)
         if session:
+            blob = session.sheets_json
+            if isinstance(blob, dict) and blob.get("rows_external"):
+                blob = {k: v for k, v in blob.items() if k != "rows_external"}
+                if include_sheets:
+                    R = models.PluginSheetRow
+                    q = db.query(R.data_json).filter(R.session_id == session_id).order_by(R.position, R.sheet_id)
+                    blob["sheets"] = [row for (row,) in q.yield_per(CLOUD_ELEMENT_CHUNK)]
             return {
                 "project": session.project,
-                "sheets": session.sheets_json,
+                "sheets": blob,
                 "param_definitions": session.param_definitions_json,
                 "plugin_session_id": session.plugin_session_id
             }
@@ -2238,6 +3469,402 @@ def get_sheet_session(session_id: str):
     finally:
         db.close()
 
+SHEET_SORT_COLUMNS = ("position", "number", "name")
+
+def _sheet_value(sheet: dict, field: str):
+    if field in ("number", "name", "id"):
+        return sheet.get(field)
+    params = sheet.get("params_data") or sheet.get("params") or {}
+    return params.get(field[6:] if field.startswith("param:") else field)
+
+def _sheet_matches(sheet: dict, f: dict) -> bool:
+    val = str(_sheet_value(sheet, f.get("field", "")) or "").lower()
+    target = f.get("value")
+    op = f.get("op", "contains")
+    if op == "in":
+        return val in [str(v).lower() for v in (target if isinstance(target, list) else [target])]
+    target = str(target or "").lower()
+    if op == "equals" or op == "eq": return val == target
+    if op == "ne": return val != target
+    if op == "startswith": return val.startswith(target)
+    if op == "empty": return val == ""
+    return target in val
+
+def query_sheet_rows(session_id: str, search: str = None, filters: list = None, sort: str = "position",
+                     descending: bool = False, offset: int = 0, limit: int = 100):
+    """
+    Page of sheets. number/name search and number/name/position sorting run in SQL on the indexed rows;
+    parameter filters / parameter sorting are evaluated over the session rows.
+    Returns { total, offset, limit, sheets } or None if the session doesn't exist.
+    """
+    db = SessionPlugin()
+    try:
+        session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if not session:
+            return None
+        if not (isinstance(session.sheets_json, dict) and session.sheets_json.get("rows_external")):
+            _externalize_sheet_session(db, session)
+            db.commit()
+
+        R = models.PluginSheetRow
+        q = db.query(R.data_json).filter(R.session_id == session_id)
+        if search:
+            like = f"%{search}%"
+            q = q.filter((R.number.ilike(like)) | (R.name.ilike(like)))
+
+        sort = sort or "position"
+        filters = [f for f in (filters or []) if isinstance(f, dict) and f.get("field")]
+        sql_sort = sort in SHEET_SORT_COLUMNS
+        if sql_sort and not filters:
+            col = getattr(R, sort)
+            total = q.order_by(None).count()
+            q = q.order_by(col.desc() if descending else col.asc(), R.sheet_id)
+            sheets = [row for (row,) in q.offset(offset).limit(limit).all()]
+            return {"total": total, "offset": offset, "limit": limit, "sheets": sheets}
+
+        if sql_sort:
+            col = getattr(R, sort)
+            q = q.order_by(col.desc() if descending else col.asc(), R.sheet_id)
+        rows = [row for (row,) in q.yield_per(CLOUD_ELEMENT_CHUNK)]
+        rows = [r for r in rows if all(_sheet_matches(r, f) for f in filters)]
+        if not sql_sort:
+            rows.sort(key=lambda r: str(_sheet_value(r, sort) or ""), reverse=descending)
+        return {"total": len(rows), "offset": offset, "limit": limit, "sheets": rows[offset:offset + limit]}
+    finally:
+        db.close()
+
+def diff_sheet_updates(session_id: str, updates: list):
+    """
+    Minimal diff of the UI's sheet list against the stored state.
+    Returns { changed: [update], unchanged: n } where each update only carries changed params
+    (number/name are always sent: the plugin keys on them). New sheets are always included.
+    The stored rows are left as they are: queue_sheet_updates() records the changes as pending and
+    update_command_status() promotes them once Revit confirms the command.
+    """
+    db = SessionPlugin()
+    try:
+        session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if not session:
+            return None
+        if not (isinstance(session.sheets_json, dict) and session.sheets_json.get("rows_external")):
+            _externalize_sheet_session(db, session)
+            db.flush()
+
+        R = models.PluginSheetRow
+        ids = [str(u.get("id")) for u in updates or [] if isinstance(u, dict) and u.get("id") and not u.get("is_new")]
+        stored = {}
+        for i in range(0, len(ids), CLOUD_ELEMENT_CHUNK):
+            chunk = ids[i:i + CLOUD_ELEMENT_CHUNK]
+            for sheet_id, row in db.query(R.sheet_id, R.data_json).filter(R.session_id == session_id, R.sheet_id.in_(chunk)).all():
+                stored[sheet_id] = row
+
+        changed, unchanged = [], 0
+        for u in updates or []:
+            if not isinstance(u, dict):
+                continue
+            if u.get("is_new") or str(u.get("id")) not in stored:
+                changed.append(u)
+                continue
+
+            sheet_id = str(u.get("id"))
+            old = stored[sheet_id]
+            old_params = old.get("params_data") or old.get("params") or {}
+            new_params = {}
+            for k, v in (u.get("params") or {}).items():
+                # Only string parameters are written by the plugin (nested UI state is ignored)
+                if isinstance(v, (dict, list)):
+                    continue
+                if str(v if v is not None else "") != str(old_params.get(k) if old_params.get(k) is not None else ""):
+                    new_params[k] = v
+
+            number = u.get("number") if u.get("number") is not None else old.get("number")
+            name = u.get("name") if u.get("name") is not None else old.get("name")
+            if not new_params and number == old.get("number") and name == old.get("name"):
+                unchanged += 1
+                continue
+
+            changed.append({"id": sheet_id, "number": number, "name": name, "params": new_params, "is_new": False})
+
+        # Sliding expiry: a session still being edited is not collected
+        from .retention import retention_policy
+        session.expires_at = datetime.datetime.now() + retention_policy.sheet_session_ttl
+        db.commit()
+        return {"changed": changed, "unchanged": unchanged}
+    except Exception as e:
+        print(f"Error diffing sheet updates: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def queue_sheet_updates(session_id: str, plugin_session_id: str, chunks: list):
+    """
+    Queues one UPDATE_SHEETS command per chunk for the Revit session and, in the same transaction,
+    records the edits to existing sheets as pending for that command. Returns the command ids.
+    """
+    db = SessionPlugin()
+    try:
+        cmds = [models.CloudCommand(session_id=plugin_session_id, action="UPDATE_SHEETS", payload=c) for c in chunks]
+        db.add_all(cmds)
+        db.flush()
+        for cmd, chunk in zip(cmds, chunks):
+            updates = [u for u in chunk if isinstance(u, dict) and u.get("id") and not u.get("is_new")]
+            if updates:
+                db.add(models.PluginSheetPendingUpdate(command_id=cmd.id, session_id=session_id, updates_json=updates))
+        db.commit()
+        return [c.id for c in cmds]
+    finally:
+        db.close()
+
+def _settle_sheet_updates(db, command_id: int, applied: bool):
+    """Promotes (applied) or drops the pending sheet edits of an UPDATE_SHEETS command. No commit."""
+    pending = db.query(models.PluginSheetPendingUpdate).filter(
+        models.PluginSheetPendingUpdate.command_id == command_id
+    ).first()
+    if not pending:
+        return
+    if applied:
+        R = models.PluginSheetRow
+        updates = {str(u["id"]): u for u in pending.updates_json or []}
+        ids = list(updates)
+        row_updates = []
+        for i in range(0, len(ids), CLOUD_ELEMENT_CHUNK):
+            chunk = ids[i:i + CLOUD_ELEMENT_CHUNK]
+            for sheet_id, data in db.query(R.sheet_id, R.data_json).filter(R.session_id == pending.session_id, R.sheet_id.in_(chunk)).all():
+                u = updates[sheet_id]
+                # Merged into the row as it is now, so commands confirmed out of order don't undo each other
+                merged = dict(data or {})
+                merged["number"], merged["name"] = u.get("number"), u.get("name")
+                merged["params_data"] = {**(merged.get("params_data") or merged.get("params") or {}), **(u.get("params") or {})}
+                row_updates.append({"session_id": pending.session_id, "sheet_id": sheet_id,
+                                    "number": u.get("number"), "name": u.get("name"), "data_json": merged})
+        if row_updates:
+            db.bulk_update_mappings(R, row_updates)
+    db.delete(pending)
+
+# -----------------------------------------------------------------------------
+# AO LABS: ACC JOB REGISTRY (uploads / folder copies)
+# -----------------------------------------------------------------------------
+
+ACC_JOB_FINISHED_STATES = ("done", "partial", "error", "cancelled")
+
+def _acc_job_dict(job, include_result: bool = True):
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params or {},
+        "progress": job.progress or {},
+        "error": job.error,
+        "attempts": job.attempts or 0,
+        "claimed_by": job.claimed_by,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+    if include_result:
+        data["result"] = job.result
+    return data
+
+def create_acc_job(job_id: str, kind: str, params: dict):
+    db = SessionOps()
+    try:
+        job = models.AccJob(id=job_id, kind=kind, status="pending", params=params, progress={},
+                            created_at=datetime.datetime.now())
+        db.add(job)
+        db.commit()
+        return _acc_job_dict(job)
+    finally:
+        db.close()
+
+def get_acc_job(job_id: str, include_result: bool = True):
+    db = SessionOps()
+    try:
+        job = db.query(models.AccJob).filter(models.AccJob.id == job_id).first()
+        return _acc_job_dict(job, include_result) if job else None
+    finally:
+        db.close()
+
+def claim_next_acc_job(worker_id: str, kinds: list):
+    """
+    Oldest pending job of the given kinds -> running, claimed by 'worker_id'.
+    The conditional UPDATE (WHERE status = 'pending') makes the claim atomic across workers.
+    """
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        candidates = db.query(J.id).filter(J.status == "pending", J.kind.in_(kinds)) \
+            .order_by(J.created_at).limit(5).all()
+        for (job_id,) in candidates:
+            now = datetime.datetime.now()
+            claimed = db.query(J).filter(J.id == job_id, J.status == "pending").update({
+                J.status: "running",
+                J.claimed_by: worker_id,
+                J.started_at: now,
+                J.heartbeat_at: now,
+                J.attempts: func.coalesce(J.attempts, 0) + 1
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return _acc_job_dict(db.query(J).filter(J.id == job_id).first())
+        return None
+    except Exception as e:
+        print(f"Error claiming ACC job: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+def update_acc_job_progress(job_id: str, progress: dict) -> bool:
+    """Stores progress + heartbeat. Returns True if a cancel was requested."""
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        db.query(J).filter(J.id == job_id).update(
+            {J.progress: progress, J.heartbeat_at: datetime.datetime.now()}, synchronize_session=False)
+        db.commit()
+        return bool(db.query(J.cancel_requested).filter(J.id == job_id).scalar())
+    except Exception as e:
+        print(f"Error updating ACC job progress: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def touch_acc_job(job_id: str) -> bool:
+    """Heartbeat only (progress untouched). Returns True if a cancel was requested."""
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        db.query(J).filter(J.id == job_id, J.status == "running").update(
+            {J.heartbeat_at: datetime.datetime.now()}, synchronize_session=False)
+        db.commit()
+        return bool(db.query(J.cancel_requested).filter(J.id == job_id).scalar())
+    except Exception as e:
+        print(f"Error heartbeating ACC job: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def finish_acc_job(job_id: str, status: str, result=None, error: str = None, progress: dict = None):
+    db = SessionOps()
+    try:
+        job = db.query(models.AccJob).filter(models.AccJob.id == job_id).first()
+        if not job:
+            return False
+        job.status = status
+        job.result = result
+        job.error = error
+        if progress is not None:
+            job.progress = progress
+        job.finished_at = datetime.datetime.now()
+        job.heartbeat_at = job.finished_at
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def request_acc_job_cancel(job_id: str):
+    """Pending jobs are cancelled right away; running ones stop at their next progress report or heartbeat."""
+    db = SessionOps()
+    try:
+        job = db.query(models.AccJob).filter(models.AccJob.id == job_id).first()
+        if not job:
+            return None
+        if job.status == "pending":
+            job.status = "cancelled"
+            job.finished_at = datetime.datetime.now()
+        elif job.status == "running":
+            job.cancel_requested = True
+        db.commit()
+        return job.status
+    finally:
+        db.close()
+
+def retry_acc_job(job_id: str):
+    """error -> pending (uploads resume from their persisted part state). Returns the new status or None."""
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        updated = db.query(J).filter(J.id == job_id, J.status == "error").update(
+            {J.status: "pending", J.error: None, J.finished_at: None, J.claimed_by: None}, synchronize_session=False)
+        db.commit()
+        return "pending" if updated else None
+    finally:
+        db.close()
+
+def recover_stale_acc_jobs(stale_after: datetime.timedelta, requeue_kinds: list, max_attempts: int = 3) -> int:
+    """
+    Running jobs whose worker stopped heartbeating (crash / restart): resumable kinds go back to
+    pending (up to max_attempts), the rest are marked as error.
+    """
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        now = datetime.datetime.now()
+        stale = db.query(J).filter(J.status == "running", J.heartbeat_at < now - stale_after).all()
+        for job in stale:
+            if job.kind in requeue_kinds and (job.attempts or 0) < max_attempts and not job.cancel_requested:
+                job.status = "pending"
+                job.claimed_by = None
+            else:
+                job.status = "cancelled" if job.cancel_requested else "error"
+                job.error = job.error or f"Worker {job.claimed_by} stopped responding"
+                job.finished_at = now
+        db.commit()
+        return len(stale)
+    except Exception as e:
+        print(f"Error recovering stale ACC jobs: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+def purge_finished_acc_jobs(older_than: datetime.timedelta, limit: int = 500) -> list:
+    """Deletes finished jobs older than 'older_than'. Returns their params (for spool file cleanup)."""
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        cutoff = datetime.datetime.now() - older_than
+        jobs = db.query(J.id, J.params).filter(J.status.in_(ACC_JOB_FINISHED_STATES), J.finished_at < cutoff) \
+            .order_by(J.finished_at).limit(limit).all()
+        if not jobs:
+            return []
+        db.query(J).filter(J.id.in_([j.id for j in jobs])).delete(synchronize_session=False)
+        db.commit()
+        return [j.params or {} for j in jobs]
+    except Exception as e:
+        print(f"Error purging ACC jobs: {e}")
+        db.rollback()
+        return []
+    finally:
+        db.close()
+
+def get_active_acc_job_ids() -> set:
+    """Ids of jobs whose spool files must be kept (not finished, or failed and resumable)."""
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        rows = db.query(J.id).filter(J.status.in_(("pending", "running", "error"))).all()
+        return {r.id for r in rows}
+    finally:
+        db.close()
+
+def get_acc_job_counts() -> dict:
+    db = SessionOps()
+    try:
+        J = models.AccJob
+        rows = db.query(J.kind, J.status, func.count(J.id)).group_by(J.kind, J.status).all()
+        out = {}
+        for kind, status, count in rows:
+            out.setdefault(kind, {})[status] = count
+        return out
+    finally:
+        db.close()
+
 # -----------------------------------------------------------------------------
 # DAILY APP FUNCTIONS (daily.somosao.com)
 # -----------------------------------------------------------------------------
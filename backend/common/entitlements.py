@@ -1,32 +1,53 @@
-
 import os
 import time
-from typing import Dict, Set
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
 from .database import SessionCore
 from . import models
 
 # FEATURE FLAG: Enforcement
 ENTITLEMENTS_ENFORCED = os.getenv("ENTITLEMENTS_ENFORCED", "true").lower() == "true"
+# Decisions served from memory this long; after that the org is revalidated in the background
+ENTITLEMENTS_TTL_SECONDS = float(os.getenv("ENTITLEMENTS_TTL_SECONDS", "15"))
+# Older than this (idle org) -> revalidated inline before answering
+ENTITLEMENTS_MAX_STALE_SECONDS = float(os.getenv("ENTITLEMENTS_MAX_STALE_SECONDS", "300"))
+# A token announcing a newer entitlements_version forces at most one inline refresh per org per interval
+FORCED_REFRESH_MIN_SECONDS = 1.0
 
 class EntitlementsClient:
     """
     Client for checking Organization Entitlements with caching.
-    Source of Truth: Core DB (accounts_org_entitlements).
+    Source of Truth: Core DB (accounts_org_entitlements + accounts_organizations status/version).
     Signal: Token 'entitlements_version' claim.
+
+    Stale-while-revalidate: within TTL a decision costs no DB access. Past TTL the cached decision
+    is still served while one background refresh (per org) re-reads status + version, and only
+    reloads the entitlement rows when the version changed. A token carrying a newer version than
+    the cache, a missing entry or an entry older than MAX_STALE refresh inline.
     """
-    
-    def __init__(self):
-        self._cache: Dict[str, Dict] = {} # { org_id: { version: int, entitlements: Set[str], expires_at: float, status: str } }
-        self.TTL_SECONDS = 60
-    
+
+    def __init__(self, ttl_seconds: float = ENTITLEMENTS_TTL_SECONDS,
+                 max_stale_seconds: float = ENTITLEMENTS_MAX_STALE_SECONDS):
+        self._cache: Dict[str, Dict] = {} # { org_id: { version: int, status: str, entitlements: Set[str], checked_at: float } }
+        self.TTL_SECONDS = ttl_seconds
+        self.max_stale_seconds = max(max_stale_seconds, ttl_seconds)
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="entitlements")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.reloads = 0
+        self.errors = 0
+
     def check_access(self, org_id: str, token_version: int, service_slug: str) -> bool:
         """
         Validates if an Org has access to a Service.
-        Strategy: Metadata-First (Hybrid Cache).
-        1. Always fetch Org Status & Version (Fast PK Lookup).
-        2. Check Revocation (Suspended).
-        3. Check Cache vs DB Version (Consistency).
-        4. Return Decision.
+        1. Cached entry (fresh, or stale + background revalidation).
+        2. Inline refresh on miss / newer token version / too stale.
+        3. Suspended or unknown orgs are denied.
         """
         if not ENTITLEMENTS_ENFORCED:
             print(f"⚠️ [ENTITLEMENTS] Enforcement DISABLED (Allowing '{service_slug}' for {org_id})")
@@ -34,77 +55,136 @@ class EntitlementsClient:
 
         if not org_id:
             return False
-            
-        # 1. Metadata Lookup (Fast, Real-time)
-        try:
-             # We use a lightweight session for metadata only
-             db = SessionCore()
-             # Query only what we need: status, entitlements_version
-             # Note: SQLAlchemy might fetch full object, but it's by PK.
-             org = db.query(models.Organization).filter(models.Organization.id == org_id).first()
-             
-             if not org:
-                 db.close()
-                 return False
-                 
-             db_status = getattr(org, "status", "Active")
-             db_version = getattr(org, "entitlements_version", 1)
-             db.close()
-             
-        except Exception as e:
-            print(f"❌ [ENTITLEMENTS] Metadata Fetch Error: {e}")
+
+        entry = self._get_entry(org_id, token_version or 0)
+        if not entry or not entry["exists"]:
             return False
 
-        # 2. Hard Revoke Check (Immediate)
-        if db_status == "Suspended":
-             # print(f"⛔ [ENTITLEMENTS] Org {org_id} is SUSPENDED. Access Denied.")
+        # Hard Revoke Check
+        if entry["status"] == "Suspended":
              return False
 
-        # 3. Cache Revalidation
-        # If DB Version != Cache Version, our Cache is STALE. Refresh it.
-        # We ignore Token Version for *Correctness* (Source of Truth is DB), 
-        # but Token Version tells us what the Client *thinks* it has.
-        # Ideally, we enforce DB Version.
-        
-        cached = self._cache.get(org_id)
-        
-        if not cached or cached["version"] != db_version:
-             # MISS or STALE -> Refresh Entitlements
-             return self._refresh_and_check(org_id, db_version, service_slug) # Use DB version
-        
-        # HIT (Cache Version == DB Version)
-        return service_slug in cached["entitlements"]
-
-    def _refresh_and_check(self, org_id: str, db_version: int, service_slug: str) -> bool:
+        return service_slug in entry["entitlements"]
+
+    def _get_entry(self, org_id: str, token_version: int) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(org_id)
+        if cached:
+            age = now - cached["checked_at"]
+            token_is_newer = token_version > cached["version"] and age >= FORCED_REFRESH_MIN_SECONDS
+            if not token_is_newer and age < self.TTL_SECONDS:
+                with self._lock:
+                    self.hits += 1
+                return cached
+            if not token_is_newer and age < self.max_stale_seconds:
+                with self._lock:
+                    self.stale_hits += 1
+                self._revalidate_async(org_id)
+                return cached
+
+        with self._lock:
+            self.misses += 1
+        entry = self._refresh(org_id)
+        if entry:
+            return entry
+        # DB unavailable: keep answering from a not-too-old entry
+        if cached and now - cached["checked_at"] < self.max_stale_seconds:
+            return cached
+        return None
+
+    def _revalidate_async(self, org_id: str):
+        with self._lock:
+            if org_id in self._refreshing:
+                return
+            self._refreshing.add(org_id)
+
+        def _run():
+            try:
+                self._refresh(org_id)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(org_id)
+
+        try:
+            self._pool.submit(_run)
+        except RuntimeError: # Interpreter shutting down
+            with self._lock:
+                self._refreshing.discard(org_id)
+
+    def _refresh(self, org_id: str) -> Optional[Dict]:
+        """Re-reads status + version; reloads the entitlement rows only when the version moved."""
         db = SessionCore()
         try:
-            # 2. Fetch Active Entitlements
-            ents = db.query(models.OrgEntitlement).filter(
-                models.OrgEntitlement.org_id == org_id,
-                models.OrgEntitlement.enabled == True
-            ).all()
-            
-            active_slugs = {e.entitlement_key for e in ents}
-            
-            # 3. Update Cache
-            self._cache[org_id] = {
-                "version": db_version,
-                "entitlements": active_slugs,
-                # "status": org_status, # Status is checked real-time now
-                "expires_at": time.time() + self.TTL_SECONDS
-            }
-            
-            return service_slug in active_slugs
-            
+            org = db.query(models.Organization.status, models.Organization.entitlements_version).filter(
+                models.Organization.id == org_id
+            ).first()
+
+            with self._lock:
+                cached = self._cache.get(org_id)
+                self.refreshes += 1
+
+            if not org:
+                entry = {"exists": False, "version": 0, "status": None, "entitlements": set()}
+            else:
+                db_version = org.entitlements_version or 1
+                if cached and cached["exists"] and cached["version"] == db_version:
+                    active_slugs = cached["entitlements"]
+                else:
+                    ents = db.query(models.OrgEntitlement.entitlement_key).filter(
+                        models.OrgEntitlement.org_id == org_id,
+                        models.OrgEntitlement.enabled == True
+                    ).all()
+                    active_slugs = {e.entitlement_key for e in ents}
+                    with self._lock:
+                        self.reloads += 1
+                entry = {"exists": True, "version": db_version, "status": org.status or "Active", "entitlements": active_slugs}
+
+            entry["checked_at"] = time.monotonic()
+            with self._lock:
+                self._cache[org_id] = entry
+            return entry
+
         except Exception as e:
+            with self._lock:
+                self.errors += 1
             print(f"❌ [ENTITLEMENTS] DB Error: {e}")
-            return False
+            return None
         finally:
             db.close()
-            
+
     def invalidate(self, org_id: str):
-        if org_id in self._cache:
-            del self._cache[org_id]
+        """Drops the org; the next check reloads it inline."""
+        with self._lock:
+            self._cache.pop(org_id, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "orgs_cached": len(self._cache),
+                "ttl_seconds": self.TTL_SECONDS,
+                "max_stale_seconds": self.max_stale_seconds,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "reloads": self.reloads,
+                "errors": self.errors
+            }
 
 # Singleton Instance
 entitlements_client = EntitlementsClient()
+
+def invalidate_local_entitlements(org_id: str):
+    """
+    Call after committing an entitlement / status change for 'org_id' (the commit must also bump
+    accounts_organizations.entitlements_version). Only this process drops its entry right away:
+    there is no cross-process push. Other services pick up the new version on their next
+    revalidation (<= ENTITLEMENTS_TTL_SECONDS), or immediately for tokens that already carry it.
+    """
+    entitlements_client.invalidate(org_id)
+    print(f"🔄 [ENTITLEMENTS] Org {org_id} changed (version bumped, local cache invalidated)")
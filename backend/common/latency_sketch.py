@@ -0,0 +1,123 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ~compression/2 centroids per digest; 200 keeps p95/p99 relative error under ~0.5% on latency-like data
+DEFAULT_COMPRESSION = 200
+
+
+class TDigest:
+    """
+    Merging t-digest (k1 / arcsine scale) for streaming latency quantiles.
+    Small enough to store as JSON per (hour, command, version, machine) and mergeable across buckets,
+    so percentiles for any window are computed from digests instead of raw PluginLog rows.
+    """
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = [] # (mean, weight), sorted by mean
+        self.count = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._buffer: List[float] = []
+
+    # --- Build ---
+
+    def add(self, value: float):
+        self._buffer.append(float(value))
+        if len(self._buffer) >= self.compression * 5:
+            self._flush()
+
+    def add_many(self, values: Iterable[float]):
+        for v in values:
+            self._buffer.append(float(v))
+        self._flush()
+
+    def merge(self, other: "TDigest"):
+        other._flush()
+        if other.count:
+            self._merge(list(other.centroids))
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        values = self._buffer
+        self._buffer = []
+        lo, hi = min(values), max(values)
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+        self._merge([(v, 1.0) for v in values])
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _merge(self, incoming: List[Tuple[float, float]]):
+        points = sorted(self.centroids + incoming)
+        total = sum(w for _, w in points)
+        if not points:
+            return
+        out = []
+        cur_m, cur_w = points[0]
+        w_so_far = 0.0
+        k_left = self._k(0.0)
+        for m, w in points[1:]:
+            if self._k((w_so_far + cur_w + w) / total) - k_left <= 1.0:
+                cur_m = (cur_m * cur_w + m * w) / (cur_w + w)
+                cur_w += w
+            else:
+                out.append((cur_m, cur_w))
+                w_so_far += cur_w
+                k_left = self._k(w_so_far / total)
+                cur_m, cur_w = m, w
+        out.append((cur_m, cur_w))
+        self.centroids = out
+        self.count = total
+
+    # --- Query ---
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._flush()
+        if not self.count:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        q = min(max(q, 0.0), 1.0)
+        target = q * self.count
+        cum = 0.0
+        prev_center, prev_mean = 0.0, self.min
+        for mean, weight in self.centroids:
+            center = cum + weight / 2.0
+            if target <= center:
+                span = center - prev_center
+                frac = (target - prev_center) / span if span > 0 else 0.0
+                return prev_mean + frac * (mean - prev_mean)
+            prev_center, prev_mean = center, mean
+            cum += weight
+        span = self.count - prev_center
+        frac = (target - prev_center) / span if span > 0 else 1.0
+        return prev_mean + frac * (self.max - prev_mean)
+
+    # --- Storage ---
+
+    def to_dict(self) -> Dict:
+        self._flush()
+        return {
+            "c": self.compression,
+            "n": self.count,
+            "min": self.min,
+            "max": self.max,
+            "m": [round(m, 3) for m, _ in self.centroids],
+            "w": [w for _, w in self.centroids]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "TDigest":
+        d = cls((data or {}).get("c", DEFAULT_COMPRESSION))
+        if data and data.get("n"):
+            d.centroids = list(zip(data["m"], data["w"]))
+            d.count = data["n"]
+            d.min = data.get("min")
+            d.max = data.get("max")
+        return d
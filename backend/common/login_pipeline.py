@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict
+
+# bcrypt releases the GIL while hashing, so threads run in parallel (no process pool / pickling needed)
+LOGIN_HASH_WORKERS = int(os.getenv("LOGIN_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Logins past admission at once per worker process; the rest wait in line
+LOGIN_MAX_CONCURRENT = int(os.getenv("LOGIN_MAX_CONCURRENT", str(LOGIN_HASH_WORKERS * 2)))
+# Beyond this many waiting logins (or after the wait timeout) the login is refused with 503
+LOGIN_MAX_QUEUED = int(os.getenv("LOGIN_MAX_QUEUED", "100"))
+LOGIN_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LOGIN_QUEUE_TIMEOUT_SECONDS", "10"))
+LOGIN_RETRY_AFTER_SECONDS = 2
+
+
+class LoginBusy(Exception):
+    pass
+
+
+class LoginPipeline:
+    """
+    Keeps password logins off the event loop:
+    - admit(): bounded concurrency + bounded waiting line, so a burst of logins queues instead of
+      taking every threadpool thread / CPU from the other requests on the worker.
+    - verify_password() / hash_password(): bcrypt on a dedicated small pool.
+    DB work stays in the handlers via run_in_threadpool.
+    """
+
+    def __init__(self, hash_workers: int = LOGIN_HASH_WORKERS, max_concurrent: int = LOGIN_MAX_CONCURRENT,
+                 max_queued: int = LOGIN_MAX_QUEUED, queue_timeout: float = LOGIN_QUEUE_TIMEOUT_SECONDS):
+        self.hash_workers = max(1, hash_workers)
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._hash_pool = ThreadPoolExecutor(max_workers=self.hash_workers, thread_name_prefix="login-bcrypt")
+        self._lock = threading.Lock()
+        self._semaphore = None # (loop, asyncio.Semaphore): created on the serving loop
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+        self.hash_ms_total = 0.0
+        self.hashes = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if not self._semaphore or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(self.max_concurrent))
+        return self._semaphore[1]
+
+    @asynccontextmanager
+    async def admit(self):
+        """Waits for a login slot. Raises LoginBusy when the line is full or the wait times out."""
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_queued:
+                self.rejected += 1
+                raise LoginBusy("Login queue full")
+            started = time.perf_counter()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise LoginBusy("Timed out waiting for a login slot")
+            finally:
+                self.waiting -= 1
+            self.max_wait_ms = max(self.max_wait_ms, (time.perf_counter() - started) * 1000)
+        else:
+            await semaphore.acquire() # Free slot: no suspension
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def _run_hash(self, func, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._hash_pool, func, *args)
+        finally:
+            with self._lock:
+                self.hashes += 1
+                self.hash_ms_total += (time.perf_counter() - started) * 1000
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        from .auth_utils import verify_password
+        return await self._run_hash(verify_password, plain_password, hashed_password)
+
+    async def hash_password(self, password: str) -> str:
+        from .auth_utils import get_password_hash
+        return await self._run_hash(get_password_hash, password)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hash_workers": self.hash_workers,
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "waiting": self.waiting,
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "max_wait_ms": round(self.max_wait_ms, 1),
+                "avg_hash_ms": round(self.hash_ms_total / self.hashes, 1) if self.hashes else None
+            }
+
+# Singleton Instance
+login_pipeline = LoginPipeline()
@@ -0,0 +1,197 @@
+from typing import Dict, List
+
+import numpy as np
+
+# Revit internal units are feet: pass scale=0.3048 to get m² / m³.
+
+def as_vertex_array(vertices) -> np.ndarray:
+    """[x,y,z,...], [[x,y,z],...] or [{'x','y','z'},...] -> (N, 3) float64."""
+    if vertices is None or len(vertices) == 0:
+        return np.zeros((0, 3), dtype=np.float64)
+    if isinstance(vertices[0], dict):
+        return np.array([(v.get("x", 0.0), v.get("y", 0.0), v.get("z", 0.0)) for v in vertices], dtype=np.float64)
+    arr = np.asarray(vertices, dtype=np.float64)
+    if arr.ndim == 1:
+        if arr.size % 3:
+            raise ValueError("Flat vertex array length must be a multiple of 3")
+        arr = arr.reshape(-1, 3)
+    if arr.ndim != 2 or arr.shape[1] != 3:
+        raise ValueError("Vertices must be 3D points")
+    return arr
+
+def as_face_array(faces, n_vertices: int) -> np.ndarray:
+    """[i,j,k,...] or [[i,j,k],...] -> (M, 3) int64, validated against the vertex count."""
+    if faces is None or len(faces) == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+    arr = np.asarray(faces, dtype=np.int64)
+    if arr.ndim == 1:
+        if arr.size % 3:
+            raise ValueError("Flat face array length must be a multiple of 3 (triangles only)")
+        arr = arr.reshape(-1, 3)
+    if arr.ndim != 2 or arr.shape[1] != 3:
+        raise ValueError("Faces must be triangles")
+    if arr.size and (arr.min() < 0 or arr.max() >= n_vertices):
+        raise ValueError("Face index out of range")
+    return arr
+
+def is_closed(faces: np.ndarray) -> bool:
+    """Watertight check: every undirected edge is shared by exactly two triangles."""
+    if len(faces) == 0:
+        return False
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    edges.sort(axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return bool(np.all(counts == 2))
+
+def _triangle_terms(v: np.ndarray, f: np.ndarray):
+    """Per-triangle area, signed tetra volume (origin apex) and tetra centroid numerator."""
+    a, b, c = v[f[:, 0]], v[f[:, 1]], v[f[:, 2]]
+    cross = np.cross(b - a, c - a)
+    areas = 0.5 * np.linalg.norm(cross, axis=1)
+    # Divergence theorem: V = sum(a . (b x c)) / 6
+    vols = np.einsum("ij,ij->i", a, np.cross(b, c)) / 6.0
+    tri_centroids = (a + b + c) / 3.0
+    return areas, vols, tri_centroids
+
+
+def mesh_quantities(vertices, faces, scale: float = 1.0) -> Dict:
+    """
+    Quantities of one triangulated mesh.
+    volume is |signed volume| (orientation independent); centroid is the solid centroid
+    for closed meshes and the area-weighted surface centroid otherwise.
+    """
+    v = as_vertex_array(vertices) * scale
+    f = as_face_array(faces, len(v))
+
+    result = {
+        "vertices": int(len(v)),
+        "triangles": int(len(f)),
+        "area": 0.0,
+        "volume": 0.0,
+        "signed_volume": 0.0,
+        "bbox_min": None,
+        "bbox_max": None,
+        "centroid": None,
+        "closed": False
+    }
+    if len(v):
+        result["bbox_min"] = v.min(axis=0).tolist()
+        result["bbox_max"] = v.max(axis=0).tolist()
+        result["centroid"] = v.mean(axis=0).tolist()
+    if not len(f):
+        return result
+
+    areas, vols, tri_centroids = _triangle_terms(v, f)
+    area = float(areas.sum())
+    signed = float(vols.sum())
+    closed = is_closed(f)
+
+    if closed and abs(signed) > 1e-12:
+        # Tetra (origin, a, b, c) centroid = (a + b + c) / 4
+        centroid = (vols[:, None] * tri_centroids * 0.75).sum(axis=0) / signed
+    elif area > 0:
+        centroid = (areas[:, None] * tri_centroids).sum(axis=0) / area
+    else:
+        centroid = v.mean(axis=0)
+
+    result.update({
+        "area": area,
+        "volume": abs(signed),
+        "signed_volume": signed,
+        "centroid": centroid.tolist(),
+        "closed": closed
+    })
+    return result
+
+
+def batch_quantities(elements: List[Dict], scale: float = 1.0) -> Dict:
+    """
+    elements: [{ id, category, vertices, faces }]. All valid meshes are concatenated into one
+    vertex/face array and reduced per element with bincount/reduceat (no per-element Python math).
+    Returns { results: [...], totals: { category: {...} }, errors: [...] }.
+    """
+    ids, cats, verts, faces, errors = [], [], [], [], []
+    for i, el in enumerate(elements):
+        el_id = str(el.get("id", i))
+        try:
+            v = as_vertex_array(el.get("vertices"))
+            f = as_face_array(el.get("faces"), len(v))
+            if not len(v):
+                raise ValueError("No vertices")
+        except (ValueError, TypeError) as e:
+            errors.append({"id": el_id, "error": str(e)})
+            continue
+        ids.append(el_id)
+        cats.append(el.get("category") or "Sin Categoría")
+        verts.append(v)
+        faces.append(f)
+
+    n = len(ids)
+    if not n:
+        return {"results": [], "totals": {}, "errors": errors}
+
+    v_counts = np.array([len(v) for v in verts], dtype=np.int64)
+    f_counts = np.array([len(f) for f in faces], dtype=np.int64)
+    v_offsets = np.concatenate([[0], np.cumsum(v_counts)[:-1]])
+
+    V = np.concatenate(verts) * scale
+    F = np.concatenate(faces) + np.repeat(v_offsets, f_counts)[:, None]
+    face_owner = np.repeat(np.arange(n), f_counts)
+
+    # Bounding boxes: vertices are contiguous per element
+    bbox_min = np.minimum.reduceat(V, v_offsets, axis=0)
+    bbox_max = np.maximum.reduceat(V, v_offsets, axis=0)
+    vertex_mean = np.add.reduceat(V, v_offsets, axis=0) / v_counts[:, None]
+
+    area = np.zeros(n)
+    signed = np.zeros(n)
+    solid_num = np.zeros((n, 3))
+    surface_num = np.zeros((n, 3))
+    if len(F):
+        areas, vols, tri_centroids = _triangle_terms(V, F)
+        area = np.bincount(face_owner, weights=areas, minlength=n)
+        signed = np.bincount(face_owner, weights=vols, minlength=n)
+        for axis in range(3):
+            solid_num[:, axis] = np.bincount(face_owner, weights=vols * tri_centroids[:, axis] * 0.75, minlength=n)
+            surface_num[:, axis] = np.bincount(face_owner, weights=areas * tri_centroids[:, axis], minlength=n)
+
+    # Watertight per element in one pass: (owner, edge) pairs must each appear exactly twice
+    closed = f_counts > 0
+    if len(F):
+        edges = np.concatenate([F[:, [0, 1]], F[:, [1, 2]], F[:, [2, 0]]])
+        edges.sort(axis=1)
+        keyed = np.column_stack([np.tile(face_owner, 3), edges])
+        uniq, counts = np.unique(keyed, axis=0, return_counts=True)
+        closed[np.unique(uniq[counts != 2, 0])] = False
+    solid = closed & (np.abs(signed) > 1e-12)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid = np.where(solid[:, None], solid_num / signed[:, None],
+                            np.where((area > 0)[:, None], surface_num / area[:, None], vertex_mean))
+    volume = np.abs(signed)
+
+    results = []
+    for i in range(n):
+        results.append({
+            "id": ids[i],
+            "category": cats[i],
+            "area": float(area[i]),
+            "volume": float(volume[i]),
+            "signed_volume": float(signed[i]),
+            "bbox_min": bbox_min[i].tolist(),
+            "bbox_max": bbox_max[i].tolist(),
+            "centroid": centroid[i].tolist(),
+            "closed": bool(closed[i]),
+            "triangles": int(f_counts[i])
+        })
+
+    # Category totals
+    cat_names, cat_idx = np.unique(np.array(cats, dtype=object).astype(str), return_inverse=True)
+    cat_area = np.bincount(cat_idx, weights=area, minlength=len(cat_names))
+    cat_volume = np.bincount(cat_idx, weights=volume, minlength=len(cat_names))
+    cat_count = np.bincount(cat_idx, minlength=len(cat_names))
+    totals = {
+        str(name): {"count": int(cat_count[k]), "area": float(cat_area[k]), "volume": float(cat_volume[k])}
+        for k, name in enumerate(cat_names)
+    }
+
+    return {"results": results, "totals": totals, "errors": errors}
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, Text, create_engine
+from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, Text, Index, create_engine, text
 from sqlalchemy.orm import sessionmaker, relationship, DeclarativeBase, synonym
 from sqlalchemy.sql import func
 import datetime
 
+from .compression import CompressedJSON
+
 class Base(DeclarativeBase):
     pass
 
@@ -152,8 +154,40 @@ class PluginLog(Base):
     timestamp = Column(DateTime, default=func.now())
     context_data = Column(JSON) # Project name, file name, etc.
 
+class PluginCommandStat(Base):
+    """
+    Hourly latency rollup per (command, Revit version, plugin version, machine), maintained at ingest.
+    digest_json is a t-digest (common.latency_sketch) so any window's percentiles merge rollups, not raw logs.
+    """
+    __tablename__ = 'plugin_command_stats'
+    __table_args__ = (
+        Index('ix_plugin_command_stats_key', 'bucket_start', 'command_name', 'revit_version', 'plugin_version', 'machine_id', unique=True),
+        Index('ix_plugin_command_stats_command', 'command_name', 'bucket_start'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket_start = Column(DateTime, nullable=False) # Hour bucket
+    command_name = Column(String, nullable=False)
+    revit_version = Column(String, nullable=False, default="")
+    plugin_version = Column(String, nullable=False, default="")
+    machine_id = Column(String, nullable=False, default="")
+    count = Column(Integer, default=0)
+    total_ms = Column(Float, default=0.0)
+    min_ms = Column(Float)
+    max_ms = Column(Float)
+    digest_json = Column(JSON)
+
 class PluginSession(Base):
     __tablename__ = 'plugin_sessions'
+    __table_args__ = (
+        # Presence lookups (session healing, "who is online") and the stale-session reaper
+        Index('ix_plugin_sessions_presence', 'user_email', 'machine_id', 'last_heartbeat'),
+        Index('ix_plugin_sessions_active_heartbeat', 'is_active', 'last_heartbeat'),
+        # Admin listing keyset pagination (start_time DESC, id DESC)
+        Index('ix_plugin_sessions_start_time', 'start_time', 'id'),
+        # Case-insensitive user filter (admin listing, user logs): lower(user_email) = :email
+        Index('ix_plugin_sessions_user_email_lower', text('lower(user_email)')),
+    )
     
     id = Column(String, primary_key=True) # UUID
     user_email = Column(String)
@@ -165,6 +199,26 @@ class PluginSession(Base):
     last_heartbeat = Column(DateTime, default=func.now())
     is_active = Column(Boolean, default=True)
 
+class PluginDeviceToken(Base):
+    """
+    Long-lived device refresh token for the Revit add-in (only the sha256 is stored).
+    POST /api/plugin/resume exchanges it for a session without a password / bcrypt verify.
+    """
+    __tablename__ = 'plugin_device_tokens'
+    __table_args__ = (
+        Index('ix_plugin_device_tokens_user', 'user_email', 'machine_id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    user_email = Column(String, nullable=False)
+    machine_id = Column(String)
+    session_id = Column(String) # Last session opened with this token
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, default=False)
+
 class PluginActivity(Base):
     __tablename__ = 'plugin_activities'
     
@@ -179,6 +233,11 @@ class PluginActivity(Base):
     
     session = relationship("PluginSession")
 
+    __table_args__ = (
+        # Per-session log counts on the admin listing page
+        Index('ix_plugin_activities_session', 'session_id'),
+    )
+
 class PluginVersion(Base):
     __tablename__ = 'plugin_versions'
     
@@ -221,8 +280,35 @@ class PluginCloudSession(Base):
     project_name = Column(String, default="Proyecto Sin Nombre")
     folder_id = Column(String, ForeignKey('plugin_project_folders.id'), nullable=True)
     folder = relationship("PluginProjectFolder", back_populates="sessions")
-    data_json = Column(JSON, default={}) # Stores { cards: [], groups: [], sheets: [], revit_data: ... }
+    data_json = Column(CompressedJSON, default={}) # Stores { cards: [], groups: [], sheets: [], revit_data: ... } (compressed above threshold)
     timestamp = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Delta Sync: bumped on every element change. Element rows live in plugin_cloud_elements
+    revision = Column(Integer, default=0, nullable=False, server_default="0")
+    # Mirrors data_json['elements_external'] so revision checks don't load data_json
+    elements_external = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # Listings (/list-projects, /list-folders) are column-only and ordered by timestamp
+        Index('ix_plugin_cloud_sessions_folder_ts', 'folder_id', 'timestamp'),
+        Index('ix_plugin_cloud_sessions_user_ts', 'user_email', 'timestamp'),
+    )
+
+class PluginCloudElement(Base):
+    """
+    One Revit element row of a Cloud Quantify session (keyed by Revit Element Id).
+    Lets the plugin sync deltas instead of rewriting the whole data_json document.
+    """
+    __tablename__ = 'plugin_cloud_elements'
+    __table_args__ = (
+        Index('ix_plugin_cloud_elements_category', 'session_id', 'category'),
+    )
+
+    session_id = Column(String, ForeignKey('plugin_cloud_sessions.id', ondelete="CASCADE"), primary_key=True)
+    element_id = Column(String, primary_key=True) # Revit ElementId (as string)
+    category = Column(String)
+    data_json = Column(JSON, default={}) # The row: { Id, Name, <param>: <value>, ... }
+    row_hash = Column(String) # sha1 of canonical row JSON (unchanged rows are skipped)
+    revision = Column(Integer, default=0) # Session revision that last touched this row
 
 class CloudCommand(Base):
     __tablename__ = 'plugin_cloud_commands'
@@ -232,12 +318,18 @@ class CloudCommand(Base):
     action = Column(String)
     payload = Column(JSON)
     status = Column(String, default="pending") # pending, sent, success, error
-    result_json = Column(JSON, nullable=True) 
+    result_json = Column(CompressedJSON, nullable=True)
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     is_consumed = Column(Boolean, default=False)
 
+    __table_args__ = (
+        # Retention purge: consumed by updated_at, undelivered by created_at
+        Index('ix_plugin_cloud_commands_consumed_updated', 'is_consumed', 'updated_at'),
+        Index('ix_plugin_cloud_commands_consumed_created', 'is_consumed', 'created_at'),
+    )
+
 
 class ExpenseCard(Base):
     __tablename__ = 'resources_expense_cards'
@@ -309,10 +401,47 @@ class PluginSheetSession(Base):
     id = Column(String, primary_key=True) # UUID
     project = Column(String)
     plugin_session_id = Column(String)
-    sheets_json = Column(JSON)
+    sheets_json = Column(CompressedJSON)
     param_definitions_json = Column(JSON, default=[])
     created_at = Column(DateTime, default=func.now())
-    expires_at = Column(DateTime, nullable=True) # Optional expiration logic logic
+    expires_at = Column(DateTime, nullable=True) # Set on create, slid on apply; enforced by common.retention
+
+    __table_args__ = (
+        Index('ix_plugin_sheet_sessions_expires', 'expires_at'),
+        Index('ix_plugin_sheet_sessions_created', 'created_at'),
+    )
+
+class PluginSheetRow(Base):
+    """
+    One sheet of a Sheet Manager session (keyed by Revit UniqueId).
+    Backs server-side paging/filtering and the minimal diff on apply; sheets_json keeps the metadata only.
+    """
+    __tablename__ = 'plugin_sheet_rows'
+
+    session_id = Column(String, ForeignKey('plugin_sheet_sessions.id', ondelete="CASCADE"), primary_key=True)
+    sheet_id = Column(String, primary_key=True) # Revit UniqueId
+    position = Column(Integer, default=0) # Order received from Revit
+    number = Column(String)
+    name = Column(String)
+    data_json = Column(JSON, default={}) # { id, number, name, params_data, browser_paths }
+
+    __table_args__ = (
+        Index('ix_plugin_sheet_rows_number', 'session_id', 'number'),
+        Index('ix_plugin_sheet_rows_name', 'session_id', 'name'),
+        Index('ix_plugin_sheet_rows_position', 'session_id', 'position'),
+    )
+
+class PluginSheetPendingUpdate(Base):
+    """
+    Sheet edits sent to Revit by one UPDATE_SHEETS command. Promoted into plugin_sheet_rows when the
+    plugin reports the command as applied, dropped if it fails: the diff baseline is the last confirmed state.
+    """
+    __tablename__ = 'plugin_sheet_pending_updates'
+
+    command_id = Column(Integer, primary_key=True) # plugin_cloud_commands.id
+    session_id = Column(String, ForeignKey('plugin_sheet_sessions.id', ondelete="CASCADE"), index=True)
+    updates_json = Column(JSON, default=[]) # [{ id, number, name, params }] (changed params only)
+    created_at = Column(DateTime, default=func.now())
 
 # -----------------------------------------------------------------------------
 # SCHEMA: BIM PORTAL (External) -> Prefix 'bim_'
@@ -690,3 +819,35 @@ class DailyMessage(Base):
     channel = relationship("DailyChannel", back_populates="messages")
 
 
+
+# -----------------------------------------------------------------------------
+# SCHEMA: AO LABS (Cloud Manager) -> Prefix 'labs_'
+# -----------------------------------------------------------------------------
+
+class AccJob(Base):
+    """
+    Durable ACC upload / folder-copy job. Any worker can create, claim (pending -> running)
+    and report on a job, so status polling works across gunicorn workers and restarts.
+    """
+    __tablename__ = 'labs_acc_jobs'
+    __table_args__ = (
+        # Claim queue (oldest pending first) and stale-heartbeat recovery
+        Index('ix_labs_acc_jobs_status_created', 'status', 'created_at'),
+        # Cleanup of finished jobs
+        Index('ix_labs_acc_jobs_finished', 'finished_at'),
+    )
+
+    id = Column(String, primary_key=True) # UUID (task_id / job_id)
+    kind = Column(String, nullable=False) # upload, copy
+    status = Column(String, default="pending") # pending, running, done, partial, error, cancelled
+    params = Column(JSON, default={}) # project_id, folder_id, temp_path, filename / source folder, target
+    progress = Column(JSON, default={}) # Counters reported by the running job
+    result = Column(CompressedJSON, nullable=True) # Item data (upload) / manifest (copy)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    claimed_by = Column(String, nullable=True) # host:pid of the worker running it
+    cancel_requested = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
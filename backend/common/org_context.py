@@ -0,0 +1,303 @@
+import os
+import time
+import datetime
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from .database import SessionCore
+from . import models
+
+# Safety net for writes made outside this process (other services, scripts)
+# (refresh also revalidates the snapshot with one query, see OrgContextCache.revalidate)
+ORG_CONTEXT_TTL_SECONDS = float(os.getenv("ORG_CONTEXT_TTL_SECONDS", "60"))
+ORG_CONTEXT_MAX_USERS = int(os.getenv("ORG_CONTEXT_MAX_USERS", "20000"))
+
+# Legacy service names -> slugs
+SERVICE_SLUG_MAP = {
+    "AODailyWork": "daily",
+    "AOPlanSystem": "bim",
+    "AOBuild": "build",
+    "AO Clients": "portal",
+    "AOdev": "plugin",
+    "AO HR & Finance": "finance"
+}
+
+def map_service_slug(s: str) -> str:
+    return SERVICE_SLUG_MAP.get(s, s.lower())
+
+def service_slugs(raw) -> List[str]:
+    """services_access ({slug: bool}), list or single string -> slug list."""
+    if not raw:
+        return []
+    if isinstance(raw, dict):
+        return [map_service_slug(k) for k, v in raw.items() if v]
+    if isinstance(raw, (list, tuple, set)):
+        return [map_service_slug(s) for s in raw]
+    if isinstance(raw, str):
+        return [map_service_slug(raw)]
+    return []
+
+
+class OrgContextCache:
+    """
+    Per-user org-context snapshot: user role / services, memberships (org role, org status,
+    entitlements_version, enabled service slugs). Built with one query per table and kept until a
+    commit touches the user, their memberships or one of their orgs (SQLAlchemy session hooks on
+    SessionCore), or ORG_CONTEXT_TTL_SECONDS passes. Login and org selection resolve their claims
+    from a dict lookup; refresh adds one revalidation query (writes from other processes).
+    """
+
+    def __init__(self, ttl_seconds: float = ORG_CONTEXT_TTL_SECONDS, max_users: int = ORG_CONTEXT_MAX_USERS):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict] = {} # user_id -> snapshot
+        self._emails: Dict[str, str] = {} # email -> user_id
+        self._org_users: Dict[str, set] = {} # org_id -> user_ids holding a snapshot with it
+        self._generation = 0 # Bumped by every invalidation: a build that raced one is not stored
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.invalidations = 0
+
+    # --- Lookup ---
+
+    def get(self, user_id: str = None, email: str = None) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            # Legacy tokens carry the email as 'sub'
+            key = user_id if user_id in self._users else self._emails.get((email or user_id or "").lower())
+            snap = self._users.get(key) if key else None
+            if snap and snap["_expires"] > now:
+                self.hits += 1
+                return snap
+            self.misses += 1
+            generation = self._generation
+        return self._build(user_id, email, generation)
+
+    def _build(self, user_id: Optional[str], email: Optional[str], generation: int) -> Optional[Dict]:
+        db = SessionCore()
+        try:
+            q = db.query(models.AccountUser)
+            user = q.filter(models.AccountUser.id == user_id).first() if user_id else None
+            if not user and email:
+                user = q.filter(models.AccountUser.email == email.strip().lower()).first()
+            if not user:
+                return None
+
+            memberships = db.query(models.OrganizationUser.organization_id, models.OrganizationUser.role).filter(
+                models.OrganizationUser.user_id == user.id
+            ).all()
+            org_ids = {m.organization_id for m in memberships}
+            if user.last_active_org_id:
+                org_ids.add(user.last_active_org_id)
+
+            orgs, services = {}, {}
+            if org_ids:
+                for o in db.query(models.Organization.id, models.Organization.name, models.Organization.status,
+                                  models.Organization.entitlements_version).filter(models.Organization.id.in_(org_ids)).all():
+                    orgs[o.id] = o
+                for e in db.query(models.OrgEntitlement.org_id, models.OrgEntitlement.entitlement_key).filter(
+                        models.OrgEntitlement.org_id.in_(org_ids), models.OrgEntitlement.enabled == True).all():
+                    services.setdefault(e.org_id, []).append(map_service_slug(e.entitlement_key))
+
+            def _org(org_id, role):
+                o = orgs.get(org_id)
+                return {
+                    "org_id": org_id,
+                    "name": o.name if o else None,
+                    "role": role,
+                    "status": (o.status if o else None) or "Active",
+                    "entitlements_version": (o.entitlements_version if o else None) or 1,
+                    "services": sorted(services.get(org_id, [])),
+                    "exists": o is not None
+                }
+
+            snap = {
+                "user_id": user.id,
+                "email": user.email,
+                "role": user.role,
+                "status": user.status,
+                "services": service_slugs(user.services_access),
+                "last_active_org_id": user.last_active_org_id,
+                "memberships": {m.organization_id: _org(m.organization_id, m.role) for m in memberships},
+                "active_org": _org(user.last_active_org_id, None) if user.last_active_org_id else None,
+                "built_at": datetime.datetime.now().isoformat(),
+                "_expires": time.monotonic() + self.ttl
+            }
+        finally:
+            db.close()
+
+        with self._lock:
+            self.builds += 1
+            if generation != self._generation:
+                return snap # Invalidated while building: serve it once, don't keep it
+            if len(self._users) >= self.max_users:
+                self._drop_user(next(iter(self._users)))
+            self._drop_user(snap["user_id"])
+            self._users[snap["user_id"]] = snap
+            self._emails[(snap["email"] or "").lower()] = snap["user_id"]
+            for org_id in set(snap["memberships"]) | {snap["last_active_org_id"]} - {None}:
+                self._org_users.setdefault(org_id, set()).add(snap["user_id"])
+        return snap
+
+    def revalidate(self, snap: Dict) -> Optional[Dict]:
+        """
+        One-query check of what a token carries (user role / status / services, active org, its
+        membership and the org's status / entitlements_version) against a cached snapshot. Catches
+        writes the session hooks can't see (other processes, raw SQL) without waiting for the TTL;
+        the snapshot is rebuilt when anything moved. None if the user is gone.
+        """
+        U, OU, O = models.AccountUser, models.OrganizationUser, models.Organization
+        db = SessionCore()
+        try:
+            row = db.query(
+                U.role, U.status, U.services_access, U.last_active_org_id,
+                OU.id.label("member_id"), OU.role.label("org_role"),
+                O.id.label("org_id"), O.status.label("org_status"), O.entitlements_version
+            ).outerjoin(OU, (OU.user_id == U.id) & (OU.organization_id == U.last_active_org_id)) \
+             .outerjoin(O, O.id == U.last_active_org_id) \
+             .filter(U.id == snap["user_id"]).first()
+        finally:
+            db.close()
+        if row is None:
+            self.invalidate_user(snap["user_id"])
+            return None
+
+        membership = snap["memberships"].get(snap["last_active_org_id"])
+        org = snap["active_org"]
+        cached = (
+            snap["role"], snap["status"], snap["services"], snap["last_active_org_id"],
+            membership is not None, membership["role"] if membership else None,
+            bool(org and org["exists"]), org["status"] if org and org["exists"] else None,
+            org["entitlements_version"] if org and org["exists"] else None
+        )
+        current = (
+            row.role, row.status, service_slugs(row.services_access), row.last_active_org_id,
+            row.member_id is not None, row.org_role if row.member_id is not None else None,
+            row.org_id is not None, (row.org_status or "Active") if row.org_id else None,
+            (row.entitlements_version or 1) if row.org_id else None
+        )
+        if cached == current:
+            return snap
+        self.invalidate_user(snap["user_id"])
+        return self.get(user_id=snap["user_id"], email=snap["email"])
+
+    # --- Resolution ---
+
+    @staticmethod
+    def active_context(snap: Dict) -> Tuple[Optional[str], str, Optional[str], List[str], int]:
+        """
+        (org_id, role, org_role, services, entitlements_version) for login / refresh tokens.
+        role stays the user's platform role (admin checks and RBAC read it); org_role is the
+        membership role in the active org (None when not a member).
+        """
+        org = snap["active_org"]
+        membership = snap["memberships"].get(snap["last_active_org_id"])
+        services = snap["services"] or (org["services"] if org else [])
+        return (snap["last_active_org_id"], snap["role"], membership["role"] if membership else None,
+                services, org["entitlements_version"] if org else 1)
+
+    @staticmethod
+    def membership_context(snap: Dict, org_id: str) -> Optional[Tuple[str, str, List[str], int]]:
+        """(org_id, org role, org services, entitlements_version) when selecting an org; None if not a member."""
+        m = snap["memberships"].get(org_id)
+        if not m:
+            return None
+        return org_id, m["role"], m["services"], m["entitlements_version"]
+
+    # --- Invalidation ---
+
+    def _drop_user(self, user_id: str):
+        snap = self._users.pop(user_id, None)
+        if not snap:
+            return
+        self._emails.pop((snap["email"] or "").lower(), None)
+        for org_id in set(snap["memberships"]) | {snap["last_active_org_id"]} - {None}:
+            users = self._org_users.get(org_id)
+            if users:
+                users.discard(user_id)
+                if not users:
+                    del self._org_users[org_id]
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._drop_user(user_id)
+
+    def invalidate_org(self, org_id: str):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for user_id in list(self._org_users.get(org_id, ())):
+                self._drop_user(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._users.clear()
+            self._emails.clear()
+            self._org_users.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "users_cached": len(self._users),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "invalidations": self.invalidations
+            }
+
+# Singleton Instance
+org_context = OrgContextCache()
+
+# -----------------------------------------------------------------------------
+# INVALIDATION HOOKS (SessionCore)
+# -----------------------------------------------------------------------------
+# Changes are collected at flush and applied after commit, so a rebuild reads committed rows.
+
+_USER_KEYED = {models.AccountUser: "id", models.OrganizationUser: "user_id"}
+_ORG_KEYED = {models.Organization: "id", models.OrgEntitlement: "org_id", models.ServicePermission: "organization_id"}
+
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault("org_context_pending", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for cls, attr in _USER_KEYED.items():
+            if isinstance(obj, cls):
+                pending.add(("user", getattr(obj, attr, None)))
+        for cls, attr in _ORG_KEYED.items():
+            if isinstance(obj, cls):
+                pending.add(("org", getattr(obj, attr, None)))
+
+def _collect_bulk(orm_execute_state):
+    # query(...).update() / .delete() bypass the unit of work: drop everything on commit
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        if orm_execute_state.bind_mapper.class_ in _USER_KEYED or orm_execute_state.bind_mapper.class_ in _ORG_KEYED:
+            orm_execute_state.session.info.setdefault("org_context_pending", set()).add(("all", None))
+
+def _apply_changes(session):
+    pending = session.info.pop("org_context_pending", None)
+    if not pending:
+        return
+    if ("all", None) in pending:
+        org_context.clear()
+        return
+    for kind, key in pending:
+        if not key:
+            continue
+        if kind == "user":
+            org_context.invalidate_user(key)
+        else:
+            org_context.invalidate_org(key)
+
+def _discard_changes(session, previous_transaction=None):
+    session.info.pop("org_context_pending", None)
+
+event.listen(SessionCore, "after_flush", _collect_changes)
+event.listen(SessionCore, "do_orm_execute", _collect_bulk)
+event.listen(SessionCore, "after_commit", _apply_changes)
+event.listen(SessionCore, "after_soft_rollback", _discard_changes)
@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+# How long a latest-version / user snapshot is served from memory
+BOOTSTRAP_TTL_SECONDS = float(os.getenv("PLUGIN_BOOTSTRAP_TTL_SECONDS", "60"))
+DEFAULT_LATEST_VERSION = "1.5.2"
+
+
+class PluginBootstrapCache:
+    """
+    Snapshot of what the add-in needs at startup: latest plugin version (global) and
+    { name, role, is_active, permissions } per user. Login and resume read it, so an
+    office-wide Revit start costs one version query and one user query per TTL, not per start.
+    """
+
+    def __init__(self, ttl_seconds: float = BOOTSTRAP_TTL_SECONDS, max_users: int = 5000):
+        self.ttl = ttl_seconds
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._version = None # (expires, data)
+        self._users: Dict[str, tuple] = {} # email -> (expires, snapshot)
+        self.hits = 0
+        self.misses = 0
+
+    def latest_version(self) -> Dict:
+        """{ latest_version, update_info }"""
+        now = time.monotonic()
+        with self._lock:
+            if self._version and self._version[0] > now:
+                self.hits += 1
+                return self._version[1]
+        # Lazy import: database.py imports this module
+        from .database import get_latest_plugin_version
+        v = get_latest_plugin_version()
+        data = {"latest_version": v["version"] if v else DEFAULT_LATEST_VERSION, "update_info": v}
+        with self._lock:
+            self.misses += 1
+            self._version = (now + self.ttl, data)
+        return data
+
+    def user(self, email: str) -> Optional[Dict]:
+        key = (email or "").lower()
+        now = time.monotonic()
+        with self._lock:
+            item = self._users.get(key)
+            if item and item[0] > now:
+                self.hits += 1
+                return item[1]
+        from .database import get_user_by_email
+        u = get_user_by_email(email)
+        snapshot = None
+        if u:
+            snapshot = {
+                "email": u.email,
+                "name": u.name,
+                "role": u.role,
+                "is_active": u.is_active,
+                "permissions": getattr(u, "permissions", None) or {}
+            }
+        with self._lock:
+            self.misses += 1
+            if len(self._users) >= self.max_users:
+                self._users = {k: v for k, v in self._users.items() if v[0] > now}
+            self._users[key] = (now + self.ttl, snapshot)
+        return snapshot
+
+    def invalidate_user(self, email: str):
+        with self._lock:
+            self._users.pop((email or "").lower(), None)
+
+    def invalidate_version(self):
+        with self._lock:
+            self._version = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"ttl_seconds": self.ttl, "users_cached": len(self._users), "hits": self.hits, "misses": self.misses}
+
+# Singleton Instance
+plugin_bootstrap = PluginBootstrapCache()
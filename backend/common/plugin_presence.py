@@ -0,0 +1,164 @@
+import os
+import datetime
+import threading
+from typing import Dict, List, Optional
+
+# Sessions without a heartbeat for this long are considered dead (crashed Revit, lost network...)
+SESSION_TIMEOUT_MINUTES = int(os.getenv("PLUGIN_SESSION_TIMEOUT_MINUTES", "5"))
+REAPER_INTERVAL_SECONDS = int(os.getenv("PLUGIN_REAPER_INTERVAL_SECONDS", "60"))
+
+class PluginPresence:
+    """
+    In-memory presence map of live Revit sessions.
+    Key: plugin session id -> { user_email, machine_id, revit_version, plugin_version, last_heartbeat }.
+    Fed by login/heartbeat/logout and re-synced from DB by the reaper, so admin
+    dashboards and session healing never scan 'plugin_sessions'.
+    NOTE: Per-process. Under several workers each map converges on every reaper tick.
+    """
+
+    def __init__(self, timeout_minutes: int = SESSION_TIMEOUT_MINUTES):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict] = {}
+        self.timeout = datetime.timedelta(minutes=timeout_minutes)
+
+    def _cutoff(self):
+        return datetime.datetime.now() - self.timeout
+
+    def touch(self, session_id: str, user_email: str = None, machine_id: str = None,
+              revit_version: str = None, plugin_version: str = None, last_heartbeat: datetime.datetime = None):
+        """Registers (or refreshes) a live session."""
+        if not session_id:
+            return
+        with self._lock:
+            entry = self._sessions.get(session_id, {"session_id": session_id})
+            if user_email is not None: entry["user_email"] = user_email
+            if machine_id is not None: entry["machine_id"] = machine_id
+            if revit_version is not None: entry["revit_version"] = revit_version
+            if plugin_version is not None: entry["plugin_version"] = plugin_version
+            entry["last_heartbeat"] = last_heartbeat or datetime.datetime.now()
+            self._sessions[session_id] = entry
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Returns the live entry for a session or None if unknown/stale."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry and entry["last_heartbeat"] > self._cutoff():
+            return dict(entry)
+        return None
+
+    def online(self) -> List[Dict]:
+        """Snapshot of every live session, newest heartbeat first."""
+        cutoff = self._cutoff()
+        with self._lock:
+            entries = [dict(e) for e in self._sessions.values() if e["last_heartbeat"] > cutoff]
+        entries.sort(key=lambda e: e["last_heartbeat"], reverse=True)
+        return entries
+
+    def find_latest(self, user_email: str = None, machine_id: str = None) -> Optional[Dict]:
+        """Most recent live session for a user OR machine (same rule as get_latest_active_session)."""
+        if not user_email and not machine_id:
+            return None
+        for entry in self.online():
+            if user_email and entry.get("user_email") == user_email:
+                return entry
+            if machine_id and entry.get("machine_id") == machine_id:
+                return entry
+        return None
+
+    def user_status(self, user_email: str) -> Optional[Dict]:
+        """Latest live session of a user (case-insensitive) or None if offline."""
+        if not user_email:
+            return None
+        target = user_email.lower().strip()
+        for entry in self.online():
+            if (entry.get("user_email") or "").lower().strip() == target:
+                return entry
+        return None
+
+    def replace_all(self, entries: List[Dict]):
+        """Rebuilds the map from a DB snapshot (see SessionReaper)."""
+        fresh = {}
+        for e in entries:
+            fresh[e["session_id"]] = e
+        with self._lock:
+            # Keep local heartbeats that are newer than what the DB snapshot saw
+            for sid, local in self._sessions.items():
+                if sid in fresh and local["last_heartbeat"] > fresh[sid]["last_heartbeat"]:
+                    fresh[sid] = local
+            self._sessions = fresh
+
+    def prune(self):
+        cutoff = self._cutoff()
+        with self._lock:
+            stale = [sid for sid, e in self._sessions.items() if e["last_heartbeat"] <= cutoff]
+            for sid in stale:
+                del self._sessions[sid]
+        return len(stale)
+
+
+class SessionReaper:
+    """
+    Background thread that closes stale plugin sessions in bulk
+    (one UPDATE per tick instead of per-request scans) and re-syncs the presence map.
+    """
+
+    def __init__(self, presence: PluginPresence, interval_seconds: int = REAPER_INTERVAL_SECONDS):
+        self.presence = presence
+        self.interval = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.last_reaped = 0
+        self.total_reaped = 0
+
+    def run_once(self):
+        # Lazy import: database.py imports this module
+        from .database import reap_stale_plugin_sessions, get_live_plugin_sessions
+
+        reaped = reap_stale_plugin_sessions(self.presence.timeout)
+        self.presence.replace_all(get_live_plugin_sessions(self.presence.timeout))
+        self.presence.prune()
+
+        self.last_run = datetime.datetime.now()
+        self.last_reaped = reaped
+        self.total_reaped += reaped
+        if reaped:
+            print(f"[PRESENCE] Reaper closed {reaped} stale plugin sessions")
+        return reaped
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[PRESENCE] Reaper Error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="plugin-session-reaper", daemon=True)
+        self._thread.start()
+        print(f"[PRESENCE] Reaper started (timeout {self.presence.timeout}, every {self.interval}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "online_sessions": len(self.presence.online()),
+            "timeout_minutes": int(self.presence.timeout.total_seconds() // 60),
+            "interval_seconds": self.interval,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_reaped": self.last_reaped,
+            "total_reaped": self.total_reaped,
+        }
+
+# Singleton Instances
+plugin_presence = PluginPresence()
+session_reaper = SessionReaper(plugin_presence)
@@ -0,0 +1,364 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Revit exports parameter values as display strings ("12,50 m²", "1,234.50 m³", "3").
+# Logical fields map to the parameter names the extractor produces (EN / ES Revit).
+FIELD_ALIASES = {
+    "level": ["Level", "Nivel", "Reference Level", "Nivel de referencia", "Base Constraint", "Restricción de base", "Base Level", "Nivel base"],
+    "type": ["Type", "Tipo", "Family and Type", "Familia y tipo", "Type Name", "Nombre de tipo"],
+    "family": ["Family", "Familia"],
+    "area": ["Area", "Área"],
+    "volume": ["Volume", "Volumen"],
+    "length": ["Length", "Longitud"],
+    "name": ["Name", "Nombre"],
+}
+
+AGGREGATIONS = ("sum", "avg", "min", "max", "count")
+FILTER_OPS = ("eq", "ne", "contains", "startswith", "in", "gt", "gte", "lt", "lte")
+MAX_GROUP_BY = 4
+CACHE_SIZE = 8
+
+# Leading number only: 'W1' or 'Level 2' are text, '12,50 m²' / '$ 100' are quantities
+_NUMBER_RE = re.compile(r"^\s*[$€£]?\s*([-+]?\d[\d.,]*)")
+
+def parse_quantity(value) -> float:
+    """'12,50 m²' -> 12.5, '1,234.50' -> 1234.5, '1.234,5' -> 1234.5. NaN when not numeric."""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _NUMBER_RE.search(str(value))
+    if not m:
+        return np.nan
+    token = m.group(1).rstrip(".,")
+    if "," in token and "." in token:
+        # Last separator is the decimal one
+        if token.rfind(",") > token.rfind("."):
+            token = token.replace(".", "").replace(",", ".")
+        else:
+            token = token.replace(",", "")
+    elif "," in token:
+        head, _, tail = token.rpartition(",")
+        # '1,234' (thousands) vs '12,5' (decimal comma)
+        if token.count(",") > 1 or len(tail) == 3:
+            token = token.replace(",", "")
+        else:
+            token = head.replace(",", "") + "." + tail
+    elif token.count(".") > 1:
+        token = token.replace(".", "")
+    try:
+        return float(token)
+    except ValueError:
+        return np.nan
+
+
+class ElementFrame:
+    """
+    Columnar view of a session's elements (one NumPy array per parameter).
+    Raw columns are object arrays; text and numeric views are built once on demand.
+    """
+
+    def __init__(self, session_id: str, revision: int, elements):
+        self.session_id = session_id
+        self.revision = revision
+
+        ids, cats, rows = [], [], []
+        for element_id, category, row in elements:
+            ids.append(element_id)
+            cats.append(category or "")
+            rows.append(row or {})
+
+        self.size = len(rows)
+        self.ids = np.array(ids, dtype=object)
+        self.columns: Dict[str, np.ndarray] = {"category": np.array(cats, dtype=object)}
+
+        names = []
+        seen = set()
+        for row in rows:
+            for k in row.keys():
+                if k not in seen:
+                    seen.add(k)
+                    names.append(k)
+        for name in names:
+            if name in ("Id", "category"):
+                continue
+            col = np.empty(self.size, dtype=object)
+            col[:] = [row.get(name) for row in rows]
+            self.columns[name] = col
+
+        self._numeric: Dict[str, np.ndarray] = {}
+        self._text: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    # --- Columns ---
+
+    def resolve(self, field: str) -> Optional[str]:
+        """
+        Logical field ('level', 'area'...) or literal parameter name -> column name.
+        Categories name the same quantity differently (Walls 'Área', Floors 'Area'), so a logical
+        field present under several names resolves to a coalesced virtual column ('@area').
+        """
+        if not field:
+            return None
+        if field in self.columns:
+            return field
+        low = field.lower().strip()
+        if low in ("category", "categoria", "categoría"):
+            return "category"
+
+        present = [name for name in FIELD_ALIASES.get(low, []) if name in self.columns]
+        if len(present) == 1:
+            return present[0]
+        if present:
+            key = "@" + low
+            with self._lock:
+                if key not in self.columns:
+                    merged = self.columns[present[0]].copy()
+                    for name in present[1:]:
+                        empty = np.array([v is None or v == "" for v in merged], dtype=bool)
+                        merged[empty] = self.columns[name][empty]
+                    self.columns[key] = merged
+            return key
+
+        for name in self.columns:
+            if name.lower() == low:
+                return name
+        return None
+
+    def text(self, column: str) -> np.ndarray:
+        with self._lock:
+            arr = self._text.get(column)
+            if arr is None:
+                arr = np.array(["" if v is None else str(v) for v in self.columns[column]], dtype=str) if self.size else np.array([], dtype=str)
+                self._text[column] = arr
+            return arr
+
+    def numeric(self, column: str) -> np.ndarray:
+        with self._lock:
+            arr = self._numeric.get(column)
+            if arr is None:
+                arr = np.fromiter((parse_quantity(v) for v in self.columns[column]), dtype=np.float64, count=self.size)
+                self._numeric[column] = arr
+            return arr
+
+    def fields(self) -> List[Dict]:
+        """Available columns with their fill rate and whether they parse as numbers."""
+        out = []
+        for name in list(self.columns):
+            if name.startswith("@"):
+                continue
+            if name == "category":
+                out.append({"name": name, "numeric": False, "filled": self.size})
+                continue
+            num = self.numeric(name)
+            col = self.columns[name]
+            filled = int(sum(1 for v in col if v not in (None, "")))
+            out.append({"name": name, "numeric": bool(filled) and int(np.count_nonzero(~np.isnan(num))) >= filled * 0.8, "filled": filled})
+        return out
+
+    # --- Query ---
+
+    def mask(self, filters: List[Dict]) -> np.ndarray:
+        keep = np.ones(self.size, dtype=bool)
+        for f in filters or []:
+            column = self.resolve(f.get("field"))
+            op = f.get("op", "eq")
+            value = f.get("value")
+            if op not in FILTER_OPS:
+                raise ValueError(f"Unsupported filter op '{op}'")
+            if column is None:
+                # Unknown parameter: nothing matches an equality, everything passes a negation
+                if op != "ne":
+                    keep[:] = False
+                continue
+
+            if op in ("gt", "gte", "lt", "lte"):
+                num = self.numeric(column)
+                ref = parse_quantity(value)
+                with np.errstate(invalid="ignore"):
+                    if op == "gt": keep &= num > ref
+                    elif op == "gte": keep &= num >= ref
+                    elif op == "lt": keep &= num < ref
+                    else: keep &= num <= ref
+                continue
+
+            txt = np.char.lower(self.text(column))
+            if op == "in":
+                values = [str(v).lower() for v in (value if isinstance(value, list) else [value])]
+                keep &= np.isin(txt, values)
+            elif op == "contains":
+                keep &= np.char.find(txt, str(value or "").lower()) >= 0
+            elif op == "startswith":
+                keep &= np.char.startswith(txt, str(value or "").lower())
+            elif op == "ne":
+                keep &= txt != str(value or "").lower()
+            else:
+                keep &= txt == str(value or "").lower()
+        return keep
+
+    def aggregate(self, group_by: List[str] = None, filters: List[Dict] = None,
+                  metrics: List[Dict] = None, limit: int = None, order_by: str = None) -> Dict:
+        """
+        group_by: ['category', 'level', ...]. metrics: [{field, agg}] (agg: sum/avg/min/max/count).
+        Returns { revision, total_elements, matched, groups: [{ key: {...}, count, values: {...} }], totals }.
+        """
+        group_by = list(group_by or [])
+        if len(group_by) > MAX_GROUP_BY:
+            raise ValueError(f"At most {MAX_GROUP_BY} group_by fields")
+        metrics = list(metrics or [{"field": "count", "agg": "count"}])
+        for m in metrics:
+            if m.get("agg", "sum") not in AGGREGATIONS:
+                raise ValueError(f"Unsupported aggregation '{m.get('agg')}'")
+
+        keep = self.mask(filters)
+        idx = np.flatnonzero(keep)
+        matched = int(idx.size)
+
+        # Group codes: one np.unique per key, combined into a single code per row
+        labels = []
+        combined = np.zeros(matched, dtype=np.int64)
+        for g in group_by:
+            column = self.resolve(g)
+            values = self.text(column)[idx] if column else np.full(matched, "", dtype=str)
+            uniq, inv = np.unique(values, return_inverse=True)
+            if len(uniq):
+                # Re-densify after each key so the combined code can't overflow
+                _, combined = np.unique(combined * len(uniq) + inv, return_inverse=True)
+            labels.append((g, uniq, inv))
+
+        if group_by and matched:
+            codes, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+        else:
+            codes = np.zeros(1 if matched or not group_by else 0, dtype=np.int64)
+            first = np.zeros(codes.size, dtype=np.int64)
+            inverse = np.zeros(matched, dtype=np.int64)
+        n_groups = codes.size
+
+        counts = np.bincount(inverse, minlength=n_groups) if n_groups else np.zeros(0, dtype=np.int64)
+        results = {}
+        totals = {}
+        for m in metrics:
+            field = m.get("field", "count")
+            agg = m.get("agg", "sum")
+            key = m.get("as") or f"{field}_{agg}"
+            if field == "count" or agg == "count":
+                if field == "count":
+                    vals = counts.astype(np.float64)
+                else:
+                    column = self.resolve(field)
+                    present = (~np.isnan(self.numeric(column)[idx])) if column else np.zeros(matched, dtype=bool)
+                    vals = np.bincount(inverse, weights=present.astype(np.float64), minlength=n_groups)
+                results[key] = vals
+                totals[key] = float(vals.sum())
+                continue
+
+            column = self.resolve(field)
+            data = self.numeric(column)[idx] if column else np.full(matched, np.nan)
+            valid = ~np.isnan(data)
+            safe = np.where(valid, data, 0.0)
+            n_valid = np.bincount(inverse, weights=valid.astype(np.float64), minlength=n_groups)
+            if agg == "sum":
+                vals = np.bincount(inverse, weights=safe, minlength=n_groups)
+                total = float(safe.sum())
+            elif agg == "avg":
+                sums = np.bincount(inverse, weights=safe, minlength=n_groups)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    vals = np.where(n_valid > 0, sums / np.maximum(n_valid, 1), np.nan)
+                total = float(safe.sum() / valid.sum()) if valid.any() else None
+            else:
+                init = np.inf if agg == "min" else -np.inf
+                vals = np.full(n_groups, init)
+                ufunc = np.minimum if agg == "min" else np.maximum
+                ufunc.at(vals, inverse[valid], data[valid])
+                vals = np.where(np.isinf(vals), np.nan, vals)
+                total = float(ufunc.reduce(data[valid])) if valid.any() else None
+            results[key] = vals
+            totals[key] = total
+
+        groups = []
+        for gi in range(n_groups):
+            row_pos = first[gi]
+            key = {g: str(uniq[inv[row_pos]]) for g, uniq, inv in labels}
+            values = {k: (None if np.isnan(v[gi]) else round(float(v[gi]), 6)) for k, v in results.items()}
+            groups.append({"key": key, "count": int(counts[gi]), "values": values})
+
+        if order_by:
+            desc = order_by.startswith("-")
+            name = order_by.lstrip("-")
+            def sort_value(g):
+                return g["count"] if name == "count" else g["values"].get(name, g["key"].get(name))
+            present = [g for g in groups if sort_value(g) is not None]
+            missing = [g for g in groups if sort_value(g) is None]
+            groups = sorted(present, key=sort_value, reverse=desc) + missing
+
+        truncated = False
+        if limit and len(groups) > limit:
+            groups = groups[:limit]
+            truncated = True
+
+        return {
+            "revision": self.revision,
+            "total_elements": self.size,
+            "matched": matched,
+            "group_by": group_by,
+            "groups": groups,
+            "totals": {k: (None if v is None else round(v, 6)) for k, v in totals.items()},
+            "truncated": truncated
+        }
+
+
+class QuantifyEngine:
+    """
+    Per-session ElementFrame cache keyed by (session_id, revision).
+    Any sync bumps the revision, so stale frames are never served; LRU keeps memory bounded.
+    """
+
+    def __init__(self, max_sessions: int = CACHE_SIZE):
+        self.max_sessions = max_sessions
+        self._frames: "OrderedDict[str, ElementFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def frame(self, session_id: str) -> Optional[ElementFrame]:
+        # Lazy import: database.py is heavy and imports models
+        from .database import get_cloud_session_revision, get_cloud_elements
+
+        revision = get_cloud_session_revision(session_id)
+        if revision is None:
+            return None
+
+        with self._lock:
+            cached = self._frames.get(session_id)
+            if cached is not None and cached.revision == revision:
+                self._frames.move_to_end(session_id)
+                self.hits += 1
+                return cached
+        self.misses += 1
+
+        frame = ElementFrame(session_id, revision, get_cloud_elements(session_id))
+        with self._lock:
+            self._frames[session_id] = frame
+            self._frames.move_to_end(session_id)
+            while len(self._frames) > self.max_sessions:
+                self._frames.popitem(last=False)
+        return frame
+
+    def invalidate(self, session_id: str = None):
+        with self._lock:
+            if session_id is None:
+                self._frames.clear()
+            else:
+                self._frames.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            cached = {sid: {"revision": f.revision, "elements": f.size} for sid, f in self._frames.items()}
+        return {"hits": self.hits, "misses": self.misses, "cached_sessions": cached}
+
+# Singleton Instance
+quantify_engine = QuantifyEngine()
@@ -0,0 +1,127 @@
+import os
+import time
+import datetime
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+# TTLs per table (hours)
+SHEET_SESSION_TTL_HOURS = float(os.getenv("RETENTION_SHEET_SESSION_TTL_HOURS", "72"))
+CONSUMED_COMMAND_TTL_HOURS = float(os.getenv("RETENTION_CONSUMED_COMMAND_TTL_HOURS", "24"))
+PENDING_COMMAND_TTL_HOURS = float(os.getenv("RETENTION_PENDING_COMMAND_TTL_HOURS", "168"))
+# Purge job
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "500"))
+# Upper bound per table per run (chunks); the rest is picked up by the next run
+RETENTION_MAX_CHUNKS = int(os.getenv("RETENTION_MAX_CHUNKS", "200"))
+
+REPORT_TABLES = ["plugin_sheet_sessions", "plugin_sheet_rows", "plugin_sheet_pending_updates", "plugin_cloud_commands"]
+
+
+class RetentionPolicy:
+    """TTL configuration per table (env defaults, overridable for tests / admin tuning)."""
+
+    def __init__(self, sheet_session_hours: float = SHEET_SESSION_TTL_HOURS,
+                 consumed_command_hours: float = CONSUMED_COMMAND_TTL_HOURS,
+                 pending_command_hours: float = PENDING_COMMAND_TTL_HOURS,
+                 chunk_size: int = RETENTION_CHUNK_SIZE,
+                 max_chunks: int = RETENTION_MAX_CHUNKS):
+        self.sheet_session_ttl = datetime.timedelta(hours=sheet_session_hours)
+        self.consumed_command_ttl = datetime.timedelta(hours=consumed_command_hours)
+        self.pending_command_ttl = datetime.timedelta(hours=pending_command_hours)
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+
+    def describe(self) -> Dict:
+        return {
+            "plugin_sheet_sessions": {"ttl_hours": self.sheet_session_ttl.total_seconds() / 3600},
+            "plugin_cloud_commands": {
+                "consumed_ttl_hours": self.consumed_command_ttl.total_seconds() / 3600,
+                "pending_ttl_hours": self.pending_command_ttl.total_seconds() / 3600
+            },
+            "chunk_size": self.chunk_size,
+            "max_chunks": self.max_chunks
+        }
+
+
+class RetentionJob:
+    """
+    Background thread that purges expired sheet sessions (and their rows) and old queue commands
+    in chunked deletes, recording table sizes / row counts before and after each run.
+    """
+
+    def __init__(self, policy: RetentionPolicy, interval_seconds: int = RETENTION_INTERVAL_SECONDS, keep_reports: int = 20):
+        self.policy = policy
+        self.interval = interval_seconds
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.reports = deque(maxlen=keep_reports)
+        self.total_deleted = {"plugin_sheet_sessions": 0, "plugin_cloud_commands": 0}
+
+    def run_once(self) -> Optional[Dict]:
+        # Lazy import: database.py imports this module
+        from .database import purge_expired_sheet_sessions, purge_cloud_commands, get_plugin_table_stats
+
+        if not self._run_lock.acquire(blocking=False):
+            return None # A run is already in progress
+        try:
+            started = time.perf_counter()
+            before = get_plugin_table_stats(REPORT_TABLES)
+            sheets = purge_expired_sheet_sessions(self.policy.sheet_session_ttl, self.policy.chunk_size, self.policy.max_chunks)
+            commands = purge_cloud_commands(self.policy.consumed_command_ttl, self.policy.pending_command_ttl,
+                                            self.policy.chunk_size, self.policy.max_chunks)
+            after = get_plugin_table_stats(REPORT_TABLES)
+
+            self.total_deleted["plugin_sheet_sessions"] += sheets
+            self.total_deleted["plugin_cloud_commands"] += commands
+            report = {
+                "ran_at": datetime.datetime.now().isoformat(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "deleted": {"plugin_sheet_sessions": sheets, "plugin_cloud_commands": commands},
+                "before": before,
+                "after": after
+            }
+            self.reports.append(report)
+            if sheets or commands:
+                print(f"[RETENTION] Purged {sheets} sheet sessions, {commands} commands in {report['duration_ms']}ms")
+            return report
+        finally:
+            self._run_lock.release()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[RETENTION] Job Error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="plugin-retention", daemon=True)
+        self._thread.start()
+        print(f"[RETENTION] Job started (every {self.interval}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def report(self) -> Dict:
+        last: List[Dict] = list(self.reports)
+        return {
+            "policy": self.policy.describe(),
+            "interval_seconds": self.interval,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "total_deleted": dict(self.total_deleted),
+            "last_run": last[-1] if last else None,
+            "history": [
+                {"ran_at": r["ran_at"], "duration_ms": r["duration_ms"], "deleted": r["deleted"]}
+                for r in reversed(last)
+            ]
+        }
+
+# Singleton Instances
+retention_policy = RetentionPolicy()
+retention_job = RetentionJob(retention_policy)
@@ -0,0 +1,191 @@
+import os
+import math
+import time
+import threading
+from typing import Dict, List, Optional
+
+from .ai_gateway import normalize_prompt
+
+# How often a worker checks the DB for routines written by other workers
+ROUTINE_INDEX_REFRESH_SECONDS = float(os.getenv("ROUTINE_INDEX_REFRESH_SECONDS", "30"))
+
+# Field weights for ranking
+FIELD_WEIGHTS = {"title": 3.0, "category": 2.0, "description": 1.0, "actions": 1.0}
+
+STOPWORDS = {
+    "a", "al", "de", "del", "el", "en", "la", "las", "los", "lo", "un", "una", "y", "o", "para", "por",
+    "con", "que", "se", "su", "sus", "the", "of", "and", "to", "in", "for", "on", "with", "an"
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in normalize_prompt(text).split() if t not in STOPWORDS and len(t) > 1]
+
+
+class RoutineSearchIndex:
+    """
+    In-process inverted index over plugin routines (title, description, category, action steps).
+    Ranked with BM25 over field-weighted term frequencies; the last query term also matches as a prefix
+    (search-as-you-type). Kept current incrementally: new ids are pulled in by watermark, deletions
+    (count mismatch) trigger one rebuild.
+    """
+
+    def __init__(self, refresh_seconds: float = ROUTINE_INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, float]] = {} # term -> { routine_id: weighted tf }
+        self._docs: Dict[int, Dict] = {} # routine_id -> { meta, length }
+        self._total_length = 0.0
+        self._max_id = 0
+        self._checked_at = 0.0
+        self._loaded = False
+        self.rebuilds = 0
+
+    # --- Indexing ---
+
+    @staticmethod
+    def _fields(routine) -> Dict[str, str]:
+        actions = routine.actions_json or []
+        if isinstance(actions, list):
+            actions = " ".join(str(a) for a in actions)
+        return {
+            "title": routine.title or "",
+            "category": routine.category or "",
+            "description": routine.description or "",
+            "actions": str(actions)
+        }
+
+    def _add(self, routine):
+        if routine.id in self._docs:
+            self._remove(routine.id)
+        tf: Dict[str, float] = {}
+        for field, text in self._fields(routine).items():
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                tf[term] = tf.get(term, 0.0) + weight
+        length = sum(tf.values())
+        for term, freq in tf.items():
+            self._postings.setdefault(term, {})[routine.id] = freq
+        self._docs[routine.id] = {
+            "length": length,
+            "terms": list(tf),
+            "meta": {
+                "id": routine.id,
+                "title": routine.title,
+                "description": routine.description,
+                "category": routine.category,
+                "actions": routine.actions_json,
+                "is_global": routine.is_global,
+                "author": routine.user_email
+            }
+        }
+        self._total_length += length
+        self._max_id = max(self._max_id, routine.id)
+
+    def _remove(self, routine_id: int):
+        doc = self._docs.pop(routine_id, None)
+        if not doc:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            posting = self._postings.get(term)
+            if posting:
+                posting.pop(routine_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def add(self, routine):
+        """Index a routine just written by this worker (visible immediately)."""
+        with self._lock:
+            self._add(routine)
+
+    def remove(self, routine_id: int):
+        with self._lock:
+            self._remove(routine_id)
+
+    def _rebuild(self, routines):
+        self._postings, self._docs = {}, {}
+        self._total_length, self._max_id = 0.0, 0
+        for r in routines:
+            self._add(r)
+        self.rebuilds += 1
+
+    def refresh(self, force: bool = False):
+        """Pull routines created by other workers (watermark on id); rebuild if rows were deleted."""
+        now = time.monotonic()
+        if not force and self._loaded and now - self._checked_at < self.refresh_seconds:
+            return
+        # Lazy import: database.py imports this module
+        from .database import get_routine_watermark, get_routines_after
+
+        with self._lock:
+            self._checked_at = now
+            max_id, count = get_routine_watermark()
+            if not self._loaded or count < len(self._docs) or (max_id or 0) < self._max_id:
+                self._rebuild(get_routines_after(0))
+                self._loaded = True
+                return
+            if (max_id or 0) > self._max_id:
+                for r in get_routines_after(self._max_id):
+                    self._add(r)
+            if count != len(self._docs): # Deleted + inserted since last check
+                self._rebuild(get_routines_after(0))
+
+    # --- Query ---
+
+    def search(self, query: str, user_email: Optional[str] = None, category: Optional[str] = None,
+               offset: int = 0, limit: int = 20) -> Dict:
+        self.refresh()
+        terms = tokenize(query)
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or not n_docs:
+                return {"total": 0, "offset": offset, "limit": limit, "results": []}
+            avg_len = self._total_length / n_docs if n_docs else 1.0
+
+            # Expand the last term as a prefix (search as you type)
+            expanded = [[t] for t in terms[:-1]]
+            last = terms[-1]
+            expanded.append([t for t in self._postings if t.startswith(last)] if len(last) >= 2 else [last])
+
+            scores: Dict[int, float] = {}
+            for variants in expanded:
+                for term in variants:
+                    posting = self._postings.get(term)
+                    if not posting:
+                        continue
+                    idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for doc_id, tf in posting.items():
+                        length = self._docs[doc_id]["length"]
+                        denom = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / denom
+
+            user = (user_email or "").lower()
+            cat = (category or "").lower()
+            hits = []
+            for doc_id, score in scores.items():
+                meta = self._docs[doc_id]["meta"]
+                if user and not (meta["is_global"] or (meta["author"] or "").lower() == user):
+                    continue
+                if cat and (meta["category"] or "").lower() != cat:
+                    continue
+                hits.append((score, doc_id))
+            hits.sort(key=lambda x: (-x[0], x[1]))
+
+            page = hits[offset:offset + limit]
+            return {
+                "total": len(hits),
+                "offset": offset,
+                "limit": limit,
+                "results": [dict(self._docs[d]["meta"], score=round(s, 4)) for s, d in page]
+            }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"routines": len(self._docs), "terms": len(self._postings), "max_id": self._max_id, "rebuilds": self.rebuilds}
+
+# Singleton Instance
+routine_index = RoutineSearchIndex()
@@ -147,6 +147,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Plugin uploads (Revit dumps, sheet sets, takeoffs) may arrive gzip/zstd encoded
+from common.compression import DecompressRequestMiddleware
+app.add_middleware(DecompressRequestMiddleware, prefixes=("/api/plugin",))
+
 
 # Mount Static
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -183,7 +187,11 @@ class AuthMiddleware(BaseHTTPMiddleware):
             "/api/login", 
             "/api/projects/stats", # Landing Page
             "/api/aps/token", # If used validly
-            "/api/aps/urn"
+            "/api/aps/urn",
+            # Revit add-in sign-in (password / device token), no bearer token yet
+            "/api/plugin/login",
+            "/api/plugin/resume",
+            "/api/plugin/device/revoke"
         ]
         
         is_protected = any(path.startswith(p) for p in protected_prefixes)
@@ -634,6 +642,35 @@ async def startup_event():
     except Exception as e:
         print(f"Startup Error (Non-Critical): {e}")
 
+    # Plugin Presence: close crashed Revit sessions + keep "who is online" in memory
+    try:
+        from common.plugin_presence import session_reaper
+        session_reaper.start()
+    except Exception as e:
+        print(f"Startup Error (Session Reaper): {e}")
+
+    # Retention: expired sheet sessions + old command queue rows
+    try:
+        from common.retention import retention_job
+        retention_job.start()
+    except Exception as e:
+        print(f"Startup Error (Retention Job): {e}")
+
+    # Cloud Quantify: move legacy sessions' element rows out of data_json (reads never write)
+    try:
+        import threading
+        from common.database import externalize_legacy_cloud_sessions
+        threading.Thread(target=externalize_legacy_cloud_sessions, name="cloud-externalize", daemon=True).start()
+    except Exception as e:
+        print(f"Startup Error (Cloud Externalize): {e}")
+
+    # ACC Cloud Manager: upload / folder-copy jobs (handlers registered by routers.acc_manager)
+    try:
+        from common.acc_jobs import acc_job_worker
+        acc_job_worker.start()
+    except Exception as e:
+        print(f"Startup Error (ACC Job Worker): {e}")
+
 # ==========================================
 # AUTH ROUTES
 # ==========================================
@@ -644,15 +681,40 @@ async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 # Import plugin db functions
-from database import get_plugin_sessions
+from common.database import list_plugin_sessions_page
 
 @app.get("/admin/plugin", response_class=HTMLResponse)
-async def admin_plugin(request: Request):
-    # root_path = get_root_path() # Removed
-    sessions = get_plugin_sessions()
-    # Sessions are already sorted by start_time desc in database.py
-    # Sessions are already sorted by start_time desc in database.py
-    return templates.TemplateResponse("admin_plugin.html", {"request": request, "sessions": sessions})
+async def admin_plugin(
+    request: Request,
+    user: str = None,
+    machine: str = None,
+    version: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    active_only: bool = False,
+    cursor: str = None
+):
+    # Server-side filters + keyset page: constant cost regardless of session history
+    def _parse_date(val):
+        try: return datetime.datetime.strptime(val, "%Y-%m-%d").date() if val else None
+        except ValueError: return None
+
+    page = list_plugin_sessions_page(
+        user=user, machine=machine, version=version,
+        date_from=_parse_date(date_from), date_to=_parse_date(date_to),
+        active_only=active_only, cursor=cursor, limit=50
+    )
+    filters = {
+        "user": user or "", "machine": machine or "", "version": version or "",
+        "date_from": date_from or "", "date_to": date_to or "", "active_only": active_only
+    }
+    return templates.TemplateResponse("admin_plugin.html", {
+        "request": request,
+        "sessions": page["sessions"],
+        "counts": page["counts"],
+        "next_cursor": page["next_cursor"],
+        "filters": filters
+    })
 
 # --- Version Management Routes ---
 from database import get_plugin_versions, create_plugin_version, delete_plugin_version
@@ -672,11 +734,15 @@ async def create_version_route(
 ):
     mandatory = True if is_mandatory else False
     create_plugin_version(version_number, changelog, download_url, mandatory)
+    from common.plugin_bootstrap import plugin_bootstrap
+    plugin_bootstrap.invalidate_version()
     return RedirectResponse("/admin/plugin/versions", status_code=303)
 
 @app.post("/admin/plugin/versions/delete")
 async def delete_version_route(request: Request, version_id: int = Form(...)):
     delete_plugin_version(version_id)
+    from common.plugin_bootstrap import plugin_bootstrap
+    plugin_bootstrap.invalidate_version()
     return RedirectResponse("/admin/plugin/versions", status_code=303)
 
 
@@ -694,9 +760,9 @@ async def admin_plugin_users_page(request: Request):
     
     # Enhanced Users Data
     # We need to link users to database logs
-    from database import get_user_plugin_stats, get_collaborator_details, get_plugin_sessions
-    
-    sessions = get_plugin_sessions()
+    from database import get_user_plugin_stats, get_collaborator_details
+    from common.database import get_user_last_heartbeat
+    from common.plugin_presence import plugin_presence
     
     enhanced_users = []
     for u in users:
@@ -708,32 +774,27 @@ async def admin_plugin_users_page(request: Request):
         is_online = False
         last_seen_str = "Offline"
         
-        user_sessions = [s for s in sessions if getattr(s, "user_email", "") == u.email]
-        if user_sessions:
-            # Sort by last heartbeat descending
-            user_sessions.sort(key=lambda x: getattr(x, "last_heartbeat", datetime.datetime.min), reverse=True)
-            last_session = user_sessions[0]
-            
+        # Presence map answers online users; offline users cost one indexed MAX() lookup
+        live = plugin_presence.user_status(u.email)
+        if live:
+            is_online = True
+            last_seen_str = "En Linea"
+        else:
             try:
                 # last_heartbeat is likely a datetime object from ORM, but handle string fallback if needed
-                lh = getattr(last_session, "last_heartbeat", None)
+                lh = get_user_last_heartbeat(u.email)
                 if isinstance(lh, str):
                     lh = datetime.datetime.fromisoformat(lh)
                 
                 if lh:
-                    # If last heartbeat was < 5 minutes ago = ONLINE
                     diff = (datetime.datetime.now() - lh).total_seconds() / 60.0
-                    if diff < 5 and getattr(last_session, "is_active", False):
-                        is_online = True
-                        last_seen_str = "En Linea"
+                    # Format friendly relative time
+                    if diff < 60:
+                        last_seen_str = f"Hace {int(diff)} min"
+                    elif diff < 1440:
+                        last_seen_str = f"Hace {int(diff/60)} hrs"
                     else:
-                        # Format friendly relative time
-                        if diff < 60:
-                            last_seen_str = f"Hace {int(diff)} min"
-                        elif diff < 1440:
-                            last_seen_str = f"Hace {int(diff/60)} hrs"
-                        else:
-                            last_seen_str = lh.strftime("%d/%m")
+                        last_seen_str = lh.strftime("%d/%m")
             except Exception as e: 
                 print(f"Error calulcating online status: {e}")
                 pass
@@ -828,6 +889,7 @@ async def update_plugin_user_route(
             break
             
     if target_user:
+        old_email = target_user.email
         # Update fields (Note: verify if email change affects PK in database.py save_user)
         # Assuming save_user handles updates via ORM merge or lookup
         target_user.name = name
@@ -836,7 +898,13 @@ async def update_plugin_user_route(
         if password and password.strip():
             target_user.hashed_password = get_password_hash(password)
             
-        save_user(target_user)
+        save_user(target_user) # Password change revokes the user's device tokens
+        if old_email and old_email.lower() != (email or "").lower():
+            # Tokens issued to the old address must not keep resuming
+            from common.database import revoke_user_device_tokens
+            from common.plugin_bootstrap import plugin_bootstrap
+            revoke_user_device_tokens(old_email)
+            plugin_bootstrap.invalidate_user(old_email)
         
     return RedirectResponse("/admin/plugin/users", status_code=303)
 
@@ -871,7 +939,6 @@ async def update_plugin_user_permissions(request: Request, uid: str):
     # So u.id == u.email.
     # So uid passed here IS the email.
     
-    from database import update_user_permissions
     update_user_permissions(uid, perms)
 
 
@@ -915,7 +982,11 @@ async def login(request: Request, username: str = Form(...), password: str = For
     return response
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request):
+    from common.auth import revoke_token
+    # The denylist is per process: other workers/services accept this token until its exp
+    # (ACCESS_TOKEN_EXPIRE_MINUTES); deleting the cookie is what ends the browser session.
+    revoke_token(request.cookies.get("access_token"))
     response = RedirectResponse("/", status_code=303)
     response.delete_cookie("access_token")
     return response
@@ -2621,8 +2692,6 @@ async def api_assign_project(req: AssignProjectRequest, request: Request):
     if not user or user["role"] != "admin":
          raise HTTPException(status_code=403, detail="Not authorized")
 
-    from database import update_user_permissions, update_user_assigned_projects
-
     # 1. Update Permissions
     update_user_permissions(req.user_id, req.permissions)
     
@@ -6,9 +6,15 @@ import uuid
 from pydantic import BaseModel
 import datetime
 
-# --- Task Store (In-Memory) ---
-# In production, use Redis or Database. For now, memory is fine for single instance.
-UPLOAD_TASKS: Dict[str, dict] = {} # task_id -> { status, result, error, created_at }
+# --- Job Registry (DB: labs_acc_jobs) ---
+# Uploads and folder copies are rows claimed by common.acc_jobs workers, so status polling
+# works from any gunicorn worker and survives restarts.
+from common.database import (
+    create_acc_job, get_acc_job, request_acc_job_cancel, retry_acc_job
+)
+from common.acc_jobs import acc_job_worker
+
+SPOOL_DIR = acc_job_worker.spool_dir
 
 import sys
 import os
@@ -27,13 +33,21 @@ if tools_path not in sys.path:
 try:
     # Import as package to support relative imports inside the tool
     from acc_copy_tool.copier import AccCopier
-    from acc_copy_tool.auth import get_access_token
+    from acc_copy_tool.auth import get_access_token, token_cache
+    from acc_copy_tool.http_pool import pool_stats
+    from acc_copy_tool.folder_tree import folder_tree
+    from acc_copy_tool.sync_planner import SyncPlanner, PlanError
+    from acc_copy_tool.parallel_copy import ParallelFolderCopy, DEFAULT_MAX_WORKERS
 except ImportError as e:
     # Fallback or detailed error
     try:
         # Fallback for local dev where tools might be in root backend/tools and not picked up by logic above if cwd is weird
         from backend.tools.acc_copy_tool.copier import AccCopier
-        from backend.tools.acc_copy_tool.auth import get_access_token
+        from backend.tools.acc_copy_tool.auth import get_access_token, token_cache
+        from backend.tools.acc_copy_tool.http_pool import pool_stats
+        from backend.tools.acc_copy_tool.folder_tree import folder_tree
+        from backend.tools.acc_copy_tool.sync_planner import SyncPlanner, PlanError
+        from backend.tools.acc_copy_tool.parallel_copy import ParallelFolderCopy, DEFAULT_MAX_WORKERS
     except ImportError:
         raise ImportError(f"Could not import 'acc_copy_tool' package from {tools_path}. Error: {e}. Sys path: {sys.path}")
 
@@ -69,9 +83,11 @@ def list_top_folders(hub_id: str, project_id: str):
     return copier.get_top_folders(hub_id, project_id)
 
 @router.get("/projects/{project_id}/folders/{folder_id}/contents")
-def list_contents(project_id: str, folder_id: str):
+def list_contents(project_id: str, folder_id: str, refresh: bool = False):
+    """All pages of the folder, cached (TTL + ETag revalidation); subfolders are prefetched."""
     copier = get_copier()
-    folders, items = copier.get_folder_contents(project_id, folder_id)
+    folders, items = folder_tree.list_contents(copier, project_id, folder_id, refresh=refresh)
+    folder_tree.prefetch(copier, project_id, [f["id"] for f in folders])
     return {"folders": folders, "items": items}
 
 # --- Create Folder ---
@@ -95,23 +111,42 @@ class CopyPayload(BaseModel):
     source_id: str # Folder or Item ID
     target_parent_id: str
     is_folder: bool = False
+    max_workers: Optional[int] = None # Folder copies only (capped at 16)
+
+# --- Background Copy Job ---
+def run_copy_job(job: dict, ctx):
+    params = job["params"]
+    copier = get_copier()
+    engine = ParallelFolderCopy(copier, params["project_id"], params["source_folder"], params["target_parent_id"],
+                                max_workers=params.get("max_workers") or DEFAULT_MAX_WORKERS, on_progress=ctx.progress)
+    ctx.on_cancel(engine.cancel)
+    result = engine.run()
+    ctx.last_progress = result["progress"]
+    return result["progress"]["status"], {"manifest": result["manifest"]}
+
+acc_job_worker.register("copy", run_copy_job)
 
 @router.post("/action/copy")
 def copy_content(payload: CopyPayload):
     copier = get_copier()
     if payload.is_folder:
-        # Full Recursive Copy
+        # Full Recursive Copy (parallel, breadth-first, as a background job)
         # 1. Fetch Source Folder Details
         source_folder = copier.get_folder(payload.project_id, payload.source_id)
         if not source_folder:
             raise HTTPException(status_code=404, detail="Source folder not found")
-            
-        # 2. Perform Recursive Copy
-        try:
-            copier.recursive_copy(payload.project_id, source_folder, payload.target_parent_id)
-            return {"status": "success", "message": "Recursive copy started/completed"}
-        except Exception as e:
-             raise HTTPException(status_code=500, detail=f"Copy Error: {str(e)}")
+
+        # 2. Register Job (claimed by a job worker)
+        job_id = str(uuid.uuid4())
+        create_acc_job(job_id, "copy", {
+            "project_id": payload.project_id,
+            "source_folder": source_folder,
+            "source_name": source_folder["attributes"]["name"],
+            "target_parent_id": payload.target_parent_id,
+            "max_workers": min(max(payload.max_workers or DEFAULT_MAX_WORKERS, 1), 16)
+        })
+        acc_job_worker.wake()
+        return {"status": "accepted", "job_id": job_id}
 
     else:
         # Single File Copy
@@ -120,6 +155,158 @@ def copy_content(payload: CopyPayload):
             raise HTTPException(status_code=500, detail="Copy failed")
         return {"status": "success", "data": res}
 
+@router.get("/action/copy/status/{job_id}")
+def get_copy_status(job_id: str, manifest: bool = False, offset: int = 0, limit: int = 500):
+    """
+    Progress counters of a folder copy job. Failed entries are included once the job has finished;
+    the full per-item manifest is paged with manifest=true&offset=&limit=.
+    """
+    job = get_acc_job(job_id)
+    if not job or job["kind"] != "copy":
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    items = (job["result"] or {}).get("manifest", [])
+    res = {
+        "job_id": job_id,
+        "status": job["status"],
+        "source_name": job["params"].get("source_name"),
+        "progress": job["progress"],
+        "failures": [m for m in items if m["status"] == "failed"][:100],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["error"]:
+        res["error"] = job["error"]
+    if manifest:
+        limit = min(max(limit, 1), 5000)
+        res["manifest"] = {"total": len(items), "offset": offset, "limit": limit, "entries": items[offset:offset + limit]}
+    return res
+
+@router.post("/action/copy/{job_id}/cancel")
+def cancel_copy(job_id: str):
+    status = request_acc_job_cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "cancelling" if status == "running" else status, "job_id": job_id}
+
+# --- Incremental Sync (plan -> dry run manifest -> execute) ---
+
+class SyncPayload(BaseModel):
+    project_id: str
+    source_id: str # Folder ID
+    target_parent_id: str
+    dry_run: bool = True # False: plan and execute in one job
+    max_workers: Optional[int] = None
+
+def run_sync_job(job: dict, ctx):
+    params = job["params"]
+    copier = get_copier()
+    planner = SyncPlanner(copier, params["project_id"], params["source_folder"], params["target_parent_id"],
+                          max_workers=params.get("max_workers") or DEFAULT_MAX_WORKERS, on_progress=ctx.progress)
+    ctx.on_cancel(planner.cancel)
+
+    if params.get("plan_job_id"):
+        # Execute exactly the plan that was inspected
+        plan = (get_acc_job(params["plan_job_id"]) or {}).get("result")
+        if not plan:
+            raise Exception("Plan not found (expired?)")
+    else:
+        try:
+            plan = planner.plan()
+        except PlanError as e:
+            raise Exception(f"Sync plan failed: {e}")
+        if params.get("dry_run", True):
+            ctx.last_progress = dict(plan["summary"], phase="planned")
+            return "done", dict(plan, executed=False)
+
+    result = planner.execute(plan["manifest"])
+    ctx.last_progress = result["progress"]
+    return result["status"], {
+        "summary": plan["summary"],
+        "planned_at": plan["planned_at"],
+        "executed": True,
+        "manifest": result["manifest"]
+    }
+
+acc_job_worker.register("sync", run_sync_job)
+
+@router.post("/action/sync")
+def sync_content(payload: SyncPayload):
+    """
+    Plans an incremental copy of 'source_id' into 'target_parent_id' (only what is missing).
+    dry_run=true (default) stores the plan: inspect it with /action/sync/status/{job_id}?manifest=true,
+    then run it with POST /action/sync/{job_id}/execute.
+    """
+    copier = get_copier()
+    source_folder = copier.get_folder(payload.project_id, payload.source_id)
+    if not source_folder:
+        raise HTTPException(status_code=404, detail="Source folder not found")
+
+    job_id = str(uuid.uuid4())
+    create_acc_job(job_id, "sync", {
+        "project_id": payload.project_id,
+        "source_folder": source_folder,
+        "source_name": source_folder["attributes"]["name"],
+        "target_parent_id": payload.target_parent_id,
+        "dry_run": payload.dry_run,
+        "max_workers": min(max(payload.max_workers or DEFAULT_MAX_WORKERS, 1), 16)
+    })
+    acc_job_worker.wake()
+    return {"status": "accepted", "job_id": job_id, "dry_run": payload.dry_run}
+
+@router.post("/action/sync/{job_id}/execute")
+def execute_sync_plan(job_id: str):
+    plan_job = get_acc_job(job_id, include_result=False)
+    if not plan_job or plan_job["kind"] != "sync":
+        raise HTTPException(status_code=404, detail="Plan not found")
+    if not plan_job["params"].get("dry_run", True) or plan_job["params"].get("plan_job_id"):
+        raise HTTPException(status_code=400, detail="Job is not a dry-run plan")
+    if plan_job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Plan is {plan_job['status']}")
+
+    exec_id = str(uuid.uuid4())
+    create_acc_job(exec_id, "sync", dict(plan_job["params"], dry_run=False, plan_job_id=job_id))
+    acc_job_worker.wake()
+    return {"status": "accepted", "job_id": exec_id, "plan_job_id": job_id}
+
+@router.get("/action/sync/status/{job_id}")
+def get_sync_status(job_id: str, manifest: bool = False, action: Optional[str] = None,
+                    offset: int = 0, limit: int = 500):
+    """Summary (create / exists / copy / skip / conflict counts) and, with manifest=true, the paged entries."""
+    job = get_acc_job(job_id)
+    if not job or job["kind"] != "sync":
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    result = job["result"] or {}
+    entries = result.get("manifest", [])
+    res = {
+        "job_id": job_id,
+        "status": job["status"],
+        "dry_run": not result.get("executed", False) if result else job["params"].get("dry_run", True),
+        "plan_job_id": job["params"].get("plan_job_id"),
+        "source_name": job["params"].get("source_name"),
+        "summary": result.get("summary"),
+        "planned_at": result.get("planned_at"),
+        "progress": job["progress"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["error"]:
+        res["error"] = job["error"]
+    if manifest:
+        if action:
+            entries = [e for e in entries if e["action"] == action]
+        limit = min(max(limit, 1), 5000)
+        res["manifest"] = {"total": len(entries), "offset": offset, "limit": limit, "entries": entries[offset:offset + limit]}
+    return res
+
+@router.post("/action/sync/{job_id}/cancel")
+def cancel_sync(job_id: str):
+    status = request_acc_job_cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "cancelling" if status == "running" else status, "job_id": job_id}
+
 # --- File Upload (Basic) ---
 # For direct browser upload to ACC, we usually need Signed URLs (OSS).
 # Implementing 3-legged or 2-legged upload flow here.
@@ -128,36 +315,24 @@ def copy_content(payload: CopyPayload):
 # Step 3: Create Item/Version.
 
 # --- Background Worker ---
-def process_acc_upload_background(task_id: str, project_id: str, folder_id: str, temp_path: str, original_filename: str):
-    try:
-        UPLOAD_TASKS[task_id]["status"] = "processing"
-        
-        copier = get_copier()
-        # Upload Logic (High Latency)
-        res = copier.upload_file(project_id, folder_id, temp_path, original_filename)
-        
-        if res:
-            UPLOAD_TASKS[task_id]["status"] = "done"
-            UPLOAD_TASKS[task_id]["result"] = res
-        else:
-            UPLOAD_TASKS[task_id]["status"] = "error"
-            UPLOAD_TASKS[task_id]["error"] = "Upload returned empty result"
-            
-    except Exception as e:
-        UPLOAD_TASKS[task_id]["status"] = "error"
-        UPLOAD_TASKS[task_id]["error"] = str(e)
-        print(f"Background Upload Error {task_id}: {e}")
-        
-    finally:
-        # Cleanup Temp File
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except: pass
+def run_upload_job(job: dict, ctx):
+    params = job["params"]
+    copier = get_copier()
+    # Upload Logic (High Latency) - chunked, resumes from the parts already sent
+    res = copier.upload_file(params["project_id"], params["folder_id"], params["temp_path"], params["filename"],
+                             on_progress=ctx.progress)
+    if not res:
+        # Spool file + part state are kept so POST /upload/{task_id}/resume can continue
+        raise Exception("Upload failed (resumable)")
+
+    # Cleanup Temp File
+    acc_job_worker._remove_spool(params["temp_path"])
+    return "done", res
+
+acc_job_worker.register("upload", run_upload_job)
 
 @router.post("/upload")
 def upload_file_to_acc(
-    background_tasks: BackgroundTasks,
     project_id: str = Form(...),
     folder_id: str = Form(...),
     file: UploadFile = File(...)
@@ -165,45 +340,76 @@ def upload_file_to_acc(
     """
     Async Upload:
     1. Saves file to disk (fast).
-    2. Spawns background task for ACC upload.
+    2. Queues an upload job (labs_acc_jobs) for the job workers.
     3. Returns task_id immediately.
     """
     
     # 1. Save temp
     try:
         # Ensure tmp dir exists
-        os.makedirs("tmp", exist_ok=True)
+        os.makedirs(SPOOL_DIR, exist_ok=True)
         task_id = str(uuid.uuid4())
         temp_filename = f"tmp_{task_id}_{file.filename}"
-        temp_path = os.path.join("tmp", temp_filename)
-        
+        temp_path = os.path.join(SPOOL_DIR, temp_filename)
+
         with open(temp_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
-            
+
         # 2. Register Task
-        UPLOAD_TASKS[task_id] = {
-            "status": "pending",
-            "created_at": datetime.datetime.now(),
-            "filename": file.filename
-        }
-        
-        # 3. Spawn Worker
-        background_tasks.add_task(
-            process_acc_upload_background, 
-            task_id, project_id, folder_id, temp_path, file.filename
-        )
-        
+        create_acc_job(task_id, "upload", {
+            "filename": file.filename,
+            "project_id": project_id,
+            "folder_id": folder_id,
+            "temp_path": temp_path
+        })
+
+        # 3. Wake a local worker
+        acc_job_worker.wake()
+
         return {"status": "accepted", "task_id": task_id}
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/upload/status/{task_id}")
 def get_upload_status(task_id: str):
-    task = UPLOAD_TASKS.get(task_id)
-    if not task:
+    task = get_acc_job(task_id)
+    if not task or task["kind"] != "upload":
         raise HTTPException(status_code=404, detail="Task not found")
-        
-    # Serialize datetime
-    res = {k: v for k, v in task.items() if k != "created_at"}
+
+    res = {
+        "status": task["status"],
+        "filename": task["params"].get("filename"),
+        "progress": task["progress"],
+        "attempts": task["attempts"],
+        "created_at": task["created_at"],
+        "finished_at": task["finished_at"]
+    }
+    if task["result"] is not None:
+        res["result"] = task["result"]
+    if task["error"]:
+        res["error"] = task["error"]
     return res
+
+@router.post("/upload/{task_id}/resume")
+def resume_upload(task_id: str):
+    """Re-queues a failed upload; only the parts not yet sent are uploaded."""
+    task = get_acc_job(task_id, include_result=False)
+    if not task or task["kind"] != "upload":
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not os.path.exists(task["params"].get("temp_path", "")):
+        raise HTTPException(status_code=410, detail="Upload spool file no longer available")
+    if not retry_acc_job(task_id):
+        raise HTTPException(status_code=409, detail=f"Task is {task['status']}")
+
+    acc_job_worker.wake()
+    return {"status": "accepted", "task_id": task_id}
+
+@router.get("/client/stats")
+def acc_client_stats():
+    """APS token reuse, pooled connection reuse and folder cache for this process."""
+    return {"token": token_cache.stats(), "http": pool_stats(), "folder_cache": folder_tree.stats()}
+
+@router.get("/jobs/stats")
+def acc_job_stats():
+    return acc_job_worker.stats()
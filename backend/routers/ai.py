@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import os
@@ -30,6 +32,19 @@ if api_key:
 else:
     print("WARNING: OPENAI_API_KEY not found. AI features will stay in fallback mode.")
 
+def get_ai_client():
+    """Upstream client dependency (override with a stub in tests)."""
+    return aclient
+
+from common.database import search_routines
+# Routines from the knowledge base added to the model context
+AI_ROUTINE_CONTEXT_K = int(os.getenv("AI_ROUTINE_CONTEXT_K", "3"))
+
+from common.ai_gateway import (
+    ai_response_cache, ai_intent_classifier, ai_rate_limiter, ai_governor, ai_gateway_metrics,
+    ai_gateway_stats, RateLimitExceeded, QueueFull
+)
+
 class ChatAttachment(BaseModel):
     name: str
     content: str # Base64
@@ -64,44 +79,41 @@ INSTRUCTIONS:
 3. If the user wants to perform one of the actions above, set "action" to the corresponding key.
 4. If the user just wants to chat or ask questions, set "action" to empty string "".
 5. Generate a helpful, professional, and concise "text" response in Spanish (Español).
+6. If RELEVANT ROUTINES are listed, mention the matching saved routine by title when it answers the request.
 
 OUTPUT FORMAT:
 Return ONLY a raw JSON object (no markdown formatting) with keys: "text" and "action".
 Example: { "text": "Entendido, voy a auditar los muros.", "action": "AUDIT_WALLS" }
 """
 
-# Simple In-Memory Stats (migrating to DB recommended for production)
-# For the urgency, we will append to a JSON file or use a global list?
-# User wants "Monitor". A simple JSON file is robust enough for a quick feature.
-STATS_FILE = "ai_stats_log.json"
+# Append-only JSONL log + incremental counters (see common/ai_usage.py)
+from common.ai_usage import ai_usage_log
 
 def log_ai_usage(user_email, action, message):
-    try:
-        entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "user": user_email,
-            "action": action if action else "Chat/Q&A",
-            "message_length": len(message)
-        }
-        
-        # Simple file append
-        mode = "r+" if os.path.exists(STATS_FILE) else "w"
-        try:
-            with open(STATS_FILE, "r") as f:
-                data = json.load(f)
-        except:
-            data = []
-            
-        data.append(entry)
-        
-        with open(STATS_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"Stats Log Error: {e}")
+    ai_usage_log.record(user_email, action, message)
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(payload: ChatPayload):
+async def chat_endpoint(payload: ChatPayload, background_tasks: BackgroundTasks, client = Depends(get_ai_client)):
     msg = payload.message
+
+    # Per-user rate limit (token bucket)
+    try:
+        ai_rate_limiter.check(payload.user_email)
+    except RateLimitExceeded as e:
+        ai_gateway_metrics.record("rate_limited")
+        retry = max(1, int(e.retry_after + 0.999))
+        return JSONResponse(
+            {"text": f"Demasiadas solicitudes. Intenta de nuevo en {retry} s.", "action": ""},
+            status_code=429, headers={"Retry-After": str(retry)}
+        )
+
+    # Known action keywords: answered locally, no model call
+    if not payload.attachments:
+        intent = ai_intent_classifier.classify(msg)
+        if intent:
+            ai_gateway_metrics.record("classifier")
+            background_tasks.add_task(log_ai_usage, payload.user_email, intent["action"], msg)
+            return ChatResponse(**intent)
     
     # Prepare Context with Attachments
     full_context = f"Context: {payload.context}\n"
@@ -121,74 +133,87 @@ async def chat_endpoint(payload: ChatPayload):
                  content_snippet = att.content[:10000] 
                  full_context += f"[File: {att.name}]\nContent:\n{content_snippet}\n...\n"
 
+    # Top-k recorded routines from the knowledge base (ranked index lookup, no full table load)
+    routines = []
     try:
-        if not aclient:
-            return fallback_logic(msg)
-
-        response = await aclient.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"User: {msg}\n{full_context}"}
-            ],
-            temperature=0.3,
-            max_tokens=300,
-            response_format={ "type": "json_object" } 
-        )
+        routines = (await run_in_threadpool(
+            search_routines, msg, user_email=payload.user_email or None, limit=AI_ROUTINE_CONTEXT_K
+        ))["results"]
+        if routines:
+            full_context += "RELEVANT ROUTINES:\n"
+            for r in routines:
+                full_context += f"- {r['title']} ({r['category']}): {(r['description'] or '')[:300]}\n"
+    except Exception as e:
+        print(f"Routine Search Error: {e}")
+
+    # Identical prompts (same context, user and routines, no attachments) reuse the previous answer
+    cache_key = None if payload.attachments else ai_response_cache.key(
+        msg, payload.context or "", payload.user_email or "", tuple(r["id"] for r in routines)
+    )
+    data = ai_response_cache.get(cache_key) if cache_key else None
 
-        content = response.choices[0].message.content
-        data = json.loads(content)
+    try:
+        if data is None:
+            if not client:
+                ai_gateway_metrics.record("fallback")
+                return fallback_logic(msg)
+
+            async def call_model():
+                return await client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": f"User: {msg}\n{full_context}"}
+                    ],
+                    temperature=0.3,
+                    max_tokens=300,
+                    response_format={ "type": "json_object" } 
+                )
+
+            # Bounded upstream concurrency (queued, then fallback when saturated)
+            response = await ai_governor.run(call_model)
+
+            content = response.choices[0].message.content
+            data = json.loads(content)
+            if cache_key:
+                ai_response_cache.set(cache_key, {"text": data.get("text", "Procesado."), "action": data.get("action", "")})
+            ai_gateway_metrics.record("model")
+        else:
+            ai_gateway_metrics.record("cache")
         
         resp_text = data.get("text", "Procesado.")
         resp_action = data.get("action", "")
         
-        # LOG STATS
-        BackgroundTasks().add_task(log_ai_usage, payload.user_email, resp_action, msg)
-        # Actually BackgroundTasks needs to be passed in verify function signature? 
-        # Fast fix: just call it sync or use simple non-await
-        log_ai_usage(payload.user_email, resp_action, msg)
+        # LOG STATS (after the response is sent)
+        background_tasks.add_task(log_ai_usage, payload.user_email, resp_action, msg)
         
         return ChatResponse(
             text=resp_text,
             action=resp_action
         )
 
+    except QueueFull:
+        print("[AI] Upstream saturated, using fallback")
+        ai_gateway_metrics.record("fallback")
+        return fallback_logic(msg)
     except Exception as e:
         print(f"OpenAI Error: {e}")
+        ai_gateway_metrics.record("fallback")
         return fallback_logic(msg)
 
 @router.get("/stats")
 async def get_ai_stats():
-    """Returns AI usage statistics for the Monitor Window"""
+    """Returns AI usage statistics for the Monitor Window (incremental counters, no log scan)"""
     try:
-        if not os.path.exists(STATS_FILE):
-             return {"total_requests": 0, "top_users": [], "recent_activity": []}
-             
-        with open(STATS_FILE, "r") as f:
-            data = json.load(f)
-            
-        total = len(data)
-        # Aggregate Top Users
-        users = {}
-        for d in data:
-            u = d.get("user", "Unknown")
-            users[u] = users.get(u, 0) + 1
-            
-        sorted_users = sorted(users.items(), key=lambda x: x[1], reverse=True)
-        top_users = [{"email": k, "count": v} for k, v in sorted_users[:5]]
-        
-        # Recent 10
-        recent = data[-10:]
-        recent.reverse()
-        
-        return {
-            "total_requests": total,
-            "top_users": top_users,
-            "recent_activity": recent
-        }
+        return ai_usage_log.stats()
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/metrics")
+async def get_ai_gateway_metrics():
+    """Cache / classifier hit rates, queue wait times and rate-limit rejections (per process)"""
+    return ai_gateway_stats()
+
 def fallback_logic(msg: str) -> ChatResponse:
     msg = msg.lower()
     text = "Lo siento, mi cerebro IA no está disponible en este momento. Usando lógica básica."
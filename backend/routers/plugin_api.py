@@ -1,5 +1,6 @@
 
 from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
@@ -10,7 +11,7 @@ from common.database import (
     start_revit_session, heartbeat_session, end_revit_session,
     log_plugin_activity, log_plugin_sync, get_user_by_email
 )
-from common.auth_utils import verify_password, create_access_token, verify_token_dep
+from common.auth_utils import create_access_token, verify_token_dep
 
 router = APIRouter(prefix="/api/plugin")
 
@@ -22,6 +23,17 @@ class PluginLoginRequest(BaseModel):
     revit_version: str
     plugin_version: Optional[str] = "1.0.0"
     ip_address: str
+    remember_device: bool = True
+
+class PluginResumeRequest(BaseModel):
+    device_token: str
+    machine_name: str
+    revit_version: str
+    plugin_version: Optional[str] = "1.0.0"
+    ip_address: str
+
+class DeviceTokenRequest(BaseModel):
+    device_token: str
 
 class HeartbeatRequest(BaseModel):
     session_id: str
@@ -45,53 +57,104 @@ class TokenValidationRequest(BaseModel):
 
 # --- Routes ---
 
-@router.post("/login")
-async def plugin_login(req: PluginLoginRequest):
-    # user = get_user_by_email(req.username)
-    user = get_user_by_email(req.username)
-    
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid username")
-        
-    if not verify_password(req.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid password")
-        
-    if not user.is_active:
-         raise HTTPException(status_code=403, detail="User account is locked")
-
-    # Plugin Current Version Logic
-    from database import get_latest_plugin_version
-    
-    latest_v_data = get_latest_plugin_version()
-    
-    latest_version = "1.5.2" # Default
-    update_info = None
-    
-    if latest_v_data:
-        latest_version = latest_v_data["version"]
-        update_info = latest_v_data
-
-    # Create Session
-    session_id = start_revit_session(user.email, req.machine_name, req.revit_version, req.ip_address, plugin_version=req.plugin_version)
+def _plugin_session_response(user: dict, session_id: str, device_token: str = None, device_expires: datetime.datetime = None):
+    """Login / resume payload: session token + cached version and permissions snapshot."""
+    from common.plugin_bootstrap import plugin_bootstrap
+    version = plugin_bootstrap.latest_version()
 
     # Generate Token (optional context)
-    token = create_access_token(data={"sub": user.email, "role": user.role, "session_id": session_id})
-    
-    # Permissions
-    permissions = getattr(user, 'permissions', {})
-    if not permissions: permissions = {}
+    token = create_access_token(data={"sub": user["email"], "role": user["role"], "session_id": session_id})
 
-    return {
+    resp = {
         "access_token": token,
         "token_type": "bearer",
         "session_id": session_id,
         "heartbeat_interval_seconds": 60, # 1 minute
-        "user_name": user.name,
-        "role": user.role,
-        "latest_version": latest_version,
-        "update_info": update_info,
-        "permissions": permissions
+        "user_name": user["name"],
+        "user_email": user["email"],
+        "role": user["role"],
+        "latest_version": version["latest_version"],
+        "update_info": version["update_info"],
+        "permissions": user["permissions"] or {}
+    }
+    if device_token:
+        resp["device_token"] = device_token
+        resp["device_token_expires_at"] = device_expires.isoformat() if device_expires else None
+    return resp
+
+def _plugin_login_session(user, req: PluginLoginRequest):
+    """Session + device token + signed response (DB / RSA work, runs in the threadpool)."""
+    session_id = start_revit_session(user.email, req.machine_name, req.revit_version, req.ip_address, plugin_version=req.plugin_version)
+
+    # Device token: next Revit start resumes without the password
+    device_token, device_expires = None, None
+    if req.remember_device:
+        from common.database import issue_device_token
+        device_token, device_expires = issue_device_token(user.email, req.machine_name, session_id)
+
+    snapshot = {
+        "email": user.email, "name": user.name, "role": user.role,
+        "permissions": getattr(user, 'permissions', {}) or {}
     }
+    return _plugin_session_response(snapshot, session_id, device_token, device_expires)
+
+@router.post("/login")
+async def plugin_login(req: PluginLoginRequest):
+    """Password login. bcrypt runs on the login pool and DB work in the threadpool; bursts queue (503 when full)."""
+    from common.login_pipeline import login_pipeline, LoginBusy, LOGIN_RETRY_AFTER_SECONDS
+
+    try:
+        async with login_pipeline.admit():
+            user = await run_in_threadpool(get_user_by_email, req.username)
+
+            if not user:
+                raise HTTPException(status_code=401, detail="Invalid username")
+
+            if not await login_pipeline.verify_password(req.password, user.hashed_password):
+                raise HTTPException(status_code=401, detail="Invalid password")
+
+            if not user.is_active:
+                 raise HTTPException(status_code=403, detail="User account is locked")
+
+            return await run_in_threadpool(_plugin_login_session, user, req)
+    except LoginBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, retry shortly",
+                            headers={"Retry-After": str(LOGIN_RETRY_AFTER_SECONDS)})
+
+@router.post("/resume")
+async def plugin_resume(req: PluginResumeRequest):
+    """
+    Device-token start: indexed token lookup + cached user/version snapshot
+    (no bcrypt, no version query). Reuses the previous session when its Revit was closed.
+    """
+    from common.database import resume_plugin_session
+    from common.plugin_bootstrap import plugin_bootstrap
+
+    def user_active(email):
+        user = plugin_bootstrap.user(email)
+        return bool(user and user["is_active"])
+
+    res = await run_in_threadpool(resume_plugin_session, req.device_token, req.machine_name, req.revit_version,
+                                  req.ip_address, req.plugin_version, user_active)
+    if not res:
+        raise HTTPException(status_code=401, detail="Invalid or expired device token")
+    if res.get("locked"):
+        raise HTTPException(status_code=403, detail="User account is locked")
+
+    user = await run_in_threadpool(plugin_bootstrap.user, res["user_email"])
+    if not user:
+        raise HTTPException(status_code=403, detail="User account is locked")
+
+    resp = await run_in_threadpool(_plugin_session_response, user, res["session_id"])
+    resp["resumed"] = res["resumed"]
+    resp["device_token_expires_at"] = res["expires_at"].isoformat()
+    return resp
+
+@router.post("/device/revoke")
+async def plugin_revoke_device(req: DeviceTokenRequest):
+    """Logout on this machine: the device token can no longer resume."""
+    from common.database import revoke_device_token
+    return {"revoked": await run_in_threadpool(revoke_device_token, req.device_token)}
 
 @router.post("/heartbeat")
 async def plugin_heartbeat(req: HeartbeatRequest):
@@ -101,7 +164,8 @@ async def plugin_heartbeat(req: HeartbeatRequest):
     # Let's modify logic to fetch session/user.
     
     # Imports inside function to avoid circular if any, or assume imported
-    from database import get_session_by_id, get_user_by_email, heartbeat_session
+    # common.database keeps the presence map in sync with heartbeats
+    from common.database import get_session_by_id, get_user_by_email, heartbeat_session
     
     success = heartbeat_session(req.session_id, req.ip_address)
     
@@ -111,14 +175,9 @@ async def plugin_heartbeat(req: HeartbeatRequest):
     # Get User Permissions
     permissions = {}
     
-    # FETCH PENDING COMMANDS
-    from database import get_pending_commands, mark_commands_as_sent
-    
-    commands = get_pending_commands(req.session_id)
-    # Mark them as SENT so we know they left the server
-    if commands:
-        cmd_ids = [c["id"] for c in commands]
-        mark_commands_as_sent(cmd_ids)
+    # Queue depth only: commands are delivered (and consumed) by the /cloud/commands poll
+    from common.database import count_pending_commands
+    pending_commands = count_pending_commands(req.session_id)
     
     session = get_session_by_id(req.session_id)
     if session:
@@ -130,9 +189,86 @@ async def plugin_heartbeat(req: HeartbeatRequest):
         "status": "Active", 
         "action": "Continue",
         "permissions": permissions,
-        "commands": commands # Helper for Plugin to consume
+        "pending_commands": pending_commands
+    }
+
+@router.get("/presence")
+async def plugin_presence_endpoint(request: Request):
+    """Who is online right now (in-memory presence map, no DB scan). Admins only."""
+    user = getattr(request.state, "user", None)
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    from common.plugin_presence import plugin_presence, session_reaper
+    online = plugin_presence.online()
+    return {
+        "online": [
+            {
+                "session_id": e["session_id"],
+                "user_email": e.get("user_email"),
+                "machine_id": e.get("machine_id"),
+                "revit_version": e.get("revit_version"),
+                "plugin_version": e.get("plugin_version"),
+                "last_heartbeat": e["last_heartbeat"].isoformat()
+            }
+            for e in online
+        ],
+        "count": len(online),
+        "reaper": session_reaper.stats()
     }
 
+@router.get("/retention")
+async def retention_report_endpoint(refresh: bool = False):
+    """Retention policy, last purge runs and current plugin table sizes / row counts."""
+    from common.retention import retention_job, REPORT_TABLES
+    from common.database import get_plugin_table_stats
+    report = retention_job.report()
+    if refresh:
+        report["tables"] = await run_in_threadpool(get_plugin_table_stats, REPORT_TABLES)
+    return report
+
+@router.post("/retention/run")
+async def retention_run_endpoint(request: Request):
+    """Runs the purge now (chunked deletes) and returns the before/after report. Admins only."""
+    user = getattr(request.state, "user", None)
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    from common.retention import retention_job
+    report = await run_in_threadpool(retention_job.run_once)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Retention run already in progress")
+    return report
+
+@router.get("/compression/stats")
+async def compression_stats_endpoint():
+    """Bytes saved by compressed request bodies and compressed JSON columns (per process)."""
+    from common.compression import compression_stats
+    return compression_stats.snapshot()
+
+@router.get("/sessions")
+async def list_plugin_sessions_endpoint(
+    request: Request,
+    user: Optional[str] = None,
+    machine: Optional[str] = None,
+    version: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    active_only: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = 50
+):
+    """Keyset-paginated, filterable session history for the admin dashboard. Admins only."""
+    user_claims = getattr(request.state, "user", None)
+    if not user_claims or user_claims.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    from common.database import list_plugin_sessions_page
+    return list_plugin_sessions_page(
+        user=user, machine=machine, version=version,
+        date_from=date_from, date_to=date_to,
+        active_only=active_only, cursor=cursor, limit=limit
+    )
+
 class CommandResult(BaseModel):
     command_id: int
     status: str # "success", "error"
@@ -141,12 +277,69 @@ class CommandResult(BaseModel):
 
 @router.post("/command/result")
 async def command_result(res: CommandResult):
-    from database import update_command_status
+    from common.database import update_command_status
     success = update_command_status(res.command_id, res.status, res.result_json, res.message)
     if not success:
         raise HTTPException(status_code=404, detail="Command not found")
     return {"status": "Updated"}
 
+class CommandTiming(BaseModel):
+    command: str
+    duration_ms: float
+    timestamp: Optional[str] = None # ISO, defaults to server time
+    context: Optional[dict] = None
+
+class CommandTimingBatch(BaseModel):
+    session_id: str
+    timings: List[CommandTiming]
+
+# Max timings per batch (the plugin flushes its buffer periodically)
+MAX_TIMINGS_PER_BATCH = 5000
+
+@router.post("/telemetry/commands")
+async def ingest_command_timings_endpoint(batch: CommandTimingBatch):
+    """Batched command durations: raw PluginLog rows + hourly latency digests."""
+    from common.database import ingest_command_timings
+    if len(batch.timings) > MAX_TIMINGS_PER_BATCH:
+        raise HTTPException(status_code=413, detail=f"Max {MAX_TIMINGS_PER_BATCH} timings per batch")
+    timings = [{"command": t.command, "duration_ms": t.duration_ms, "timestamp": t.timestamp, "context": t.context} for t in batch.timings]
+    return await run_in_threadpool(ingest_command_timings, batch.session_id, timings)
+
+@router.get("/analytics/commands")
+async def command_latency_analytics(
+    window: str = "24h",
+    date_from: Optional[datetime.datetime] = None,
+    date_to: Optional[datetime.datetime] = None,
+    group_by: str = "command",
+    command: Optional[str] = None,
+    machine: Optional[str] = None,
+    revit_version: Optional[str] = None,
+    plugin_version: Optional[str] = None,
+    interval: Optional[str] = None,
+    limit: int = 200
+):
+    """
+    p50/p95/p99 command latency. window: '<n>h' or '<n>d' (ignored if date_from is given).
+    group_by: comma list of command, revit_version, plugin_version, machine. interval: hour | day.
+    """
+    from common.database import get_command_latency_stats
+    date_to = date_to or datetime.datetime.now()
+    if not date_from:
+        try:
+            n, unit = int(window[:-1]), window[-1].lower()
+            if unit not in ("h", "d"):
+                raise ValueError(unit)
+            date_from = date_to - (datetime.timedelta(hours=n) if unit == "h" else datetime.timedelta(days=n))
+        except (ValueError, IndexError):
+            raise HTTPException(status_code=400, detail="window must look like '24h' or '7d'")
+    if interval not in (None, "hour", "day"):
+        raise HTTPException(status_code=400, detail="interval must be 'hour' or 'day'")
+    return await run_in_threadpool(
+        get_command_latency_stats, date_from, date_to,
+        [g.strip() for g in group_by.split(",") if g.strip()],
+        command, machine, revit_version, plugin_version, interval, max(1, min(limit, 1000))
+    )
+
 @router.post("/track")
 async def plugin_track(req: ActivityCheckRequest):
     log_plugin_activity(
@@ -174,7 +367,8 @@ async def validate_token_endpoint(req: TokenValidationRequest):
         return {"valid": False}
 
 
-from takeoff_database import save_project_packages, get_project_packages
+from takeoff_database import takeoff_store
+from fastapi import Response
 
 class TakeoffSyncRequest(BaseModel):
     project_id: str
@@ -184,20 +378,39 @@ class TakeoffSyncRequest(BaseModel):
 async def sync_takeoff(req: TakeoffSyncRequest, token: str = Depends(verify_token_dep)):
     # Verify token implies user is authenticated.
     # In a real scenario, we'd check if user has access to this project_id.
-    save_project_packages(req.project_id, req.packages_json)
-    return {"status": "Saved", "project_id": req.project_id}
+    res = takeoff_store.save(req.project_id, req.packages_json)
+    return {"status": "Saved", "project_id": req.project_id, "revision": res["revision"], "etag": res["etag"], "changed": res["changed"]}
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    candidates = [t.strip().removeprefix("W/").strip('"') for t in header.split(",")]
+    return "*" in candidates or etag in candidates
 
 @router.get("/takeoff/{project_id}")
-async def get_takeoff(project_id: str, token: str = Depends(verify_token_dep)):
-    data = get_project_packages(project_id)
-    # Return as raw json string or parsed object? 
-    # Let's return as object to be clean, or raw string inside a field.
-    # To avoid double parsing overhead here, we can just return it as a generic dict.
-    try:
-        parsed = json.loads(data)
-        return parsed
-    except:
-        return []
+async def get_takeoff(project_id: str, request: Request, token: str = Depends(verify_token_dep)):
+    # Conditional GET: cached ETag + stat, no disk read
+    etag = takeoff_store.current_etag(project_id)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+
+    # Stored bytes are already JSON: served as-is (no json.loads / re-serialize)
+    data, etag = takeoff_store.read(project_id)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+    return Response(content=data, media_type="application/json", headers={"ETag": f'"{etag}"', "Cache-Control": "no-cache"})
+
+@router.get("/takeoff/{project_id}/revisions")
+async def list_takeoff_revisions(project_id: str, token: str = Depends(verify_token_dep)):
+    return takeoff_store.list_revisions(project_id)
+
+@router.get("/takeoff/{project_id}/revisions/{revision}")
+async def get_takeoff_revision(project_id: str, revision: int, token: str = Depends(verify_token_dep)):
+    data = takeoff_store.read_revision(project_id, revision)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return Response(content=data, media_type="application/json")
 
 # Helper for Dependency Injection if not present in original file
 def verify_token_dep():
@@ -207,7 +420,7 @@ def verify_token_dep():
 # -----------------------------------------------------------------------------
 # ROUTINES (KNOWLEDGE BASE)
 # -----------------------------------------------------------------------------
-from database import save_routine, get_all_routines
+from common.database import save_routine, get_all_routines, search_routines
 
 class RoutineCreate(BaseModel):
     title: str
@@ -233,6 +446,13 @@ def create_routine_endpoint(routine: RoutineCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/routines/search")
+def search_routines_endpoint(q: str, user_email: Optional[str] = None, category: Optional[str] = None,
+                             offset: int = 0, limit: int = 20):
+    """Ranked routine search (title > category > description / steps). user_email limits to globals + own."""
+    limit = max(1, min(limit, 100))
+    return search_routines(q, user_email=user_email, category=category, offset=max(0, offset), limit=limit)
+
 @router.get("/routines")
 def get_routines_endpoint(user_email: Optional[str] = None):
     # If called from Admin Dashboard (no email param usually), return ALL (handled by get_all_routines if email is None)
@@ -1,5 +1,6 @@
+import os
 from fastapi import APIRouter, Depends, HTTPException, Body
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 
 router = APIRouter(
@@ -11,50 +12,90 @@ router = APIRouter(
 class GeometryPayload(BaseModel):
     project_id: str
     element_type: str # e.g., 'Wall', 'Floor'
-    vertices: List[Dict[str, float]] # [{'x':0.0, 'y':0.0, 'z':0.0}, ...]
-    metadata: Dict[str, Any]
+    vertices: List[Any] # [{'x':0.0, 'y':0.0, 'z':0.0}, ...], [[x,y,z], ...] or flat [x,y,z, ...]
+    faces: List[Any] = [] # Triangles: [[i,j,k], ...] or flat [i,j,k, ...]
+    unit_scale: float = 1.0 # e.g. 0.3048 to return m²/m³ from Revit feet
+    metadata: Dict[str, Any] = {}
 
 class CalculationResult(BaseModel):
     volume: float
     area: float
     status: str
     message: str
+    signed_volume: float = 0.0
+    bbox_min: Optional[List[float]] = None
+    bbox_max: Optional[List[float]] = None
+    centroid: Optional[List[float]] = None
+    closed: bool = False
+
+from common.mesh_engine import mesh_quantities, batch_quantities
+# Mesh reductions are CPU-bound: plain 'def' endpoints run in FastAPI's threadpool, not on the event loop.
 
 @router.post("/calculate/quantities", response_model=CalculationResult)
-async def calculate_quantities_cloud(payload: GeometryPayload):
+def calculate_quantities_cloud(payload: GeometryPayload):
     """
     Cloud-based calculation endpoint.
     The logic here is protected on the server.
+    Area / signed volume (divergence theorem) / bbox / centroid of a triangulated mesh.
     """
     # 1. Verify User/License (Ideally via Dependency)
     # verify_license(request) ...
     
     print(f"Received Cloud Logic Request for {payload.element_type}")
-    
-    # 2. Perform proprietary calculation
-    # (Placeholder logic)
-    # real_volume = convex_hull_volume(payload.vertices) ...
-    
-    calculated_volume = 0.0
-    calculated_area = 0.0
-    
-    # Heuristic demo
-    if payload.vertices:
-        calculated_area = len(payload.vertices) * 1.5 # Fake math
-        calculated_volume = calculated_area * 3.0
-        
+
+    try:
+        q = mesh_quantities(payload.vertices, payload.faces, payload.unit_scale)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    message = "Calculated securely in cloud"
+    if q["vertices"] and not q["triangles"]:
+        message = "No faces received: only bounding box and centroid were computed"
+    elif q["triangles"] and not q["closed"]:
+        message = "Mesh is not closed: volume is approximate"
+
     return CalculationResult(
-        volume=calculated_volume,
-        area=calculated_area,
+        volume=q["volume"],
+        area=q["area"],
         status="Success",
-        message="Calculated securely in cloud"
+        message=message,
+        signed_volume=q["signed_volume"],
+        bbox_min=q["bbox_min"],
+        bbox_max=q["bbox_max"],
+        centroid=q["centroid"],
+        closed=q["closed"]
     )
 
+class MeshElement(BaseModel):
+    id: str
+    category: Optional[str] = None
+    vertices: List[Any] # Flat [x,y,z, ...] is the cheapest to send and parse
+    faces: List[Any] = []
+
+class BatchGeometryPayload(BaseModel):
+    project_id: str
+    unit_scale: float = 1.0
+    elements: List[MeshElement]
+
+@router.post("/calculate/quantities/batch")
+def calculate_quantities_batch(payload: BatchGeometryPayload):
+    """
+    Thousands of meshes per call: all elements are reduced in one vectorized pass.
+    Returns per-element results, per-category totals and per-element errors (invalid meshes are skipped).
+    """
+    elements = [{"id": e.id, "category": e.category, "vertices": e.vertices, "faces": e.faces} for e in payload.elements]
+    print(f"Received Cloud Batch Quantities for {payload.project_id}: {len(elements)} elements")
+    res = batch_quantities(elements, payload.unit_scale)
+    res["status"] = "Success"
+    return res
+
 # ==========================================
 # COMMAND QUEUE (BRIDGE)
 # ==========================================
 # Replaced In-Memory with DB Queue to handle multiple workers (Gunicorn)
 from common.database import queue_command, get_pending_commands
+# Max commands handed to the plugin per poll (it polls every 0.5s; big batches stall its UI thread)
+COMMANDS_PER_POLL = int(os.getenv("PLUGIN_COMMANDS_PER_POLL", "20"))
 
 class CommandPayload(BaseModel):
     action: str
@@ -66,8 +107,8 @@ async def send_command_to_revit(session_id: str, cmd: CommandPayload):
     return {"status": "queued"}
 
 @router.get("/commands/{session_id}")
-async def get_commands_for_revit(session_id: str):
-    cmds = get_pending_commands(session_id)
+async def get_commands_for_revit(session_id: str, limit: Optional[int] = None):
+    cmds = get_pending_commands(session_id, limit=min(limit or COMMANDS_PER_POLL, COMMANDS_PER_POLL))
     return {"commands": cmds}
 
 # ==========================================
@@ -76,6 +117,8 @@ async def get_commands_for_revit(session_id: str):
 
 # In-Memory Session Store (For now, could be DB backed later)
 from common.database import save_cloud_session, get_cloud_session, list_cloud_projects, delete_cloud_session, create_project_folder, list_project_folders, delete_project_folder
+from common.database import list_cloud_projects_page, list_project_folders_page
+from common.database import sync_cloud_session_full, apply_cloud_delta, get_cloud_element_index, save_cloud_project_state
 
 class CloudQuantifyPayload(BaseModel):
     session_id: str
@@ -92,38 +135,63 @@ async def sync_quantities(payload: CloudQuantifyPayload):
     """
     print(f"Received Cloud Sync from {payload.user_email} for {payload.project_name}")
     
-    # Save to DB
-    # We construct the initial data state.
-    # We assume 'data' is the Revit Data.
-    # The session might already exist if re-syncing.
-    
-    # We need to preserve existing 'cards/sheets' if session exists?
-    # Usually a Sync overwrites the 'REVIT_DATA' part but SHOULD keep user cards/sheets?
-    # Current implementation in JS: loadSessionData overwrites REVIT_DATA but uses payload.savedData for cards.
-    # Let's see if payload has 'cards'. No, CloudQuantifyPayload just has 'data' (Revit dump).
+    # Element rows are stored keyed by Revit Id: only rows that changed are written,
+    # user cards/groups/sheets are preserved.
+    res = sync_cloud_session_full(payload.session_id, payload.data, payload.project_name, payload.user_email, payload.folder_id)
     
-    # Check existing session
-    existing = get_cloud_session(payload.session_id)
-    final_data = {}
-    
-    if existing:
-        final_data = existing["data"]
-        final_data["data"] = payload.data # Update Revit Data part
-    else:
-        final_data = {
-            "data": payload.data, # Revit Data
-            "cards": [],
-            "groups": [],
-            "sheets": []
+    if res.get("status") == "ok":
+        return {
+            "status": "success",
+            "session_id": payload.session_id,
+            "revision": res["revision"],
+            "message": "Data synced and saved to DB"
         }
-        
-    # If folder_id provided, ensure session is linked
-    res = save_cloud_session(payload.session_id, final_data, payload.project_name, payload.user_email, payload.folder_id)
-    
-    if res:
-        return {"status": "success", "session_id": payload.session_id, "message": "Data synced and saved to DB"}
     return {"status": "error", "message": "DB Error"}
 
+class CloudDeltaPayload(BaseModel):
+    session_id: str
+    base_revision: int
+    added: Dict[str, List[Dict[str, Any]]] = {} # { category: [row, ...] }
+    changed: Dict[str, List[Dict[str, Any]]] = {} # { category: [row, ...] }
+    removed: List[Any] = [] # Element Ids
+    meta: Optional[Dict[str, Any]] = None # sheets, schedules, materials, worksets...
+
+@router.post("/sync-delta")
+async def sync_quantities_delta(payload: CloudDeltaPayload):
+    """
+    Element-level delta sync. The plugin sends added/changed/removed elements keyed by Id
+    against 'base_revision'. 409 when the server moved on (plugin must re-fetch the element index).
+    """
+    upserts = {}
+    for part in (payload.added, payload.changed):
+        for category, rows in part.items():
+            upserts.setdefault(category, []).extend(rows)
+
+    res = apply_cloud_delta(payload.session_id, payload.base_revision, upserts, payload.removed, payload.meta)
+    status = res.get("status")
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Session not found")
+    if status == "conflict":
+        raise HTTPException(status_code=409, detail={"message": "Revision conflict", "revision": res["revision"]})
+    if status != "ok":
+        raise HTTPException(status_code=500, detail="DB Error")
+    return {
+        "status": "success",
+        "session_id": payload.session_id,
+        "revision": res["revision"],
+        "written": res["written"],
+        "skipped": res["skipped"],
+        "removed": res["removed"]
+    }
+
+@router.get("/session/{session_id}/element-index")
+def get_element_index(session_id: str):
+    """{ revision, elements: { id: hash } } - lets the plugin compute a delta without a local cache."""
+    index = get_cloud_element_index(session_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return index
+
 class ProjectSavePayload(BaseModel):
     session_id: str
     project_name: str
@@ -133,33 +201,20 @@ class ProjectSavePayload(BaseModel):
 
 @router.post("/save-project")
 async def save_project(payload: ProjectSavePayload):
-    # Get existing to preserve Revit Data
-    existing = get_cloud_session(payload.session_id)
-    if not existing:
-         return {"status": "error", "message": "Session not found to update"}
-         
-    current_data = existing["data"]
-    
-    # Update managed parts
-    current_data["cards"] = payload.cards
-    current_data["groups"] = payload.groups
-    current_data["sheets"] = payload.sheets
-    
-    # Save
-    res = save_cloud_session(payload.session_id, current_data, payload.project_name)
+    # Only the managed parts are written; Revit element rows are untouched
+    res = save_cloud_project_state(payload.session_id, payload.cards, payload.groups, payload.sheets, payload.project_name)
     
     if res:
         return {"status": "success", "message": "Project saved to DB"}
     return {"status": "error", "message": "DB Save Error"}
 
 @router.get("/list-projects")
-async def list_projects_endpoint():
+async def list_projects_endpoint(email: Optional[str] = None, folder_id: Optional[str] = None, limit: Optional[int] = None, offset: int = 0):
     # In future, filter by user from token
-    projects = list_cloud_projects()
-    # Transform to match frontend expectation if needed
     # Frontend expects: { projects: [ {name, session_id, updated}, ... ] }
-    # list_cloud_projects returns matches that structure.
-    return {"projects": projects}
+    # Column-only query: the (large) data_json is never loaded for listings.
+    page = list_cloud_projects_page(email, folder_id, limit, max(offset, 0))
+    return page
 
 @router.post("/archive-project")
 async def archive_project_endpoint(session_id: str):
@@ -181,9 +236,10 @@ async def create_folder_endpoint(payload: CreateFolderPayload):
     return {"status": "error", "message": "Failed to create folder"}
 
 @router.get("/list-folders")
-async def list_folders_endpoint():
-    folders = list_project_folders()
-    return {"folders": folders}
+async def list_folders_endpoint(limit: Optional[int] = None, offset: int = 0, sessions_per_folder: Optional[int] = None):
+    # Plugin (ProjectSelectorWindow) reads folders[].sessions; session_count is the full count
+    # even when sessions_per_folder caps the embedded list.
+    return list_project_folders_page(limit, max(offset, 0), sessions_per_folder)
 
 @router.post("/delete-folder")
 async def delete_folder_endpoint(folder_id: str = Body(..., embed=True)):
@@ -211,12 +267,77 @@ async def rename_session_endpoint(session_id: str = Body(..., embed=True), new_n
         return {"status": "success", "message": "Session renamed"}
     return {"status": "error", "message": "Failed to rename session"}
 
+# ==========================================
+# SERVER-SIDE AGGREGATION
+# ==========================================
+# Elements are loaded into a NumPy columnar frame cached per (session, revision);
+# the Web UI downloads aggregates (or one category's rows) instead of the whole dump.
+# Plain 'def' endpoints: FastAPI runs them in its threadpool (sync SQLAlchemy + NumPy off the event loop).
+from common.quantify_engine import quantify_engine
+from common.database import get_cloud_category_rows
+
+class AggregateFilter(BaseModel):
+    field: str
+    op: str = "eq" # eq, ne, contains, startswith, in, gt, gte, lt, lte
+    value: Any = None
+
+class AggregateMetric(BaseModel):
+    field: str # 'count', 'area', 'volume', 'length' or any parameter name
+    agg: str = "sum" # sum, avg, min, max, count
+    alias: Optional[str] = None
+
+class AggregatePayload(BaseModel):
+    group_by: List[str] = [] # e.g. ['category', 'level', 'type'] or parameter names
+    filters: List[AggregateFilter] = []
+    metrics: List[AggregateMetric] = [AggregateMetric(field="count", agg="count")]
+    order_by: Optional[str] = None # metric key or '-metric key' (desc)
+    limit: Optional[int] = 500
+
+@router.post("/session/{session_id}/aggregate")
+def aggregate_session(session_id: str, payload: AggregatePayload):
+    frame = quantify_engine.frame(session_id)
+    if frame is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        metrics = []
+        for m in payload.metrics:
+            spec = {"field": m.field, "agg": m.agg}
+            if m.alias: spec["as"] = m.alias
+            metrics.append(spec)
+        return frame.aggregate(
+            group_by=payload.group_by,
+            filters=[{"field": f.field, "op": f.op, "value": f.value} for f in payload.filters],
+            metrics=metrics,
+            limit=payload.limit,
+            order_by=payload.order_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/session/{session_id}/fields")
+def get_session_fields(session_id: str):
+    """Columns available for group-by/filter, flagged numeric when they parse as quantities."""
+    frame = quantify_engine.frame(session_id)
+    if frame is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"revision": frame.revision, "elements": frame.size, "fields": frame.fields()}
+
+@router.get("/session/{session_id}/category/{category}/rows")
+def get_category_rows(session_id: str, category: str, fields: Optional[str] = None, offset: int = 0, limit: Optional[int] = None):
+    """Rows of a single category, loaded on demand by the card detail view. fields: comma separated."""
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    res = get_cloud_category_rows(session_id, category, field_list, max(offset, 0), limit)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"category": category, "offset": offset, **res}
+
 @router.get("/session/{session_id}")
-async def get_session_data(session_id: str):
+async def get_session_data(session_id: str, rows: bool = True):
     """
     Retrieves the stored session data for the Web UI.
+    rows=false omits categories[].rows (counts/headers only); rows are then fetched per category.
     """
-    data = get_cloud_session(session_id)
+    data = get_cloud_session(session_id, include_rows=rows)
     if data:
         # Frontend logic expects 'data' key to be the Revit Data?
         # Let's check frontend.
@@ -243,6 +364,7 @@ async def get_session_data(session_id: str):
                 "groups": inner_json.get("groups", []),
                 "sheets": inner_json.get("sheets", [])
             },
+            "revision": data.get("revision", 0),
             "timestamp": data["timestamp"]
         }
         return response_obj
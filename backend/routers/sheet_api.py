@@ -8,7 +8,10 @@ import json
 router = APIRouter(prefix="/api/plugin/sheets", tags=["Sheets"])
 
 
-from common.database import create_sheet_session, get_sheet_session, queue_command
+from common.database import create_sheet_session, get_sheet_session, queue_sheet_updates, query_sheet_rows, diff_sheet_updates
+
+# Sheets per UPDATE_SHEETS command (the plugin applies each command in its own Revit transaction)
+SHEET_COMMAND_CHUNK = int(os.getenv("SHEET_COMMAND_CHUNK", "100"))
 
 @router.post("/init")
 async def init_sheet_session(request: Request):
@@ -53,12 +56,39 @@ async def init_sheet_session(request: Request):
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
 @router.get("/session/{session_id}")
-async def get_session_data(session_id: str):
-    data = get_sheet_session(session_id)
+async def get_session_data(session_id: str, include_sheets: bool = True):
+    """Session document; include_sheets=false returns metadata only (rows come from /sheets/query)."""
+    data = get_sheet_session(session_id, include_sheets=include_sheets)
     if not data:
         return JSONResponse({"status": "error", "message": "Session expired or not found"}, status_code=404)
     return JSONResponse({"status": "ok", "data": data})
 
+@router.post("/session/{session_id}/sheets/query")
+async def query_session_sheets(session_id: str, request: Request):
+    """
+    Server-side page of sheets.
+    Body: { search, filters: [{ field, op, value }], sort, order: 'asc'|'desc', offset, limit }
+    field is 'number', 'name' or a parameter name (optionally 'param:<name>').
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    limit = max(1, min(int(data.get("limit") or 100), 1000))
+    offset = max(0, int(data.get("offset") or 0))
+    page = query_sheet_rows(
+        session_id,
+        search=data.get("search"),
+        filters=data.get("filters"),
+        sort=data.get("sort") or "position",
+        descending=(data.get("order") == "desc"),
+        offset=offset,
+        limit=limit
+    )
+    if page is None:
+        return JSONResponse({"status": "error", "message": "Session expired or not found"}, status_code=404)
+    return JSONResponse({"status": "ok", **page})
+
 @router.post("/apply")
 async def apply_sheet_changes(request: Request):
     """
@@ -70,10 +100,12 @@ async def apply_sheet_changes(request: Request):
         session_id = data.get("session_id")
         updates = data.get("updates") 
         
+        if not isinstance(updates, list):
+            return JSONResponse({"status": "error", "message": "updates must be a list"}, status_code=400)
         print(f"DEBUG Apply: Received {len(updates)} updates for session {session_id}")
         
         # We need to know WHICH plugin session to target.
-        session_data = get_sheet_session(session_id)
+        session_data = get_sheet_session(session_id, include_sheets=False)
         if not session_data:
              print("DEBUG Apply: Session Expired/Not Found")
              return JSONResponse({"status": "error", "message": "Session expired"}, status_code=404)
@@ -83,24 +115,30 @@ async def apply_sheet_changes(request: Request):
         
         # AGGRESSIVE RECOVERY: Check if session is alive
         from common.database import get_session_by_id, get_latest_active_session, update_sheet_session_plugin_id
+        from common.plugin_presence import plugin_presence
         import datetime
         
-        current_plugin_session = get_session_by_id(plugin_session_id)
+        # Presence map first (no DB hit when the link is alive)
+        live = plugin_presence.get(plugin_session_id) if plugin_session_id else None
+        if live:
+            user_email, machine_id, last_heartbeat = live.get("user_email"), live.get("machine_id"), live["last_heartbeat"]
+        else:
+            current_plugin_session = get_session_by_id(plugin_session_id)
+            user_email = current_plugin_session.user_email if current_plugin_session else None
+            machine_id = current_plugin_session.machine_id if current_plugin_session else None
+            last_heartbeat = current_plugin_session.last_heartbeat if current_plugin_session else None
         
         # Determine if stale (older than 2 mins or missing)
         is_stale = False
-        if not current_plugin_session:
+        if not last_heartbeat:
             is_stale = True
         else:
             cutoff = datetime.datetime.now() - datetime.timedelta(minutes=2)
-            if current_plugin_session.last_heartbeat < cutoff:
+            if last_heartbeat < cutoff:
                 is_stale = True
                 
         if is_stale:
             # Try to heal
-            user_email = current_plugin_session.user_email if current_plugin_session else None
-            machine_id = current_plugin_session.machine_id if current_plugin_session else None
-            
             if user_email or machine_id:
                 new_session = get_latest_active_session(user_email, machine_id)
                 if new_session:
@@ -116,11 +154,25 @@ async def apply_sheet_changes(request: Request):
         if not plugin_session_id:
              return JSONResponse({"status": "error", "message": "Plugin Link Lost"}, status_code=400)
         
-        # Queue Command for the specific Plugin Session
+        # Only what actually changed goes to Revit
+        diff = diff_sheet_updates(session_id, updates)
+        changed = diff["changed"]
+        if not changed:
+            return JSONResponse({"status": "ok", "message": "No changes", "changed": 0, "unchanged": diff["unchanged"], "chunks": 0})
+        
+        # Queue Command(s) for the specific Plugin Session
         # Targeted Command - No Broadcast
-        queue_command(plugin_session_id, "UPDATE_SHEETS", updates)
+        chunks = [changed[i:i + SHEET_COMMAND_CHUNK] for i in range(0, len(changed), SHEET_COMMAND_CHUNK)]
+        queue_sheet_updates(session_id, plugin_session_id, chunks)
+        print(f"DEBUG Apply: {len(changed)} changed / {diff['unchanged']} unchanged -> {len(chunks)} commands")
         
-        return JSONResponse({"status": "ok", "message": "Command Queued (Targeted)"})
+        return JSONResponse({
+            "status": "ok",
+            "message": "Command Queued (Targeted)",
+            "changed": len(changed),
+            "unchanged": diff["unchanged"],
+            "chunks": len(chunks)
+        })
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
@@ -165,7 +217,7 @@ async def check_connection_status(session_id: str):
     Returns the health of the Revit Link.
     """
     from common.database import get_sheet_session # Ensure imports
-    session_data = get_sheet_session(session_id)
+    session_data = get_sheet_session(session_id, include_sheets=False)
     if not session_data:
         return {"status": "error", "message": "Session Not Found"}
     
@@ -173,7 +225,7 @@ async def check_connection_status(session_id: str):
     if not plugin_session_id:
         return {"status": "disconnected", "message": "No Revit Link"}
         
-    from common.database import get_session_by_id, get_pending_commands
+    from common.database import get_session_by_id, count_pending_commands
     import datetime
     
     ps = get_session_by_id(plugin_session_id)
@@ -185,8 +237,7 @@ async def check_connection_status(session_id: str):
     is_alive = age < 60 # 1 minute threshold
     
     # Check Queue
-    pending = get_pending_commands(plugin_session_id) # returns list
-    queue_size = len(pending)
+    queue_size = count_pending_commands(plugin_session_id) # peek, doesn't consume
     
     return {
         "status": "connected" if is_alive else "stale",
@@ -199,7 +250,7 @@ async def check_connection_status(session_id: str):
 async def get_logs_endpoint(session_id: str):
     from common.database import get_sheet_session, get_session_logs
     
-    session_data = get_sheet_session(session_id)
+    session_data = get_sheet_session(session_id, include_sheets=False)
     if not session_data:
         return {"status": "error", "message": "Session Not Found"}
         
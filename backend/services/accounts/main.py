@@ -48,8 +48,12 @@ STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 
 from common.database import get_db, SessionCore 
-from common.auth import create_access_token, create_refresh_token, decode_token, AO_JWT_PUBLIC_KEY_PEM
+from common.auth import create_access_token, create_refresh_token, decode_token, revoke_token, AO_JWT_PUBLIC_KEY_PEM
+from common.entitlements import invalidate_local_entitlements
+from common.org_context import org_context
 from common.auth_utils import verify_password, get_password_hash 
+from common.login_pipeline import login_pipeline, LoginBusy, LOGIN_RETRY_AFTER_SECONDS
+from fastapi.concurrency import run_in_threadpool
 import common.models as models 
 from common.models import AccountUser 
 # from common.db_migration_entitlements import run_entitlements_migration # MOVED TO LIFESPAN
@@ -262,74 +266,15 @@ def get_active_org_context(db, user: "AccountUser"):
     """
     Determines the active organization context for a user.
     Returns: (org_id, role, services_list) or (None, None, [])
-    Robust against missing OrganizationUser model AND missing User attributes.
+    Served from the per-user org-context snapshot (common.org_context); 'db' is kept for callers.
     """
-    
-    # 1. Determine Org ID (Safe Access)
-    org_id = getattr(user, "last_active_org_id", None)
-    if not org_id:
-        org_id = getattr(user, "organization_id", None)
-    
-    # 2. Determine Role (Safe Access)
-    org_role = getattr(user, "last_active_org_role", None)
-    if not org_role:
-        org_role = getattr(user, "role", "Member")
-    
-    # 3. Determine Services (Safe Access & Multi-Type Support)
-    services = []
-    
-    # Candidates: services_access (dict usually), services (list usually)
-    services_raw = getattr(user, "services_access", None)
-    if not services_raw:
-        # Fallback to 'services' attribute if exists
-        services_raw = getattr(user, "services", None)
-        
-    if services_raw:
-        if isinstance(services_raw, dict):
-            # If dict, assume {slug: bool} and take True ones
-            services = [k for k, v in services_raw.items() if v]
-        elif isinstance(services_raw, (list, tuple, set)):
-            services = list(services_raw)
-        elif isinstance(services_raw, str):
-            services = [services_raw]
-            
-    # Normalize keys to lowercase slugs
-    slug_map = {
-        "AODailyWork": "daily",
-        "AOPlanSystem": "bim",
-        "AOBuild": "build",
-        "AO Clients": "portal",
-        "AOdev": "plugin",
-        "AO HR & Finance": "finance"
-    }
-
-    # Helper to map slugs
-    def map_slug(s):
-        return slug_map.get(s, s.lower())
-
-    if services:
-        services = [map_slug(s) for s in services]
-    else:
-        # Optional: Try to fetch Org Services if User has no explicit services
-        if org_id and hasattr(models, "Organization"):
-            try:
-                org = db.query(models.Organization).filter(models.Organization.id == org_id).first()
-                if org:
-                    # check org.services or org.enabled_services
-                    org_s = getattr(org, "services", None) or getattr(org, "enabled_services", None)
-                    if org_s:
-                        if isinstance(org_s, dict):
-                            services = [map_slug(k) for k, v in org_s.items() if v]
-                        elif isinstance(org_s, (list, tuple, set)):
-                            services = [map_slug(s) for s in org_s]
-                        elif isinstance(org_s, str):
-                            services = [map_slug(org_s)]
-            except Exception:
-                pass
+    snap = org_context.get(user_id=getattr(user, "id", None), email=getattr(user, "email", None))
+    if not snap:
+        return None, None, []
+    org_id, _, org_role, services, _ = org_context.active_context(snap)
 
     # Log Resolution
-    user_email = getattr(user, "email", "unknown")
-    print(f"[ACCOUNTS] Active org resolved: user={user_email}, org_id={org_id}, org_role={org_role}, services_count={len(services)}")
+    print(f"[ACCOUNTS] Active org resolved: user={snap['email']}, org_id={org_id}, org_role={org_role}, services_count={len(services)}")
     
     return org_id, org_role, services
 
@@ -444,119 +389,141 @@ async def set_active_org(data: dict = Body(...), user=Depends(get_current_active
     finally:
         db.close()
 
+def _login_lookup(email: str):
+    db = SessionCore()
+    try:
+        return db.query(AccountUser).filter(AccountUser.email == email).first()
+    finally:
+        db.close()
+
+def _login_issue_tokens(user: "AccountUser"):
+    """Org context (snapshot), claims and signed tokens for a verified user (runs in the threadpool)."""
+    snap = org_context.get(user_id=user.id, email=user.email)
+    if not snap:
+        return JSONResponse({"status": "error", "message": f"User '{user.email}' not found."}, status_code=401)
+
+    # ORG CONTEXT RESOLUTION (+ Entitlements Version for Cache Invalidation)
+    org_id, role, org_role, services, entitlements_version = org_context.active_context(snap)
+    
+    # SUPER ADMIN OVERRIDE
+    is_super_admin = user.email in SUPER_ADMIN_EMAILS
+    if is_super_admin:
+        role = "SuperAdmin"
+
+    # Robust ID Resolution (Fix for AppUser missing 'id')
+    real_user_id = getattr(user, "id", None)
+    if not real_user_id:
+         # HARDENING: Fallback to email is NO LONGER ALLOWED.
+         # If user model has no ID, this is a critical data error.
+         print(f"❌ [LOGIN] CRITICAL: User {user.email} has no UUID (Legacy AppUser?). Login blocked.")
+         return JSONResponse({"status": "error", "message": "Account migration required. Contact Support."}, status_code=403)
+         # real_user_id = user.email # REMOVED
+
+    # Token Claims (Standardized)
+    claims = {
+        "sub": str(real_user_id),   # Use UUID or Email as sub
+        "email": user.email,
+        "role": role, # Platform role (admin checks / RBAC); the org membership role goes in org_role
+        "org_role": org_role,
+        "platform_role": "super_admin" if is_super_admin else None,
+        "org_id": org_id, 
+        "entitlements_version": entitlements_version,
+        "services": services or []
+    }
+    
+    # Determine Response Status
+    status_response = "ok"
+    redirect_url = "/dashboard" 
+    
+    if not org_id:
+        if is_super_admin:
+            status_response = "ok"
+            redirect_url = "/platform/dashboard"
+        else:
+            status_response = "select_org"
+            redirect_url = "/select-org"
+        
+    # ACCESS TOKEN (Dual Audience for compatibility)
+    access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
+    
+    # REFRESH TOKEN
+    refresh_claims = {"sub": str(real_user_id), "email": user.email}
+    refresh_token = create_refresh_token(data=refresh_claims)
+
+    return {
+        "user_id": str(real_user_id),
+        "org_id": org_id,
+        "status": status_response,
+        "redirect": redirect_url,
+        "access_token": access_token,
+        "refresh_token": refresh_token
+    }
+
 @app.post("/auth/login")
 async def login_action(email: str = Form(...), password: str = Form(...)):
     # print(f"Login Attempt: '{email}'")
     email = email.strip().lower()
-    
-    db = SessionCore()
+
+    # Event loop stays free: DB in the threadpool, bcrypt on the login pool, bursts wait for a slot
     try:
-        user = db.query(AccountUser).filter(AccountUser.email == email).first()
-        
-        if not user:
-            return JSONResponse({"status": "error", "message": f"User '{email}' not found."}, status_code=401)
-            
-        verification = verify_password(password, user.hashed_password)
-        if not verification:
-            return JSONResponse({"status": "error", "message": "Invalid password."}, status_code=401)
-            
-        # ORG CONTEXT RESOLUTION
-        org_id, org_role, services = get_active_org_context(db, user)
-        
-        # SUPER ADMIN OVERRIDE
-        is_super_admin = user.email in SUPER_ADMIN_EMAILS
-        if is_super_admin:
-            org_role = "SuperAdmin"
-
-        # Robust ID Resolution (Fix for AppUser missing 'id')
-        real_user_id = getattr(user, "id", None)
-        if not real_user_id:
-             # HARDENING: Fallback to email is NO LONGER ALLOWED.
-             # If user model has no ID, this is a critical data error.
-             print(f"❌ [LOGIN] CRITICAL: User {email} has no UUID (Legacy AppUser?). Login blocked.")
-             return JSONResponse({"status": "error", "message": "Account migration required. Contact Support."}, status_code=403)
-             # real_user_id = user.email # REMOVED
-
-        # Fetch Entitlements Version for Cache Invalidation
-        entitlements_version = 1
-        if org_id:
-             try:
-                 org_obj = db.query(models.Organization).filter(models.Organization.id == org_id).first()
-                 if org_obj:
-                     entitlements_version = getattr(org_obj, "entitlements_version", 1)
-             except Exception:
-                 pass
-
-        # Token Claims (Standardized)
-        claims = {
-            "sub": str(real_user_id),   # Use UUID or Email as sub
-            "email": user.email,
-            "role": org_role if org_role else user.role, 
-            "platform_role": "super_admin" if is_super_admin else None,
-            "org_id": org_id, 
-            "entitlements_version": entitlements_version,
-            "services": services or []
-        }
-        
-        # Determine Response Status
-        status_response = "ok"
-        redirect_url = "/dashboard" 
-        
-        if not org_id:
-            if is_super_admin:
-                status_response = "ok"
-                redirect_url = "/platform/dashboard"
-            else:
-                status_response = "select_org"
-                redirect_url = "/select-org"
+        async with login_pipeline.admit():
+            user = await run_in_threadpool(_login_lookup, email)
             
-        # ACCESS TOKEN (Dual Audience for compatibility)
-        access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
-        
-        # REFRESH TOKEN
-        refresh_claims = {"sub": str(real_user_id), "email": user.email}
-        refresh_token = create_refresh_token(data=refresh_claims)
-        
-        response = JSONResponse({"status": status_response, "redirect": redirect_url, "user": {"id": str(real_user_id), "email": user.email}})
-        
-        # COOKIE 1: Unified Access Token (accounts_access_token)
-        response.set_cookie(
-            key=ACCESS_COOKIE_NAME, 
-            value=access_token, 
-            httponly=True,
-            samesite=COOKIE_SAMESITE,
-            secure=COOKIE_SECURE, 
-            domain=COOKIE_DOMAIN
-        )
+            if not user:
+                return JSONResponse({"status": "error", "message": f"User '{email}' not found."}, status_code=401)
+                
+            verification = await login_pipeline.verify_password(password, user.hashed_password)
+            if not verification:
+                return JSONResponse({"status": "error", "message": "Invalid password."}, status_code=401)
+
+            issued = await run_in_threadpool(_login_issue_tokens, user)
+    except LoginBusy:
+        return JSONResponse({"status": "error", "message": "Too many logins in progress. Retry in a moment."},
+                            status_code=503, headers={"Retry-After": str(LOGIN_RETRY_AFTER_SECONDS)})
+
+    if isinstance(issued, JSONResponse):
+        return issued
+    access_token = issued["access_token"]
+    refresh_token = issued["refresh_token"]
+
+    response = JSONResponse({"status": issued["status"], "redirect": issued["redirect"], "user": {"id": issued["user_id"], "email": user.email}})
+    
+    # COOKIE 1: Unified Access Token (accounts_access_token)
+    response.set_cookie(
+        key=ACCESS_COOKIE_NAME, 
+        value=access_token, 
+        httponly=True,
+        samesite=COOKIE_SAMESITE,
+        secure=COOKIE_SECURE, 
+        domain=COOKIE_DOMAIN
+    )
 
-        # COOKIE 2: Legacy/Compat (access_token) - Share config
-        # HARDENING: Short Max-Age (1 Hour) to encourage migration
-        response.set_cookie(
-            key="access_token", 
-            value=access_token, 
-            httponly=True,
-            samesite=COOKIE_SAMESITE,
-            secure=COOKIE_SECURE, 
-            domain=COOKIE_DOMAIN,
-            path="/",
-            max_age=3600 # 1 Hour Deprecation Window
-        )
+    # COOKIE 2: Legacy/Compat (access_token) - Share config
+    # HARDENING: Short Max-Age (1 Hour) to encourage migration
+    response.set_cookie(
+        key="access_token", 
+        value=access_token, 
+        httponly=True,
+        samesite=COOKIE_SAMESITE,
+        secure=COOKIE_SECURE, 
+        domain=COOKIE_DOMAIN,
+        path="/",
+        max_age=3600 # 1 Hour Deprecation Window
+    )
 
-        # COOKIE 3: Refresh Token
-        response.set_cookie(
-            key=REFRESH_COOKIE_NAME,
-            value=refresh_token,
-            httponly=True,
-            samesite=COOKIE_SAMESITE,
-            secure=COOKIE_SECURE, 
-            domain=COOKIE_DOMAIN,
-            max_age=7 * 24 * 60 * 60
-        )
-        
-        print(f"Login Success: {user.email} (Org: {org_id})")
-        return response
-    finally:
-        db.close()
+    # COOKIE 3: Refresh Token
+    response.set_cookie(
+        key=REFRESH_COOKIE_NAME,
+        value=refresh_token,
+        httponly=True,
+        samesite=COOKIE_SAMESITE,
+        secure=COOKIE_SECURE, 
+        domain=COOKIE_DOMAIN,
+        max_age=7 * 24 * 60 * 60
+    )
+    
+    print(f"Login Success: {user.email} (Org: {issued['org_id']})")
+    return response
 
 # --- Organization Projects API ---
 
@@ -738,6 +705,7 @@ def toggle_org_service(
             pass # Ignore legacy errors
             
         db.commit()
+        invalidate_local_entitlements(org_id)
         return {"status": "ok", "new_version": org.entitlements_version if org else None}
     except Exception as e:
         db.rollback()
@@ -1213,10 +1181,11 @@ def migrate_db_schema(user_jwt = Depends(get_current_admin)):
     return {"status": "done", "log": messages}
 
 @app.post("/auth/refresh")
-async def refresh_token_endpoint(request: Request):
+def refresh_token_endpoint(request: Request):
     """
     Refreshes the access_token using the HttpOnly refresh_token cookie.
-    Re-evaluates Org Context from DB (last_active_org_id).
+    Re-evaluates Org Context from the org-context snapshot (last_active_org_id).
+    Plain 'def': FastAPI runs it in the threadpool, so a snapshot rebuild and RSA signing stay off the event loop.
     """
     refresh_token = request.cookies.get(REFRESH_COOKIE_NAME)
     if not refresh_token:
@@ -1230,61 +1199,73 @@ async def refresh_token_endpoint(request: Request):
              
         user_id = payload.get("sub")
         
-        # Verify User & Context
-        db = SessionCore()
-        try:
-            user = db.query(AccountUser).filter(AccountUser.id == user_id).first()
-            if not user:
-                 return JSONResponse({"status": "error", "message": "User not found"}, status_code=401)
-                 
-            # CONTEXT RE-EVALUATION
-            org_id, org_role, services = get_active_org_context(db, user)
-            
-            if not org_id:
-                return JSONResponse({"status": "error", "message": "Organization selection required", "code": "ORG_REQUIRED"}, status_code=409)
-
-            # Issue New Access Token
-            claims = {
-                "sub": user.id,
-                "email": user.email,
-                "role": org_role if org_role else user.role,
-                "org_id": org_id,
-                "services": services or []
-            }
-            
-            access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
-            
-            response = JSONResponse({"status": "ok", "message": "Token refreshed", "org_id": org_id})
-            
-            # 1. ACCESS_COOKIE_NAME
-            response.set_cookie(
-                key=ACCESS_COOKIE_NAME, 
-                value=access_token, 
-                httponly=True,
-                samesite=COOKIE_SAMESITE,
-                secure=COOKIE_SECURE, 
-                domain=COOKIE_DOMAIN
-            )
-            
-            # 2. Legacy access_token
-            response.set_cookie(
-                key="access_token", 
-                value=access_token, 
-                httponly=True,
-                samesite=COOKIE_SAMESITE,
-                secure=COOKIE_SECURE,
-                domain=COOKIE_DOMAIN,
-                path="/"
-            )
-            
-            return response
-        finally:
-            db.close()
-            
+        # Verify User & Context: one keyed lookup in the org-context snapshot
+        snap = org_context.get(user_id=user_id, email=payload.get("email"))
+        if snap:
+            # Membership / role changes made by other processes must not outlive a refresh
+            snap = org_context.revalidate(snap)
+        if not snap:
+             return JSONResponse({"status": "error", "message": "User not found"}, status_code=401)
+             
+        # CONTEXT RE-EVALUATION
+        org_id, role, org_role, services, entitlements_version = org_context.active_context(snap)
+        if org_id and org_role is None and (role or "").lower() not in ("admin", "superadmin"):
+            org_id = None # No longer a member of the last active org: pick again
+        
+        if not org_id:
+            return JSONResponse({"status": "error", "message": "Organization selection required", "code": "ORG_REQUIRED"}, status_code=409)
+
+        # Issue New Access Token
+        claims = {
+            "sub": snap["user_id"],
+            "email": snap["email"],
+            "role": role,
+            "org_role": org_role,
+            "org_id": org_id,
+            "entitlements_version": entitlements_version,
+            "services": services or []
+        }
+        
+        access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
+        
+        response = JSONResponse({"status": "ok", "message": "Token refreshed", "org_id": org_id})
+        
+        # 1. ACCESS_COOKIE_NAME
+        response.set_cookie(
+            key=ACCESS_COOKIE_NAME, 
+            value=access_token, 
+            httponly=True,
+            samesite=COOKIE_SAMESITE,
+            secure=COOKIE_SECURE, 
+            domain=COOKIE_DOMAIN
+        )
+        
+        # 2. Legacy access_token
+        response.set_cookie(
+            key="access_token", 
+            value=access_token, 
+            httponly=True,
+            samesite=COOKIE_SAMESITE,
+            secure=COOKIE_SECURE,
+            domain=COOKIE_DOMAIN,
+            path="/"
+        )
+        
+        return response
     except Exception as e:
         print(f"Refresh Error: {e}")
         return JSONResponse({"status": "error", "message": "Refresh failed"}, status_code=401)
 
+def _set_last_active_org(user_id: str, org_id: str):
+    db = SessionCore()
+    try:
+        user = db.query(AccountUser).filter(AccountUser.id == user_id).first()
+        if user:
+            user.last_active_org_id = org_id
+            db.commit()
+    finally:
+        db.close()
+
 @app.post("/auth/select-org")
 async def select_organization(
     request: Request,
@@ -1322,155 +1303,134 @@ async def select_organization(
     if not user_id and not user_email:
         raise HTTPException(status_code=401, detail="Authentication required")
         
-    # 2. VERIFY & SWITCH
-    db = SessionCore()
-    try:
-        # Find User
-        if user_id:
-             user = db.query(AccountUser).filter(AccountUser.id == user_id).first()
-        else:
-             user = db.query(AccountUser).filter(AccountUser.email == user_email).first()
-             
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-            
-        # Verify Membership in Target Org
-        membership = db.query(models.OrganizationUser).filter(
-            models.OrganizationUser.user_id == user.id,
-            models.OrganizationUser.organization_id == org_id
-        ).first()
-        
-        if not membership:
-             raise HTTPException(status_code=403, detail="Not a member of this organization")
-             
-        # Update Last Active
-        user.last_active_org_id = org_id
-        db.commit()
-        
-        # 3. ISSUE NEW TOKEN
-        org_id, org_role, services = _build_context(db, membership)
-        
-        claims = {
-            "sub": user.id,
-            "email": user.email,
-            "role": org_role if org_role else user.role,
-            "org_id": org_id,
-            "services": services or []
-        }
-        
-        access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
-        
-        response = JSONResponse({"status": "ok", "message": "Organization selected"})
+    # 2. VERIFY & SWITCH (membership from the org-context snapshot)
+    snap = await run_in_threadpool(org_context.get, user_id, user_email)
+    if not snap:
+        raise HTTPException(status_code=401, detail="User not found")
         
-        response.set_cookie(
-            key=ACCESS_COOKIE_NAME, 
-            value=access_token, 
-            httponly=True,
-            samesite=COOKIE_SAMESITE,
-            secure=COOKIE_SECURE, 
-            domain=COOKIE_DOMAIN
-        )
-        
-        response.set_cookie(
-            key="access_token",
-            value=access_token,
-            httponly=True,
-            samesite=COOKIE_SAMESITE,
-            secure=COOKIE_SECURE,
-            domain=COOKIE_DOMAIN,
-            path="/" 
-        )
-        return response
-    finally:
-        db.close()
+    # Verify Membership in Target Org
+    context = org_context.membership_context(snap, org_id)
+    if not context:
+         raise HTTPException(status_code=403, detail="Not a member of this organization")
+         
+    # Update Last Active (the commit invalidates this user's snapshot)
+    if snap["last_active_org_id"] != org_id:
+        await run_in_threadpool(_set_last_active_org, snap["user_id"], org_id)
+    
+    # 3. ISSUE NEW TOKEN
+    org_id, org_role, services, entitlements_version = context
+    
+    claims = {
+        "sub": snap["user_id"],
+        "email": snap["email"],
+        "role": snap["role"],
+        "org_role": org_role,
+        "org_id": org_id,
+        "entitlements_version": entitlements_version,
+        "services": services or []
+    }
+    
+    access_token = create_access_token(data=claims, audience=["somosao", "ao-platform"])
+    
+    response = JSONResponse({"status": "ok", "message": "Organization selected"})
+    
+    response.set_cookie(
+        key=ACCESS_COOKIE_NAME, 
+        value=access_token, 
+        httponly=True,
+        samesite=COOKIE_SAMESITE,
+        secure=COOKIE_SECURE, 
+        domain=COOKIE_DOMAIN
+    )
+    
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=True,
+        samesite=COOKIE_SAMESITE,
+        secure=COOKIE_SECURE,
+        domain=COOKIE_DOMAIN,
+        path="/" 
+    )
+    return response
 
 @app.get("/api/my-organizations")
 async def get_my_organizations_endpoint(request: Request):
     """Return organizations visible to the current user.
 
-    - Normal users: orgs where they are a member.
+    - Normal users: orgs where they are a member (org-context snapshot, no queries when cached).
     - Platform admins/superadmins: all orgs (so they can manage tenants/users).
     """
     token = request.cookies.get(ACCESS_COOKIE_NAME)
+    user_id = None
     user_email = None
     role_norm = ""
 
     if token:
         payload = decode_token(token)
         if payload:
-            user_email = (payload.get("sub") or payload.get("email") or "").strip()
+            user_id = (payload.get("sub") or "").strip()
+            user_email = (payload.get("email") or "").strip()
             role_norm = ((payload.get("role") or "")).strip().lower()
 
     refresh_token = request.cookies.get(REFRESH_COOKIE_NAME)
-    if (not user_email) and refresh_token:
-        refresh_payload = decode_token(refresh_token, expected_type="refresh")
-        if refresh_payload:
-            user_email = (refresh_payload.get("sub") or refresh_payload.get("email") or "").strip()
+    if (not user_id) and refresh_token:
+        refresh_payload = decode_token(refresh_token)
+        if refresh_payload and refresh_payload.get("type") == "refresh":
+            user_id = (refresh_payload.get("sub") or "").strip()
+            user_email = (refresh_payload.get("email") or "").strip()
             role_norm = ((refresh_payload.get("role") or "")).strip().lower()
 
-    if not user_email:
+    if not user_id and not user_email:
         return []
 
-    db = SessionCore()
-    try:
-        email_col = getattr(AccountUser, "email", None)
-        if email_col is None:
-            return []
-
-        user_db = db.query(AccountUser).filter(email_col == user_email).first()
-        if not user_db:
-            return []
-
-        # Platform admins see ALL orgs
-        is_platform_admin = (role_norm in ["admin", "superadmin"]) or (user_email.lower() in [e.lower() for e in SUPER_ADMIN_EMAILS])
-        if is_platform_admin:
-            orgs = db.query(models.Organization).all()
-            return [
-                {
-                    "id": o.id,
-                    "name": getattr(o, "name", None),
-                    "role": "superadmin" if role_norm == "superadmin" else "admin",
-                    "is_active": True,
-                }
-                for o in orgs
-            ]
-
-        # Normal users: via membership table
-        member_org_ids = (
-            db.query(models.OrganizationUser.org_id)
-            .filter(models.OrganizationUser.user_id == getattr(user_db, "id", getattr(user_db, "user_id", None)))
-            .all()
-        )
-        member_org_ids = [row[0] for row in member_org_ids]
-
-        if not member_org_ids:
-            return []
-
-        orgs = db.query(models.Organization).filter(models.Organization.id.in_(member_org_ids)).all()
-
-        # map roles
-        roles = {
-            r.org_id: r.role
-            for r in db.query(models.OrganizationUser)
-            .filter(models.OrganizationUser.user_id == getattr(user_db, "id", getattr(user_db, "user_id", None)))
-            .all()
-        }
+    snap = await run_in_threadpool(org_context.get, user_id, user_email)
+    if not snap:
+        return []
 
+    # Platform admins see ALL orgs
+    is_platform_admin = (role_norm in ["admin", "superadmin"]) or ((snap["email"] or "").lower() in [e.lower() for e in SUPER_ADMIN_EMAILS])
+    if is_platform_admin:
+        def _all_orgs():
+            db = SessionCore()
+            try:
+                return db.query(models.Organization.id, models.Organization.name).all()
+            finally:
+                db.close()
+        orgs = await run_in_threadpool(_all_orgs)
         return [
             {
                 "id": o.id,
-                "name": getattr(o, "name", None),
-                "role": roles.get(o.id, "user"),
-                "is_active": getattr(o, "is_active", True),
+                "name": o.name,
+                "role": "superadmin" if role_norm == "superadmin" else "admin",
+                "is_active": True,
             }
             for o in orgs
         ]
-    finally:
-        db.close()
+
+    # Normal users: via membership table
+    return [
+        {
+            "id": m["org_id"],
+            "name": m["name"],
+            "role": m["role"] or "user",
+            "is_active": m["status"] != "Suspended",
+        }
+        for m in snap["memberships"].values()
+        if m["exists"]
+    ]
 
 
 @app.post("/auth/logout")
-async def logout_endpoint():
+async def logout_endpoint(request: Request):
+    # Verified-token cache: these tokens stop validating now, not at their exp - in THIS process only.
+    # The denylist is not shared: other workers and services (Plugin, BIM, Daily, Finance) keep
+    # accepting an access token until its exp (ACCESS_TOKEN_EXPIRE_MINUTES); the refresh token
+    # is what bounds the session, and clearing the cookies below ends it in the browser.
+    for name in (ACCESS_COOKIE_NAME, "access_token", REFRESH_COOKIE_NAME):
+        revoke_token(request.cookies.get(name))
+    revoke_token(request.headers.get("Authorization"))
+
     response = JSONResponse({"status": "ok", "message": "Logged out"})
     # Clear both access cookies
     response.delete_cookie(key=ACCESS_COOKIE_NAME, domain=COOKIE_DOMAIN, path="/")
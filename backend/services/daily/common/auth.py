@@ -96,6 +96,15 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
     )
     return encoded_jwt
 
+
+# Verified-claims cache shared with the root auth module (LRU until 'exp' + per-process denylist)
+try:
+    from backend.common.auth import verified_tokens
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+    from backend.common.auth import verified_tokens
+
 def decode_token(token: str) -> Optional[Dict[str, Any]]:
     """
     Decodes and validates a JWT using RS256 Public Key.
@@ -110,6 +119,13 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
 
+        token_hash = verified_tokens._hash(token)
+        if verified_tokens.is_revoked(token_hash):
+            return None
+        cached = verified_tokens.get(token_hash, "somosao")
+        if cached is not None:
+            return cached
+
         # Verify Signature using Public Key
         payload = jwt.decode(
             token, 
@@ -119,6 +135,7 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
             issuer="accounts.somosao.com",
             options={"require": ["exp", "iss", "aud", "sub"]}
         )
+        verified_tokens.put(token_hash, "somosao", payload)
         return payload
     except jwt.ExpiredSignatureError:
         # print("⚠️ [AUTH] Token Expired")
@@ -22,6 +22,15 @@ PluginSheetSession = getattr(models, "PluginSheetSession", None)
 
 from sqlalchemy.orm.attributes import flag_modified
 
+# Shared column codec: plugin_cloud_sessions.data_json / plugin_sheet_sessions.sheets_json may hold
+# compressed envelopes (written by the monolith / plugin service), so reads go through decode_document.
+try:
+    from backend.common.compression import decode_document
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+    from backend.common.compression import decode_document
+
 # DATABASE SETUP
 # Multi-DB Configuration for Microservices/Monolith Hybrid
 
@@ -1730,7 +1739,7 @@ def get_cloud_session(session_id: str):
                 "session_id": s.id,
                 "project_name": s.project_name,
                 "user_email": s.user_email,
-                "data": s.data_json,
+                "data": decode_document(s.data_json),
                 "timestamp": s.timestamp.isoformat() if s.timestamp else ""
             }
         return None
@@ -2063,7 +2072,7 @@ def get_sheet_session(session_id: str):
         if session:
             return {
                 "project": session.project,
-                "sheets": session.sheets_json,
+                "sheets": decode_document(session.sheets_json),
                 "param_definitions": session.param_definitions_json,
                 "plugin_session_id": session.plugin_session_id
             }
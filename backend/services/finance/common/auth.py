@@ -179,6 +179,17 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
 import logging
 logger = logging.getLogger("uvicorn")
 
+
+# Verified-claims cache shared with the root auth module (LRU until 'exp' + per-process denylist)
+try:
+    from backend.common.auth import verified_tokens
+except ImportError:
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+    from backend.common.auth import verified_tokens
+
+FINANCE_TOKEN_CACHE_KEY = "finance:no-aud"
+
 def decode_token(token: str) -> Optional[Dict[str, Any]]:
     """
     Decodes and validates a JWT using RS256 Public Key.
@@ -193,6 +204,14 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
 
+        # Separate cache key: this service does not verify 'aud'
+        token_hash = verified_tokens._hash(token)
+        if verified_tokens.is_revoked(token_hash):
+            return None
+        cached = verified_tokens.get(token_hash, FINANCE_TOKEN_CACHE_KEY)
+        if cached is not None:
+            return cached
+
         # DEBUG: Print Token Header and Key details
         try:
             # logger.info(f"🕵️ [AUTH DEBUG] Token Length: {len(token)}") 
@@ -214,6 +233,7 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
                 audience=["somosao", "ao-platform"], # Expect list match
                 options={"verify_aud": False} # CRITICAL DEBUG: Disable audience check to isolate Signature Error
             )
+            verified_tokens.put(token_hash, FINANCE_TOKEN_CACHE_KEY, payload)
             return payload
             
         except jwt.InvalidTokenError as e:
@@ -276,11 +296,14 @@ async def get_current_user_claims(request: Request) -> Dict[str, Any]:
     
     return payload
 
-# Import EntitlementsClient from Local Common
+# Import EntitlementsClient from Root Backend (shared TTL / stale-while-revalidate cache)
 try:
-    from .entitlements import entitlements_client
+    from backend.common.entitlements import entitlements_client
 except ImportError:
-    from common.entitlements import entitlements_client
+    # Fallback for local dev if path is weird
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+    from backend.common.entitlements import entitlements_client
 
 def require_service(service_slug: str):
     """
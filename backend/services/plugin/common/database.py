@@ -4,6 +4,8 @@ import datetime
 import json
 import uuid
 import types
+import hashlib
+import secrets
 from typing import List, Optional
 from sqlalchemy.orm import Session, sessionmaker, joinedload
 from sqlalchemy import create_engine, text
@@ -1067,6 +1069,93 @@ def start_revit_session(email, machine, version, ip, plugin_version="1.0.0"):
     finally:
         db.close()
 
+# Device refresh tokens (plugin resume) - same table / rules as backend/common/database.py
+PLUGIN_DEVICE_TOKEN_TTL_DAYS = int(os.getenv("PLUGIN_DEVICE_TOKEN_TTL_DAYS", "30"))
+# A prior session silent for longer than this is assumed to belong to a closed Revit and is reused
+PLUGIN_RESUME_REUSE_AFTER_SECONDS = int(os.getenv("PLUGIN_RESUME_REUSE_AFTER_SECONDS", "90"))
+
+def _hash_device_token(raw: str) -> str:
+    return hashlib.sha256((raw or "").encode("utf-8")).hexdigest()
+
+def issue_device_token(user_email: str, machine_id: str, session_id: str):
+    """New device token for (user, machine). Returns (raw_token, expires_at); only the hash is stored."""
+    db = SessionPlugin()
+    try:
+        raw = secrets.token_urlsafe(32)
+        now = datetime.datetime.now()
+        expires_at = now + datetime.timedelta(days=PLUGIN_DEVICE_TOKEN_TTL_DAYS)
+        db.add(models.PluginDeviceToken(
+            token_hash=_hash_device_token(raw), user_email=user_email, machine_id=machine_id,
+            session_id=session_id, created_at=now, last_used_at=now, expires_at=expires_at
+        ))
+        db.commit()
+        return raw, expires_at
+    finally:
+        db.close()
+
+def revoke_device_token(raw: str) -> bool:
+    db = SessionPlugin()
+    try:
+        n = db.query(models.PluginDeviceToken).filter(
+            models.PluginDeviceToken.token_hash == _hash_device_token(raw)
+        ).update({models.PluginDeviceToken.revoked: True}, synchronize_session=False)
+        db.commit()
+        return n > 0
+    finally:
+        db.close()
+
+def resume_plugin_session(raw: str, machine: str, version: str, ip: str, plugin_version: str = "1.0.0", user_active=None):
+    """
+    Validates a device token and returns { user_email, session_id, resumed, expires_at } or None.
+    'user_active(email) -> bool' is checked before any session is opened: a locked user's token is
+    revoked and { user_email, locked: True } returned.
+    """
+    db = SessionPlugin()
+    try:
+        now = datetime.datetime.now()
+        T = models.PluginDeviceToken
+        tok = db.query(T).filter(T.token_hash == _hash_device_token(raw)).first()
+        if not tok or tok.revoked or tok.expires_at < now:
+            return None
+        if tok.machine_id and machine and tok.machine_id != machine:
+            return None # Token copied to another machine
+        if user_active is not None and not user_active(tok.user_email):
+            tok.revoked = True
+            db.commit()
+            return {"user_email": tok.user_email, "locked": True}
+
+        session = None
+        if tok.session_id:
+            session = db.query(models.PluginSession).filter(models.PluginSession.id == tok.session_id).first()
+        silent_for = (now - session.last_heartbeat).total_seconds() if session and session.last_heartbeat else None
+        resumed = bool(
+            session and session.machine_id == machine and session.revit_version == version
+            and silent_for is not None and silent_for > PLUGIN_RESUME_REUSE_AFTER_SECONDS
+        )
+        if resumed:
+            session.is_active = True
+            session.last_heartbeat = now
+            session.plugin_version = plugin_version
+            session.ip_address = ip
+        else:
+            session = models.PluginSession(
+                id=str(uuid.uuid4()), user_email=tok.user_email, machine_id=machine, revit_version=version,
+                plugin_version=plugin_version, ip_address=ip, start_time=now, last_heartbeat=now, is_active=True
+            )
+            db.add(session)
+
+        tok.session_id = session.id
+        tok.last_used_at = now
+        tok.expires_at = now + datetime.timedelta(days=PLUGIN_DEVICE_TOKEN_TTL_DAYS)
+        db.commit()
+        return {"user_email": tok.user_email, "session_id": session.id, "resumed": resumed, "expires_at": tok.expires_at}
+    except Exception as e:
+        print(f"Error resuming plugin session: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
 def heartbeat_session(session_id, ip):
     db = SessionPlugin()
     try:
@@ -1658,13 +1747,23 @@ def get_latest_plugin_version():
 # ==========================================
 
 def save_cloud_session(session_id: str, data: dict, project_name: str = None, user_email: str = None, folder_id: str = None):
+    """
+    Wholesale write of the document (legacy path). Its inline rows become the source of truth:
+    stored element rows are dropped and 'elements_external' cleared, so nothing is counted twice.
+    """
     db = SessionPlugin()
     try:
         session = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        data = dict(data or {})
+        data.pop("elements_external", None)
         
         if session:
             # Update
+            db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == session_id).delete(synchronize_session=False)
             session.data_json = data
+            flag_modified(session, "data_json")
+            session.revision = (session.revision or 0) + 1
+            session.elements_external = False
             if project_name: session.project_name = project_name
             if user_email: session.user_email = user_email
             if folder_id: session.folder_id = folder_id
@@ -1676,7 +1775,8 @@ def save_cloud_session(session_id: str, data: dict, project_name: str = None, us
                 user_email=user_email or "unknown",
                 project_name=project_name or "Sin Nombre",
                 data_json=data,
-                folder_id=folder_id
+                folder_id=folder_id,
+                elements_external=False
             )
             db.add(new_s)
         
@@ -1693,17 +1793,231 @@ def get_cloud_session(session_id: str):
     try:
         s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
         if s:
+            data = s.data_json or {}
+            if data.get("elements_external"):
+                # Element rows live in plugin_cloud_elements: rebuild the legacy document shape
+                data = dict(data)
+                data["data"] = _assemble_revit_data(db, s.id, data.get("data") or {})
+                data.pop("elements_external", None)
             return {
                 "session_id": s.id,
                 "project_name": s.project_name,
                 "user_email": s.user_email,
-                "data": s.data_json,
+                "data": data,
+                "revision": s.revision or 0,
                 "timestamp": s.timestamp.isoformat() if s.timestamp else ""
             }
         return None
     finally:
         db.close()
 
+# --- Element-level Sync (same storage as backend/common/database.py) ---
+# data_json keeps the small parts (cards, groups, sheets, schedules, category headers).
+# categories[].rows are stored one row per element in plugin_cloud_elements, keyed by Revit Id,
+# and every change bumps PluginCloudSession.revision.
+
+CLOUD_ELEMENT_CHUNK = 1000
+
+def _cloud_row_hash(row: dict) -> str:
+    raw = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _split_revit_data(revit_data: dict):
+    """
+    Splits a Revit dump into (meta, elements).
+    elements: [(element_id, category, row)]. Rows without 'Id' stay inline in meta.
+    """
+    meta = dict(revit_data or {})
+    elements = []
+    cats = meta.get("categories")
+    if isinstance(cats, list):
+        slim = []
+        for c in cats:
+            if not isinstance(c, dict):
+                slim.append(c)
+                continue
+            c2 = {k: v for k, v in c.items() if k != "rows"}
+            inline = []
+            for row in c.get("rows") or []:
+                if isinstance(row, dict) and row.get("Id") is not None:
+                    elements.append((str(row["Id"]), c.get("name"), row))
+                else:
+                    inline.append(row)
+            if inline:
+                c2["rows"] = inline
+            slim.append(c2)
+        meta["categories"] = slim
+    return meta, elements
+
+def _inline_rows(category: dict) -> list:
+    """Rows kept inline in an externalized session: only the ones without 'Id' (others duplicate stored elements)."""
+    return [r for r in category.get("rows") or [] if not (isinstance(r, dict) and r.get("Id") is not None)]
+
+def _assemble_revit_data(db, session_id: str, meta: dict) -> dict:
+    """Inverse of _split_revit_data: streams element rows back into categories[].rows."""
+    E = models.PluginCloudElement
+    rows_by_cat = {}
+    q = db.query(E.category, E.data_json).filter(E.session_id == session_id).order_by(E.category, E.element_id)
+    for cat, row in q.yield_per(CLOUD_ELEMENT_CHUNK):
+        rows_by_cat.setdefault(cat, []).append(row)
+
+    data = dict(meta)
+    categories = []
+    for c in meta.get("categories") or []:
+        if not isinstance(c, dict):
+            categories.append(c)
+            continue
+        c2 = dict(c)
+        c2["rows"] = _inline_rows(c) + rows_by_cat.pop(c.get("name"), [])
+        categories.append(c2)
+
+    # Categories introduced by deltas (not present in the last full dump)
+    for cat, rows in rows_by_cat.items():
+        headers = sorted({k for r in rows for k in r.keys() if k not in ("Id", "Name")})
+        categories.append({"name": cat, "count": len(rows), "rows": rows, "headers": headers})
+
+    data["categories"] = categories
+    return data
+
+def _upsert_cloud_elements(db, session_id: str, elements, revision: int):
+    """Chunked upsert. Rows whose hash did not change are skipped. Returns (written, skipped)."""
+    E = models.PluginCloudElement
+    written = skipped = 0
+    for i in range(0, len(elements), CLOUD_ELEMENT_CHUNK):
+        chunk = elements[i:i + CLOUD_ELEMENT_CHUNK]
+        ids = [el_id for el_id, _, _ in chunk]
+        existing = dict(db.query(E.element_id, E.row_hash).filter(
+            E.session_id == session_id, E.element_id.in_(ids)
+        ).all())
+
+        inserts, updates = [], []
+        for el_id, category, row in chunk:
+            row_hash = _cloud_row_hash(row)
+            mapping = {
+                "session_id": session_id,
+                "element_id": el_id,
+                "category": category,
+                "data_json": row,
+                "row_hash": row_hash,
+                "revision": revision
+            }
+            if el_id not in existing:
+                inserts.append(mapping)
+                existing[el_id] = row_hash # Guard against duplicate ids inside the payload
+            elif existing[el_id] != row_hash:
+                updates.append(mapping)
+            else:
+                skipped += 1
+
+        if inserts: db.bulk_insert_mappings(E, inserts)
+        if updates: db.bulk_update_mappings(E, updates)
+        written += len(inserts) + len(updates)
+    return written, skipped
+
+def _delete_cloud_elements(db, session_id: str, element_ids) -> int:
+    E = models.PluginCloudElement
+    removed = 0
+    element_ids = [str(x) for x in element_ids]
+    for i in range(0, len(element_ids), CLOUD_ELEMENT_CHUNK):
+        chunk = element_ids[i:i + CLOUD_ELEMENT_CHUNK]
+        removed += db.query(E).filter(E.session_id == session_id, E.element_id.in_(chunk)).delete(synchronize_session=False)
+    return removed
+
+def _externalize_cloud_session(db, s):
+    """Moves a legacy session (rows inside data_json) into plugin_cloud_elements. Revision unchanged."""
+    s.elements_external = True
+    data = dict(s.data_json or {})
+    if data.get("elements_external"):
+        return
+    meta, elements = _split_revit_data(data.get("data") or {})
+    _upsert_cloud_elements(db, s.id, elements, s.revision or 0)
+    data["data"] = meta
+    data["elements_external"] = True
+    s.data_json = data
+    flag_modified(s, "data_json")
+
+def sync_cloud_session_full(session_id: str, revit_data: dict, project_name: str = None, user_email: str = None, folder_id: str = None):
+    """
+    Full dump from Revit. Stores element rows keyed by Id and writes only what changed
+    (hash diff + removal of vanished elements). Cards/groups/sheets are preserved.
+    Returns { status, revision, written, skipped, removed }.
+    """
+    db = SessionPlugin()
+    try:
+        s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        if not s:
+            s = models.PluginCloudSession(
+                id=session_id,
+                user_email=user_email or "unknown",
+                project_name=project_name or "Sin Nombre",
+                data_json={"cards": [], "groups": [], "sheets": []},
+                folder_id=folder_id,
+                revision=0
+            )
+            db.add(s)
+            db.flush()
+        else:
+            if project_name: s.project_name = project_name
+            if user_email: s.user_email = user_email
+            if folder_id: s.folder_id = folder_id
+
+        meta, elements = _split_revit_data(revit_data)
+        new_rev = (s.revision or 0) + 1
+
+        written, skipped = _upsert_cloud_elements(db, session_id, elements, new_rev)
+
+        # Elements that disappeared from the model
+        E = models.PluginCloudElement
+        incoming = {el_id for el_id, _, _ in elements}
+        stored = [r[0] for r in db.query(E.element_id).filter(E.session_id == session_id).all()]
+        removed = _delete_cloud_elements(db, session_id, [x for x in stored if x not in incoming])
+
+        data = dict(s.data_json or {})
+        changed = bool(written or removed) or data.get("data") != meta or not data.get("elements_external")
+        if changed:
+            data["data"] = meta
+            data["elements_external"] = True
+            s.data_json = data
+            flag_modified(s, "data_json")
+            s.revision = new_rev
+            s.timestamp = datetime.datetime.now()
+        s.elements_external = True
+
+        db.commit()
+        return {"status": "ok", "revision": s.revision, "written": written, "skipped": skipped, "removed": removed}
+    except Exception as e:
+        print(f"Error syncing cloud session: {e}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+def save_cloud_project_state(session_id: str, cards: list, groups: list, sheets: list, project_name: str = None):
+    """Saves only the user-managed parts (cards/groups/sheets). Element rows are not rewritten."""
+    db = SessionPlugin()
+    try:
+        s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
+        if not s:
+            return False
+        if not (s.data_json or {}).get("elements_external"):
+            _externalize_cloud_session(db, s)
+        data = dict(s.data_json or {})
+        data["cards"] = cards
+        data["groups"] = groups
+        data["sheets"] = sheets
+        s.data_json = data
+        flag_modified(s, "data_json")
+        if project_name: s.project_name = project_name
+        s.timestamp = datetime.datetime.now()
+        db.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving cloud project state: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
 def list_cloud_projects(email: str = None):
     db = SessionPlugin()
     try:
@@ -1732,6 +2046,7 @@ def delete_cloud_session(session_id: str):
     try:
         s = db.query(models.PluginCloudSession).filter(models.PluginCloudSession.id == session_id).first()
         if s:
+            db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == session_id).delete(synchronize_session=False)
             db.delete(s)
             db.commit()
             return True
@@ -1789,6 +2104,7 @@ def delete_project_folder(folder_id: str):
         f = db.query(models.PluginProjectFolder).filter(models.PluginProjectFolder.id == folder_id).first()
         if f:
             for s in f.sessions:
+                db.query(models.PluginCloudElement).filter(models.PluginCloudElement.session_id == s.id).delete(synchronize_session=False)
                 db.delete(s)
             db.delete(f)
             db.commit()
@@ -1884,23 +2200,29 @@ def queue_command(session_id: str, action: str, payload: dict):
     finally:
         db.close()
 
-def get_pending_commands(session_id: str):
+def get_pending_commands(session_id: str, limit: int = None):
+    """Oldest unconsumed commands (at most 'limit'), marked consumed/sent on the way out."""
     db = SessionPlugin()
     try:
         # Get unconsumed commands
-        cmds = db.query(models.CloudCommand).filter(
+        q = db.query(models.CloudCommand).filter(
             models.CloudCommand.session_id == session_id,
             models.CloudCommand.is_consumed == False
-        ).order_by(models.CloudCommand.created_at.asc()).all()
+        ).order_by(models.CloudCommand.created_at.asc(), models.CloudCommand.id.asc())
+        if limit:
+            q = q.limit(limit)
+        cmds = q.all()
         
         result = []
         for c in cmds:
             result.append({
+                "id": c.id,
                 "action": c.action,
                 "payload": c.payload
             })
             # Mark consumed
             c.is_consumed = True
+            c.status = "sent"
             
         if result:
             db.commit()
@@ -1909,6 +2231,38 @@ def get_pending_commands(session_id: str):
     finally:
         db.close()
 
+def count_pending_commands(session_id: str) -> int:
+    """Queue depth without consuming anything."""
+    db = SessionPlugin()
+    try:
+        return db.query(func.count(models.CloudCommand.id)).filter(
+            models.CloudCommand.session_id == session_id,
+            models.CloudCommand.is_consumed == False
+        ).scalar() or 0
+    finally:
+        db.close()
+
+def update_command_status(command_id: int, status: str, result_json: dict = None, message: str = None):
+    db = SessionPlugin()
+    try:
+        cmd = db.query(models.CloudCommand).filter(models.CloudCommand.id == command_id).first()
+        if not cmd:
+            return False
+        cmd.status = status
+        cmd.result_json = result_json
+        if message:
+            cmd.error_message = message
+        if cmd.action == "UPDATE_SHEETS" and status in ("success", "error"):
+            _settle_sheet_updates(db, cmd.id, applied=status == "success")
+        db.commit()
+        return True
+    except Exception as e:
+        print(f"Error updating command status: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
 
 # -----------------------------------------------------------------------------
 # ROUTINES (KNOWLEDGE BASE)
@@ -1986,19 +2340,65 @@ def delete_sheet_template(tpl_id: int):
 # SHEET MANAGER SESSION FUNCTIONS
 # -----------------------------------------------------------------------------
 
-def create_sheet_session(session_id: str, project_name: str, sheets: list, param_defs: list, plugin_session_id: str):
+# Same env var as common.retention (the monolith's purge job collects expired sessions)
+SHEET_SESSION_TTL_HOURS = float(os.getenv("RETENTION_SHEET_SESSION_TTL_HOURS", "72"))
+
+def _sheet_row_mappings(session_id: str, sheets: list):
+    rows = []
+    seen = set()
+    for pos, sh in enumerate(sheets or []):
+        if not isinstance(sh, dict):
+            continue
+        sheet_id = str(sh.get("id") or "")
+        if not sheet_id or sheet_id in seen:
+            continue
+        seen.add(sheet_id)
+        rows.append({
+            "session_id": session_id,
+            "sheet_id": sheet_id,
+            "position": pos,
+            "number": sh.get("number"),
+            "name": sh.get("name"),
+            "data_json": sh
+        })
+    return rows
+
+def _externalize_sheet_session(db, session):
+    """Moves the sheets list of sheets_json into plugin_sheet_rows (legacy sessions are migrated lazily)."""
+    blob = session.sheets_json
+    if isinstance(blob, dict) and blob.get("rows_external"):
+        return
+    if isinstance(blob, dict):
+        sheets = blob.get("sheets") or []
+        meta = {k: v for k, v in blob.items() if k != "sheets"}
+    else:
+        sheets = blob or []
+        meta = {"version": "v2"}
+    rows = _sheet_row_mappings(session.id, sheets)
+    for i in range(0, len(rows), CLOUD_ELEMENT_CHUNK):
+        db.bulk_insert_mappings(models.PluginSheetRow, rows[i:i + CLOUD_ELEMENT_CHUNK])
+    meta["rows_external"] = True
+    session.sheets_json = meta
+    flag_modified(session, "sheets_json")
+
+def create_sheet_session(session_id: str, project_name: str, sheets, param_defs: list, plugin_session_id: str):
     db = SessionPlugin()
     try:
         # Check if exists (unlikely given UUID)
+        now = datetime.datetime.now()
         new_session = PluginSheetSession(
             id=session_id,
             project=project_name,
             plugin_session_id=plugin_session_id,
             sheets_json=sheets,
             param_definitions_json=param_defs,
-            created_at=datetime.datetime.now()
+            created_at=now,
+            expires_at=now + datetime.timedelta(hours=SHEET_SESSION_TTL_HOURS)
         )
         db.add(new_session)
+        db.flush()
+        # One row per sheet (paging / filtering / diff); the blob keeps metadata only
+        _externalize_sheet_session(db, new_session)
         db.commit()
         return True
     except Exception as e:
@@ -2009,7 +2409,7 @@ def create_sheet_session(session_id: str, project_name: str, sheets: list, param
         db.close()
 
 def update_sheet_session_plugin_id(session_id: str, new_plugin_session_id: str):
-    db = SessionLocal()
+    db = SessionPlugin()
     try:
         s = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
         if s:
@@ -2023,14 +2423,24 @@ def update_sheet_session_plugin_id(session_id: str, new_plugin_session_id: str):
     finally:
         db.close()
 
-def get_sheet_session(session_id: str):
-    db = SessionLocal()
+def get_sheet_session(session_id: str, include_sheets: bool = True):
+    """Legacy document shape ({ sheets: { version, sheets: [...], ... } }). include_sheets=False skips the rows."""
+    db = SessionPlugin()
     try:
         session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if session and session.expires_at and session.expires_at < datetime.datetime.now():
+            return None # Expired (row is removed by the retention job)
         if session:
+            blob = session.sheets_json
+            if isinstance(blob, dict) and blob.get("rows_external"):
+                blob = {k: v for k, v in blob.items() if k != "rows_external"}
+                if include_sheets:
+                    R = models.PluginSheetRow
+                    q = db.query(R.data_json).filter(R.session_id == session_id).order_by(R.position, R.sheet_id)
+                    blob["sheets"] = [row for (row,) in q.yield_per(CLOUD_ELEMENT_CHUNK)]
             return {
                 "project": session.project,
-                "sheets": session.sheets_json,
+                "sheets": blob,
                 "param_definitions": session.param_definitions_json,
                 "plugin_session_id": session.plugin_session_id
             }
@@ -2038,6 +2448,178 @@ def get_sheet_session(session_id: str):
     finally:
         db.close()
 
+SHEET_SORT_COLUMNS = ("position", "number", "name")
+
+def _sheet_value(sheet: dict, field: str):
+    if field in ("number", "name", "id"):
+        return sheet.get(field)
+    params = sheet.get("params_data") or sheet.get("params") or {}
+    return params.get(field[6:] if field.startswith("param:") else field)
+
+def _sheet_matches(sheet: dict, f: dict) -> bool:
+    val = str(_sheet_value(sheet, f.get("field", "")) or "").lower()
+    target = f.get("value")
+    op = f.get("op", "contains")
+    if op == "in":
+        return val in [str(v).lower() for v in (target if isinstance(target, list) else [target])]
+    target = str(target or "").lower()
+    if op == "equals" or op == "eq": return val == target
+    if op == "ne": return val != target
+    if op == "startswith": return val.startswith(target)
+    if op == "empty": return val == ""
+    return target in val
+
+def query_sheet_rows(session_id: str, search: str = None, filters: list = None, sort: str = "position",
+                     descending: bool = False, offset: int = 0, limit: int = 100):
+    """
+    Page of sheets. number/name search and number/name/position sorting run in SQL on the indexed rows;
+    parameter filters / parameter sorting are evaluated over the session rows.
+    Returns { total, offset, limit, sheets } or None if the session doesn't exist.
+    """
+    db = SessionPlugin()
+    try:
+        session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if not session:
+            return None
+        if not (isinstance(session.sheets_json, dict) and session.sheets_json.get("rows_external")):
+            _externalize_sheet_session(db, session)
+            db.commit()
+
+        R = models.PluginSheetRow
+        q = db.query(R.data_json).filter(R.session_id == session_id)
+        if search:
+            like = f"%{search}%"
+            q = q.filter((R.number.ilike(like)) | (R.name.ilike(like)))
+
+        sort = sort or "position"
+        filters = [f for f in (filters or []) if isinstance(f, dict) and f.get("field")]
+        sql_sort = sort in SHEET_SORT_COLUMNS
+        if sql_sort and not filters:
+            col = getattr(R, sort)
+            total = q.order_by(None).count()
+            q = q.order_by(col.desc() if descending else col.asc(), R.sheet_id)
+            sheets = [row for (row,) in q.offset(offset).limit(limit).all()]
+            return {"total": total, "offset": offset, "limit": limit, "sheets": sheets}
+
+        if sql_sort:
+            col = getattr(R, sort)
+            q = q.order_by(col.desc() if descending else col.asc(), R.sheet_id)
+        rows = [row for (row,) in q.yield_per(CLOUD_ELEMENT_CHUNK)]
+        rows = [r for r in rows if all(_sheet_matches(r, f) for f in filters)]
+        if not sql_sort:
+            rows.sort(key=lambda r: str(_sheet_value(r, sort) or ""), reverse=descending)
+        return {"total": len(rows), "offset": offset, "limit": limit, "sheets": rows[offset:offset + limit]}
+    finally:
+        db.close()
+
+def diff_sheet_updates(session_id: str, updates: list):
+    """
+    Minimal diff of the UI's sheet list against the stored state.
+    Returns { changed: [update], unchanged: n } where each update only carries changed params
+    (number/name are always sent: the plugin keys on them). New sheets are always included.
+    The stored rows are left as they are: queue_sheet_updates() records the changes as pending and
+    update_command_status() promotes them once Revit confirms the command.
+    """
+    db = SessionPlugin()
+    try:
+        session = db.query(PluginSheetSession).filter(PluginSheetSession.id == session_id).first()
+        if not session:
+            return None
+        if not (isinstance(session.sheets_json, dict) and session.sheets_json.get("rows_external")):
+            _externalize_sheet_session(db, session)
+            db.flush()
+
+        R = models.PluginSheetRow
+        ids = [str(u.get("id")) for u in updates or [] if isinstance(u, dict) and u.get("id") and not u.get("is_new")]
+        stored = {}
+        for i in range(0, len(ids), CLOUD_ELEMENT_CHUNK):
+            chunk = ids[i:i + CLOUD_ELEMENT_CHUNK]
+            for sheet_id, row in db.query(R.sheet_id, R.data_json).filter(R.session_id == session_id, R.sheet_id.in_(chunk)).all():
+                stored[sheet_id] = row
+
+        changed, unchanged = [], 0
+        for u in updates or []:
+            if not isinstance(u, dict):
+                continue
+            if u.get("is_new") or str(u.get("id")) not in stored:
+                changed.append(u)
+                continue
+
+            sheet_id = str(u.get("id"))
+            old = stored[sheet_id]
+            old_params = old.get("params_data") or old.get("params") or {}
+            new_params = {}
+            for k, v in (u.get("params") or {}).items():
+                # Only string parameters are written by the plugin (nested UI state is ignored)
+                if isinstance(v, (dict, list)):
+                    continue
+                if str(v if v is not None else "") != str(old_params.get(k) if old_params.get(k) is not None else ""):
+                    new_params[k] = v
+
+            number = u.get("number") if u.get("number") is not None else old.get("number")
+            name = u.get("name") if u.get("name") is not None else old.get("name")
+            if not new_params and number == old.get("number") and name == old.get("name"):
+                unchanged += 1
+                continue
+
+            changed.append({"id": sheet_id, "number": number, "name": name, "params": new_params, "is_new": False})
+
+        # Sliding expiry: a session still being edited is not collected
+        session.expires_at = datetime.datetime.now() + datetime.timedelta(hours=SHEET_SESSION_TTL_HOURS)
+        db.commit()
+        return {"changed": changed, "unchanged": unchanged}
+    except Exception as e:
+        print(f"Error diffing sheet updates: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def queue_sheet_updates(session_id: str, plugin_session_id: str, chunks: list):
+    """
+    Queues one UPDATE_SHEETS command per chunk for the Revit session and, in the same transaction,
+    records the edits to existing sheets as pending for that command. Returns the command ids.
+    """
+    db = SessionPlugin()
+    try:
+        cmds = [models.CloudCommand(session_id=plugin_session_id, action="UPDATE_SHEETS", payload=c) for c in chunks]
+        db.add_all(cmds)
+        db.flush()
+        for cmd, chunk in zip(cmds, chunks):
+            updates = [u for u in chunk if isinstance(u, dict) and u.get("id") and not u.get("is_new")]
+            if updates:
+                db.add(models.PluginSheetPendingUpdate(command_id=cmd.id, session_id=session_id, updates_json=updates))
+        db.commit()
+        return [c.id for c in cmds]
+    finally:
+        db.close()
+
+def _settle_sheet_updates(db, command_id: int, applied: bool):
+    """Promotes (applied) or drops the pending sheet edits of an UPDATE_SHEETS command. No commit."""
+    pending = db.query(models.PluginSheetPendingUpdate).filter(
+        models.PluginSheetPendingUpdate.command_id == command_id
+    ).first()
+    if not pending:
+        return
+    if applied:
+        R = models.PluginSheetRow
+        updates = {str(u["id"]): u for u in pending.updates_json or []}
+        ids = list(updates)
+        row_updates = []
+        for i in range(0, len(ids), CLOUD_ELEMENT_CHUNK):
+            chunk = ids[i:i + CLOUD_ELEMENT_CHUNK]
+            for sheet_id, data in db.query(R.sheet_id, R.data_json).filter(R.session_id == pending.session_id, R.sheet_id.in_(chunk)).all():
+                u = updates[sheet_id]
+                # Merged into the row as it is now, so commands confirmed out of order don't undo each other
+                merged = dict(data or {})
+                merged["number"], merged["name"] = u.get("number"), u.get("name")
+                merged["params_data"] = {**(merged.get("params_data") or merged.get("params") or {}), **(u.get("params") or {})}
+                row_updates.append({"session_id": pending.session_id, "sheet_id": sheet_id,
+                                    "number": u.get("number"), "name": u.get("name"), "data_json": merged})
+        if row_updates:
+            db.bulk_update_mappings(R, row_updates)
+    db.delete(pending)
+
 # -----------------------------------------------------------------------------
 # DAILY APP FUNCTIONS (daily.somosao.com)
 # -----------------------------------------------------------------------------
@@ -1,7 +1,17 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, Text
+from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, Text, Index
 from sqlalchemy.orm import relationship, DeclarativeBase
 from sqlalchemy.sql import func
 import datetime
+import os
+import sys
+
+# Shared column codec: these tables are also read/written by the monolith (backend/common/models.py),
+# so both apps must store and decode the same compressed envelopes.
+try:
+    from common.compression import CompressedJSON
+except ImportError:
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+    from common.compression import CompressedJSON
 
 # LOCAL DECOUPLED MODELS
 # Copied from backend/common/models.py to avoid 'backend' package dependency on Railway
@@ -61,6 +71,26 @@ class PluginSession(Base):
     last_heartbeat = Column(DateTime, default=func.now())
     is_active = Column(Boolean, default=True)
 
+class PluginDeviceToken(Base):
+    """
+    Long-lived device refresh token for the Revit add-in (only the sha256 is stored).
+    POST /api/plugin/resume exchanges it for a session without a password / bcrypt verify.
+    """
+    __tablename__ = 'plugin_device_tokens'
+    __table_args__ = (
+        Index('ix_plugin_device_tokens_user', 'user_email', 'machine_id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    user_email = Column(String, nullable=False)
+    machine_id = Column(String)
+    session_id = Column(String) # Last session opened with this token
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, default=False)
+
 class PluginActivity(Base):
     __tablename__ = 'plugin_activities'
     
@@ -104,8 +134,29 @@ class PluginCloudSession(Base):
     project_name = Column(String, default="Proyecto Sin Nombre")
     folder_id = Column(String, ForeignKey('plugin_project_folders.id'), nullable=True)
     folder = relationship("PluginProjectFolder", back_populates="sessions")
-    data_json = Column(JSON, default={}) # Stores { cards: [], groups: [], sheets: [], revit_data: ... }
+    data_json = Column(CompressedJSON, default={}) # Stores { cards: [], groups: [], sheets: [], revit_data: ... } (compressed above threshold)
     timestamp = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Delta Sync: bumped on every element change. Element rows live in plugin_cloud_elements
+    revision = Column(Integer, default=0, nullable=False, server_default="0")
+    # Mirrors data_json['elements_external'] so revision checks don't load data_json
+    elements_external = Column(Boolean, default=False)
+
+class PluginCloudElement(Base):
+    """
+    One Revit element row of a Cloud Quantify session (keyed by Revit Element Id).
+    Lets the plugin sync deltas instead of rewriting the whole data_json document.
+    """
+    __tablename__ = 'plugin_cloud_elements'
+    __table_args__ = (
+        Index('ix_plugin_cloud_elements_category', 'session_id', 'category'),
+    )
+
+    session_id = Column(String, ForeignKey('plugin_cloud_sessions.id', ondelete="CASCADE"), primary_key=True)
+    element_id = Column(String, primary_key=True) # Revit ElementId (as string)
+    category = Column(String)
+    data_json = Column(JSON, default={}) # The row: { Id, Name, <param>: <value>, ... }
+    row_hash = Column(String) # sha1 of canonical row JSON (unchanged rows are skipped)
+    revision = Column(Integer, default=0) # Session revision that last touched this row
 
 class CloudCommand(Base):
     __tablename__ = 'plugin_cloud_commands'
@@ -115,7 +166,7 @@ class CloudCommand(Base):
     action = Column(String)
     payload = Column(JSON)
     status = Column(String, default="pending") # pending, sent, success, error
-    result_json = Column(JSON, nullable=True) 
+    result_json = Column(CompressedJSON, nullable=True)
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -149,10 +200,47 @@ class PluginSheetSession(Base):
     id = Column(String, primary_key=True) # UUID
     project = Column(String)
     plugin_session_id = Column(String)
-    sheets_json = Column(JSON)
+    sheets_json = Column(CompressedJSON)
     param_definitions_json = Column(JSON, default=[])
     created_at = Column(DateTime, default=func.now())
-    expires_at = Column(DateTime, nullable=True) # Optional expiration logic logic
+    expires_at = Column(DateTime, nullable=True) # Set on create, slid on apply; enforced by common.retention
+
+    __table_args__ = (
+        Index('ix_plugin_sheet_sessions_expires', 'expires_at'),
+        Index('ix_plugin_sheet_sessions_created', 'created_at'),
+    )
+
+class PluginSheetRow(Base):
+    """
+    One sheet of a Sheet Manager session (keyed by Revit UniqueId).
+    Backs server-side paging/filtering and the minimal diff on apply; sheets_json keeps the metadata only.
+    """
+    __tablename__ = 'plugin_sheet_rows'
+
+    session_id = Column(String, ForeignKey('plugin_sheet_sessions.id', ondelete="CASCADE"), primary_key=True)
+    sheet_id = Column(String, primary_key=True) # Revit UniqueId
+    position = Column(Integer, default=0) # Order received from Revit
+    number = Column(String)
+    name = Column(String)
+    data_json = Column(JSON, default={}) # { id, number, name, params_data, browser_paths }
+
+    __table_args__ = (
+        Index('ix_plugin_sheet_rows_number', 'session_id', 'number'),
+        Index('ix_plugin_sheet_rows_name', 'session_id', 'name'),
+        Index('ix_plugin_sheet_rows_position', 'session_id', 'position'),
+    )
+
+class PluginSheetPendingUpdate(Base):
+    """
+    Sheet edits sent to Revit by one UPDATE_SHEETS command. Promoted into plugin_sheet_rows when the
+    plugin reports the command as applied, dropped if it fails: the diff baseline is the last confirmed state.
+    """
+    __tablename__ = 'plugin_sheet_pending_updates'
+
+    command_id = Column(Integer, primary_key=True) # plugin_cloud_commands.id
+    session_id = Column(String, ForeignKey('plugin_sheet_sessions.id', ondelete="CASCADE"), index=True)
+    updates_json = Column(JSON, default=[]) # [{ id, number, name, params }] (changed params only)
+    created_at = Column(DateTime, default=func.now())
 
 # LEGACY COMPAT: Type Hint Stubs
 class Collaborator(Base):
@@ -185,10 +273,6 @@ class ExpenseCard(Base):
     __tablename__ = 'resources_expense_cards'
     id = Column(String, primary_key=True)
 
-class PluginSheetSession(Base):
-    __tablename__ = 'plugin_sheet_sessions'
-    id = Column(String, primary_key=True)
-
 class Quotation(Base):
     __tablename__ = 'resources_quotations'
     id = Column(String, primary_key=True)
@@ -197,10 +281,6 @@ class QuotationTemplate(Base):
     __tablename__ = 'resources_quotation_templates'
     id = Column(Integer, primary_key=True)
 
-class SheetTemplate(Base):
-    __tablename__ = 'plugin_sheet_templates'
-    id = Column(Integer, primary_key=True)
-
 # Backward-compat alias for legacy imports
 AccountUser = AppUser
 
@@ -41,6 +41,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gzip/zstd request bodies from the add-in (same as the monolith's /api/plugin)
+from common.compression import DecompressRequestMiddleware
+app.add_middleware(DecompressRequestMiddleware, prefixes=("/api/plugin",))
+
 # Include Routers
 # plugin_api handles its own mixed auth (login vs protected)
 app.include_router(plugin_api.router) 
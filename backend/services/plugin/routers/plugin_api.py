@@ -1,5 +1,6 @@
 
 from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
@@ -8,7 +9,8 @@ import json
 # Import from local common
 from ..common.database import (
     start_revit_session, heartbeat_session, end_revit_session,
-    log_plugin_activity, log_plugin_sync, get_user_by_email
+    log_plugin_activity, log_plugin_sync, get_user_by_email,
+    issue_device_token, revoke_device_token, resume_plugin_session
 )
 from ..common.auth import create_access_token # RS256
 # verify_password -> might need to vendor utils or just copy it? verify_password is in auth_utils.
@@ -33,6 +35,17 @@ class PluginLoginRequest(BaseModel):
     revit_version: str
     plugin_version: Optional[str] = "1.0.0"
     ip_address: str
+    remember_device: bool = True
+
+class PluginResumeRequest(BaseModel):
+    device_token: str
+    machine_name: str
+    revit_version: str
+    plugin_version: Optional[str] = "1.0.0"
+    ip_address: str
+
+class DeviceTokenRequest(BaseModel):
+    device_token: str
 
 class HeartbeatRequest(BaseModel):
     session_id: str
@@ -56,20 +69,8 @@ class TokenValidationRequest(BaseModel):
 
 # --- Routes ---
 
-@router.post("/login")
-async def plugin_login(req: PluginLoginRequest):
-    # user = get_user_by_email(req.username)
-    user = get_user_by_email(req.username)
-    
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid username")
-        
-    if not verify_password(req.password, user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid password")
-        
-    if not user.is_active:
-         raise HTTPException(status_code=403, detail="User account is locked")
-
+def _plugin_session_response(user, session_id: str, device_token: str = None, device_expires: datetime.datetime = None):
+    """Login / resume payload: session token, latest version and permissions."""
     # Plugin Current Version Logic
     from database import get_latest_plugin_version
     
@@ -82,9 +83,6 @@ async def plugin_login(req: PluginLoginRequest):
         latest_version = latest_v_data["version"]
         update_info = latest_v_data
 
-    # Create Session
-    session_id = start_revit_session(user.email, req.machine_name, req.revit_version, req.ip_address, plugin_version=req.plugin_version)
-
     # Generate Token (optional context)
     token = create_access_token(data={"sub": user.email, "role": user.role, "session_id": session_id})
     
@@ -92,7 +90,7 @@ async def plugin_login(req: PluginLoginRequest):
     permissions = getattr(user, 'permissions', {})
     if not permissions: permissions = {}
 
-    return {
+    resp = {
         "access_token": token,
         "token_type": "bearer",
         "session_id": session_id,
@@ -103,6 +101,72 @@ async def plugin_login(req: PluginLoginRequest):
         "update_info": update_info,
         "permissions": permissions
     }
+    if device_token:
+        resp["device_token"] = device_token
+        resp["device_token_expires_at"] = device_expires.isoformat() if device_expires else None
+    return resp
+
+def _plugin_login_session(user, req: PluginLoginRequest):
+    """Session + device token + signed response (DB / RSA work, runs in the threadpool)."""
+    session_id = start_revit_session(user.email, req.machine_name, req.revit_version, req.ip_address, plugin_version=req.plugin_version)
+
+    # Device token: next Revit start resumes without the password
+    device_token, device_expires = None, None
+    if req.remember_device:
+        device_token, device_expires = issue_device_token(user.email, req.machine_name, session_id)
+
+    return _plugin_session_response(user, session_id, device_token, device_expires)
+
+@router.post("/login")
+async def plugin_login(req: PluginLoginRequest):
+    """Password login. bcrypt runs on the login pool and DB work in the threadpool; bursts queue (503 when full)."""
+    from common.login_pipeline import login_pipeline, LoginBusy, LOGIN_RETRY_AFTER_SECONDS
+
+    try:
+        async with login_pipeline.admit():
+            user = await run_in_threadpool(get_user_by_email, req.username)
+
+            if not user:
+                raise HTTPException(status_code=401, detail="Invalid username")
+
+            if not await login_pipeline.verify_password(req.password, user.hashed_password):
+                raise HTTPException(status_code=401, detail="Invalid password")
+
+            if not user.is_active:
+                 raise HTTPException(status_code=403, detail="User account is locked")
+
+            return await run_in_threadpool(_plugin_login_session, user, req)
+    except LoginBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, retry shortly",
+                            headers={"Retry-After": str(LOGIN_RETRY_AFTER_SECONDS)})
+
+@router.post("/resume")
+async def plugin_resume(req: PluginResumeRequest):
+    """Device-token start (no password / bcrypt). Reuses the previous session when its Revit was closed."""
+    def user_active(email):
+        user = get_user_by_email(email)
+        return bool(user and user.is_active)
+
+    res = await run_in_threadpool(resume_plugin_session, req.device_token, req.machine_name, req.revit_version,
+                                  req.ip_address, req.plugin_version, user_active)
+    if not res:
+        raise HTTPException(status_code=401, detail="Invalid or expired device token")
+    if res.get("locked"):
+        raise HTTPException(status_code=403, detail="User account is locked")
+
+    user = await run_in_threadpool(get_user_by_email, res["user_email"])
+    if not user:
+        raise HTTPException(status_code=403, detail="User account is locked")
+
+    resp = await run_in_threadpool(_plugin_session_response, user, res["session_id"])
+    resp["resumed"] = res["resumed"]
+    resp["device_token_expires_at"] = res["expires_at"].isoformat()
+    return resp
+
+@router.post("/device/revoke")
+async def plugin_revoke_device(req: DeviceTokenRequest):
+    """Logout on this machine: the device token can no longer resume."""
+    return {"revoked": await run_in_threadpool(revoke_device_token, req.device_token)}
 
 @router.post("/heartbeat")
 async def plugin_heartbeat(req: HeartbeatRequest):
@@ -152,7 +216,7 @@ class CommandResult(BaseModel):
 
 @router.post("/command/result")
 async def command_result(res: CommandResult):
-    from database import update_command_status
+    from ..common.database import update_command_status
     success = update_command_status(res.command_id, res.status, res.result_json, res.message)
     if not success:
         raise HTTPException(status_code=404, detail="Command not found")
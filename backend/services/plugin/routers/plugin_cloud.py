@@ -76,6 +76,7 @@ async def get_commands_for_revit(session_id: str):
 
 # In-Memory Session Store (For now, could be DB backed later)
 from ..common.database import save_cloud_session, get_cloud_session, list_cloud_projects, delete_cloud_session, create_project_folder, list_project_folders, delete_project_folder
+from ..common.database import sync_cloud_session_full, save_cloud_project_state
 
 class CloudQuantifyPayload(BaseModel):
     session_id: str
@@ -92,36 +93,17 @@ async def sync_quantities(payload: CloudQuantifyPayload):
     """
     print(f"Received Cloud Sync from {payload.user_email} for {payload.project_name}")
     
-    # Save to DB
-    # We construct the initial data state.
-    # We assume 'data' is the Revit Data.
-    # The session might already exist if re-syncing.
+    # Element rows are stored keyed by Revit Id: only rows that changed are written,
+    # user cards/groups/sheets are preserved.
+    res = sync_cloud_session_full(payload.session_id, payload.data, payload.project_name, payload.user_email, payload.folder_id)
     
-    # We need to preserve existing 'cards/sheets' if session exists?
-    # Usually a Sync overwrites the 'REVIT_DATA' part but SHOULD keep user cards/sheets?
-    # Current implementation in JS: loadSessionData overwrites REVIT_DATA but uses payload.savedData for cards.
-    # Let's see if payload has 'cards'. No, CloudQuantifyPayload just has 'data' (Revit dump).
-    
-    # Check existing session
-    existing = get_cloud_session(payload.session_id)
-    final_data = {}
-    
-    if existing:
-        final_data = existing["data"]
-        final_data["data"] = payload.data # Update Revit Data part
-    else:
-        final_data = {
-            "data": payload.data, # Revit Data
-            "cards": [],
-            "groups": [],
-            "sheets": []
+    if res.get("status") == "ok":
+        return {
+            "status": "success",
+            "session_id": payload.session_id,
+            "revision": res["revision"],
+            "message": "Data synced and saved to DB"
         }
-        
-    # If folder_id provided, ensure session is linked
-    res = save_cloud_session(payload.session_id, final_data, payload.project_name, payload.user_email, payload.folder_id)
-    
-    if res:
-        return {"status": "success", "session_id": payload.session_id, "message": "Data synced and saved to DB"}
     return {"status": "error", "message": "DB Error"}
 
 class ProjectSavePayload(BaseModel):
@@ -133,20 +115,8 @@ class ProjectSavePayload(BaseModel):
 
 @router.post("/save-project")
 async def save_project(payload: ProjectSavePayload):
-    # Get existing to preserve Revit Data
-    existing = get_cloud_session(payload.session_id)
-    if not existing:
-         return {"status": "error", "message": "Session not found to update"}
-         
-    current_data = existing["data"]
-    
-    # Update managed parts
-    current_data["cards"] = payload.cards
-    current_data["groups"] = payload.groups
-    current_data["sheets"] = payload.sheets
-    
-    # Save
-    res = save_cloud_session(payload.session_id, current_data, payload.project_name)
+    # Only the managed parts are written; Revit element rows are untouched
+    res = save_cloud_project_state(payload.session_id, payload.cards, payload.groups, payload.sheets, payload.project_name)
     
     if res:
         return {"status": "success", "message": "Project saved to DB"}
@@ -72,7 +72,9 @@ document.addEventListener('DOMContentLoaded', async () => {
 async function loadSessionData() {
     updateStatus("Conectando...", "emerald");
     try {
-        const res = await fetch(`${API_BASE}/session/${SESSION_ID}`);
+        // Rows are not downloaded here: categories come with counts/headers only,
+        // rows are fetched per category when a card is opened (ensureCategoryRows).
+        const res = await fetch(`${API_BASE}/session/${SESSION_ID}?rows=false`);
         if (!res.ok) throw new Error("Server Error");
 
         const payload = await res.json();
@@ -111,6 +113,37 @@ async function loadSessionData() {
     switchTab('compilation'); // Default view for testing
 }
 
+// Lazy category rows (server keeps the full Revit dump)
+async function ensureCategoryRows(categoryName) {
+    if (!REVIT_DATA || !Array.isArray(REVIT_DATA.categories)) return null;
+    const cat = REVIT_DATA.categories.find(c => c.name === categoryName);
+    if (!cat) return null;
+    if (Array.isArray(cat.rows) && cat.rows.length >= (cat.count || 0)) return cat;
+
+    try {
+        const res = await fetch(`${API_BASE}/session/${SESSION_ID}/category/${encodeURIComponent(categoryName)}/rows`);
+        if (!res.ok) throw new Error("Server Error");
+        const payload = await res.json();
+        cat.rows = payload.rows || [];
+        cat.count = payload.total;
+    } catch (e) {
+        console.error("Could not load rows for", categoryName, e);
+        cat.rows = cat.rows || [];
+    }
+    return cat;
+}
+
+// Server-side aggregation: { group_by: ['level'], filters: [{field, op, value}], metrics: [{field: 'area', agg: 'sum'}] }
+async function fetchAggregate(spec) {
+    const res = await fetch(`${API_BASE}/session/${SESSION_ID}/aggregate`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(spec)
+    });
+    if (!res.ok) throw new Error("Aggregate Error");
+    return await res.json();
+}
+
 // 4. Tab Logic
 function switchTab(tabId) {
     CURRENT_TAB = tabId;
@@ -805,6 +838,18 @@ function openCardModal(categoryName, count) {
     document.getElementById('modal-category-name').innerText = categoryName || "General";
     document.getElementById('modal-element-count').innerText = count || 0;
 
+    // Live count from the server (the category list may predate the last delta sync)
+    if (SESSION_ID && categoryName) {
+        fetchAggregate({ filters: [{ field: 'category', op: 'eq', value: categoryName }], metrics: [{ field: 'count', agg: 'count' }] })
+            .then(agg => {
+                const countEl = document.getElementById('modal-element-count');
+                if (countEl && document.getElementById('modal-category-name').innerText === categoryName) {
+                    countEl.innerText = agg.matched;
+                }
+            })
+            .catch(e => console.warn("Aggregate count unavailable, keeping the listed count", e));
+    }
+
     // Groups Selector
     const sel = document.getElementById('card-group-select');
     if (sel) {
@@ -835,6 +880,9 @@ function openCardModal(categoryName, count) {
 
         if (categoryData && categoryData.rows && categoryData.rows.length > 0) {
             params = Object.keys(categoryData.rows[0]);
+        } else if (categoryData && Array.isArray(categoryData.headers) && categoryData.headers.length > 0) {
+            // Lightweight session payload: no rows, headers only
+            params = ["Id", "Name", ...categoryData.headers];
         }
 
         if (params.length > 0) {
@@ -1111,7 +1159,10 @@ const DETAIL_MODAL_TEMPLATE = `
 </div>
 `;
 
-function openCardDetails(cardId) {
+async function openCardDetails(cardId) {
+    const target = activeCards.find(card => card.id === cardId);
+    if (target) await ensureCategoryRows(target.source);
+
     if (!document.getElementById('card-detail-modal')) {
         document.body.insertAdjacentHTML('beforeend', DETAIL_MODAL_TEMPLATE);
     }
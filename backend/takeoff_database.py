@@ -1,31 +1,219 @@
-
-import json
 import os
+import gzip
+import json
+import hashlib
+import datetime
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows dev boxes: in-process lock only
 
 # "Separate Database" simulation (File System for now)
 DB_PATH = "takeoff_storage_db"
+# Compressed previous revisions kept per project
+HISTORY_KEEP = int(os.getenv("TAKEOFF_HISTORY_KEEP", "20"))
+
+EMPTY_PACKAGES = b"[]"
+
+
+def _safe_id(project_id: str) -> str:
+    # Sanitize project_id just in case
+    safe_id = "".join([c for c in (project_id or "") if c.isalnum() or c in ('-', '_')])
+    return safe_id or "default_project"
+
+def _etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _atomic_write(path: str, data: bytes):
+    """Write to a temp file in the same directory, fsync, then rename over the target."""
+    folder = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class TakeoffStore:
+    """
+    Versioned takeoff package store.
+    - {id}.json: current packages (raw bytes, never parsed server-side)
+    - {id}.meta.json: { revision, etag, size, updated_at }
+    - history/{id}/{revision}.json.gz: previous revisions, last HISTORY_KEEP kept
+    Writes are atomic (temp file + os.replace) under a per-project lock (flock across workers).
+    ETags are cached in memory keyed by the file's (mtime, size), so If-None-Match needs only a stat.
+    """
+
+    def __init__(self, root: str = DB_PATH, history_keep: int = HISTORY_KEEP):
+        self.root = root
+        self.history_keep = history_keep
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._etags = {} # safe_id -> (mtime_ns, size, etag)
+
+    # --- Paths / locking ---
+
+    def _path(self, safe_id: str) -> str:
+        return os.path.join(self.root, f"{safe_id}.json")
+
+    def _meta_path(self, safe_id: str) -> str:
+        return os.path.join(self.root, f"{safe_id}.meta.json")
+
+    def _history_dir(self, safe_id: str) -> str:
+        return os.path.join(self.root, "history", safe_id)
+
+    def _lock(self, safe_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(safe_id)
+            if lock is None:
+                lock = self._locks[safe_id] = threading.Lock()
+            return lock
+
+    def _read_meta(self, safe_id: str) -> dict:
+        try:
+            with open(self._meta_path(safe_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # --- ETag cache ---
+
+    def current_etag(self, project_id: str):
+        """ETag of the current packages via stat only (None if the project has no packages)."""
+        safe_id = _safe_id(project_id)
+        try:
+            st = os.stat(self._path(safe_id))
+        except OSError:
+            return _etag(EMPTY_PACKAGES)
+        cached = self._etags.get(safe_id)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        return None # Unknown until read (written by another worker / legacy file)
+
+    # --- Read ---
+
+    def read(self, project_id: str):
+        """Returns (raw_bytes, etag). Missing projects return '[]'."""
+        safe_id = _safe_id(project_id)
+        try:
+            with open(self._path(safe_id), "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            return EMPTY_PACKAGES, _etag(EMPTY_PACKAGES)
+
+        cached = self._etags.get(safe_id)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return data, cached[2]
+        etag = _etag(data)
+        self._etags[safe_id] = (st.st_mtime_ns, st.st_size, etag)
+        return data, etag
+
+    # --- Write ---
+
+    def save(self, project_id: str, packages_json_str) -> dict:
+        """Atomically replaces the packages. Identical content is a no-op. Returns { revision, etag, changed }."""
+        safe_id = _safe_id(project_id)
+        data = packages_json_str.encode("utf-8") if isinstance(packages_json_str, str) else bytes(packages_json_str)
+        etag = _etag(data)
+        os.makedirs(self.root, exist_ok=True)
+
+        with self._lock(safe_id):
+            lock_file = open(os.path.join(self.root, f".{safe_id}.lock"), "a")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+                meta = self._read_meta(safe_id)
+                path = self._path(safe_id)
+                previous = None
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        previous = f.read()
+                    if _etag(previous) == etag:
+                        return {"revision": meta.get("revision", 0), "etag": etag, "changed": False}
+
+                revision = meta.get("revision", 0 if previous is None else 1)
+                if previous is not None:
+                    self._archive(safe_id, revision, previous)
+                revision += 1
+
+                _atomic_write(path, data)
+                st = os.stat(path)
+                self._etags[safe_id] = (st.st_mtime_ns, st.st_size, etag)
+
+                meta = {
+                    "revision": revision,
+                    "etag": etag,
+                    "size": len(data),
+                    "updated_at": datetime.datetime.now().isoformat()
+                }
+                _atomic_write(self._meta_path(safe_id), json.dumps(meta).encode("utf-8"))
+                return {"revision": revision, "etag": etag, "changed": True}
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+
+    # --- History ---
+
+    def _archive(self, safe_id: str, revision: int, data: bytes):
+        folder = self._history_dir(safe_id)
+        os.makedirs(folder, exist_ok=True)
+        _atomic_write(os.path.join(folder, f"{revision:06d}.json.gz"), gzip.compress(data, compresslevel=6))
+
+        # Retention
+        files = sorted(f for f in os.listdir(folder) if f.endswith(".json.gz"))
+        for old in files[:-self.history_keep] if self.history_keep > 0 else files:
+            try:
+                os.remove(os.path.join(folder, old))
+            except OSError as e:
+                print(f"[TAKEOFF] Could not prune {old}: {e}")
+
+    def list_revisions(self, project_id: str) -> list:
+        safe_id = _safe_id(project_id)
+        folder = self._history_dir(safe_id)
+        out = []
+        if os.path.isdir(folder):
+            for name in sorted(os.listdir(folder), reverse=True):
+                if not name.endswith(".json.gz"):
+                    continue
+                st = os.stat(os.path.join(folder, name))
+                out.append({
+                    "revision": int(name.split(".")[0]),
+                    "compressed_size": st.st_size,
+                    "archived_at": datetime.datetime.fromtimestamp(st.st_mtime).isoformat()
+                })
+        meta = self._read_meta(safe_id)
+        return {"current": meta or None, "history": out}
+
+    def read_revision(self, project_id: str, revision: int):
+        """Raw bytes of an archived revision (None if pruned / unknown)."""
+        path = os.path.join(self._history_dir(_safe_id(project_id)), f"{int(revision):06d}.json.gz")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return gzip.decompress(f.read())
+
+# Singleton Instance
+takeoff_store = TakeoffStore()
+
 
 def save_project_packages(project_id: str, packages_json_str: str):
     """Saves the raw JSON string of packages for a project."""
-    if not os.path.exists(DB_PATH):
-        os.makedirs(DB_PATH)
-    
-    # Sanitize project_id just in case
-    safe_id = "".join([c for c in project_id if c.isalnum() or c in ('-','_')])
-    if not safe_id: safe_id = "default_project"
-    
-    file_path = os.path.join(DB_PATH, f"{safe_id}.json")
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(packages_json_str)
+    takeoff_store.save(project_id, packages_json_str)
     return True
 
 def get_project_packages(project_id: str) -> str:
     """Returns the raw JSON string."""
-    safe_id = "".join([c for c in project_id if c.isalnum() or c in ('-','_')])
-    file_path = os.path.join(DB_PATH, f"{safe_id}.json")
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    return "[]"
+    data, _ = takeoff_store.read(project_id)
+    return data.decode("utf-8")
@@ -1,47 +1,93 @@
-import requests
 import time
 import base64
-from .config import APS_CLIENT_ID, APS_CLIENT_SECRET, APS_SCOPES
+import threading
+from .config import APS_CLIENT_ID, APS_CLIENT_SECRET, APS_SCOPES, APS_BASE_URL
+from .http_pool import get_session
+
+# Refresh this long before the token expires (so calls in flight never carry an expired token)
+TOKEN_REFRESH_SKEW_SECONDS = 300
+
+
+class TokenCache:
+    """
+    Process-wide 2-legged APS token. One fetch per expiry window: concurrent callers wait on
+    the lock and reuse the token the first one fetched (single flight).
+    """
+
+    def __init__(self, skew_seconds=TOKEN_REFRESH_SKEW_SECONDS, session=None):
+        self.skew = skew_seconds
+        self.session = session
+        self._lock = threading.Lock()
+        self.access_token = None
+        self.expires_at = 0.0
+        self.fetches = 0
+        self.reuses = 0
+        self.forced_refreshes = 0
+
+    def _valid(self):
+        return self.access_token and time.time() < self.expires_at - self.skew
+
+    def get(self, rejected=None):
+        """
+        Returns a valid access token, fetching one if needed.
+        rejected: a token APS answered 401 to; refreshed once (unless another thread already did).
+        """
+        if self._valid() and self.access_token != rejected:
+            self.reuses += 1
+            return self.access_token
+        with self._lock:
+            if self._valid() and self.access_token != rejected:
+                self.reuses += 1
+                return self.access_token
+            if rejected:
+                self.forced_refreshes += 1
+            return self._fetch()
+
+    def _fetch(self):
+        url = f"{APS_BASE_URL}/authentication/v2/token"
+
+        # Needs Basic Auth header
+        auth_str = f"{APS_CLIENT_ID}:{APS_CLIENT_SECRET}"
+        b64_auth = base64.b64encode(auth_str.encode()).decode()
+
+        headers = {
+            "Authorization": f"Basic {b64_auth}",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        data = {
+            "grant_type": "client_credentials",
+            "scope": " ".join(APS_SCOPES)
+        }
+
+        res = (self.session or get_session()).post(url, headers=headers, data=data, timeout=30)
+
+        if res.status_code != 200:
+            raise Exception(f"Failed to authenticate: {res.text}")
+
+        json_data = res.json()
+        self.fetches += 1
+        self.access_token = json_data["access_token"]
+        self.expires_at = time.time() + json_data["expires_in"]
+        return self.access_token
+
+    def stats(self):
+        lookups = self.fetches + self.reuses
+        return {
+            "fetches": self.fetches,
+            "reuses": self.reuses,
+            "forced_refreshes": self.forced_refreshes,
+            "reuse_rate": round(self.reuses / lookups, 4) if lookups else 0.0,
+            "expires_in_seconds": max(0, round(self.expires_at - time.time())) if self.access_token else None
+        }
+
+# Singleton Instance
+token_cache = TokenCache()
 
-_TOKEN_CACHE = {
-    "access_token": None,
-    "expires_at": 0
-}
 
 def get_access_token():
     """
     Returns a valid access token (2-legged).
-    Refreshes if expired.
+    Refreshes shortly before it expires.
     """
-    global _TOKEN_CACHE
-    
-    if _TOKEN_CACHE["access_token"] and time.time() < _TOKEN_CACHE["expires_at"]:
-        return _TOKEN_CACHE["access_token"]
-        
-    url = "https://developer.api.autodesk.com/authentication/v2/token"
-    
-    # Needs Basic Auth header
-    auth_str = f"{APS_CLIENT_ID}:{APS_CLIENT_SECRET}"
-    b64_auth = base64.b64encode(auth_str.encode()).decode()
-    
-    headers = {
-        "Authorization": f"Basic {b64_auth}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    
-    data = {
-        "grant_type": "client_credentials",
-        "scope": " ".join(APS_SCOPES)
-    }
-    
-    res = requests.post(url, headers=headers, data=data)
-    
-    if res.status_code != 200:
-        raise Exception(f"Failed to authenticate: {res.text}")
-        
-    json_data = res.json()
-    _TOKEN_CACHE["access_token"] = json_data["access_token"]
-    # Buffer of 60 seconds
-    _TOKEN_CACHE["expires_at"] = time.time() + json_data["expires_in"] - 60
-    
-    return _TOKEN_CACHE["access_token"]
+    return token_cache.get()
@@ -0,0 +1,217 @@
+import os
+import json
+import math
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .config import APS_BASE_URL
+
+# S3 multipart limits: parts >= 5 MB (except the last), <= 10,000 parts
+UPLOAD_PART_SIZE = int(float(os.getenv("ACC_UPLOAD_PART_MB", "8")) * 1024 * 1024)
+# Parts uploaded concurrently; memory use is ~ UPLOAD_PARALLEL_PARTS * UPLOAD_PART_SIZE whatever the file size
+UPLOAD_PARALLEL_PARTS = int(os.getenv("ACC_UPLOAD_PARALLEL_PARTS", "4"))
+# signeds3upload returns at most 25 URLs per call
+URLS_PER_REQUEST = 25
+URL_MINUTES_EXPIRATION = 60
+PART_RETRIES = 5
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# signeds3upload answers these for an expired / unknown uploadKey
+UPLOAD_KEY_INVALID_STATUSES = (400, 404)
+
+OSS_BASE = f"{APS_BASE_URL}/oss/v2"
+
+
+class UploadFailed(Exception):
+    pass
+
+
+class UploadKeyInvalid(UploadFailed):
+    """OSS rejected the stored upload key (expired after 24h or unknown): the upload has to start over."""
+    pass
+
+
+class ChunkedUpload:
+    """
+    Signed S3 multipart upload of a local file to an OSS object (OSS v2 signeds3upload).
+    Parts are read from disk one at a time per worker (flat memory), UPLOAD_PARALLEL_PARTS in flight.
+    Progress (upload key + completed parts) is persisted in 'state_path' after every part, so running
+    the same upload again resumes with the parts still missing. The state is removed once completed.
+    """
+
+    def __init__(self, copier, bucket_key, object_key, file_path, state_path,
+                 part_size=UPLOAD_PART_SIZE, parallel_parts=UPLOAD_PARALLEL_PARTS, on_progress=None):
+        self.copier = copier
+        self.bucket_key = bucket_key
+        self.object_key = object_key
+        self.file_path = file_path
+        self.state_path = state_path
+        self.size = os.path.getsize(file_path)
+        # Keep within the part count limit for very large files
+        self.part_size = max(part_size, MIN_PART_SIZE, math.ceil(self.size / MAX_PARTS))
+        self.parallel_parts = max(1, parallel_parts)
+        self.on_progress = on_progress
+        self.parts_total = max(1, math.ceil(self.size / self.part_size))
+        self._lock = threading.Lock()
+        self.state = None
+        self.bytes_done = 0
+        self.bytes_this_run = 0
+        self._started = None
+        self._last_report = 0.0
+
+    @property
+    def url(self):
+        return f"{OSS_BASE}/buckets/{self.bucket_key}/objects/{self.object_key}/signeds3upload"
+
+    # --- State ---
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            # Only resume the exact same upload (same object, file size and part layout)
+            if (state.get("object_key") == self.object_key and state.get("size") == self.size
+                    and state.get("part_size") == self.part_size and state.get("upload_key")):
+                return state
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_state(self):
+        tmp = self.state_path + ".part"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def _part_length(self, part):
+        start = (part - 1) * self.part_size
+        return min(self.part_size, self.size - start)
+
+    # --- Progress ---
+
+    def _report(self, force=False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < 1.0:
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-6)
+        try:
+            self.on_progress({
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.size,
+                "parts_done": len(self.state["completed"]),
+                "parts_total": self.parts_total,
+                "bytes_per_sec": round(self.bytes_this_run / elapsed),
+                "resumed": self.state.get("resumed", False)
+            })
+        except Exception as e:
+            print(f"[ACC UPLOAD] Progress callback error: {e}")
+
+    # --- OSS calls ---
+
+    def _signed_urls(self, first_part, count):
+        params = {"parts": count, "firstPart": first_part, "minutesExpiration": URL_MINUTES_EXPIRATION}
+        if self.state.get("upload_key"):
+            params["uploadKey"] = self.state["upload_key"]
+        res, _ = self.copier._request("GET", self.url, params=params)
+        if (res is not None and "uploadKey" in params and res.status_code in UPLOAD_KEY_INVALID_STATUSES
+                and "uploadkey" in res.text.lower().replace(" ", "")):
+            raise UploadKeyInvalid(f"signeds3upload rejected the upload key: {res.status_code} {res.text[:200]}")
+        if res is None or res.status_code != 200:
+            raise UploadFailed(f"signeds3upload GET failed: {res.status_code if res is not None else 'connection'} {res.text if res is not None else ''}")
+        data = res.json()
+        return data["uploadKey"], data["urls"]
+
+    def _put_part(self, part, url):
+        """Reads one part from disk and PUTs it to its signed URL (retries; refreshes an expired URL)."""
+        length = self._part_length(part)
+        with open(self.file_path, "rb") as f:
+            f.seek((part - 1) * self.part_size)
+            body = f.read(length)
+        for attempt in range(1, PART_RETRIES + 2):
+            try:
+                res = self.copier.session.put(url, data=body, timeout=300)
+                if res.status_code in (200, 201):
+                    break
+                if res.status_code == 403: # Signed URL expired
+                    error = "403: signed URL expired"
+                    _, urls = self._signed_urls(part, 1)
+                    url = urls[0]
+                    continue
+                error = f"{res.status_code}: {res.text[:200]}"
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt > PART_RETRIES:
+                raise UploadFailed(f"Part {part} failed: {error}")
+            time.sleep(self.copier._backoff(attempt))
+        else:
+            # Retries used up on refreshed URLs (every attempt 403): the part was never stored
+            raise UploadFailed(f"Part {part} failed: {error}")
+        del body
+        with self._lock:
+            self.state["completed"].append(part)
+            self.bytes_done += length
+            self.bytes_this_run += length
+            self._save_state()
+        self._report()
+
+    def _complete(self):
+        res, _ = self.copier._request("POST", self.url, json={"uploadKey": self.state["upload_key"]},
+                                      extra_headers={"Content-Type": "application/json"})
+        if res is None or res.status_code not in (200, 201):
+            raise UploadFailed(f"signeds3upload complete failed: {res.status_code if res is not None else 'connection'} {res.text if res is not None else ''}")
+        return res.json()
+
+    # --- Driver ---
+
+    def run(self):
+        """Uploads the missing parts and completes the object. Raises UploadFailed."""
+        self._started = time.monotonic()
+        self.state = self._load_state()
+        if self.state:
+            self.state["resumed"] = True
+        else:
+            self.state = {"object_key": self.object_key, "size": self.size, "part_size": self.part_size,
+                          "upload_key": None, "completed": []}
+        done = set(self.state["completed"])
+        self.bytes_done = sum(self._part_length(p) for p in done)
+        missing = [p for p in range(1, self.parts_total + 1) if p not in done]
+
+        # Contiguous runs of missing parts, at most URLS_PER_REQUEST each
+        batches, run = [], []
+        for p in missing:
+            if run and (p != run[-1] + 1 or len(run) == URLS_PER_REQUEST):
+                batches.append(run)
+                run = []
+            run.append(p)
+        if run:
+            batches.append(run)
+
+        with ThreadPoolExecutor(max_workers=self.parallel_parts, thread_name_prefix="acc-upload") as pool:
+            for batch in batches:
+                try:
+                    upload_key, urls = self._signed_urls(batch[0], len(batch))
+                except UploadKeyInvalid:
+                    if not self.state.get("resumed"):
+                        raise
+                    # Upload key expired (24h): start over. Other failures keep the state for the next resume
+                    os.remove(self.state_path)
+                    self.bytes_this_run = 0
+                    return self.run()
+                with self._lock:
+                    self.state["upload_key"] = upload_key
+                    self._save_state()
+                futures = [pool.submit(self._put_part, part, url) for part, url in zip(batch, urls)]
+                for future in as_completed(futures):
+                    future.result() # Re-raises UploadFailed; state keeps the finished parts
+
+        result = self._complete()
+        self._report(force=True)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+        return result
@@ -1,3 +1,5 @@
+import os
+
 # Autodesk Platform Services Credentials
 # Provided by User
 
@@ -7,3 +9,6 @@ APS_CLIENT_SECRET = "bGgzvsLWO3iwh1gRxLV32zlZYh6XvSYtsUalnYwuddjw2YXMAxp5ASOAgYT
 # Scopes needed for copying files/folders
 # include data:read, data:write, data:create
 APS_SCOPES = ["data:read", "data:write", "data:create", "data:search", "bucket:read"]
+
+# APS endpoint (override to point the tool at a local mock APS server)
+APS_BASE_URL = os.getenv("APS_BASE_URL", "https://developer.api.autodesk.com").rstrip("/")
@@ -1,46 +1,133 @@
+import os
 import requests
 import json
+import time
+import random
 import urllib.parse
-from .auth import get_access_token
+from urllib3.exceptions import NewConnectionError
+from .auth import token_cache
+from .config import APS_BASE_URL
+from .http_pool import get_session
+from .folder_tree import folder_tree
 
-API_BASE = "https://developer.api.autodesk.com"
+API_BASE = APS_BASE_URL
+
+# APS throttling / transient errors worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Non-idempotent requests (POST creates a folder / item) are only retried when APS certainly did
+# not act on them: throttled / unavailable, or the connection was never established
+NON_IDEMPOTENT_METHODS = {"POST", "PATCH"}
+NON_IDEMPOTENT_RETRY_STATUS = {429, 503}
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# Entries per /contents page (APS maximum)
+FOLDER_PAGE_SIZE = 200
 
 class AccCopier:
-    def __init__(self):
+    def __init__(self, session=None, tokens=None):
+        """
+        session: requests.Session to send through (default: the process-wide pool, http_pool.get_session)
+        tokens: TokenCache (default: the process-wide auth.token_cache)
+        Cheap to construct: no token round-trip while the cached token is valid.
+        """
+        self.session = session or get_session()
+        self.tokens = tokens or token_cache
         self.ensure_token()
 
-    def ensure_token(self):
-        self.token = get_access_token()
-        self.headers = {
+    def ensure_token(self, rejected=None):
+        return self.tokens.get(rejected=rejected)
+
+    @property
+    def token(self):
+        return self.tokens.get()
+
+    @property
+    def headers(self):
+        return {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/vnd.api+json"
         }
 
+    def _request(self, method, url, max_retries=MAX_RETRIES, extra_headers=None, **kwargs):
+        """
+        Pooled session request with retries: 429/5xx and connection errors back off exponentially
+        (honouring Retry-After), a 401 refreshes the token once. POST/PATCH only retry 429/503 and
+        connect failures: a 500/502/504 or a read timeout may mean the folder/item was created.
+        Returns (response, attempts). response is None if the connection never succeeded.
+        """
+        idempotent = method.upper() not in NON_IDEMPOTENT_METHODS
+        retry_status = RETRY_STATUS if idempotent else NON_IDEMPOTENT_RETRY_STATUS
+        refreshed = False
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                headers = self.headers
+                if extra_headers:
+                    headers.update(extra_headers)
+                res = self.session.request(method, url, headers=headers, timeout=60, **kwargs)
+            except requests.RequestException as e:
+                if attempt > max_retries or not (idempotent or self._never_sent(e)):
+                    print(f"Request failed after {attempt} attempts: {e}")
+                    return None, attempt
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if res.status_code == 401 and not refreshed:
+                refreshed = True
+                self.ensure_token(rejected=headers["Authorization"][len("Bearer "):])
+                continue
+            if res.status_code in retry_status and attempt <= max_retries:
+                time.sleep(self._backoff(attempt, res.headers.get("Retry-After")))
+                continue
+            return res, attempt
+
+    @staticmethod
+    def _never_sent(exc):
+        """True when the request cannot have reached APS (connect timeout / refused / DNS)."""
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            reason = exc.args[0] if exc.args else None
+            return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+        return False
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)), BACKOFF_MAX_SECONDS)
+        return delay / 2 + random.uniform(0, delay / 2) # Jitter so parallel workers don't retry in lockstep
+
     # ========================
     # NAVIGATION
     # ========================
 
     def get_hubs(self):
         url = f"{API_BASE}/project/v1/hubs"
-        res = requests.get(url, headers=self.headers)
-        if res.status_code != 200:
-            print(f"Error getting hubs: {res.text}")
+        res, _ = self._request("GET", url)
+        if res is None or res.status_code != 200:
+            print(f"Error getting hubs: {res.text if res is not None else 'connection failed'}")
             return []
         return res.json().get("data", [])
 
     def get_projects(self, hub_id):
         url = f"{API_BASE}/project/v1/hubs/{hub_id}/projects"
-        res = requests.get(url, headers=self.headers)
-        if res.status_code != 200:
-            print(f"Error getting projects: {res.text}")
+        res, _ = self._request("GET", url)
+        if res is None or res.status_code != 200:
+            print(f"Error getting projects: {res.text if res is not None else 'connection failed'}")
             return []
         return res.json().get("data", [])
 
     def get_top_folders(self, hub_id, project_id):
         url = f"{API_BASE}/project/v1/hubs/{hub_id}/projects/{project_id}/topFolders"
-        res = requests.get(url, headers=self.headers)
-        if res.status_code != 200:
-            print(f"Error getting top folders: {res.text}")
+        res, _ = self._request("GET", url)
+        if res is None or res.status_code != 200:
+            print(f"Error getting top folders: {res.text if res is not None else 'connection failed'}")
             return []
         data = res.json().get("data", [])
         # Strict Whitelist for Top Level to match UI
@@ -48,29 +135,69 @@ class AccCopier:
         filtered = [x for x in data if x["attributes"]["name"] in whitelist]
         return filtered
 
-    def get_folder_contents(self, project_id, folder_id):
+    def fetch_folder_contents(self, project_id, folder_id, etag=None, last_modified=None):
         """
-        Returns (folders, items) in the directory
+        Full listing of a folder, following links.next (APS pages at 200 entries).
+        With etag/last_modified the first page is a conditional GET.
+        Returns { status: "ok" | "not_modified" | "error", data, included, etag, last_modified }
+        ('included' holds the tip versions of the items: storageSize, versionNumber, ...).
         """
         url = f"{API_BASE}/data/v1/projects/{project_id}/folders/{folder_id}/contents"
-        res = requests.get(url, headers=self.headers)
-        if res.status_code != 200:
-            print(f"Error getting contents: {res.text}")
-            return [], []
-            
-        data = res.json().get("data", [])
+        params = {"page[limit]": FOLDER_PAGE_SIZE}
+        conditional = {}
+        if etag:
+            conditional["If-None-Match"] = etag
+        if last_modified:
+            conditional["If-Modified-Since"] = last_modified
+
+        data, included = [], []
+        first = True
+        while url:
+            res, _ = self._request("GET", url, params=params, extra_headers=conditional if first else None)
+            if res is not None and res.status_code == 304 and first:
+                return {"status": "not_modified", "data": None, "included": None, "etag": etag, "last_modified": last_modified}
+            if res is None or res.status_code != 200:
+                print(f"Error getting contents: {res.text if res is not None else 'connection failed'}")
+                return {"status": "error", "data": data, "included": included, "etag": None, "last_modified": None}
+            if first:
+                etag, last_modified = res.headers.get("ETag"), res.headers.get("Last-Modified")
+                first = False
+            body = res.json()
+            data.extend(body.get("data", []))
+            included.extend(body.get("included", []))
+            url = ((body.get("links") or {}).get("next") or {}).get("href")
+            params = None # links.next carries the page cursor
+        return {"status": "ok", "data": data, "included": included, "etag": etag, "last_modified": last_modified}
+
+    @staticmethod
+    def split_contents(data):
+        """Visible entries of a listing -> (folders, items)"""
         # Filter hidden items
         visible_data = [x for x in data if not x["attributes"].get("hidden", False)]
-        
+
         folders = [x for x in visible_data if x["type"] == "folders"]
         items = [x for x in visible_data if x["type"] == "items"]
         return folders, items
 
+    def get_folder_contents(self, project_id, folder_id):
+        """
+        Returns (folders, items) in the directory (all pages, uncached).
+        The browser uses folder_tree.folder_tree.list_contents (cached).
+        """
+        listing = self.fetch_folder_contents(project_id, folder_id)
+        if listing["status"] != "ok":
+            return [], [] # Never hand out a truncated listing
+        return self.split_contents(listing["data"])
+
     # ========================
     # ACTIONS
     # ========================
 
-    def create_folder(self, project_id, parent_folder_id, folder_name):
+    def create_folder(self, project_id, parent_folder_id, folder_name, with_error=False):
+        """
+        Creates 'folder_name' under 'parent_folder_id'.
+        Returns the folder data (or None); with_error=True returns (data, error, attempts).
+        """
         url = f"{API_BASE}/data/v1/projects/{project_id}/folders"
         body = {
             "jsonapi": {"version": "1.0"},
@@ -93,16 +220,19 @@ class AccCopier:
                 }
             }
         }
-        res = requests.post(url, headers=self.headers, json=body)
-        if res.status_code in [201, 200]:
-            return res.json()["data"]
-        else:
-            print(f"Error creating folder {folder_name}: {res.text}")
-            return None
+        res, attempts = self._request("POST", url, json=body)
+        if res is not None and res.status_code in [201, 200]:
+            folder_tree.invalidate(project_id, parent_folder_id)
+            data = res.json()["data"]
+            return (data, None, attempts) if with_error else data
+        error = f"{res.status_code}: {res.text}" if res is not None else "connection failed"
+        print(f"Error creating folder {folder_name}: {error}")
+        return (None, error, attempts) if with_error else None
 
-    def copy_item(self, project_id, item_id, target_folder_id, name_override=None):
+    def copy_item(self, project_id, item_id, target_folder_id, name_override=None, with_error=False):
         """
         Server-side copy of an ITEM (File) to a target folder.
+        Returns the new item data (or None); with_error=True returns (data, error, attempts).
         Note: The URL format for COPY is specific.
         Docs: https://aps.autodesk.com/en/docs/data/v2/reference/http/projects-project_id-items-item_id-copy-POST/
         Endpoint: POST /data/v1/projects/:project_id/items/:item_id/copy
@@ -144,59 +274,40 @@ class AccCopier:
         # Need to re-auth? copy operations can take time but call is async?
         # No, usually sync response with 201 Created for the new item version.
         
-        res = requests.post(url, headers=self.headers, json=body)
-        if res.status_code in [201, 200]:
-            # print(f"File copied successfully.")
-            return res.json()["data"]
-        else:
-            print(f"Error copying item {item_id}: {res.text}")
-            return None
+        res, attempts = self._request("POST", url, json=body)
+        if res is not None and res.status_code in [201, 200]:
+            folder_tree.invalidate(project_id, target_folder_id)
+            data = res.json()["data"]
+            return (data, None, attempts) if with_error else data
+        error = f"{res.status_code}: {res.text}" if res is not None else "connection failed"
+        print(f"Error copying item {item_id}: {error}")
+        return (None, error, attempts) if with_error else None
 
-    def recursive_copy(self, project_id, source_folder, target_parent_id, depth=0):
+    def recursive_copy(self, project_id, source_folder, target_parent_id, max_workers=None):
         """
-        1. Create 'source_folder.name' inside 'target_parent_id'
-        2. Copy all files from source to new folder
-        3. Recurse for subfolders
+        Copies 'source_folder' (and everything below it) into 'target_parent_id'.
+        Breadth-first with a bounded worker pool, see parallel_copy.ParallelFolderCopy.
+        Returns the job summary (counters + manifest).
         """
-        folder_name = source_folder["attributes"]["name"]
-        print(f"{'  '*depth}📂 Creating folder: {folder_name}")
-        
-        # 1. Create Folder
-        new_folder = self.create_folder(project_id, target_parent_id, folder_name)
-        if not new_folder:
-            print(f"Skipping {folder_name} due to creation failure")
-            return
-            
-        new_folder_id = new_folder["id"]
-        
-        # 2. Get Contents
-        source_id = source_folder["id"]
-        sub_folders, items = self.get_folder_contents(project_id, source_id)
-        
-        # 3. Copy Files
-        print(f"{'  '*depth}   Found {len(items)} files, {len(sub_folders)} subfolders.")
-        for item in items:
-            item_name = item["attributes"]["displayName"]
-            print(f"{'  '*depth}   📄 Copying file: {item_name}")
-            self.copy_item(project_id, item["id"], new_folder_id)
-            
-        # 4. Recurse
+        from .parallel_copy import ParallelFolderCopy, DEFAULT_MAX_WORKERS
+
+        def report(progress):
+            print(f"   {progress['folders_created']}/{progress['folders_found']} folders, "
+                  f"{progress['items_copied']}/{progress['items_found']} files, {progress['failed']} failed")
+
+        job = ParallelFolderCopy(self, project_id, source_folder, target_parent_id,
+                                 max_workers=max_workers or DEFAULT_MAX_WORKERS, on_progress=report)
+        return job.run()
 
     def get_folder(self, project_id, folder_id):
         url = f"{API_BASE}/data/v1/projects/{project_id}/folders/{folder_id}"
-        res = requests.get(url, headers=self.headers)
-        if res.status_code == 200:
+        res, _ = self._request("GET", url)
+        if res is not None and res.status_code == 200:
             return res.json()["data"]
         return None
 
-    def upload_file(self, project_id, folder_id, file_path, file_name):
-        """
-        Uploads a local file to ACC.
-        Step 1: Create Storage
-        Step 2: Upload Stream
-        Step 3: Create Item
-        """
-        # 1. Create Storage
+    def create_storage(self, project_id, folder_id, file_name):
+        """Registers a storage object for 'file_name' in the target folder. Returns the storage id (URN)."""
         storage_url = f"{API_BASE}/data/v1/projects/{project_id}/storage"
         body = {
             "jsonapi": {"version": "1.0"},
@@ -212,80 +323,62 @@ class AccCopier:
                 }
             }
         }
-        res = requests.post(storage_url, headers=self.headers, json=body)
-        if res.status_code != 201:
-            print(f"Error creating storage: {res.text}")
+        res, _ = self._request("POST", storage_url, json=body)
+        if res is None or res.status_code != 201:
+            print(f"Error creating storage: {res.text if res is not None else 'connection failed'}")
             return None
-            
-        storage_data = res.json()["data"]
-        storage_id = storage_data["id"]
-        bucket_key = storage_id.split(":")[3].split("/")[0] # approximate parsing or use from response?
-        # Usually storage id: urn:adsk.objects:os.object:wip.dm.prod/UUID
-        # The response usually contains 'links' for upload if it's OSS?
-        # For Data Management API, we usually upload to the bucket.
-        # Actually, Data V1 Storage endpoint returns data.id.
-        # We simply upload to the OBJECTS API using the bucket/key derived?
-        # NO, Data V1 is simpler:
-        # Actually for BIM 360/ACC, Create Storage returns an ID.
-        # Then we PUT to that storage location?
-        
-        # Simpler: The response usually doesn't give a direct S3 link unless we ask or use OSS directly.
-        # But we must use Create Storage to register it in DM.
-        
-        # Let's inspect the ID.
-        # If ID = "urn:adsk.objects:os.object:wip.dm.prod/1234..."
-        # We upload to OSS: PUT https://developer.api.autodesk.com/oss/v2/buckets/{bucketKey}/objects/{objectName}
-        # Bucket Key is the part after os.object:
-        
-        # 2. Extract Bucket Key
+        return res.json()["data"]["id"]
+
+    @staticmethod
+    def parse_storage_id(storage_id):
+        """urn:adsk.objects:os.object:wip.dm.prod/UUID -> (bucket_key, object_key)"""
+        last_part = storage_id.split(':')[-1] # wip.dm.prod/UUID
+        if '/' not in last_part:
+            raise Exception("Invalid URN format (no slash)")
+        bucket_key, object_key = last_part.split('/', 1)
+        return bucket_key, object_key
+
+    def upload_file(self, project_id, folder_id, file_path, file_name, on_progress=None, state_path=None):
+        """
+        Uploads a local file to ACC.
+        Step 1: Create Storage (reused when resuming)
+        Step 2: Signed S3 multipart upload, streamed from disk (chunked_upload.ChunkedUpload)
+        Step 3: Create Item
+        'state_path' (default: file_path + ".upload.json") keeps the storage id and finished parts;
+        calling upload_file again after a failure resumes from there.
+        Returns the item data or None.
+        """
+        from .chunked_upload import ChunkedUpload, UploadFailed
+
+        state_path = state_path or f"{file_path}.upload.json"
+        storage_path = f"{state_path}.storage"
+
+        # 1. Create Storage (or reuse the one of the interrupted attempt)
+        storage_id = None
+        if os.path.exists(storage_path):
+            with open(storage_path, "r") as f:
+                storage_id = f.read().strip() or None
+        if not storage_id:
+            storage_id = self.create_storage(project_id, folder_id, file_name)
+            if not storage_id:
+                return None
+            with open(storage_path, "w") as f:
+                f.write(storage_id)
+
+        # 2. Upload to OSS
         try:
-            # ID format: urn:adsk.objects:os.object:wip.dm.prod/UUID
-            # Robust parsing: Split by ':' and take the last segment, then split by '/'
-            urn_parts = storage_id.split(':')
-            if len(urn_parts) > 0:
-                last_part = urn_parts[-1] # wip.dm.prod/UUID
-                if '/' in last_part:
-                    bucket_key = last_part.split('/')[0]
-                    object_key = last_part.split('/', 1)[1]
-                else:
-                    raise Exception("Invalid URN format (no slash)")
-            else:
-                 raise Exception("Invalid URN format (empty)")
-            
-            # debug
+            bucket_key, object_key = self.parse_storage_id(storage_id)
             print(f"Uploading to Bucket: {bucket_key}, Object: {object_key}")
         except Exception as e:
-             print(f"Error parsing storage ID '{storage_id}': {e}")
-             return None
-        
-        # 2. Upload to OSS
-        with open(file_path, "rb") as f:
-            content = f.read()
-
-        # Limit check
-        if len(content) > 100 * 1024 * 1024:
-            print("Error: File too large (>100MB) for simple upload.")
+            print(f"Error parsing storage ID '{storage_id}': {e}")
             return None
-            
-        oss_url = f"{API_BASE}/oss/v2/buckets/{bucket_key}/objects/{object_key}"
-        auth = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/octet-stream"
-        }
-        
+
         try:
-            res_upload = requests.put(oss_url, headers=auth, data=content)
-            res_upload.raise_for_status()
-        except Exception as e:
-            print(f"Upload failed: {e}")
-            if res_upload: 
-                print(f"OSS Response: {res_upload.status_code} - {res_upload.text}")
+            ChunkedUpload(self, bucket_key, object_key, file_path, state_path, on_progress=on_progress).run()
+        except UploadFailed as e:
+            print(f"Upload failed (resumable): {e}")
             return None
-        
-        if res_upload.status_code != 200:
-             print(f"Error uploading bytes: {res_upload.text}")
-             return None
-             
+
         # 3. Create Item (The File Version in Doc Mgmt)
         item_url = f"{API_BASE}/data/v1/projects/{project_id}/items"
         item_body = {
@@ -335,10 +428,15 @@ class AccCopier:
             ]
         }
         
-        res_item = requests.post(item_url, headers=self.headers, json=item_body)
-        if res_item.status_code in [201, 200]:
+        res_item, _ = self._request("POST", item_url, json=item_body)
+        if res_item is not None and res_item.status_code in [201, 200]:
+            folder_tree.invalidate(project_id, folder_id)
+            try:
+                os.remove(storage_path)
+            except OSError:
+                pass
             return res_item.json()["data"]
         else:
-            print(f"Error creating item: {res_item.text}")
+            print(f"Error creating item: {res_item.text if res_item is not None else 'connection failed'}")
             return None
 
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Listings younger than this are served without asking APS; older ones are revalidated (ETag / Last-Modified)
+FOLDER_CACHE_TTL_SECONDS = float(os.getenv("ACC_FOLDER_CACHE_TTL_SECONDS", "60"))
+FOLDER_CACHE_MAX_ENTRIES = int(os.getenv("ACC_FOLDER_CACHE_MAX_ENTRIES", "2000"))
+# Background fetches of the subfolders of an opened folder
+FOLDER_PREFETCH_WORKERS = int(os.getenv("ACC_FOLDER_PREFETCH_WORKERS", "4"))
+FOLDER_PREFETCH_MAX = int(os.getenv("ACC_FOLDER_PREFETCH_MAX", "50"))
+
+
+class FolderTreeCache:
+    """
+    Process-wide cache of complete (all pages) folder listings for the Cloud Manager browser.
+    - Fresh (< TTL): served from memory.
+    - Stale: conditional GET with the stored ETag / Last-Modified; 304 keeps the listing.
+    - Opening a folder prefetches its subfolders in the background.
+    - AccCopier invalidates a folder when it creates / copies / uploads into it (this process;
+      other workers see the change after their TTL).
+    """
+
+    def __init__(self, ttl_seconds=FOLDER_CACHE_TTL_SECONDS, max_entries=FOLDER_CACHE_MAX_ENTRIES,
+                 prefetch_workers=FOLDER_PREFETCH_WORKERS):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # (project_id, folder_id) -> { data, fetched_at, etag, last_modified }
+        self._generation = {} # key -> invalidation counter (drops fetches that raced an invalidation)
+        self._prefetching = set()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, prefetch_workers), thread_name_prefix="acc-prefetch")
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.refetched = 0
+        self.prefetched = 0
+        self.invalidations = 0
+
+    # --- Lookup ---
+
+    def list_contents(self, copier, project_id, folder_id, refresh=False):
+        """(folders, items) of a folder; 'refresh' bypasses the TTL (still revalidates)."""
+        key = (project_id, folder_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not refresh and now - entry["fetched_at"] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copier.split_contents(entry["data"])
+            generation = self._generation.get(key, 0)
+
+        data = self._load(copier, key, entry, generation)
+        return copier.split_contents(data) if data is not None else ([], [])
+
+    def _load(self, copier, key, entry, generation):
+        project_id, folder_id = key
+        listing = copier.fetch_folder_contents(
+            project_id, folder_id,
+            etag=entry["etag"] if entry else None,
+            last_modified=entry["last_modified"] if entry else None
+        )
+        with self._lock:
+            if listing["status"] == "not_modified" and entry:
+                self.revalidated += 1
+                entry["fetched_at"] = time.monotonic()
+                return entry["data"]
+            if listing["status"] != "ok":
+                # Serve the last good listing rather than nothing
+                return entry["data"] if entry else None
+            if entry:
+                self.refetched += 1
+            else:
+                self.misses += 1
+            if self._generation.get(key, 0) == generation:
+                self._entries[key] = {
+                    "data": listing["data"],
+                    "fetched_at": time.monotonic(),
+                    "etag": listing["etag"],
+                    "last_modified": listing["last_modified"]
+                }
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return listing["data"]
+
+    # --- Prefetch ---
+
+    def prefetch(self, copier, project_id, folder_ids):
+        """Loads uncached folders in the background (one level below the folder just opened)."""
+        scheduled = 0
+        for folder_id in folder_ids[:FOLDER_PREFETCH_MAX]:
+            key = (project_id, folder_id)
+            with self._lock:
+                if key in self._entries or key in self._prefetching:
+                    continue
+                self._prefetching.add(key)
+                generation = self._generation.get(key, 0)
+            self._pool.submit(self._prefetch_one, copier, key, generation)
+            scheduled += 1
+        return scheduled
+
+    def _prefetch_one(self, copier, key, generation):
+        try:
+            if self._load(copier, key, None, generation) is not None:
+                with self._lock:
+                    self.prefetched += 1
+        except Exception as e:
+            print(f"[ACC TREE] Prefetch error {key[1]}: {e}")
+        finally:
+            with self._lock:
+                self._prefetching.discard(key)
+
+    # --- Invalidation ---
+
+    def invalidate(self, project_id, folder_id):
+        key = (project_id, folder_id)
+        with self._lock:
+            self._generation[key] = self._generation.get(key, 0) + 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.revalidated + self.refetched
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated_304": self.revalidated,
+                "refetched": self.refetched,
+                "prefetched": self.prefetched,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.revalidated) / lookups, 4) if lookups else 0.0
+            }
+
+# Singleton Instance
+folder_tree = FolderTreeCache()
@@ -0,0 +1,71 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep-alive connections per host (APS, S3): >= copy workers + upload parts running at once
+HTTP_POOL_SIZE = int(os.getenv("ACC_HTTP_POOL_SIZE", "32"))
+# Connection-level retries (DNS / connect / reset on idempotent calls).
+# 429/5xx with backoff are handled by AccCopier._request.
+HTTP_CONNECT_RETRIES = int(os.getenv("ACC_HTTP_CONNECT_RETRIES", "3"))
+
+_lock = threading.Lock()
+_session = None
+_adapter = None
+_requests = 0
+
+
+def _count_response(response, *args, **kwargs):
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def build_session(pool_size=HTTP_POOL_SIZE):
+    """requests.Session with a pooled keep-alive adapter and connect retries (also used by tests)."""
+    session = requests.Session()
+    retry = Retry(
+        total=HTTP_CONNECT_RETRIES,
+        connect=HTTP_CONNECT_RETRIES,
+        read=1,
+        status=0,
+        backoff_factor=0.3,
+        allowed_methods=frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_count_response)
+    return session, adapter
+
+
+def get_session():
+    """Process-wide pooled session shared by every AccCopier."""
+    global _session, _adapter
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session, _adapter = build_session()
+    return _session
+
+
+def pool_stats():
+    """Requests sent vs TCP connections opened by the shared session (reuse = 1 - opened/requests)."""
+    opened = 0
+    pools = 0
+    if _adapter is not None:
+        manager = _adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is not None:
+                pools += 1
+                opened += pool.num_connections
+    return {
+        "requests": _requests,
+        "connections_opened": opened,
+        "connection_reuse_rate": round(1 - opened / _requests, 4) if _requests else 0.0,
+        "host_pools": pools,
+        "pool_maxsize": HTTP_POOL_SIZE
+    }
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+# Concurrent APS calls per copy job (folder creation + item copies share the pool)
+DEFAULT_MAX_WORKERS = int(os.getenv("ACC_COPY_MAX_WORKERS", "8"))
+# Minimum interval between on_progress callbacks
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class ParallelFolderCopy:
+    """
+    Breadth-first copy of an ACC folder tree.
+    Each level of folders is created (and its source listed) in parallel; the items found are
+    queued on the same bounded pool while the next level is being created, so the pool stays busy
+    and APS sees at most max_workers requests at a time. Retries/backoff live in AccCopier._request.
+    Every folder and item gets a manifest entry with its outcome.
+    """
+
+    def __init__(self, copier, project_id, source_folder, target_parent_id,
+                 max_workers=DEFAULT_MAX_WORKERS, on_progress=None):
+        self.copier = copier
+        self.project_id = project_id
+        self.source_folder = source_folder
+        self.target_parent_id = target_parent_id
+        self.max_workers = max(1, int(max_workers))
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._last_report = 0.0
+        self.manifest = []
+        self.progress = {
+            "status": "pending",
+            "folders_found": 1,
+            "folders_created": 0,
+            "items_found": 0,
+            "items_copied": 0,
+            "failed": 0,
+            "skipped": 0,
+            "depth": 0,
+            "elapsed_seconds": 0.0
+        }
+        self._started = None
+
+    def cancel(self):
+        """Stops scheduling new work; requests already in flight finish."""
+        self._cancel.set()
+
+    def snapshot(self):
+        """(progress, manifest) copies, safe to read while the job runs."""
+        with self._lock:
+            progress = dict(self.progress)
+            if self._started and progress["status"] == "running":
+                progress["elapsed_seconds"] = round(time.monotonic() - self._started, 1)
+            return progress, list(self.manifest)
+
+    # --- Bookkeeping ---
+
+    def _record(self, entry, counter):
+        with self._lock:
+            self.manifest.append(entry)
+            self.progress[counter] += 1
+        self._report()
+
+    def _report(self, force=False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < PROGRESS_INTERVAL_SECONDS:
+                return
+            self._last_report = now
+            self.progress["elapsed_seconds"] = round(now - self._started, 1) if self._started else 0.0
+            snapshot = dict(self.progress)
+        try:
+            self.on_progress(snapshot)
+        except Exception as e:
+            print(f"[ACC COPY] Progress callback error: {e}")
+
+    # --- Work units ---
+
+    def _copy_folder(self, source, target_parent_id, path):
+        """Creates the folder and lists its source contents. Returns (new_id, folders, items) or None."""
+        name = source["attributes"]["name"]
+        entry = {"type": "folder", "path": path, "name": name, "source_id": source["id"]}
+        if self._cancel.is_set():
+            self._record(dict(entry, status="skipped"), "skipped")
+            return None
+        started = time.perf_counter()
+        try:
+            data, error, attempts = self.copier.create_folder(self.project_id, target_parent_id, name, with_error=True)
+        except Exception as e:
+            data, error, attempts = None, str(e), 1
+        entry.update(attempts=attempts, ms=round((time.perf_counter() - started) * 1000))
+        if not data:
+            # Nothing below a failed folder can be copied
+            self._record(dict(entry, status="failed", error=error), "failed")
+            return None
+        self._record(dict(entry, status="created", target_id=data["id"]), "folders_created")
+        listing = self.copier.fetch_folder_contents(self.project_id, source["id"])
+        if listing["status"] != "ok":
+            # The subtree can't be walked: record it so the job ends 'partial' instead of silently 'done'
+            self._record({"type": "listing", "path": path, "name": name, "source_id": source["id"],
+                          "status": "failed", "error": "Could not list source folder contents"}, "failed")
+            return data["id"], [], []
+        folders, items = self.copier.split_contents(listing["data"])
+        return data["id"], folders, items
+
+    def _copy_item(self, item, target_folder_id, path):
+        name = item["attributes"].get("displayName") or item["id"]
+        entry = {"type": "item", "path": f"{path}/{name}", "name": name, "source_id": item["id"]}
+        if self._cancel.is_set():
+            self._record(dict(entry, status="skipped"), "skipped")
+            return
+        started = time.perf_counter()
+        try:
+            data, error, attempts = self.copier.copy_item(self.project_id, item["id"], target_folder_id, with_error=True)
+        except Exception as e:
+            data, error, attempts = None, str(e), 1
+        entry.update(attempts=attempts, ms=round((time.perf_counter() - started) * 1000))
+        if data:
+            self._record(dict(entry, status="copied", target_id=data.get("id")), "items_copied")
+        else:
+            self._record(dict(entry, status="failed", error=error), "failed")
+
+    # --- Driver ---
+
+    def run(self):
+        """Blocks until the whole tree is processed. Returns { progress, manifest }."""
+        self._started = time.monotonic()
+        self.progress["status"] = "running"
+        root_name = self.source_folder["attributes"]["name"]
+        level = [(self.source_folder, self.target_parent_id, root_name)]
+        item_futures = []
+        root_failed = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="acc-copy") as pool:
+            while level and not self._cancel.is_set():
+                with self._lock:
+                    self.progress["depth"] += 1
+                futures = {pool.submit(self._copy_folder, *entry): entry for entry in level}
+                next_level = []
+                for future in as_completed(futures):
+                    source, _, path = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        root_failed = root_failed or source is self.source_folder
+                        self._record({"type": "folder", "path": path, "name": source["attributes"]["name"],
+                                      "source_id": source["id"], "status": "failed", "error": str(e)}, "failed")
+                        continue
+                    if not result:
+                        root_failed = root_failed or source is self.source_folder
+                        continue
+                    new_id, folders, items = result
+                    with self._lock:
+                        self.progress["folders_found"] += len(folders)
+                        self.progress["items_found"] += len(items)
+                    for item in items:
+                        item_futures.append(pool.submit(self._copy_item, item, new_id, path))
+                    for folder in folders:
+                        next_level.append((folder, new_id, f"{path}/{folder['attributes']['name']}"))
+                level = next_level
+            wait(item_futures)
+
+        with self._lock:
+            self.progress["elapsed_seconds"] = round(time.monotonic() - self._started, 1)
+            if self._cancel.is_set():
+                self.progress["status"] = "cancelled"
+            elif root_failed:
+                self.progress["status"] = "error"
+            elif self.progress["failed"]:
+                self.progress["status"] = "partial"
+            else:
+                self.progress["status"] = "done"
+        self._report(force=True)
+        return {"progress": dict(self.progress), "manifest": list(self.manifest)}
@@ -0,0 +1,264 @@
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .parallel_copy import DEFAULT_MAX_WORKERS
+
+# Manifest actions
+CREATE = "create"     # Folder missing in target
+EXISTS = "exists"     # Folder already in target (descended into)
+COPY = "copy"         # Item missing in target
+SKIP = "skip"         # Item already in target (same size)
+CONFLICT = "conflict" # Same name, different content / ambiguous match: reported, never executed
+
+
+class PlanError(Exception):
+    pass
+
+
+def _name_key(name):
+    # ACC folder/file names are unique case-insensitively
+    return (name or "").casefold()
+
+
+class SyncPlanner:
+    """
+    Incremental ACC folder sync.
+    plan(): lists source and target trees level by level (both sides in parallel) and matches
+    folders by path + name and items by name + size of the tip version. The manifest says what would
+    be created / copied / skipped / flagged as conflict (dry run).
+    execute(manifest): runs only the create + copy entries, folders level by level and items on a
+    bounded pool, like ParallelFolderCopy.
+    """
+
+    def __init__(self, copier, project_id, source_folder, target_parent_id,
+                 max_workers=DEFAULT_MAX_WORKERS, on_progress=None):
+        self.copier = copier
+        self.project_id = project_id
+        self.source_folder = source_folder
+        self.target_parent_id = target_parent_id
+        self.max_workers = max(1, int(max_workers))
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._last_report = 0.0
+        self.progress = {}
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _report(self, force=False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < 1.0:
+                return
+            self._last_report = now
+            snapshot = dict(self.progress)
+        try:
+            self.on_progress(snapshot)
+        except Exception as e:
+            print(f"[ACC SYNC] Progress callback error: {e}")
+
+    # --- Planning ---
+
+    def _list(self, folder_id):
+        """(folders, items, sizes{item_id: storageSize}) or PlanError: a partial listing would plan duplicates."""
+        listing = self.copier.fetch_folder_contents(self.project_id, folder_id)
+        if listing["status"] != "ok":
+            raise PlanError(f"Could not list folder {folder_id}")
+        folders, items = self.copier.split_contents(listing["data"])
+        versions = {v["id"]: v.get("attributes", {}) for v in listing["included"] or [] if v.get("type") == "versions"}
+        sizes = {}
+        for item in items:
+            tip = ((item.get("relationships") or {}).get("tip") or {}).get("data") or {}
+            sizes[item["id"]] = versions.get(tip.get("id"), {}).get("storageSize")
+        return folders, items, sizes
+
+    @staticmethod
+    def _entry(action, kind, path, parent_path, source, target=None, size=None, reason=None):
+        name = source["attributes"].get("name") if kind == "folder" else source["attributes"].get("displayName")
+        return {
+            "action": action,
+            "type": kind,
+            "path": path,
+            "parent_path": parent_path,
+            "depth": path.count("/"),
+            "name": name,
+            "source_id": source["id"],
+            "target_id": target["id"] if target else None,
+            "size": size,
+            "reason": reason
+        }
+
+    def plan(self):
+        """Returns { summary, manifest, planned_at, duration_ms }. Raises PlanError."""
+        started = time.perf_counter()
+        manifest = []
+        root_name = self.source_folder["attributes"]["name"]
+        self.progress = {"phase": "planning", "folders_listed": 0}
+
+        parent_folders, _, _ = self._list(self.target_parent_id)
+        roots = [f for f in parent_folders if _name_key(f["attributes"].get("name")) == _name_key(root_name)]
+        if roots:
+            manifest.append(self._entry(EXISTS, "folder", root_name, "", self.source_folder, roots[0]))
+        else:
+            manifest.append(self._entry(CREATE, "folder", root_name, "", self.source_folder))
+        level = [(self.source_folder, roots[0] if roots else None, root_name)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="acc-sync-plan") as pool:
+            while level:
+                if self._cancel.is_set():
+                    raise PlanError("Cancelled")
+                # Source and target listings of the whole level in flight together
+                pending = [(src, tgt, path, pool.submit(self._list, src["id"]),
+                            pool.submit(self._list, tgt["id"]) if tgt else None) for src, tgt, path in level]
+                next_level = []
+                for src, tgt, path, src_future, tgt_future in pending:
+                    s_folders, s_items, s_sizes = src_future.result()
+                    t_folders, t_items, t_sizes = tgt_future.result() if tgt_future else ([], [], {})
+                    self.progress["folders_listed"] += 2 if tgt_future else 1
+
+                    t_folder_map, t_item_map = {}, {}
+                    for f in t_folders:
+                        t_folder_map.setdefault(_name_key(f["attributes"].get("name")), []).append(f)
+                    for i in t_items:
+                        t_item_map.setdefault(_name_key(i["attributes"].get("displayName")), []).append(i)
+
+                    for sf in s_folders:
+                        child = f"{path}/{sf['attributes']['name']}"
+                        matches = t_folder_map.get(_name_key(sf["attributes"].get("name")), [])
+                        if not matches:
+                            manifest.append(self._entry(CREATE, "folder", child, path, sf))
+                            next_level.append((sf, None, child))
+                        else:
+                            reason = "duplicate folder name in target" if len(matches) > 1 else None
+                            manifest.append(self._entry(EXISTS, "folder", child, path, sf, matches[0], reason=reason))
+                            next_level.append((sf, matches[0], child))
+
+                    for si in s_items:
+                        name = si["attributes"].get("displayName")
+                        child = f"{path}/{name}"
+                        size = s_sizes.get(si["id"])
+                        matches = t_item_map.get(_name_key(name), [])
+                        if not matches:
+                            manifest.append(self._entry(COPY, "item", child, path, si, size=size))
+                        elif len(matches) > 1:
+                            manifest.append(self._entry(CONFLICT, "item", child, path, si, matches[0], size,
+                                                        "several items with this name in target"))
+                        else:
+                            t_size = t_sizes.get(matches[0]["id"])
+                            if size is None or t_size is None:
+                                manifest.append(self._entry(SKIP, "item", child, path, si, matches[0], size, "exists (size unknown)"))
+                            elif size == t_size:
+                                manifest.append(self._entry(SKIP, "item", child, path, si, matches[0], size, "exists"))
+                            else:
+                                manifest.append(self._entry(CONFLICT, "item", child, path, si, matches[0], size,
+                                                            f"size differs (source {size}, target {t_size})"))
+                level = next_level
+                self._report()
+
+        summary = {a: 0 for a in (CREATE, EXISTS, COPY, SKIP, CONFLICT)}
+        for e in manifest:
+            summary[e["action"]] += 1
+        summary["bytes_to_copy"] = sum(e["size"] or 0 for e in manifest if e["action"] == COPY)
+        return {
+            "summary": summary,
+            "manifest": manifest,
+            "planned_at": datetime.datetime.now().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    # --- Execution ---
+
+    def _create(self, entry, parent_id):
+        if self._cancel.is_set():
+            return dict(entry, status="skipped"), None
+        data, error, attempts = self.copier.create_folder(self.project_id, parent_id, entry["name"], with_error=True)
+        if data:
+            return dict(entry, status="created", target_id=data["id"], attempts=attempts), data["id"]
+        return dict(entry, status="failed", error=error, attempts=attempts), None
+
+    def _copy(self, entry, parent_id):
+        if self._cancel.is_set():
+            return dict(entry, status="skipped")
+        data, error, attempts = self.copier.copy_item(self.project_id, entry["source_id"], parent_id, with_error=True)
+        if data:
+            return dict(entry, status="copied", target_id=data.get("id"), attempts=attempts)
+        return dict(entry, status="failed", error=error, attempts=attempts)
+
+    def _done(self, result, results):
+        with self._lock:
+            results.append(result)
+            key = {"created": "folders_created", "copied": "items_copied"}.get(result["status"], result["status"])
+            self.progress[key] = self.progress.get(key, 0) + 1
+        self._report()
+
+    def execute(self, manifest):
+        """Runs the create / copy entries of a plan. Returns { status, progress, manifest }."""
+        started = time.monotonic()
+        creates = sorted((e for e in manifest if e["action"] == CREATE), key=lambda e: e["depth"])
+        copies_by_parent = {}
+        for e in manifest:
+            if e["action"] == COPY:
+                copies_by_parent.setdefault(e["parent_path"], []).append(e)
+        folder_ids = {"": self.target_parent_id}
+        folder_ids.update({e["path"]: e["target_id"] for e in manifest if e["action"] == EXISTS})
+
+        self.progress = {
+            "phase": "executing",
+            "folders_to_create": len(creates),
+            "items_to_copy": sum(len(v) for v in copies_by_parent.values()),
+            "folders_created": 0,
+            "items_copied": 0,
+            "failed": 0,
+            "skipped": 0
+        }
+        results = []
+        item_futures = []
+
+        def queue_copies(pool, parent_path, parent_id):
+            for entry in copies_by_parent.pop(parent_path, []):
+                item_futures.append(pool.submit(self._copy, entry, parent_id))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="acc-sync") as pool:
+            # Items into folders that already exist can start right away
+            for path, target_id in list(folder_ids.items()):
+                queue_copies(pool, path, target_id)
+
+            depths = sorted({e["depth"] for e in creates})
+            for depth in depths:
+                level = [e for e in creates if e["depth"] == depth]
+                futures = {}
+                for entry in level:
+                    parent_id = folder_ids.get(entry["parent_path"])
+                    if not parent_id:
+                        self._done(dict(entry, status="failed", error="parent folder was not created"), results)
+                        continue
+                    futures[pool.submit(self._create, entry, parent_id)] = entry
+                for future in as_completed(futures):
+                    result, new_id = future.result()
+                    self._done(result, results)
+                    if new_id:
+                        folder_ids[result["path"]] = new_id
+                        queue_copies(pool, result["path"], new_id)
+
+            # Whatever is left lost its parent folder
+            for entries in copies_by_parent.values():
+                for entry in entries:
+                    self._done(dict(entry, status="failed", error="parent folder was not created"), results)
+            for future in as_completed(item_futures):
+                self._done(future.result(), results)
+
+        self.progress["elapsed_seconds"] = round(time.monotonic() - started, 1)
+        if self._cancel.is_set():
+            status = "cancelled"
+        elif self.progress["failed"]:
+            status = "partial"
+        else:
+            status = "done"
+        self.progress["phase"] = status
+        self._report(force=True)
+        return {"status": status, "progress": dict(self.progress), "manifest": results}
@@ -141,7 +141,7 @@ namespace RevitCivilConnector
                             if (AuthService.Instance.IsLoggedIn)
                                 client.DefaultRequestHeaders.Authorization = new System.Net.Http.Headers.AuthenticationHeaderValue("Bearer", AuthService.Instance.AccessToken);
 
-                            var content = new StringContent(json, Encoding.UTF8, "application/json");
+                            var content = RevitCivilConnector.Utils.GzipJsonContent.Create(json);
                             var response = await client.PostAsync(backendUrl, content);
                             success = response.IsSuccessStatusCode;
                         }
@@ -83,7 +83,7 @@ namespace RevitCivilConnector
                         if (AuthService.Instance.IsLoggedIn)
                             client.DefaultRequestHeaders.Authorization = new System.Net.Http.Headers.AuthenticationHeaderValue("Bearer", AuthService.Instance.AccessToken);
                             
-                        var content = new StringContent(json, Encoding.UTF8, "application/json");
+                        var content = RevitCivilConnector.Utils.GzipJsonContent.Create(json);
                         await client.PostAsync(backendUrl, content);
                     }
                 }
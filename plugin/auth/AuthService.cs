@@ -8,6 +8,8 @@ using System.Threading;
 using Newtonsoft.Json;
 using Newtonsoft.Json.Linq;
 using System.Net;
+using System.IO;
+using System.Security.Cryptography;
 using Autodesk.Revit.UI;
 
 namespace RevitCivilConnector.Auth
@@ -87,95 +89,11 @@ namespace RevitCivilConnector.Auth
                 {
                     var respString = await response.Content.ReadAsStringAsync();
                     dynamic respData = JsonConvert.DeserializeObject(respString);
-                    
-                    AccessToken = respData.access_token;
-                    SessionId = respData.session_id;
-                    CurrentUserName = respData.user_name;
-                    CurrentUserEmail = username;
-                    
-                    // Version Check
-                    try {
-                         LatestPluginVersion = respData.latest_version;
-                         
-                         // Check for update info object
-                         dynamic updateInfo = respData.update_info;
-                         
-                         if (LatestPluginVersion != currentPluginVersion)
-                         {
-                             bool isMandatory = false;
-                             string url = "";
-                             string changelog = "";
-                             
-                             if (updateInfo != null)
-                             {
-                                 isMandatory = (bool)updateInfo.mandatory;
-                                 url = (string)updateInfo.url;
-                                 changelog = (string)updateInfo.changelog;
-                             }
-                             
-                             if (isMandatory)
-                             {
-                                 TaskDialog.Show("Actualización Requerida", 
-                                     $"Es obligatorio actualizar a la versión {LatestPluginVersion} para continuar.\n\nNotas:\n{changelog}\n\nEl plugin se cerrará.");
-                                 
-                                 if (!string.IsNullOrEmpty(url)) 
-                                 {
-                                     try { System.Diagnostics.Process.Start(url); } catch {}
-                                 }
-                                 return false; // Abort Login
-                             }
-                             else
-                             {
-                                 TaskDialog.Show("Actualización Disponible", 
-                                     $"Nueva versión disponible: {LatestPluginVersion}.\n\nTu versión: {currentPluginVersion}.\n\n{changelog}");
-                             }
-                         }
-                    } catch { }
 
-                    // Role
-                    try
-                    {
-                        string r = (string)respData.role;
-                        CurrentUserRole = string.IsNullOrEmpty(r) ? "Colaborador" : r;
-                    }
-                    catch { CurrentUserRole = "Colaborador"; }
-                    
-                    // Permissions
-                    try {
-                        UserPermissions.Clear();
-                        var permsToken = respData.permissions; // JToken from dynamic
-
-                        if (permsToken != null)
-                        {
-                            if (permsToken.Type == JTokenType.Object)
-                            {
-                                foreach (JProperty prop in permsToken.Properties())
-                                {
-                                    UserPermissions[prop.Name] = (bool)prop.Value;
-                                }
-                            }
-                            else if (permsToken.Type == JTokenType.String)
-                            {
-                                string jsonStruct = (string)permsToken;
-                                var dict = JsonConvert.DeserializeObject<Dictionary<string, bool>>(jsonStruct);
-                                if (dict != null)
-                                {
-                                    foreach(var kvp in dict) UserPermissions[kvp.Key] = kvp.Value;
-                                }
-                            }
-                        }
-                    } catch (Exception ex) {
-                        // Store error for Debug Info if needed
-                        // Console.WriteLine(ex.ToString());
-                    }
+                    if (!ApplySession(respData, username, currentPluginVersion)) return false;
 
-                    // Start Heartbeat
-                    StartHeartbeat();
-                    StartCommandPolling(); // Start polling for commands (Visualizer)
-                    
-                    // Unblock
-                    OnBlockStatusChanged?.Invoke(false);
-                    OnLogin?.Invoke();
+                    // Next Revit start resumes with this token instead of the password
+                    try { SaveDeviceToken((string)respData.device_token); } catch { }
                     return true;
                 }
                 return false;
@@ -191,6 +109,172 @@ namespace RevitCivilConnector.Auth
                 return false;
             }
         }
+
+        /// <summary>
+        /// Resume with the stored device token (no password). Returns false if there is no token
+        /// or the server rejects it, so the caller falls back to the login form.
+        /// </summary>
+        public async Task<bool> TryResumeAsync()
+        {
+            string deviceToken = LoadDeviceToken();
+            if (string.IsNullOrEmpty(deviceToken)) return false;
+
+            try
+            {
+                var currentPluginVersion = "1.5.3"; // Should come from Assembly
+                var payload = new
+                {
+                    device_token = deviceToken,
+                    machine_name = Environment.MachineName,
+                    revit_version = "2024",
+                    plugin_version = currentPluginVersion,
+                    ip_address = GetLocalIPAddress()
+                };
+
+                var content = new StringContent(JsonConvert.SerializeObject(payload), Encoding.UTF8, "application/json");
+                var response = await _client.PostAsync($"{BASE_URL}/resume", content);
+
+                if (response.StatusCode == HttpStatusCode.Unauthorized || response.StatusCode == HttpStatusCode.Forbidden)
+                {
+                    DeleteDeviceToken(); // Expired / revoked: ask for the password again
+                    return false;
+                }
+                if (!response.IsSuccessStatusCode) return false;
+
+                var respString = await response.Content.ReadAsStringAsync();
+                dynamic respData = JsonConvert.DeserializeObject(respString);
+                return ApplySession(respData, (string)respData.user_email, currentPluginVersion);
+            }
+            catch
+            {
+                return false; // Offline etc.: show the login form
+            }
+        }
+
+        /// <summary>
+        /// Shared by login and resume: session state, version check, role, permissions, background loops.
+        /// </summary>
+        private bool ApplySession(dynamic respData, string email, string currentPluginVersion)
+        {
+            AccessToken = respData.access_token;
+            SessionId = respData.session_id;
+            CurrentUserName = respData.user_name;
+            CurrentUserEmail = email;
+            
+            // Version Check
+            try {
+                 LatestPluginVersion = respData.latest_version;
+                 
+                 // Check for update info object
+                 dynamic updateInfo = respData.update_info;
+                 
+                 if (LatestPluginVersion != currentPluginVersion)
+                 {
+                     bool isMandatory = false;
+                     string url = "";
+                     string changelog = "";
+                     
+                     if (updateInfo != null)
+                     {
+                         isMandatory = (bool)updateInfo.mandatory;
+                         url = (string)updateInfo.url;
+                         changelog = (string)updateInfo.changelog;
+                     }
+                     
+                     if (isMandatory)
+                     {
+                         TaskDialog.Show("Actualización Requerida", 
+                             $"Es obligatorio actualizar a la versión {LatestPluginVersion} para continuar.\n\nNotas:\n{changelog}\n\nEl plugin se cerrará.");
+                         
+                         if (!string.IsNullOrEmpty(url)) 
+                         {
+                             try { System.Diagnostics.Process.Start(url); } catch {}
+                         }
+                         return false; // Abort Login
+                     }
+                     else
+                     {
+                         TaskDialog.Show("Actualización Disponible", 
+                             $"Nueva versión disponible: {LatestPluginVersion}.\n\nTu versión: {currentPluginVersion}.\n\n{changelog}");
+                     }
+                 }
+            } catch { }
+
+            // Role
+            try
+            {
+                string r = (string)respData.role;
+                CurrentUserRole = string.IsNullOrEmpty(r) ? "Colaborador" : r;
+            }
+            catch { CurrentUserRole = "Colaborador"; }
+            
+            // Permissions
+            try {
+                UserPermissions.Clear();
+                var permsToken = respData.permissions; // JToken from dynamic
+
+                if (permsToken != null)
+                {
+                    if (permsToken.Type == JTokenType.Object)
+                    {
+                        foreach (JProperty prop in permsToken.Properties())
+                        {
+                            UserPermissions[prop.Name] = (bool)prop.Value;
+                        }
+                    }
+                    else if (permsToken.Type == JTokenType.String)
+                    {
+                        string jsonStruct = (string)permsToken;
+                        var dict = JsonConvert.DeserializeObject<Dictionary<string, bool>>(jsonStruct);
+                        if (dict != null)
+                        {
+                            foreach(var kvp in dict) UserPermissions[kvp.Key] = kvp.Value;
+                        }
+                    }
+                }
+            } catch (Exception ex) {
+                // Store error for Debug Info if needed
+                // Console.WriteLine(ex.ToString());
+            }
+
+            // Start Heartbeat
+            StartHeartbeat();
+            StartCommandPolling(); // Start polling for commands (Visualizer)
+            
+            // Unblock
+            OnBlockStatusChanged?.Invoke(false);
+            OnLogin?.Invoke();
+            return true;
+        }
+
+        // --- Device Token (DPAPI, current Windows user) ---
+
+        private static string DeviceTokenPath => Path.Combine(
+            Environment.GetFolderPath(Environment.SpecialFolder.ApplicationData), "AODevelopment", "device.token");
+
+        private void SaveDeviceToken(string deviceToken)
+        {
+            if (string.IsNullOrEmpty(deviceToken)) return;
+            Directory.CreateDirectory(Path.GetDirectoryName(DeviceTokenPath));
+            byte[] data = ProtectedData.Protect(Encoding.UTF8.GetBytes(deviceToken), null, DataProtectionScope.CurrentUser);
+            File.WriteAllBytes(DeviceTokenPath, data);
+        }
+
+        private string LoadDeviceToken()
+        {
+            try
+            {
+                if (!File.Exists(DeviceTokenPath)) return null;
+                byte[] data = ProtectedData.Unprotect(File.ReadAllBytes(DeviceTokenPath), null, DataProtectionScope.CurrentUser);
+                return Encoding.UTF8.GetString(data);
+            }
+            catch { return null; }
+        }
+
+        private void DeleteDeviceToken()
+        {
+            try { if (File.Exists(DeviceTokenPath)) File.Delete(DeviceTokenPath); } catch { }
+        }
         
         public bool HasPermission(string permissionKey)
         {
@@ -244,6 +328,14 @@ namespace RevitCivilConnector.Auth
                         try {
                             var respString = await response.Content.ReadAsStringAsync();
                             dynamic respData = JsonConvert.DeserializeObject(respString);
+
+                            // Session ended server-side (logout / stale reaper): resume with the device token or lock
+                            if ((string)respData.action == "ReLogin")
+                            {
+                                bool resumed = await TryResumeAsync();
+                                OnBlockStatusChanged?.Invoke(!resumed);
+                                continue;
+                            }
                             
                             // Permissions Sync
                             var permsToken = respData.permissions; // JToken
@@ -341,8 +433,33 @@ namespace RevitCivilConnector.Auth
             }
         }
 
+        public async Task ReportCommandResult(long commandId, string status, string message = null)
+        {
+            // Confirms a polled command (UPDATE_SHEETS promotes its pending rows into the session baseline)
+            try
+            {
+                var payload = new { command_id = commandId, status = status, result_json = new { }, message = message };
+                var content = new StringContent(JsonConvert.SerializeObject(payload), Encoding.UTF8, "application/json");
+                await _client.PostAsync($"{BASE_URL}/command/result", content);
+            }
+            catch { }
+        }
+
         public async void Logout()
         {
+            // Explicit logout: this machine must use the password again
+            string deviceToken = LoadDeviceToken();
+            DeleteDeviceToken();
+            if (!string.IsNullOrEmpty(deviceToken))
+            {
+                try
+                {
+                    var content = new StringContent(JsonConvert.SerializeObject(new { device_token = deviceToken }), Encoding.UTF8, "application/json");
+                    await _client.PostAsync($"{BASE_URL}/device/revoke", content);
+                }
+                catch { }
+            }
+
             StopHeartbeat();
             AccessToken = null;
             SessionId = null;
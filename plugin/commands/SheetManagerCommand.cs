@@ -129,7 +129,7 @@ namespace RevitCivilConnector.Commands
                         {
                             string url = "https://aodevelopment-production.up.railway.app/api/plugin/sheets/init";
                             string json = Newtonsoft.Json.JsonConvert.SerializeObject(payload);
-                            var content = new System.Net.Http.StringContent(json, System.Text.Encoding.UTF8, "application/json");
+                            var content = RevitCivilConnector.Utils.GzipJsonContent.Create(json);
 
                             var res = await client.PostAsync(url, content);
                             if (res.IsSuccessStatusCode)
@@ -14,10 +14,13 @@ namespace RevitCivilConnector.Services
         {
             while (CommandQueue.Count > 0)
             {
+                dynamic cmd = CommandQueue.Dequeue();
+                long? commandId = null;
+                try { commandId = (long?)cmd.id; } catch {}
+                string action = null;
                 try 
                 {
-                    dynamic cmd = CommandQueue.Dequeue();
-                    string action = cmd.action;
+                    action = cmd.action;
                     dynamic payload = cmd.payload;
 
                     if (action == "visualize")
@@ -146,16 +149,25 @@ namespace RevitCivilConnector.Services
                             }
                             t.Commit();
                         }
+                        ReportResult(commandId, "success", null);
                     }
                 }
                 catch (Exception ex)
                 {
-                    // Log error?
+                    if (action == "UPDATE_SHEETS") ReportResult(commandId, "error", ex.Message);
                     TaskDialog.Show("Visualizer Error", ex.Message);
                 }
             }
         }
         
+        private void ReportResult(long? commandId, string status, string message)
+        {
+            // Off the Revit thread: the server drops or promotes the pending sheet edits of this command
+            if (commandId == null) return;
+            long id = commandId.Value;
+            System.Threading.Tasks.Task.Run(() => RevitCivilConnector.Auth.AuthService.Instance.ReportCommandResult(id, status, message));
+        }
+
         public string GetName()
         {
             return "Cloud Visualizer Handler";
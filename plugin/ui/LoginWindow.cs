@@ -21,6 +21,25 @@ namespace RevitCivilConnector.UI
         public LoginWindow()
         {
             InitializeUI();
+            this.Loaded += LoginWindow_Loaded;
+        }
+
+        private async void LoginWindow_Loaded(object sender, RoutedEventArgs e)
+        {
+            // Saved device token: resume without asking for the password
+            btnLogin.Content = "Conectando...";
+            btnLogin.IsEnabled = false;
+
+            bool resumed = await RevitCivilConnector.Auth.AuthService.Instance.TryResumeAsync();
+            if (resumed)
+            {
+                this.DialogResult = true;
+                this.Close();
+                return;
+            }
+
+            btnLogin.Content = "Ingresar";
+            btnLogin.IsEnabled = true;
         }
 
         private void InitializeUI()
@@ -0,0 +1,40 @@
+using System.IO;
+using System.IO.Compression;
+using System.Net.Http;
+using System.Net.Http.Headers;
+using System.Text;
+
+namespace RevitCivilConnector.Utils
+{
+    /// <summary>
+    /// Gzip-compressed JSON request body (Content-Encoding: gzip).
+    /// The backend decodes it transparently for every /api/plugin route.
+    /// </summary>
+    public static class GzipJsonContent
+    {
+        // Small payloads are sent as-is (compression overhead isn't worth it)
+        private const int MinBytes = 8 * 1024;
+
+        public static HttpContent Create(string json)
+        {
+            byte[] raw = Encoding.UTF8.GetBytes(json);
+            if (raw.Length < MinBytes)
+                return new StringContent(json, Encoding.UTF8, "application/json");
+
+            byte[] packed;
+            using (var ms = new MemoryStream())
+            {
+                using (var gz = new GZipStream(ms, CompressionLevel.Fastest, true))
+                {
+                    gz.Write(raw, 0, raw.Length);
+                }
+                packed = ms.ToArray();
+            }
+
+            var content = new ByteArrayContent(packed);
+            content.Headers.ContentType = new MediaTypeHeaderValue("application/json") { CharSet = "utf-8" };
+            content.Headers.ContentEncoding.Add("gzip");
+            return content;
+        }
+    }
+}